@@ -0,0 +1,115 @@
+"""
+Benchmark comparing throughput and latency of the Twisted
+and asyncio server backends. Starts a server with every backend,
+client processes run SET and GET of random keys and time every request.
+
+Run from the repository root:
+    python -m benchmarks.backends [--backends twisted,asyncio] [--clients c] [--duration s]
+"""
+import sys, getopt
+import os
+import signal
+import subprocess
+import tempfile
+import time
+from multiprocessing import Pool
+
+from benchmarks.blocking_client import BlockingRedisClient, wait_for_port
+
+
+help_msg =\
+    '''
+    Usage: backends [-h] [--backends b1,b2] [--clients c] [--duration s] [--pipeline n] [--port p]
+        -h, --help      see this message
+        --backends b    comma separated backends (default is twisted,asyncio)
+        --clients c     number of client processes (default is 4)
+        --duration s    seconds to run every backend (default is 5)
+        --pipeline n    commands sent in one request (default is 1)
+        --port p        port of the server (default is 7100)
+    '''
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_client(params):
+    """
+    SET and GET random keys for the given time
+    :return: (number of executed commands, list of request latencies in seconds)
+    """
+    client_id, port, duration, pipeline = params
+    connection = BlockingRedisClient('127.0.0.1', port)
+    count = 0
+    latencies = []
+    deadline = time.time() + duration
+    while time.time() < deadline:
+        commands = []
+        for i in range(pipeline):
+            key = f'key:{client_id}:{(count + i) % 10000}'
+            commands.append(['get', key] if (count + i) % 2 else ['set', key, 'value'])
+        start = time.perf_counter()
+        connection.pipeline(commands)
+        latencies.append(time.perf_counter() - start)
+        count += pipeline
+    connection.close()
+    return count, latencies
+
+
+def percentile(values: list, share: float):
+    """
+    :param values: sorted list
+    :param share: from 0 to 1
+    :return:
+    """
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+if __name__ == '__main__':
+    backends = ['twisted', 'asyncio']
+    clients = 4
+    duration = 5
+    pipeline = 1
+    port = 7100
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'h', ['backends=', 'clients=', 'duration=',
+                                                      'pipeline=', 'port=', 'help'])
+    except getopt.GetoptError as err:
+        print(help_msg)
+        sys.exit(err.msg)
+
+    for opt, arg in opts:
+        if opt in ('-h', '--help'):
+            print(help_msg)
+            sys.exit()
+        if opt == '--backends':
+            backends = arg.split(',')
+        if opt == '--clients':
+            clients = int(arg)
+        if opt == '--duration':
+            duration = float(arg)
+        if opt == '--pipeline':
+            pipeline = int(arg)
+        if opt == '--port':
+            port = int(arg)
+
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    print(f'{"backend":>8} {"ops/s":>10} {"p50 ms":>8} {"p99 ms":>8} {"p99.9 ms":>9} {"max ms":>8}')
+    for backend in backends:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            server = subprocess.Popen([sys.executable, os.path.join(ROOT, 'server', 'server.py'),
+                                       '--backend', backend, '--port', str(port), '--save', tmp_dir],
+                                      env=env, stdout=subprocess.DEVNULL)
+            try:
+                wait_for_port('127.0.0.1', port)
+                with Pool(clients) as pool:
+                    start = time.perf_counter()
+                    results = pool.map(run_client, [(i, port, duration, pipeline) for i in range(clients)])
+                    elapsed = time.perf_counter() - start
+            finally:
+                server.send_signal(signal.SIGTERM)
+                server.wait()
+        total = sum(count for count, latencies in results)
+        latencies = sorted(latency * 1000 for count, client_latencies in results
+                           for latency in client_latencies)
+        print(f'{backend:>8} {total / elapsed:>10.0f} {percentile(latencies, 0.5):>8.3f} '
+              f'{percentile(latencies, 0.99):>8.3f} {percentile(latencies, 0.999):>9.3f} {latencies[-1]:>8.3f}')
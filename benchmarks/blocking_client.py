@@ -0,0 +1,74 @@
+"""
+Minimal blocking Redis client for benchmark scripts.
+Uses the same encoder and data parser as the server.
+"""
+import socket
+import time
+from src.redis_encoder import RedisEncoder
+from src.redis_data_parser import RedisDataParser
+
+
+class BlockingRedisClient:
+    def __init__(self, host='127.0.0.1', port=6379, unix_socket=None):
+        """
+        :param host:
+        :param port:
+        :param unix_socket: path of unix socket, used instead of host and port
+        """
+        if unix_socket is None:
+            self.sock = socket.create_connection((host, port))
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        else:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.connect(unix_socket)
+        self._buffer = b''
+        self._replies = []
+        self._parser = RedisDataParser()
+        self._parser.getDeferred().addCallback(self._valueParsed)
+
+    def _valueParsed(self, value):
+        self._replies.append(value)
+        self._parser.getDeferred().addCallback(self._valueParsed)
+
+    def pipeline(self, commands: list) -> list:
+        """
+        Send commands in one write and wait for all replies
+        :param commands: list of lists of arguments
+        :return: list of replies
+        """
+        self.sock.sendall(b''.join(RedisEncoder.encodeArray(command) for command in commands))
+        while len(self._replies) < len(commands):
+            data = self.sock.recv(65536)
+            if not data:
+                raise ConnectionError('connection closed by server')
+            self._buffer += data
+            while self._buffer:
+                size = len(self._buffer)
+                self._buffer = self._parser.parse(self._buffer)
+                if len(self._buffer) == size:
+                    break
+        replies = self._replies[:len(commands)]
+        del self._replies[:len(commands)]
+        return replies
+
+    def execute(self, *args):
+        return self.pipeline([list(args)])[0]
+
+    def close(self):
+        self.sock.close()
+
+
+def wait_for_port(host, port, timeout=10):
+    """
+    Wait until the port accepts connections
+    :return:
+    """
+    deadline = time.time() + timeout
+    while True:
+        try:
+            socket.create_connection((host, port)).close()
+            return
+        except OSError:
+            if time.time() > deadline:
+                raise
+            time.sleep(0.05)
@@ -0,0 +1,100 @@
+"""
+Benchmark of cluster throughput as a function of the number of nodes.
+Starts a local cluster for every size, client processes route
+commands to the node owning the key.
+
+Run from the repository root:
+    python -m benchmarks.cluster_throughput [--nodes 1,2,4,8] [--clients c] [--duration s]
+"""
+import sys, getopt
+import os
+import signal
+import subprocess
+import tempfile
+import time
+from multiprocessing import Pool
+
+from src.cluster import ClusterLayout
+from benchmarks.blocking_client import BlockingRedisClient, wait_for_port
+
+
+help_msg =\
+    '''
+    Usage: cluster_throughput [-h] [--nodes n1,n2,...] [--clients c] [--duration s] [--port p]
+        -h, --help      see this message
+        --nodes n       comma separated cluster sizes (default is 1,2,4,8)
+        --clients c     number of client processes (default is 2 per node)
+        --duration s    seconds to run every size (default is 5)
+        --port p        port of the first node (default is 7000)
+    '''
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_client(params):
+    """
+    SET and GET random keys on the owning nodes for the given time
+    :return: number of executed commands
+    """
+    client_id, size, port, duration = params
+    layout = ClusterLayout.local(size, port)
+    connections = [BlockingRedisClient(host, node_port) for host, node_port in layout.nodes]
+    count = 0
+    deadline = time.time() + duration
+    while time.time() < deadline:
+        key = f'key:{client_id}:{count % 10000}'
+        connection = connections[layout.key_node(key)]
+        if count % 2:
+            connection.execute('get', key)
+        else:
+            connection.execute('set', key, 'value')
+        count += 1
+    for connection in connections:
+        connection.close()
+    return count
+
+
+if __name__ == '__main__':
+    sizes = [1, 2, 4, 8]
+    clients = None
+    duration = 5
+    port = 7000
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'h', ['nodes=', 'clients=', 'duration=', 'port=', 'help'])
+    except getopt.GetoptError as err:
+        print(help_msg)
+        sys.exit(err.msg)
+
+    for opt, arg in opts:
+        if opt in ('-h', '--help'):
+            print(help_msg)
+            sys.exit()
+        if opt == '--nodes':
+            sizes = [int(size) for size in arg.split(',')]
+        if opt == '--clients':
+            clients = int(arg)
+        if opt == '--duration':
+            duration = float(arg)
+        if opt == '--port':
+            port = int(arg)
+
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    print(f'{"nodes":>6} {"clients":>8} {"ops/s":>10}')
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            server = subprocess.Popen([sys.executable, os.path.join(ROOT, 'server', 'server.py'),
+                                       '--cluster', str(size), '--port', str(port), '--save', tmp_dir],
+                                      env=env, stdout=subprocess.DEVNULL)
+            try:
+                for node in range(size):
+                    wait_for_port('127.0.0.1', port + node)
+                client_count = clients or 2 * size
+                with Pool(client_count) as pool:
+                    start = time.perf_counter()
+                    counts = pool.map(run_client, [(i, size, port, duration) for i in range(client_count)])
+                    elapsed = time.perf_counter() - start
+                print(f'{size:>6} {client_count:>8} {sum(counts) / elapsed:>10.0f}')
+            finally:
+                server.send_signal(signal.SIGTERM)
+                server.wait()
@@ -0,0 +1,110 @@
+"""
+Benchmark of interactive latency next to a bulk loading client.
+For every limit of commands per turn a server is started, one
+connection sends big pipelines of SET while another one times
+single GET requests.
+
+Run from the repository root:
+    python -m benchmarks.fair_scheduling [--limits 0,20] [--pipeline n] [--duration s] [--port p]
+"""
+import sys, getopt
+import os
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+
+from benchmarks.blocking_client import BlockingRedisClient, wait_for_port
+from benchmarks.backends import percentile
+
+
+help_msg =\
+    '''
+    Usage: fair_scheduling [-h] [--limits l1,l2] [--pipeline n] [--duration s] [--port p]
+        -h, --help      see this message
+        --limits l      comma separated values of --max-commands-per-turn,
+                        0 disables the limit (default is 0,20)
+        --pipeline n    SET commands in one write of the bulk client
+                        (default is 20000)
+        --duration s    seconds to run every limit (default is 5)
+        --port p        port of the server (default is 7300)
+    '''
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def bulk_load(port, pipeline, stop, counter):
+    """
+    Send pipelines of SET and wait for their replies until stopped
+    """
+    client = BlockingRedisClient('127.0.0.1', port)
+    commands = [['set', f'bulk:{i}', 'x' * 20] for i in range(pipeline)]
+    while not stop.is_set():
+        client.pipeline(commands)
+        counter[0] += pipeline
+    client.close()
+
+
+def run_limit(limit, pipeline, duration, port):
+    """
+    :return: (bulk commands per second, sorted GET latencies in seconds)
+    """
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        server = subprocess.Popen([sys.executable, os.path.join(ROOT, 'server', 'server.py'), '--port', str(port),
+                                   '--save', tmp_dir, '--max-commands-per-turn', str(limit)],
+                                  env=env, stdout=subprocess.DEVNULL)
+        try:
+            wait_for_port('127.0.0.1', port)
+            stop = threading.Event()
+            counter = [0]
+            bulk = threading.Thread(target=bulk_load, args=(port, pipeline, stop, counter))
+            bulk.start()
+            client = BlockingRedisClient('127.0.0.1', port)
+            latencies = []
+            start = time.time()
+            while time.time() - start < duration:
+                request = time.perf_counter()
+                client.execute('get', 'key')
+                latencies.append(time.perf_counter() - request)
+                time.sleep(0.001)
+            stop.set()
+            bulk.join()
+            client.close()
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait()
+    return counter[0] / duration, sorted(latencies)
+
+
+if __name__ == '__main__':
+    limits = [0, 20]
+    pipeline = 20000
+    duration = 5
+    port = 7300
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'h', ['limits=', 'pipeline=', 'duration=', 'port=', 'help'])
+    except getopt.GetoptError as err:
+        print(help_msg)
+        sys.exit(err.msg)
+
+    for opt, arg in opts:
+        if opt in ('-h', '--help'):
+            print(help_msg)
+            sys.exit()
+        if opt == '--limits':
+            limits = [int(limit) for limit in arg.split(',')]
+        if opt == '--pipeline':
+            pipeline = int(arg)
+        if opt == '--duration':
+            duration = float(arg)
+        if opt == '--port':
+            port = int(arg)
+
+    for limit in limits:
+        throughput, latencies = run_limit(limit, pipeline, duration, port)
+        print(f'max commands per turn {limit or "unlimited"}: bulk {throughput:.0f} commands/s, '
+              f'GET p50 {percentile(latencies, 0.5) * 1000:.2f} ms, p99 {percentile(latencies, 0.99) * 1000:.2f} ms, '
+              f'max {latencies[-1] * 1000:.2f} ms')
@@ -0,0 +1,101 @@
+"""
+Benchmark of the latency spike caused by deleting a big list.
+A server is started, a list of many elements is pushed, then it
+is deleted with DEL or UNLINK while another connection times
+single GET requests.
+
+Run from the repository root:
+    python -m benchmarks.lazy_free [--elements n] [--port p]
+"""
+import sys, getopt
+import os
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+
+from benchmarks.blocking_client import BlockingRedisClient, wait_for_port
+from benchmarks.backends import percentile
+
+
+help_msg =\
+    '''
+    Usage: lazy_free [-h] [--elements n] [--port p]
+        -h, --help      see this message
+        --elements n    elements of the deleted list (default is 2000000)
+        --port p        port of the server (default is 7310)
+    '''
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def ping(port, stop, latencies):
+    """
+    Time GET requests until stopped
+    """
+    client = BlockingRedisClient('127.0.0.1', port)
+    while not stop.is_set():
+        request = time.perf_counter()
+        client.execute('get', 'key')
+        latencies.append(time.perf_counter() - request)
+        time.sleep(0.001)
+    client.close()
+
+
+def run_command(client, port, command, elements):
+    """
+    Fill the list and delete it with the command
+    :return: (seconds of the command, sorted GET latencies in seconds)
+    """
+    chunk = [f'element:{i}' for i in range(1000)]
+    client.pipeline([['rpush', 'big'] + chunk for _ in range(elements // 1000)])
+    stop = threading.Event()
+    latencies = []
+    pinger = threading.Thread(target=ping, args=(port, stop, latencies))
+    pinger.start()
+    time.sleep(0.5)
+    request = time.perf_counter()
+    client.execute(command, 'big')
+    spent = time.perf_counter() - request
+    time.sleep(1)
+    stop.set()
+    pinger.join()
+    return spent, sorted(latencies)
+
+
+if __name__ == '__main__':
+    elements = 2000000
+    port = 7310
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'h', ['elements=', 'port=', 'help'])
+    except getopt.GetoptError as err:
+        print(help_msg)
+        sys.exit(err.msg)
+
+    for opt, arg in opts:
+        if opt in ('-h', '--help'):
+            print(help_msg)
+            sys.exit()
+        if opt == '--elements':
+            elements = int(arg)
+        if opt == '--port':
+            port = int(arg)
+
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        server = subprocess.Popen([sys.executable, os.path.join(ROOT, 'server', 'server.py'), '--port', str(port),
+                                   '--save', tmp_dir], env=env, stdout=subprocess.DEVNULL)
+        try:
+            wait_for_port('127.0.0.1', port)
+            client = BlockingRedisClient('127.0.0.1', port)
+            for command in ('del', 'unlink'):
+                spent, latencies = run_command(client, port, command, elements)
+                print(f'{command} of {elements} elements: reply {spent * 1000:.2f} ms, '
+                      f'GET p50 {percentile(latencies, 0.5) * 1000:.2f} ms, '
+                      f'p99 {percentile(latencies, 0.99) * 1000:.2f} ms, max {latencies[-1] * 1000:.2f} ms')
+            client.close()
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait()
@@ -0,0 +1,172 @@
+"""
+Benchmark of publishing to many subscribers.
+In-process part compares encoding the message once with encoding it
+for every subscriber, and indexed pattern matching with a loop over
+all patterns. TCP part starts a server, subscribes a number of
+connections and measures PUBLISH reply time and the time until
+every subscriber got the message.
+
+Run from the repository root:
+    python -m benchmarks.pubsub_fanout [--subscribers n] [--messages m] [--port p]
+"""
+import sys, getopt
+import os
+import signal
+import socket
+import subprocess
+import tempfile
+import time
+
+from src.pubsub import PubSub
+from src.redis_encoder import RedisEncoder
+from src.redis_pattern_matching import str_match_pattern_redis
+from benchmarks.blocking_client import BlockingRedisClient, wait_for_port
+
+
+help_msg =\
+    '''
+    Usage: pubsub_fanout [-h] [--subscribers n] [--messages m] [--port p] [--no-tcp]
+        -h, --help      see this message
+        --subscribers n number of subscribers (default is 10000)
+        --messages m    number of published messages (default is 20)
+        --port p        port of the server (default is 7200)
+        --no-tcp        run only in-process part
+    '''
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class NullTransport:
+    def __init__(self):
+        self.written = 0
+
+    def write(self, data):
+        self.written += len(data)
+
+
+class Subscriber:
+    def __init__(self):
+        self.transport = NullTransport()
+
+    def sendData(self, data):
+        self.transport.write(data)
+
+
+def run_inprocess(subscribers, messages):
+    pubsub = PubSub()
+    subs = [Subscriber() for _ in range(subscribers)]
+    for sub in subs:
+        pubsub.subscribe(sub, 'channel')
+    message = 'x' * 100
+
+    start = time.perf_counter()
+    for _ in range(messages):
+        pubsub.publish('channel', message)
+    encode_once = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(messages):
+        for sub in subs:
+            sub.sendData(RedisEncoder.encodeArray(['message', 'channel', message]))
+    encode_each = time.perf_counter() - start
+    print(f'channel, {subscribers} subscribers: encode once {encode_once / messages * 1000:.3f} ms/message, '
+          f'encode per subscriber {encode_each / messages * 1000:.3f} ms/message')
+
+    pubsub = PubSub()
+    patterns = [f'user.{i}.*' for i in range(subscribers)]
+    for sub, pattern in zip(subs, patterns):
+        pubsub.psubscribe(sub, pattern)
+    channels = [f'user.{i * 7 % subscribers}.event' for i in range(messages)]
+
+    start = time.perf_counter()
+    for channel in channels:
+        pubsub.publish(channel, message)
+    indexed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for channel in channels:
+        for pattern in patterns:
+            str_match_pattern_redis(channel, pattern)
+    loop = time.perf_counter() - start
+    print(f'{subscribers} patterns: indexed {indexed / messages * 1000:.3f} ms/message, '
+          f'loop over patterns {loop / messages * 1000:.3f} ms/message')
+
+
+def read_message(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError('connection closed by server')
+        data += chunk
+    return data
+
+
+def run_tcp(subscribers, messages, port):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        server = subprocess.Popen([sys.executable, os.path.join(ROOT, 'server', 'server.py'),
+                                   '--port', str(port), '--save', tmp_dir],
+                                  env=env, stdout=subprocess.DEVNULL)
+        socks = []
+        try:
+            wait_for_port('127.0.0.1', port)
+            subscribe = RedisEncoder.encodeArray(['subscribe', 'channel'])
+            reply_size = len(RedisEncoder.encodeArray(['subscribe', 'channel', 1]))
+            for _ in range(subscribers):
+                sock = socket.create_connection(('127.0.0.1', port))
+                sock.sendall(subscribe)
+                socks.append(sock)
+            for sock in socks:
+                read_message(sock, reply_size)
+            publisher = BlockingRedisClient('127.0.0.1', port)
+            message = 'x' * 100
+            size = len(RedisEncoder.encodeArray(['message', 'channel', message]))
+            reply_time = 0
+            delivery_time = 0
+            for _ in range(messages):
+                start = time.perf_counter()
+                count = publisher.execute('publish', 'channel', message)
+                reply_time += time.perf_counter() - start
+                for sock in socks:
+                    read_message(sock, size)
+                delivery_time += time.perf_counter() - start
+                assert count == subscribers
+            publisher.close()
+            print(f'tcp, {subscribers} subscribers: PUBLISH reply {reply_time / messages * 1000:.2f} ms, '
+                  f'delivered to all {delivery_time / messages * 1000:.2f} ms')
+        finally:
+            for sock in socks:
+                sock.close()
+            server.send_signal(signal.SIGTERM)
+            server.wait()
+
+
+if __name__ == '__main__':
+    subscribers = 10000
+    messages = 20
+    port = 7200
+    tcp = True
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'h', ['subscribers=', 'messages=', 'port=', 'no-tcp', 'help'])
+    except getopt.GetoptError as err:
+        print(help_msg)
+        sys.exit(err.msg)
+
+    for opt, arg in opts:
+        if opt in ('-h', '--help'):
+            print(help_msg)
+            sys.exit()
+        if opt == '--subscribers':
+            subscribers = int(arg)
+        if opt == '--messages':
+            messages = int(arg)
+        if opt == '--port':
+            port = int(arg)
+        if opt == '--no-tcp':
+            tcp = False
+
+    run_inprocess(subscribers, messages)
+    if tcp:
+        run_tcp(subscribers, messages, port)
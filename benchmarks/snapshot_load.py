@@ -0,0 +1,82 @@
+"""
+Benchmark of storage restart time as a function of
+the number of snapshot decoding workers.
+
+Run from the repository root:
+    python -m benchmarks.snapshot_load [--keys n] [--shards s] [--workers 1,2,4,8]
+"""
+import sys, getopt
+import os
+import tempfile
+import time
+
+from src.storage import Storage
+
+
+help_msg =\
+    '''
+    Usage: snapshot_load [-h] [--keys n] [--shards s] [--workers w1,w2,...] [--value-size b]
+        -h, --help      see this message
+        --keys n        number of keys in the snapshot (default is 1000000)
+        --shards s      number of snapshot shards (default is number of cpus)
+        --workers w     comma separated worker counts to measure
+                        (default is 1,2,4,8)
+        --value-size b  size of string values in bytes (default is 100)
+    '''
+
+
+def fill_storage(storage, keys, value_size):
+    value = 'v' * value_size
+    for i in range(keys):
+        if i % 4 == 0:
+            storage.set(f'key:{i}', [value] * 4)
+        elif i % 4 == 1:
+            storage.set(f'key:{i}', {'field': value}, moe=time.time() + 3600)
+        else:
+            storage.set(f'key:{i}', value)
+
+
+if __name__ == '__main__':
+    keys = 1000000
+    shards = os.cpu_count() or 1
+    workers = [1, 2, 4, 8]
+    value_size = 100
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'h', ['keys=', 'shards=', 'workers=', 'value-size=', 'help'])
+    except getopt.GetoptError as err:
+        print(help_msg)
+        sys.exit(err.msg)
+
+    for opt, arg in opts:
+        if opt in ('-h', '--help'):
+            print(help_msg)
+            sys.exit()
+        if opt == '--keys':
+            keys = int(arg)
+        if opt == '--shards':
+            shards = int(arg)
+        if opt == '--workers':
+            workers = [int(w) for w in arg.split(',')]
+        if opt == '--value-size':
+            value_size = int(arg)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        prefix = os.path.join(tmp_dir, 'storage')
+        storage = Storage(file_prefix=prefix, shards=shards)
+        fill_storage(storage, keys, value_size)
+        start = time.perf_counter()
+        storage.save()
+        print(f'Saved {keys} keys in {shards} shards: {time.perf_counter() - start:.3f}s')
+        del storage
+
+        print(f'{"workers":>8} {"load, s":>10} {"speedup":>8}')
+        base = None
+        for worker_count in workers:
+            start = time.perf_counter()
+            storage = Storage(file_prefix=prefix, load_workers=worker_count)
+            elapsed = time.perf_counter() - start
+            if base is None:
+                base = elapsed
+            print(f'{worker_count:>8} {elapsed:>10.3f} {base / elapsed:>8.2f}')
+            del storage
@@ -0,0 +1,93 @@
+"""
+Benchmark of round-trip latency over TCP loopback and unix socket.
+Starts a server listening on both, then sends single GET requests
+over each connection in turns and times every request.
+
+Run from the repository root:
+    python -m benchmarks.unix_latency [--requests n] [--port p]
+"""
+import sys, getopt
+import os
+import signal
+import subprocess
+import tempfile
+import time
+
+from benchmarks.blocking_client import BlockingRedisClient, wait_for_port
+from benchmarks.backends import percentile
+
+
+help_msg =\
+    '''
+    Usage: unix_latency [-h] [--requests n] [--port p]
+        -h, --help      see this message
+        --requests n    requests over every transport (default is 20000)
+        --port p        port of the server (default is 7400)
+    '''
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def wait_for_socket(path, timeout=10):
+    deadline = time.time() + timeout
+    while not os.path.exists(path):
+        if time.time() > deadline:
+            raise TimeoutError(f'no socket {path}')
+        time.sleep(0.05)
+
+
+def run(requests, port):
+    """
+    :return: dict of sorted latencies in seconds by transport name
+    """
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'server.sock')
+        server = subprocess.Popen([sys.executable, os.path.join(ROOT, 'server', 'server.py'), '--port', str(port),
+                                   '--save', tmp_dir, '--unixsocket', path],
+                                  env=env, stdout=subprocess.DEVNULL)
+        try:
+            wait_for_port('127.0.0.1', port)
+            wait_for_socket(path)
+            clients = {'tcp': BlockingRedisClient('127.0.0.1', port),
+                       'unix': BlockingRedisClient(unix_socket=path)}
+            clients['tcp'].execute('set', 'key', 'x' * 100)
+            latencies = {name: [] for name in clients}
+            # transports take turns in alternating order, so both see the same server state
+            order = list(clients.items())
+            for _ in range(requests):
+                order.reverse()
+                for name, client in order:
+                    start = time.perf_counter()
+                    client.execute('get', 'key')
+                    latencies[name].append(time.perf_counter() - start)
+            for client in clients.values():
+                client.close()
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait()
+    return {name: sorted(values) for name, values in latencies.items()}
+
+
+if __name__ == '__main__':
+    requests = 20000
+    port = 7400
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'h', ['requests=', 'port=', 'help'])
+    except getopt.GetoptError as err:
+        print(help_msg)
+        sys.exit(err.msg)
+
+    for opt, arg in opts:
+        if opt in ('-h', '--help'):
+            print(help_msg)
+            sys.exit()
+        if opt == '--requests':
+            requests = int(arg)
+        if opt == '--port':
+            port = int(arg)
+
+    for name, values in run(requests, port).items():
+        print(f'{name}: mean {sum(values) / len(values) * 1e6:.1f} us, p50 {percentile(values, 0.5) * 1e6:.1f} us, '
+              f'p99 {percentile(values, 0.99) * 1e6:.1f} us')
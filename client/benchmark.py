@@ -0,0 +1,134 @@
+import sys, getopt
+import json
+from twisted.internet import reactor
+from src.load_generator import LoadFactory, Workload, parse_mix, format_report
+
+
+help_msg =\
+    '''
+    Usage: benchmark [-h] [--host h] [--port p] [--clients n] [--requests n] [--mix m]
+        -h, --help      see this message
+        --host h        address of the server (default is 127.0.0.1)
+        --port p        port of the server (default is 6379)
+        --unixsocket path
+                        connect to unix socket instead of host and port
+        --clients n     number of connections (default is 50)
+        --requests n    number of commands to send (default is 100000)
+        --duration s    send commands for s seconds instead of
+                        a number of them
+        --mix m         comma separated commands with weights, of set,
+                        get, lpush, lrange, hset and keys
+                        (default is set:1,get:1)
+        --keyspace n    number of keys of every type (default is 10000)
+        --value-size b  bytes of values (default is 3)
+        --pipeline n    commands in one write of a connection
+                        (default is 1)
+        --ttl-ratio r   share of SET commands with EX, from 0 to 1
+                        (default is 0)
+        --ttl s         seconds of EX (default is 60)
+        --lrange-count n
+                        elements read by LRANGE (default is 100)
+        --keys-pattern p
+                        pattern of KEYS (default is bench:key:1*)
+        --seed n        seed of random keys, runs with the same seed
+                        send the same commands
+        --json path     write the report as JSON to path
+    '''
+
+
+if __name__ == '__main__':
+    host = '127.0.0.1'
+    port = 6379
+    unixsocket = None
+    clients = 50
+    requests = 100000
+    duration = None
+    mix = parse_mix('set:1,get:1')
+    keyspace = 10000
+    value_size = 3
+    pipeline = 1
+    ttl_ratio = 0.0
+    ttl = 60
+    lrange_count = 100
+    keys_pattern = None
+    seed = None
+    json_path = None
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'h', ['host=', 'port=', 'unixsocket=', 'clients=', 'requests=',
+                                                      'duration=', 'mix=', 'keyspace=', 'value-size=', 'pipeline=',
+                                                      'ttl-ratio=', 'ttl=', 'lrange-count=', 'keys-pattern=',
+                                                      'seed=', 'json=', 'help'])
+    except getopt.GetoptError as err:
+        print('Usage: benchmark [-h] [--host h] [--port p] [--clients n] [--requests n] [--mix m]')
+        sys.exit(err.msg)
+
+    try:
+        for opt, arg in opts:
+            if opt in ('-h', '--help'):
+                print(help_msg)
+                sys.exit()
+            if opt == '--host':
+                host = arg
+            if opt == '--port':
+                port = int(arg)
+            if opt == '--unixsocket':
+                unixsocket = arg
+            if opt == '--clients':
+                clients = int(arg)
+            if opt == '--requests':
+                requests = int(arg)
+            if opt == '--duration':
+                duration = float(arg)
+            if opt == '--mix':
+                mix = parse_mix(arg)
+            if opt == '--keyspace':
+                keyspace = int(arg)
+            if opt == '--value-size':
+                value_size = int(arg)
+            if opt == '--pipeline':
+                pipeline = int(arg)
+            if opt == '--ttl-ratio':
+                ttl_ratio = float(arg)
+            if opt == '--ttl':
+                ttl = int(arg)
+            if opt == '--lrange-count':
+                lrange_count = int(arg)
+            if opt == '--keys-pattern':
+                keys_pattern = arg
+            if opt == '--seed':
+                seed = int(arg)
+            if opt == '--json':
+                json_path = arg
+    except ValueError as err:
+        sys.exit(f'Wrong option value: {err}')
+    if min(clients, requests, keyspace, pipeline, lrange_count) <= 0 or not 0 <= ttl_ratio <= 1:
+        sys.exit('clients, requests, keyspace, pipeline and lrange count must be positive, '
+                 'ttl ratio must be from 0 to 1')
+
+    workload = Workload(mix, keyspace, value_size, ttl_ratio, ttl, lrange_count, keys_pattern, seed=seed)
+    factory = LoadFactory(workload, clients, requests, pipeline, duration)
+    result = {}
+
+    def finished(factory):
+        report = factory.report()
+        report.update(mix=dict(mix), keyspace=keyspace, value_size=value_size, ttl_ratio=ttl_ratio)
+        result['report'] = report
+        reactor.stop()
+
+    def failed(failure):
+        print('Benchmark failed:', failure.getErrorMessage())
+        reactor.stop()
+
+    factory.finished.addCallbacks(finished, failed)
+    for _ in range(clients):
+        if unixsocket is None:
+            reactor.connectTCP(host, port, factory)
+        else:
+            reactor.connectUNIX(unixsocket, factory)
+    reactor.run()
+    if 'report' not in result:
+        sys.exit(1)
+    print(format_report(result['report']))
+    if json_path is not None:
+        with open(json_path, 'w') as f:
+            json.dump(result['report'], f, indent=2)
@@ -1,6 +1,6 @@
 import sys, getopt
 from twisted.internet import reactor
-from src.client_protocol import ClientProtocolFactory
+from src.client_protocol import ClientProtocolFactory, PipeClientFactory, iter_pipe_commands
 
 
 help_msg =\
@@ -10,14 +10,24 @@ help_msg =\
         --host h        address of the server to connect to
         --port p        port to connect to
                         (default port is 6379)
+        --unixsocket path
+                        connect to unix socket instead of host and port
+        --pipe          send commands from stdin (RESP or one command
+                        per line) without printing replies, print
+                        number of errors and throughput at the end
+        --window n      maximum number of commands waiting for replies
+                        in pipe mode (default is 1000)
     '''
 
 
 if __name__ == '__main__':
     port = 6379
     host = '127.0.0.1'
+    pipe = False
+    window = 1000
+    unixsocket = None
     try:
-        opts, args = getopt.getopt(sys.argv[1:],'h',['port=','host=', 'help'])
+        opts, args = getopt.getopt(sys.argv[1:],'h',['port=','host=', 'pipe', 'window=', 'unixsocket=', 'help'])
     except getopt.GetoptError as err:
         print('Usage: client [-h] [--host h] [--port p]')
         sys.exit(err.msg)
@@ -30,6 +40,35 @@ if __name__ == '__main__':
             port = int(arg)
         if opt == '--host':
             host = arg
-    reactor.connectTCP(host, port, ClientProtocolFactory())
-    print(f"Connected to {host}:{port}")
+        if opt == '--pipe':
+            pipe = True
+        if opt == '--window':
+            window = int(arg)
+        if opt == '--unixsocket':
+            unixsocket = arg
+
+    def connect(factory):
+        if unixsocket is None:
+            reactor.connectTCP(host, port, factory)
+        else:
+            reactor.connectUNIX(unixsocket, factory)
+
+    if pipe:
+        factory = PipeClientFactory(iter_pipe_commands(sys.stdin.buffer), window)
+
+        def finished(proto):
+            print(proto.report())
+            reactor.stop()
+
+        def failed(failure):
+            print('Pipe failed:', failure.getErrorMessage())
+            reactor.stop()
+
+        factory.finished.addCallbacks(finished, failed)
+        connect(factory)
+        reactor.run()
+        sys.exit()
+
+    connect(ClientProtocolFactory())
+    print(f"Connected to {unixsocket or f'{host}:{port}'}")
     reactor.run()
@@ -1,12 +1,26 @@
 import sys, getopt
+import os
+import resource
+import stat
+import subprocess
+import asyncio
 from signal import signal, SIGINT, SIGTERM
 
 from twisted.internet import reactor
 
-from src.server_protocol import ServerProtocolFactory
+from src.server_protocol import ServerProtocolFactory, parse_output_buffer_limit
 from src.exceptions.storage_exceptions import StorageFileError
 from src.storage import Storage
 from src.redis_command_parser import RedisCommandParser
+from src.value_compression import ValueCompressor, CODECS
+from src.disk_tier import DiskTier
+from src.cluster import ClusterLayout, ClusterCommandParser
+from src.asyncio_server import AsyncioServer, AsyncioClock
+from src.replication import Replication
+from src.fair_scheduler import FairScheduler
+from src.slowlog import SlowLog
+from src.metrics_http import metrics_site
+from src.loop_monitor import LoopMonitor
 
 
 help_msg =\
@@ -14,18 +28,203 @@ help_msg =\
     Usage: server [-h] [--port p]
         -h, -- help     see this message
         --port p        set port p at which server listens
-                        (default port is 6379)
+                        (default port is 6379, 0 to listen only
+                        on unix socket)
+        --unixsocket path
+                        also listen on unix socket at path
+        --unixsocketperm mode
+                        octal permissions of the unix socket
+                        (default is 700)
         --save dest     set destination for saving storage keys
+        --shards n      number of snapshot shard files written on save
+                        (default is 1)
+        --load-workers n
+                        number of processes decoding snapshot shards
+                        on start (default is 1)
+        --compress-threshold b
+                        compress string values of at least b bytes
+                        (compression is disabled by default)
+        --compress-codec c
+                        compression codec, zlib or lzma (default is zlib)
+        --spill-after s move values of keys not accessed for s seconds
+                        to the disk tier (disabled by default)
+        --spill-dir dir directory of the disk tier log (default is ./)
+        --cluster n     start n node processes on ports p, p+1, ..., p+n-1,
+                        each node owns an equal range of hash slots
+        --cluster-host h
+                        host announced to clients in redirects
+                        and CLUSTER SLOTS (default is 127.0.0.1)
+        --backend b     event loop, twisted or asyncio (default is twisted),
+                        INFO, SLOWLOG, LATENCY, CLIENT, DEBUG, BLPOP,
+                        BRPOP, BLMOVE, pub/sub and replication commands
+                        need twisted backend
+        --replicaof host:port
+                        start as a read-only replica of the server
+                        (replication needs twisted backend)
+        --repl-backlog-size b
+                        bytes of write commands kept for partial resync
+                        of replicas (default is 1048576)
+        --client-output-buffer-limit 'class hard soft seconds'
+                        disconnect clients of class normal, replica or pubsub
+                        when their output buffer is over hard limit or over
+                        soft limit for seconds, sizes take kb, mb and gb units,
+                        0 disables a limit (twisted backend, may be repeated)
+        --max-commands-per-turn n
+                        commands parsed per connection before other
+                        connections get their turn, 0 for no limit
+                        (twisted backend, default is 20)
+        --max-turn-time ms
+                        milliseconds of parsing per connection per turn
+                        (twisted backend, no limit by default)
+        --maxclients n  refuse connections over n clients, 0 for no limit
+                        (twisted backend, default is 10000)
+        --timeout s     close normal clients idle for s seconds, 0 to
+                        disable (twisted backend, default is 0)
+        --tcp-keepalive s
+                        send TCP keepalive probes after s seconds
+                        of silence, 0 to disable (twisted backend,
+                        default is 300)
+        --slowlog-log-slower-than us
+                        log commands executed for at least us microseconds,
+                        0 logs every command, negative disables the log
+                        (twisted backend, default is 10000)
+        --slowlog-max-len n
+                        entries kept in the slow log (default is 128)
+        --metrics-port p
+                        serve metrics in Prometheus format at
+                        http://host:p/metrics (twisted backend,
+                        disabled by default)
+        --latency-monitor-threshold ms
+                        record event loop stalls of at least ms
+                        milliseconds for LATENCY LATEST and HISTORY,
+                        0 disables the monitor (twisted backend,
+                        default is 100)
+        --profile-dir dir
+                        directory of profiles written by DEBUG PROFILE
+                        (twisted backend, default is the current one)
     '''
 
+BACKENDS = ('twisted', 'asyncio')
+
+
+def run_cluster(size):
+    """
+    Start cluster node processes with the same options
+    and wait for them to finish. SIGINT and SIGTERM
+    are passed to the nodes.
+    :param size: number of nodes
+    :return:
+    """
+    nodes = [subprocess.Popen([sys.executable] + sys.argv + ['--cluster-node', str(node)])
+             for node in range(size)]
+
+    def stop_nodes(signal_recieved, frame):
+        for node in nodes:
+            node.send_signal(signal_recieved)
+
+    signal(SIGINT, stop_nodes)
+    signal(SIGTERM, stop_nodes)
+    for node in nodes:
+        node.wait()
+
+
+def remove_stale_socket(path):
+    """
+    Remove unix socket left by a previous server
+    :param path:
+    :return:
+    """
+    try:
+        mode = os.stat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        sys.exit(f'{path} exists and is not a socket')
+    os.unlink(path)
+
+
+def raise_open_files_limit(max_clients):
+    """
+    Raise the soft limit of open files to fit max_clients
+    connections and files of the server itself
+    :param max_clients:
+    :return: the number of clients fitting the limit
+    """
+    # listening sockets, snapshot and disk tier files, replication links
+    reserved = 32
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    needed = max_clients + reserved
+    if soft == resource.RLIM_INFINITY or soft >= needed:
+        return max_clients
+    if hard == resource.RLIM_INFINITY or hard >= needed:
+        soft = needed
+    else:
+        soft = hard
+    try:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+    except (ValueError, OSError) as err:
+        print(f"Can't raise open files limit: {err}")
+        soft = resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+    return max(soft - reserved, 1)
+
+
+def save_storage(storage):
+    """
+    Save storage keys and remove the disk tier on shutdown
+    :param storage:
+    :return:
+    """
+    try:
+        storage.save()
+    except StorageFileError as err:
+        print(err)
+        print('Keys are not saved')
+    if storage.disk_tier is not None:
+        storage.disk_tier.close()
+
+
 if __name__ == '__main__':
     print('Server starting...')
     port = 6379
     save_dest = './'
+    shards = 1
+    load_workers = 1
+    compress_threshold = None
+    compress_codec = 'zlib'
+    spill_after = None
+    spill_dir = './'
+    cluster_size = None
+    cluster_host = '127.0.0.1'
+    cluster_node = None
+    backend = 'twisted'
+    replicaof = None
+    backlog_size = 1 << 20
+    output_limits = {}
+    max_commands = 20
+    unixsocket = None
+    unixsocketperm = 0o700
+    max_turn_time = None
+    max_clients = 10000
+    timeout = 0
+    tcp_keepalive = 300
+    slowlog_threshold = 10000
+    slowlog_max_len = 128
+    metrics_port = None
+    latency_threshold = 100
+    profile_dir = '.'
 
     # Reading options
     try:
-        opts, args = getopt.getopt(sys.argv[1:], 'h', ['port=', 'save=', 'help'])
+        opts, args = getopt.getopt(sys.argv[1:], 'h', ['port=', 'save=', 'shards=', 'load-workers=',
+                                                      'compress-threshold=', 'compress-codec=',
+                                                      'spill-after=', 'spill-dir=', 'cluster=',
+                                                      'cluster-host=', 'cluster-node=', 'backend=', 'replicaof=',
+                                                      'repl-backlog-size=', 'client-output-buffer-limit=',
+                                                      'max-commands-per-turn=', 'max-turn-time=', 'unixsocket=',
+                                                      'unixsocketperm=', 'maxclients=', 'timeout=',
+                                                      'tcp-keepalive=', 'slowlog-log-slower-than=',
+                                                      'slowlog-max-len=', 'metrics-port=',
+                                                      'latency-monitor-threshold=', 'profile-dir=', 'help'])
     except getopt.GetoptError as err:
         print('Usage: server [-h] [--port p] [--save dest]')
         sys.exit(err.msg)
@@ -40,28 +239,183 @@ if __name__ == '__main__':
         if opt == '--save':
             save_dest = arg + '/'
             print('Saving to', save_dest)
+        if opt == '--shards':
+            shards = int(arg)
+        if opt == '--load-workers':
+            load_workers = int(arg)
+        if opt == '--compress-threshold':
+            compress_threshold = int(arg)
+        if opt == '--compress-codec':
+            if arg not in CODECS:
+                sys.exit(f'Unknown compression codec {arg}')
+            compress_codec = arg
+        if opt == '--spill-after':
+            spill_after = float(arg)
+        if opt == '--spill-dir':
+            spill_dir = arg + '/'
+        if opt == '--cluster':
+            cluster_size = int(arg)
+        if opt == '--cluster-host':
+            cluster_host = arg
+        if opt == '--backend':
+            if arg not in BACKENDS:
+                sys.exit(f'Unknown backend {arg}')
+            backend = arg
+        if opt == '--replicaof':
+            host, _, replica_port = arg.rpartition(':')
+            replicaof = (host, int(replica_port))
+        if opt == '--repl-backlog-size':
+            backlog_size = int(arg)
+        if opt == '--client-output-buffer-limit':
+            try:
+                client_class, limit = parse_output_buffer_limit(arg)
+            except ValueError as err:
+                sys.exit(str(err))
+            output_limits[client_class] = limit
+        if opt == '--max-commands-per-turn':
+            max_commands = int(arg)
+        if opt == '--max-turn-time':
+            max_turn_time = float(arg) / 1000
+        if opt == '--unixsocket':
+            unixsocket = arg
+        if opt == '--unixsocketperm':
+            unixsocketperm = int(arg, 8)
+        if opt == '--maxclients':
+            max_clients = int(arg)
+        if opt == '--timeout':
+            timeout = float(arg)
+        if opt == '--tcp-keepalive':
+            tcp_keepalive = int(arg)
+        if opt == '--slowlog-log-slower-than':
+            slowlog_threshold = int(arg)
+        if opt == '--slowlog-max-len':
+            slowlog_max_len = int(arg)
+        if opt == '--metrics-port':
+            metrics_port = int(arg)
+        if opt == '--latency-monitor-threshold':
+            latency_threshold = float(arg)
+        if opt == '--profile-dir':
+            profile_dir = arg
+        # set for node processes started by run_cluster
+        if opt == '--cluster-node':
+            cluster_node = int(arg)
+
+    if replicaof is not None and backend != 'twisted':
+        sys.exit('Replication needs twisted backend')
+    if unixsocket is not None and cluster_size is not None:
+        sys.exit('Unix socket is not supported in cluster mode')
+    if not port and unixsocket is None:
+        sys.exit('Nothing to listen on: port is 0 and there is no unix socket')
+    if unixsocket is not None:
+        remove_stale_socket(unixsocket)
+
+    file_name = 'storage'
+    if cluster_size is not None:
+        if cluster_node is None:
+            print(f'Starting cluster of {cluster_size} nodes on ports {port}-{port + cluster_size - 1}')
+            run_cluster(cluster_size)
+            print('Bye')
+            sys.exit()
+        file_name = f'storage_node{cluster_node}'
+        port += cluster_node
+        print(f'Cluster node {cluster_node} on port {port}')
+
+    compressor = None
+    if compress_threshold is not None:
+        compressor = ValueCompressor(compress_codec, compress_threshold)
+        print(f'Compressing values of at least {compress_threshold} bytes with {compress_codec}')
+
+    disk_tier = None
+    if spill_after is not None:
+        try:
+            disk_tier = DiskTier(spill_dir + file_name + '_tier.log')
+        except StorageFileError as err:
+            print(err)
+            print('Starting without disk tier.')
+        else:
+            print(f'Moving values idle for {spill_after}s to {disk_tier.path}')
+
+    # storage timers run on the loop of the backend
+    clock = None
+    if backend == 'asyncio':
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        clock = AsyncioClock(loop)
 
     # Creating storage
     try:
-        storage = Storage(gc=True, file_prefix=save_dest+'storage')
+        storage = Storage(gc=True, file_prefix=save_dest+file_name,
+                          shards=shards, load_workers=load_workers, compressor=compressor,
+                          disk_tier=disk_tier, spill_after=spill_after, clock=clock)
     except StorageFileError as err:
         print(f"Error using save destination '{save_dest}': \n", str(err))
         print("Starting without disk saving/loading feature.")
-        storage = Storage(gc=True)
+        storage = Storage(gc=True, compressor=compressor,
+                          disk_tier=disk_tier, spill_after=spill_after, clock=clock)
+
+    if cluster_size is None:
+        command_parser = RedisCommandParser(storage=storage)
+    else:
+        layout = ClusterLayout.local(cluster_size, port - cluster_node, cluster_host)
+        command_parser = ClusterCommandParser(layout, cluster_node, storage=storage)
+
+    if backend == 'asyncio':
+        server = AsyncioServer(parser=command_parser, loop=loop)
+        if port:
+            loop.run_until_complete(server.start(port))
+        if unixsocket is not None:
+            loop.run_until_complete(server.startUnix(unixsocket, unixsocketperm))
+            print('Listening on', unixsocket)
+
+        def stop_loop():
+            server.stop()
+            save_storage(storage)
+            loop.stop()
+            print('Bye')
 
-    command_parser = RedisCommandParser(storage=storage)
+        loop.add_signal_handler(SIGINT, stop_loop)
+        loop.add_signal_handler(SIGTERM, stop_loop)
+        print('Server is up (asyncio)')
+        loop.run_forever()
+        sys.exit()
+
+    command_parser.replication = Replication(command_parser, backlog_size)
+    if replicaof is not None:
+        print(f'Replicating {replicaof[0]}:{replicaof[1]}')
+        command_parser.replication.replicaOf(*replicaof)
     factory = ServerProtocolFactory(parser=command_parser)
+    factory.output_limits.update(output_limits)
+    factory.scheduler = FairScheduler(max_commands, max_turn_time)
+    if max_clients:
+        fitting = raise_open_files_limit(max_clients)
+        if fitting < max_clients:
+            print(f'Open files limit allows {fitting} clients, maxclients is lowered from {max_clients}')
+        max_clients = fitting
+    factory.max_clients = max_clients
+    factory.tcp_keepalive = tcp_keepalive
+    factory.setIdleTimeout(timeout)
+    factory.stats.startSampling()
+    factory.slowlog = SlowLog(slowlog_threshold, slowlog_max_len)
+    if latency_threshold:
+        factory.loop_monitor = LoopMonitor(threshold=latency_threshold / 1000)
+        reactor.callWhenRunning(factory.loop_monitor.start)
+    factory.profiler.directory = profile_dir
 
-    listening_port = reactor.listenTCP(port, factory)
+    listening_ports = []
+    if port:
+        listening_ports.append(reactor.listenTCP(port, factory))
+    if unixsocket is not None:
+        listening_ports.append(reactor.listenUNIX(unixsocket, factory, mode=unixsocketperm))
+        print('Listening on', unixsocket)
+    if metrics_port is not None:
+        listening_ports.append(reactor.listenTCP(metrics_port, metrics_site(factory)))
+        print(f'Serving metrics on port {metrics_port}')
 
     # CTRL+C handling
     def sigint_handler(signal_recieved, frame):
-        listening_port.stopListening()
-        try:
-            factory.parser.storage.save()
-        except StorageFileError as err:
-            print(err)
-            print('Keys are not saved')
+        for listening_port in listening_ports:
+            listening_port.stopListening()
+        save_storage(factory.parser.storage)
         reactor.stop()
         print('Bye')
 
@@ -1,3 +1,7 @@
 __all__ = ['storage', 'redis_command_parser', 'server_protocol',
            'client_protocol', 'redis_protocol', 'redis_protocol_error', 'redis_data_parser',
-           'redis_data_parser', 'redis_protocol', 'redis_encoder','redis_pattern_matching']
+           'redis_data_parser', 'redis_protocol', 'redis_encoder','redis_pattern_matching',
+           'snapshot', 'bulk_loader', 'snapshot_analyzer', 'value_compression',
+           'disk_tier', 'cluster', 'asyncio_server', 'replication', 'redis_client', 'pubsub', 'list_waiters', 'client_tracking', 'fair_scheduler', 'lazy_free', 'timer_wheel', 'server_stats', 'slowlog',
+           'latency_histogram', 'metrics_http', 'loop_monitor',
+           'profiler', 'load_generator']
@@ -0,0 +1,231 @@
+"""
+asyncio backend of the server. Uses the same RedisDataParser,
+RedisCommandParser and reply encoding as the Twisted backend,
+only the event loop and transports are different.
+"""
+import asyncio
+import os
+from collections import deque
+from src.redis_data_parser import RedisDataParser
+from src.redis_protocol import parse_buffer
+from src.redis_command_parser import RedisCommandParser
+from src.server_protocol import ServerProtocol, encode_result
+from src.exceptions.redis_command_parser_exceptions import RedisCommandParserException, WrongCommand
+from src.exceptions.redis_data_parser_exceptions import RedisDataParserException
+
+# commands handled by connections of the twisted backend,
+# like INFO, CLIENT, SUBSCRIBE and blocking pops
+TWISTED_ONLY_COMMANDS = frozenset(name[len('_handle_'):] for name in dir(ServerProtocol)
+                                  if name.startswith('_handle_'))
+
+
+class AsyncioClock:
+    """
+    Gives asyncio loop the callLater method of twisted reactor,
+    so storage timers can run on the loop
+    """
+    def __init__(self, loop):
+        self.loop = loop
+
+    def callLater(self, delay, f, *args):
+        return self.loop.call_later(delay, f, *args)
+
+
+class AsyncioServerProtocol(asyncio.Protocol):
+    """
+    Redis protocol for asyncio transports. Replies to all commands
+    of one received chunk are written to the transport at once.
+    Reading is paused while the transport can't send replies.
+    """
+    def __init__(self, server):
+        self.server = server
+        self.transport = None
+        self._data_buffer = b''
+        # position of the first unparsed byte of the buffer
+        self._buffer_pos = 0
+        # replies are not drained, commands are not parsed
+        self.paused = False
+        # encoded replies waiting to be written
+        self._write_buffer = []
+        # replies waiting for a slow command before them,
+        # a reply is a list holding encoded data or None until it's ready
+        self._pending_replies = deque()
+        self._resetParser()
+
+    def _resetParser(self):
+        self._parser = RedisDataParser()
+        self._parser.getDeferred().addCallback(self._valueParsed)
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.server.proto_count += 1
+
+    def connection_lost(self, exc):
+        self.transport = None
+        self.server.proto_count -= 1
+
+    def data_received(self, data):
+        if self._buffer_pos:
+            self._data_buffer = self._data_buffer[self._buffer_pos:] + data
+            self._buffer_pos = 0
+        else:
+            self._data_buffer += data
+        self._parseBuffer()
+
+    def _parseBuffer(self):
+        """
+        Parse buffered commands like RedisProtocol does
+        and write their replies
+        :return:
+        """
+        data = self._data_buffer
+        try:
+            pos = parse_buffer(self._parser, data, self._buffer_pos, lambda: not self.paused)
+        except RedisDataParserException as err:
+            print(err)
+            pos = len(data)
+            self._resetParser()
+        if pos == len(data):
+            self._data_buffer = b''
+            self._buffer_pos = 0
+        else:
+            self._buffer_pos = pos
+        self._flush()
+
+    def pause_writing(self):
+        """
+        Called by the transport when its buffer is over the high-water mark,
+        stop reading and parsing commands
+        """
+        self.paused = True
+        if self.transport is not None:
+            self.transport.pause_reading()
+
+    def resume_writing(self):
+        """
+        Called by the transport when its buffer is drained
+        """
+        self.paused = False
+        if self.transport is not None:
+            self.transport.resume_reading()
+            self._parseBuffer()
+
+    def _valueParsed(self, value):
+        self._parser.getDeferred().addCallback(self._valueParsed)
+        slow = None
+        try:
+            if value and isinstance(value[0], str) and value[0].lower() in TWISTED_ONLY_COMMANDS:
+                raise WrongCommand(f'`{value[0].lower()}` command is supported only by twisted backend')
+            slow = self.server.parser.parse_slow(value)
+            if slow is None:
+                result = self.server.parser.parse(value)
+        except RedisCommandParserException as err:
+            result = err
+        if slow is None:
+            self._reply(encode_result(result))
+        else:
+            self._replyLater(slow)
+
+    def _reply(self, data: bytes):
+        """
+        Buffer reply or queue it after replies of slow commands
+        :param data: encoded reply
+        :return:
+        """
+        if self._pending_replies:
+            self._pending_replies.append([data])
+        else:
+            self._write_buffer.append(data)
+
+    def _replyLater(self, slow):
+        """
+        Run slow command in the executor of the loop, its reply and replies
+        of commands after it are sent when it's done.
+        :param slow: function returning result of the command
+        :return: future done when the reply is queued
+        """
+        reply = [None]
+        self._pending_replies.append(reply)
+        future = self.server.loop.run_in_executor(None, self._runSlow, slow)
+        future.add_done_callback(lambda done: self._slowDone(done.result(), reply))
+        return future
+
+    @staticmethod
+    def _runSlow(slow) -> bytes:
+        """
+        Called in a thread
+        :return: encoded result of the slow command
+        """
+        try:
+            result = slow()
+        # any failure must become a reply, or replies after it are never sent
+        except Exception as err:
+            result = err
+        return encode_result(result)
+
+    def _slowDone(self, data, reply):
+        reply[0] = data
+        while self._pending_replies and self._pending_replies[0][0] is not None:
+            self._write_buffer.append(self._pending_replies.popleft()[0])
+        self._flush()
+
+    def _flush(self):
+        if self._write_buffer:
+            if self.transport is not None:
+                self.transport.write(b''.join(self._write_buffer))
+            self._write_buffer.clear()
+
+
+class AsyncioServer:
+    """
+    Creates protocols for connections and holds objects they share,
+    analog of ServerProtocolFactory
+    """
+    protocol = AsyncioServerProtocol
+
+    def __init__(self, parser=None, loop=None):
+        """
+        :param parser: RedisCommandParser object or None, to create it automatically
+        :param loop: asyncio event loop, current loop by default
+        """
+        self.proto_count = 0
+        if parser is None:
+            parser = RedisCommandParser()
+        self.parser = parser
+        self.loop = loop or asyncio.get_event_loop()
+        self.server = None
+        self.unix_server = None
+
+    def buildProtocol(self):
+        return self.protocol(self)
+
+    async def start(self, port: int, host=None):
+        """
+        Start listening
+        :param port:
+        :param host: interface to listen on, all interfaces by default
+        :return: asyncio.Server
+        """
+        self.server = await self.loop.create_server(self.buildProtocol, host, port)
+        return self.server
+
+    async def startUnix(self, path: str, mode=0o700):
+        """
+        Start listening on unix socket
+        :param path: path of the socket
+        :param mode: permissions of the socket
+        :return: asyncio.Server
+        """
+        self.unix_server = await self.loop.create_unix_server(self.buildProtocol, path)
+        os.chmod(path, mode)
+        return self.unix_server
+
+    def stop(self):
+        """
+        Stop listening, connections stay open
+        :return:
+        """
+        if self.server is not None:
+            self.server.close()
+        if self.unix_server is not None:
+            self.unix_server.close()
@@ -0,0 +1,128 @@
+"""
+Functions for building storage snapshots directly
+from CSV or JSON lines input, without the server.
+Input records are streamed, so memory usage doesn't
+depend on the size of the input.
+"""
+import csv
+import json
+import time
+from src.snapshot import SnapshotWriter, DEFAULT_BATCH_SIZE
+from src.exceptions.bulk_loader_exceptions import *
+
+RECORD_FIELDS = ('key', 'type', 'value', 'ttl')
+
+
+def make_record(key, value_type, value, ttl=None, now=None) -> tuple:
+    """
+    Convert input fields to a storage record.
+    Values of lists and hashes may be given as JSON text.
+    :param key:
+    :param value_type: 'string', 'list' or 'hash'
+    :param value:
+    :param ttl: time to live in seconds, None or empty string for no ttl
+    :param now: moment the ttl is counted from, current time by default
+    :return: (key, value, moe)
+    :exception BulkLoaderRecordError: fields can't be converted
+    """
+    if key is None or key == '':
+        raise BulkLoaderRecordError('key is empty')
+    key = str(key)
+    value_type = str(value_type).lower()
+    if value_type in ('list', 'hash') and isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            raise BulkLoaderRecordError(f'{value_type} value of key `{key}` is not valid JSON')
+    if value_type == 'string':
+        if isinstance(value, (list, dict)) or value is None:
+            raise BulkLoaderRecordError(f'string value expected for key `{key}`')
+        value = str(value)
+    elif value_type == 'list':
+        if not isinstance(value, list):
+            raise BulkLoaderRecordError(f'list value expected for key `{key}`')
+        value = [str(item) for item in value]
+    elif value_type == 'hash':
+        if not isinstance(value, dict):
+            raise BulkLoaderRecordError(f'hash value expected for key `{key}`')
+        value = dict((str(field), str(val)) for field, val in value.items())
+    else:
+        raise BulkLoaderRecordError(f'unknown type `{value_type}` of key `{key}`')
+
+    moe = None
+    if ttl is not None and ttl != '':
+        try:
+            ttl = float(ttl)
+        except ValueError:
+            raise BulkLoaderRecordError(f'ttl of key `{key}` is not a number')
+        if now is None:
+            now = time.time()
+        moe = now + ttl
+    return key, value, moe
+
+
+def iter_csv_records(lines, now=None):
+    """
+    Iterate over records of CSV input with columns key, type, value, ttl.
+    Header row with these names is skipped, ttl column is optional.
+    :param lines: iterable of text lines
+    :param now: moment ttls are counted from
+    :return: generator of (key, value, moe)
+    :exception BulkLoaderRecordError: wrong row
+    """
+    for line_num, row in enumerate(csv.reader(lines), 1):
+        if not row:
+            continue
+        if line_num == 1 and tuple(field.lower() for field in row[:4]) == RECORD_FIELDS[:len(row)]:
+            continue
+        if len(row) not in (3, 4):
+            raise BulkLoaderRecordError(f'line {line_num}: expected 3 or 4 columns, found {len(row)}')
+        try:
+            yield make_record(*row, now=now)
+        except BulkLoaderRecordError as err:
+            raise BulkLoaderRecordError(f'line {line_num}: {err}')
+
+
+def iter_jsonl_records(lines, now=None):
+    """
+    Iterate over records of JSON lines input. Each line is
+    an object with 'key', 'type', 'value' and optional 'ttl'.
+    :param lines: iterable of text lines
+    :param now: moment ttls are counted from
+    :return: generator of (key, value, moe)
+    :exception BulkLoaderRecordError: wrong line
+    """
+    for line_num, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            obj = json.loads(line)
+        except ValueError:
+            raise BulkLoaderRecordError(f'line {line_num}: not valid JSON')
+        if not isinstance(obj, dict):
+            raise BulkLoaderRecordError(f'line {line_num}: JSON object expected')
+        try:
+            yield make_record(obj.get('key'), obj.get('type', 'string'), obj.get('value'),
+                              obj.get('ttl'), now=now)
+        except BulkLoaderRecordError as err:
+            raise BulkLoaderRecordError(f'line {line_num}: {err}')
+
+
+def build_snapshot(records, file_prefix: str, shards=1, batch_size=DEFAULT_BATCH_SIZE) -> int:
+    """
+    Write records to a snapshot which Storage loads on start.
+    If a key appears several times, all records are written, keeping
+    memory independent of the number of keys, the last record wins
+    when the snapshot is loaded.
+    :param records: iterable of (key, value, moe)
+    :param file_prefix: prefix of snapshot file names
+    :param shards: number of shard files
+    :param batch_size: number of records in one batch
+    :return: number of written records
+    :exception StorageFileError: can't write snapshot
+    :exception BulkLoaderRecordError: wrong input record, snapshot is not written
+    """
+    with SnapshotWriter(file_prefix, shards, batch_size) as writer:
+        for key, value, moe in records:
+            writer.add(key, value, moe)
+    return writer.records
@@ -1,8 +1,23 @@
 from src.redis_protocol import RedisProtocol
+from src.redis_encoder import RedisEncoder
+from src.redis_protocol_error import RedisProtocolError
 from twisted.internet.protocol import ClientFactory
+from twisted.internet.defer import Deferred
 from twisted.internet import reactor
-from src.exceptions.redis_data_parser_exceptions import RedisDataParserException
+from src.exceptions.redis_data_parser_exceptions import *
 import shlex
+import time
+
+
+def address_label(addr) -> str:
+    """
+    :param addr: IPv4Address or UNIXAddress of the server
+    :return: host:port or path of unix socket
+    """
+    if hasattr(addr, 'host'):
+        return f'{addr.host}:{addr.port}'
+    name = addr.name
+    return name.decode('utf-8') if isinstance(name, bytes) else name
 
 
 class ClientProtocol(RedisProtocol):
@@ -14,7 +29,7 @@ class ClientProtocol(RedisProtocol):
         Wait for user input, then encode it and send
         :return:
         """
-        s = input(f'{self.addr.host}:{self.addr.port}>')
+        s = input(f'{address_label(self.addr)}>')
         if s.lower() == 'exit':
             self.factory.exit = True
             self.transport.loseConnection()
@@ -39,14 +54,7 @@ class ClientProtocol(RedisProtocol):
             self.transport.loseConnection()
 
     def encodeCommand(self, command:str) -> bytes:
-        words = shlex.split(command, posix=True)
-        s = f'*{len(words)}\r\n'
-        data = s.encode('utf-8')
-        for word in words:
-            byteword = word.encode('utf-8')
-            data += b'$' + str(len(byteword)).encode('utf-8') + b'\r\n' +\
-                byteword + b'\r\n'
-        return data
+        return RedisEncoder.encodeArray(shlex.split(command, posix=True))
 
 
 class ClientProtocolFactory(ClientFactory):
@@ -69,3 +77,223 @@ class ClientProtocolFactory(ClientFactory):
         else:
             print(reason)
         reactor.stop()
+
+
+def resp_command_end(buffer: bytes, pos: int) -> int:
+    """
+    Find the end of RESP array of bulk strings without decoding it
+    :param buffer:
+    :param pos: position of the array in the buffer
+    :return: position after the array or -1 if it's not complete
+    :exception ParserFirstByteNotRecognized: data is not an array of bulk strings
+    :exception ParserValueError: wrong size of the array or a string
+    """
+    if buffer[pos] != ord('*'):
+        raise ParserFirstByteNotRecognized(f'command must be an array, first byte {buffer[pos]}')
+    eol = buffer.find(b'\r\n', pos)
+    if eol == -1:
+        return -1
+    try:
+        count = int(buffer[pos + 1:eol])
+    except ValueError:
+        raise ParserValueError(f"can't convert '{buffer[pos + 1:eol]}' to int")
+    pos = eol + 2
+    for _ in range(count):
+        if pos >= len(buffer):
+            return -1
+        if buffer[pos] != ord('$'):
+            raise ParserFirstByteNotRecognized(f'command arguments must be bulk strings, first byte {buffer[pos]}')
+        eol = buffer.find(b'\r\n', pos)
+        if eol == -1:
+            return -1
+        try:
+            pos = eol + 2 + int(buffer[pos + 1:eol]) + 2
+        except ValueError:
+            raise ParserValueError(f"can't convert '{buffer[pos + 1:eol]}' to int")
+        if pos > len(buffer):
+            return -1
+    return pos
+
+
+def resp_reply_end(buffer: bytes, pos: int) -> int:
+    """
+    Find the end of RESP value of any type without decoding it
+    :param buffer:
+    :param pos: position of the value in the buffer
+    :return: position after the value or -1 if it's not complete
+    :exception ParserFirstByteNotRecognized: unknown type of the value
+    :exception ParserValueError: wrong size of an array or a string
+    """
+    eol = buffer.find(b'\r\n', pos)
+    if eol == -1:
+        return -1
+    kind = buffer[pos]
+    # simple string, error, integer
+    if kind in b'+-:':
+        return eol + 2
+    if kind not in b'$*':
+        raise ParserFirstByteNotRecognized(f'unknown type of value, first byte {kind}')
+    try:
+        size = int(buffer[pos + 1:eol])
+    except ValueError:
+        raise ParserValueError(f"can't convert '{buffer[pos + 1:eol]}' to int")
+    pos = eol + 2
+    if kind == ord('$'):
+        # null bulk string has no data
+        if size >= 0:
+            pos += size + 2
+        return pos if pos <= len(buffer) else -1
+    for _ in range(size):
+        if pos >= len(buffer):
+            return -1
+        pos = resp_reply_end(buffer, pos)
+        if pos == -1:
+            return -1
+    return pos
+
+
+def iter_resp_commands(stream, chunk_size=1 << 16):
+    """
+    Split RESP stream into encoded commands
+    :param stream: binary file
+    :param chunk_size: bytes read at once
+    :return: generator of encoded commands
+    :exception RedisDataParserException: wrong data, see resp_command_end
+    """
+    buffer = b''
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        buffer += chunk
+        pos = 0
+        while pos < len(buffer):
+            end = resp_command_end(buffer, pos)
+            if end == -1:
+                break
+            yield buffer[pos:end]
+            pos = end
+        buffer = buffer[pos:]
+    if buffer:
+        raise ParserValueError('stream ends with incomplete command')
+
+
+def iter_text_commands(stream):
+    """
+    Encode commands given as lines of words, like in the interactive client
+    :param stream: binary file
+    :return: generator of encoded commands
+    """
+    for line in stream:
+        words = shlex.split(line.decode('utf-8'), posix=True)
+        if words:
+            yield RedisEncoder.encodeArray(words)
+
+
+def iter_pipe_commands(stream):
+    """
+    Encoded commands of RESP or text stream,
+    stream starting with '*' is RESP
+    :param stream: binary file supporting peek, like sys.stdin.buffer
+    :return: generator of encoded commands
+    """
+    if stream.peek(1)[:1] == b'*':
+        return iter_resp_commands(stream)
+    return iter_text_commands(stream)
+
+
+class PipeClientProtocol(RedisProtocol):
+    """
+    Sends commands keeping at most window of them waiting for replies,
+    counts replies and errors instead of printing them
+    """
+    def __init__(self, commands, window=1000):
+        """
+        :param commands: iterator of encoded commands
+        :param window: maximum number of commands waiting for replies
+        """
+        super().__init__()
+        self.commands = commands
+        self.window = window
+        self.sent = 0
+        self.replies = 0
+        self.errors = 0
+        self.first_error = None
+        self.elapsed = None
+        self._eof = False
+        self._start = None
+
+    def connectionMade(self):
+        self._start = time.perf_counter()
+        self._fill()
+
+    def _fill(self):
+        """
+        Send commands until the window is full
+        :return:
+        """
+        batch = []
+        in_flight = self.sent - self.replies
+        while not self._eof and in_flight + len(batch) < self.window:
+            try:
+                batch.append(next(self.commands))
+            except StopIteration:
+                self._eof = True
+            except RedisDataParserException as err:
+                print('Wrong input, sending stopped:', err)
+                self._eof = True
+        if batch:
+            self.sent += len(batch)
+            self.sendData(b''.join(batch))
+        elif self._eof and self.replies == self.sent:
+            self.elapsed = time.perf_counter() - self._start
+            self.transport.loseConnection()
+            self.factory.finished.callback(self)
+
+    def _valueParsed(self, value):
+        super()._valueParsed(value)
+        self.replies += 1
+        if type(value) is RedisProtocolError:
+            self.errors += 1
+            if self.first_error is None:
+                self.first_error = str(value)
+        # refill when half of the window is free, so writes are not too small
+        if self.sent - self.replies <= self.window // 2:
+            self._fill()
+
+    def report(self) -> str:
+        """
+        :return: summary of the run
+        """
+        rate = self.sent / self.elapsed if self.elapsed else 0
+        msg = f'{self.sent} commands, {self.replies} replies, {self.errors} errors, ' \
+              f'{self.elapsed:.2f}s, {rate:.0f} commands/s'
+        if self.first_error is not None:
+            msg += f'\nfirst error: {self.first_error}'
+        return msg
+
+
+class PipeClientFactory(ClientFactory):
+    protocol = PipeClientProtocol
+
+    def __init__(self, commands, window=1000):
+        """
+        :param commands: iterator of encoded commands
+        :param window: maximum number of commands waiting for replies
+        """
+        self.commands = commands
+        self.window = window
+        # fires with the protocol when all replies are received
+        self.finished = Deferred()
+
+    def buildProtocol(self, addr):
+        prot = self.protocol(self.commands, self.window)
+        prot.factory = self
+        return prot
+
+    def clientConnectionFailed(self, connector, reason):
+        self.finished.errback(reason)
+
+    def clientConnectionLost(self, connector, reason):
+        if not self.finished.called:
+            self.finished.errback(reason)
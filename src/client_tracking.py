@@ -0,0 +1,174 @@
+"""
+Server-assisted client side caching. The server remembers keys
+read by tracking connections and sends invalidation messages when
+the keys are changed, deleted or expire. In broadcasting mode
+the server remembers nothing and sends invalidations for all keys
+with subscribed prefixes, batched once per reactor turn.
+Invalidations are pub/sub messages of INVALIDATE_CHANNEL sent
+to the redirect connection of a tracking connection, the message
+with null instead of keys invalidates all keys after FLUSHALL.
+"""
+from twisted.internet import reactor
+from src.redis_encoder import RedisEncoder
+
+INVALIDATE_CHANNEL = '__redis__:invalidate'
+
+
+class TrackingClient:
+    """
+    Tracking options of a connection
+    """
+    def __init__(self, redirect: int, bcast=False, prefixes=()):
+        """
+        :param redirect: id of the connection getting invalidation messages
+        :param bcast: broadcasting mode
+        :param prefixes: key prefixes in broadcasting mode
+        """
+        self.redirect = redirect
+        self.bcast = bcast
+        self.prefixes = list(prefixes)
+
+
+class ClientTracking:
+    """
+    Tracking table of keys read by connections
+    """
+    def __init__(self, storage, clients: dict, clock=None, max_keys=1000000):
+        """
+        :param storage: Storage object, its changes are listened to while
+            there are tracking connections
+        :param clients: dict of connections by their ids
+        :param clock: reactor, the global one by default
+        :param max_keys: maximum number of keys in the tracking table,
+            the oldest keys are invalidated when it's exceeded
+        """
+        self.storage = storage
+        self.connections = clients
+        self.clock = clock or reactor
+        self.max_keys = max_keys
+        # client id: TrackingClient
+        self.clients = {}
+        # key: set of ids of connections that read it
+        self.table = {}
+        # prefix: set of ids of connections in broadcasting mode
+        self.prefixes = {}
+        # client id: dict of keys waiting to be sent in broadcasting mode
+        self._pending = {}
+        self._flush_call = None
+        # number of sent invalidation messages
+        self.invalidations = 0
+
+    def enable(self, client_id: int, redirect: int, bcast=False, prefixes=()):
+        """
+        Turn tracking on for the connection, previous options are replaced
+        :param client_id:
+        :param redirect: id of the connection getting invalidation messages
+        :param bcast: broadcasting mode
+        :param prefixes: key prefixes in broadcasting mode, all keys if empty
+        :return:
+        """
+        self.disable(client_id)
+        if bcast and not prefixes:
+            prefixes = ('',)
+        client = TrackingClient(redirect, bcast, prefixes)
+        self.clients[client_id] = client
+        for prefix in client.prefixes:
+            self.prefixes.setdefault(prefix, set()).add(client_id)
+        self.storage.change_listener = self.keyChanged
+
+    def disable(self, client_id: int):
+        """
+        Turn tracking off for the connection
+        :param client_id:
+        :return:
+        """
+        client = self.clients.pop(client_id, None)
+        if client is None:
+            return
+        for prefix in client.prefixes:
+            ids = self.prefixes[prefix]
+            ids.discard(client_id)
+            if not ids:
+                del self.prefixes[prefix]
+        self._pending.pop(client_id, None)
+        # ids of the connection left in the table are skipped when keys change
+        if not self.clients:
+            self.table.clear()
+            self.storage.change_listener = None
+
+    def track(self, client_id: int, keys: list):
+        """
+        Remember keys read by the connection, nothing is remembered
+        in broadcasting mode
+        :param client_id:
+        :param keys:
+        :return:
+        """
+        client = self.clients.get(client_id)
+        if client is None or client.bcast:
+            return
+        for key in keys:
+            ids = self.table.get(key)
+            if ids is None:
+                self.table[key] = {client_id}
+            else:
+                ids.add(client_id)
+        while len(self.table) > self.max_keys:
+            self.keyChanged(next(iter(self.table)))
+
+    def keyChanged(self, key):
+        """
+        Storage listener, called when the key is changed or removed
+        :param key: None when all keys are flushed
+        :return:
+        """
+        if key is None:
+            self.flushed()
+            return
+        ids = self.table.pop(key, None)
+        if ids:
+            for client_id in ids:
+                client = self.clients.get(client_id)
+                if client is not None and not client.bcast:
+                    self._send(client, [key])
+        if self.prefixes:
+            for prefix, ids in self.prefixes.items():
+                if key.startswith(prefix):
+                    for client_id in ids:
+                        self._pending.setdefault(client_id, {})[key] = None
+            if self._pending and self._flush_call is None:
+                self._flush_call = self.clock.callLater(0, self._flush)
+
+    def flushed(self):
+        """
+        Invalidate all keys of every tracking connection with one message
+        :return:
+        """
+        self.table.clear()
+        self._pending.clear()
+        for client in self.clients.values():
+            self._send(client, None)
+
+    def _flush(self):
+        """
+        Send keys collected in broadcasting mode, one message per connection
+        """
+        self._flush_call = None
+        pending = self._pending
+        self._pending = {}
+        for client_id, keys in pending.items():
+            client = self.clients.get(client_id)
+            if client is not None:
+                self._send(client, list(keys))
+
+    def _send(self, client: TrackingClient, keys):
+        """
+        Write invalidation message to the redirect connection,
+        it is dropped if the connection is closed
+        :param client:
+        :param keys: list of keys or None for all keys
+        """
+        target = self.connections.get(client.redirect)
+        if target is not None:
+            target.sendData(RedisEncoder.encodeArray(['message', INVALIDATE_CHANNEL, keys]))
+            self.invalidations += 1
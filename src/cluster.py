@@ -0,0 +1,169 @@
+"""
+Cluster mode: keyspace is split into hash slots, every node
+of the cluster owns a contiguous range of slots and redirects
+commands for other slots with MOVED errors.
+"""
+import binascii
+import hashlib
+from src.redis_command_parser import RedisCommandParser, CommandParserSuccess
+from src.exceptions.redis_command_parser_exceptions import *
+
+CLUSTER_SLOTS = 16384
+
+
+def crc16(data: bytes) -> int:
+    """
+    CRC16-CCITT (XMODEM), the checksum Redis cluster uses for keys
+    :param data:
+    :return:
+    """
+    return binascii.crc_hqx(data, 0)
+
+
+def key_hash_slot(key: str) -> int:
+    """
+    Hash slot of a key. If key contains non-empty hash tag {...},
+    only the tag is hashed, so related keys can be put in one slot.
+    :param key:
+    :return: slot from 0 to CLUSTER_SLOTS - 1
+    """
+    data = str(key).encode('utf-8')
+    start = data.find(b'{')
+    if start != -1:
+        end = data.find(b'}', start + 1)
+        if end > start + 1:
+            data = data[start + 1:end]
+    return crc16(data) % CLUSTER_SLOTS
+
+
+class ClusterLayout:
+    """
+    Assignment of hash slots to cluster nodes. Slots are split
+    into equal contiguous ranges, one range per node.
+    """
+    def __init__(self, nodes: list):
+        """
+        :param nodes: list of (host, port) of cluster nodes
+        """
+        if not 0 < len(nodes) <= CLUSTER_SLOTS:
+            raise ValueError(f'cluster must have from 1 to {CLUSTER_SLOTS} nodes')
+        self.nodes = list(nodes)
+        self.node_ids = [hashlib.sha1(f'{host}:{port}'.encode('utf-8')).hexdigest()
+                         for host, port in self.nodes]
+        self.ranges = []
+        self._slot_nodes = bytearray(CLUSTER_SLOTS) if len(nodes) <= 256 else [0] * CLUSTER_SLOTS
+        for node in range(len(nodes)):
+            start = node * CLUSTER_SLOTS // len(nodes)
+            end = (node + 1) * CLUSTER_SLOTS // len(nodes) - 1
+            self.ranges.append((start, end, node))
+            for slot in range(start, end + 1):
+                self._slot_nodes[slot] = node
+
+    @classmethod
+    def local(cls, size: int, base_port: int, host='127.0.0.1'):
+        """
+        Layout of a cluster running on one host
+        :param size: number of nodes
+        :param base_port: port of the first node, others use next ports
+        :param host: host the nodes are announced at
+        :return:
+        """
+        return cls([(host, base_port + node) for node in range(size)])
+
+    def slot_node(self, slot: int) -> int:
+        """
+        :param slot:
+        :return: index of the node owning the slot
+        """
+        return self._slot_nodes[slot]
+
+    def key_node(self, key) -> int:
+        """
+        :param key:
+        :return: index of the node owning the key
+        """
+        return self._slot_nodes[key_hash_slot(key)]
+
+    def slots_reply(self) -> list:
+        """
+        Layout in CLUSTER SLOTS reply format
+        :return: list of [start, end, [host, port, id]]
+        """
+        return [[start, end, [self.nodes[node][0], self.nodes[node][1], self.node_ids[node]]]
+                for start, end, node in self.ranges]
+
+
+class ClusterCommandParser(RedisCommandParser):
+    """
+    Command parser of one cluster node. Executes commands
+    for keys of own slots, redirects the rest.
+    """
+    def __init__(self, layout: ClusterLayout, node: int, storage=None):
+        """
+        :param layout: ClusterLayout of the cluster
+        :param node: index of this node in the layout
+        :param storage: Storage object or None for creating it automatically
+        """
+        super().__init__(storage=storage)
+        self.layout = layout
+        self.node = node
+
+    def parse(self, args: list):
+        """
+        Check that keys of the command belong to this node, then parse it.
+        :exception CommandMoved: keys belong to another node
+        :exception CommandCrossSlot: keys belong to different slots
+        """
+        self.check_keys(args)
+        return super().parse(args)
+
+    def check_keys(self, args: list):
+        """
+        Check that keys of the command belong to one slot of this node
+        :param args: command with arguments
+        :return:
+        :exception CommandMoved: keys belong to another node
+        :exception CommandCrossSlot: keys belong to different slots
+        """
+        keys = self.command_keys(args)
+        if keys:
+            slot = key_hash_slot(keys[0])
+            for key in keys[1:]:
+                if key_hash_slot(key) != slot:
+                    raise CommandCrossSlot()
+            node = self.layout.slot_node(slot)
+            if node != self.node:
+                host, port = self.layout.nodes[node]
+                raise CommandMoved(slot, host, port)
+
+    def _parse_cluster(self, args):
+        """
+        Cluster information commands.
+        Usage: CLUSTER SLOTS | CLUSTER KEYSLOT key | CLUSTER MYID
+        :param args:
+        :return: slot ranges with their nodes for SLOTS, slot of the key for KEYSLOT,
+            id of this node for MYID
+        :exception CommandWrongArgumentNumber: wrong number of arguments for a subcommand
+        :exception CommandSyntaxError: unknown subcommand
+        """
+        if not args:
+            raise CommandWrongArgumentNumber('`cluster` command needs a subcommand')
+        subcommand = args[0].lower()
+        if subcommand == 'slots':
+            return self.layout.slots_reply()
+        elif subcommand == 'keyslot':
+            if len(args) != 2:
+                raise CommandWrongArgumentNumber(f'`cluster keyslot` needs 1 argument, found {len(args) - 1}')
+            return key_hash_slot(args[1])
+        elif subcommand == 'myid':
+            return self.layout.node_ids[self.node]
+        raise CommandSyntaxError(f'unknown `cluster` subcommand `{subcommand}`')
+
+    def _parse_asking(self, args):
+        """
+        Accepted for compatibility with cluster clients. Slots never
+        migrate between nodes, so ASK redirects are not issued.
+        Usage: ASKING
+        :return: CommandParserSuccess
+        """
+        return CommandParserSuccess
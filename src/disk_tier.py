@@ -0,0 +1,169 @@
+"""
+Disk tier for values of keys that were not accessed for a long time.
+Values are appended to a log file, only the key and the position of its
+record stay in memory. The log is not persistent, snapshots are still
+written by Storage.save. Records are read with positional reads, so a
+background save can read them from another thread.
+"""
+import os
+import pickle
+import threading
+from src.exceptions.storage_exceptions import StorageFileError
+
+# Object kept in Storage instead of a value moved to the disk tier
+Spilled = object()
+
+
+class DiskTier:
+    """
+    Append-only log of pickled values with in-memory offset index
+    """
+    def __init__(self, path: str, compact_ratio=0.5, compact_min_bytes=1 << 20):
+        """
+        :param path: path to the log file, it's truncated on start
+        :param compact_ratio: rewrite the log when this share of it is dead records
+        :param compact_min_bytes: don't rewrite logs smaller than this
+        :exception StorageFileError: can't create the log file
+        """
+        self.path = path
+        self.compact_ratio = compact_ratio
+        self.compact_min_bytes = compact_min_bytes
+        self._index = {}
+        self._size = 0
+        self.dead_bytes = 0
+        # number of index views in use, log is not compacted while there are any,
+        # views are released by saving threads
+        self._views = 0
+        self._views_lock = threading.Lock()
+        try:
+            self._file = open(path, 'w+b', buffering=0)
+        except OSError:
+            raise StorageFileError(f"can't create disk tier log {path}")
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    @property
+    def size(self) -> int:
+        """
+        :return: size of the log file in bytes
+        """
+        return self._size
+
+    def put(self, key, value):
+        """
+        Append value of the key to the log
+        :param key:
+        :param value:
+        :return:
+        :exception StorageFileError: can't write to the log
+        """
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        try:
+            os.pwrite(self._file.fileno(), data, self._size)
+        except OSError:
+            raise StorageFileError(f"can't write to disk tier log {self.path}")
+        self.discard(key)
+        self._index[key] = (self._size, len(data))
+        self._size += len(data)
+
+    def get(self, key):
+        """
+        Read value of the key from the log
+        :param key:
+        :return: value
+        :exception KeyError: key is not in the tier
+        :exception StorageFileError: can't read the log
+        """
+        return self.read_record(self._index[key])
+
+    def read_record(self, record: tuple):
+        """
+        Read value at the position in the log
+        :param record: (offset, length)
+        :return: value
+        :exception StorageFileError: can't read the log
+        """
+        offset, length = record
+        try:
+            return pickle.loads(os.pread(self._file.fileno(), length, offset))
+        except (OSError, EOFError, pickle.UnpicklingError):
+            raise StorageFileError(f"can't read record at {offset} from disk tier log {self.path}")
+
+    def index_view(self) -> dict:
+        """
+        Copy of the index. Records it points to stay valid
+        until release_view is called.
+        :return: dict of key: (offset, length)
+        """
+        with self._views_lock:
+            self._views += 1
+        return dict(self._index)
+
+    def release_view(self):
+        with self._views_lock:
+            self._views -= 1
+
+    def pop(self, key):
+        """
+        Read value of the key and remove the key from the tier
+        :param key:
+        :return: value
+        :exception KeyError: key is not in the tier
+        """
+        value = self.get(key)
+        self.discard(key)
+        return value
+
+    def discard(self, key):
+        """
+        Remove the key from the tier if it's there.
+        Log is compacted when there are too many dead records.
+        :param key:
+        :return:
+        """
+        record = self._index.pop(key, None)
+        if record is not None:
+            self.dead_bytes += record[1]
+            if self.dead_bytes >= self.compact_min_bytes and self.dead_bytes >= self._size * self.compact_ratio:
+                with self._views_lock:
+                    if not self._views:
+                        self.compact()
+
+    def compact(self):
+        """
+        Rewrite the log keeping only live records
+        :return:
+        :exception StorageFileError: can't write new log
+        """
+        tmp_path = self.path + '.tmp'
+        index = {}
+        size = 0
+        try:
+            with open(tmp_path, 'wb') as new_file:
+                for key, (offset, length) in self._index.items():
+                    new_file.write(os.pread(self._file.fileno(), length, offset))
+                    index[key] = (size, length)
+                    size += length
+            self._file.close()
+            os.replace(tmp_path, self.path)
+            self._file = open(self.path, 'r+b', buffering=0)
+        except OSError:
+            raise StorageFileError(f"can't compact disk tier log {self.path}")
+        self._index = index
+        self._size = size
+        self.dead_bytes = 0
+
+    def close(self):
+        """
+        Close and remove the log
+        :return:
+        """
+        self._file.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
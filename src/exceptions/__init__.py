@@ -1,2 +1,3 @@
 __all__ = ['redis_command_parser_exceptions', 'redis_data_parser_exceptions',
-           'server_protocol_exceptions', 'storage_exceptions','redis_encoder_exceptions']
+           'server_protocol_exceptions', 'storage_exceptions','redis_encoder_exceptions',
+           'bulk_loader_exceptions', 'redis_client_exceptions']
@@ -0,0 +1,17 @@
+class BulkLoaderException(Exception):
+    """
+    Basic bulk loader exception
+    """
+    pass
+
+
+class BulkLoaderRecordError(BulkLoaderException):
+    """
+    Input record can't be converted to a storage value
+    """
+    def __init__(self, msg=None):
+        if msg is None:
+            msg = 'Wrong record'
+        else:
+            msg = 'Wrong record: ' + msg
+        super().__init__(msg)
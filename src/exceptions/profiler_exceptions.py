@@ -0,0 +1,17 @@
+class ProfilerException(Exception):
+    """
+    Basic Profiler class exception
+    """
+    pass
+
+
+class ProfilerStateError(ProfilerException):
+    """
+    Profiler is started twice or stopped when not running
+    """
+    def __init__(self, msg=None):
+        if msg is None:
+            msg = 'Wrong profiler state'
+        else:
+            msg = 'Wrong profiler state: ' + msg
+        super().__init__(msg)
@@ -0,0 +1,37 @@
+class RedisClientException(Exception):
+    """
+    Basic RedisClient exception
+    """
+    pass
+
+
+class RedisReplyError(RedisClientException):
+    """
+    Server replied with an error
+    """
+    def __init__(self, msg=None):
+        if msg is None:
+            msg = 'Error reply'
+        super().__init__(msg)
+
+
+class RedisConnectionLost(RedisClientException):
+    """
+    Connection was lost before the reply came
+    """
+    def __init__(self, msg=None):
+        if msg is None:
+            msg = 'Connection lost'
+        else:
+            msg = 'Connection lost: ' + msg
+        super().__init__(msg)
+
+
+class RedisPoolClosed(RedisClientException):
+    """
+    Command was sent to a closed connection pool
+    """
+    def __init__(self, msg=None):
+        if msg is None:
+            msg = 'Connection pool is closed'
+        super().__init__(msg)
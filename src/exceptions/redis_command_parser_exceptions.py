@@ -75,3 +75,57 @@ class CommandOutOfRange(RedisCommandParserException):
         else:
             msg = 'Out of range: ' + msg
         super().__init__(msg)
+
+
+class CommandStorageError(RedisCommandParserException):
+    """
+    Storage failed to read or write a file, e.g. the disk tier log
+    """
+    def __init__(self, msg=None):
+        if msg is None:
+            msg = 'Storage error'
+        else:
+            msg = 'Storage error: ' + msg
+        super().__init__(msg)
+
+
+class CommandMoved(RedisCommandParserException):
+    """
+    Key belongs to a hash slot served by another cluster node.
+    Message follows Redis format, so cluster clients can follow the redirect
+    """
+    def __init__(self, slot: int, host: str, port: int):
+        self.slot = slot
+        self.host = host
+        self.port = port
+        super().__init__(f'MOVED {slot} {host}:{port}')
+
+
+class CommandCrossSlot(RedisCommandParserException):
+    """
+    Keys of one command belong to different hash slots
+    """
+    def __init__(self, msg=None):
+        if msg is None:
+            msg = "CROSSSLOT Keys in request don't hash to the same slot"
+        super().__init__(msg)
+
+
+class CommandReadOnly(RedisCommandParserException):
+    """
+    Write command sent to a read-only replica
+    """
+    def __init__(self, msg=None):
+        if msg is None:
+            msg = "READONLY You can't write against a read only replica."
+        super().__init__(msg)
+
+
+class CommandLoading(RedisCommandParserException):
+    """
+    Server is loading keys and can't serve the command yet
+    """
+    def __init__(self, msg=None):
+        if msg is None:
+            msg = 'LOADING Server is loading the dataset from its primary'
+        super().__init__(msg)
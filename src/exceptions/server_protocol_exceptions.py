@@ -3,4 +3,12 @@ class BaseServerException(Exception):
 
 
 class UnidentifiedParserResult(BaseServerException):
-    pass
\ No newline at end of file
+    pass
+
+
+class MaxClientsReached(BaseServerException):
+    """
+    Connection refused because of the maxclients limit
+    """
+    def __init__(self):
+        super().__init__('ERR max number of clients reached')
@@ -0,0 +1,98 @@
+"""
+Fair scheduling of connections. A connection parses at most
+max_commands commands or for at most max_time seconds per reactor
+turn, the rest of its buffer waits for the next turn in round-robin
+order, so one pipelining client can't starve the others.
+"""
+import time
+from collections import deque
+from twisted.internet import reactor
+
+
+class FairScheduler:
+    """
+    Round-robin queue of connections with buffered commands
+    left from their previous turn
+    """
+    def __init__(self, max_commands=20, max_time=None, clock=None):
+        """
+        :param max_commands: commands per connection per turn, 0 or None for no limit
+        :param max_time: seconds of parsing per connection per turn, None for no limit
+        :param clock: reactor, the global one by default
+        """
+        self.max_commands = max_commands
+        self.max_time = max_time
+        self.clock = clock or reactor
+        self._queue = deque()
+        self._call = None
+        # times connections yielded with commands left
+        self.deferrals = 0
+        # turns run by the scheduler
+        self.turns = 0
+        # the longest queue of waiting connections
+        self.max_queue = 0
+        # seconds connections waited for their next turn
+        self.wait_total = 0
+        self.wait_max = 0
+
+    def turnStarted(self):
+        """
+        :return: moment of the start of a turn for overBudget
+        """
+        return time.perf_counter() if self.max_time else None
+
+    def overBudget(self, commands: int, started) -> bool:
+        """
+        :param commands: number of commands parsed in the turn
+        :param started: value returned by turnStarted
+        :return: True if the connection has to yield, at least
+            one command is parsed per turn
+        """
+        if not commands:
+            return False
+        if self.max_commands and commands >= self.max_commands:
+            return True
+        return bool(self.max_time) and time.perf_counter() - started >= self.max_time
+
+    def defer(self, connection):
+        """
+        Queue the connection for the next turn, its continueParsing
+        method is called then
+        :param connection:
+        :return:
+        """
+        connection.deferred_at = time.perf_counter()
+        self._queue.append(connection)
+        self.deferrals += 1
+        if len(self._queue) > self.max_queue:
+            self.max_queue = len(self._queue)
+        if self._call is None:
+            self._call = self.clock.callLater(0, self._run)
+
+    def _run(self):
+        """
+        Give a turn to every queued connection, connections
+        yielding again are queued for the next turn
+        """
+        self._call = None
+        self.turns += 1
+        queue = self._queue
+        self._queue = deque()
+        now = time.perf_counter()
+        for connection in queue:
+            wait = now - connection.deferred_at
+            self.wait_total += wait
+            if wait > self.wait_max:
+                self.wait_max = wait
+            connection.continueParsing()
+
+    def __len__(self):
+        """
+        :return: number of connections waiting for their turn
+        """
+        return len(self._queue)
+
+    def stats(self) -> dict:
+        return {'deferrals': self.deferrals, 'turns': self.turns, 'waiting': len(self._queue),
+                'max_queue': self.max_queue, 'wait_max_ms': round(self.wait_max * 1000, 3),
+                'wait_avg_ms': round(self.wait_total / self.deferrals * 1000, 3) if self.deferrals else 0}
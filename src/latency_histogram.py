@@ -0,0 +1,110 @@
+"""
+Per command latency histograms with log-scaled buckets, like
+HdrHistogram: every power of two of microseconds is split into
+16 linear sub-buckets, so a bucket is at most 1/16 of its value wide
+and a histogram takes constant memory whatever it records.
+"""
+
+SUB_BITS = 4
+SUB_BUCKETS = 1 << SUB_BITS
+# values of more microseconds (about 9 days) get to the last bucket
+MAX_BITS = 40
+MAX_VALUE = (1 << MAX_BITS) - 1
+
+
+def bucket_index(value: int) -> int:
+    """
+    :param value: microseconds
+    :return: index of the bucket holding the value
+    """
+    if value < 2 * SUB_BUCKETS:
+        return value
+    shift = value.bit_length() - SUB_BITS - 1
+    return (shift << SUB_BITS) + (value >> shift)
+
+
+def bucket_bounds(index: int) -> tuple:
+    """
+    :param index: index of a bucket
+    :return: the lowest and the highest value of the bucket
+    """
+    if index < 2 * SUB_BUCKETS:
+        return index, index
+    shift = (index >> SUB_BITS) - 1
+    mantissa = index - (shift << SUB_BITS)
+    return mantissa << shift, ((mantissa + 1) << shift) - 1
+
+
+BUCKETS = bucket_index(MAX_VALUE) + 1
+
+
+class LatencyHistogram:
+    """
+    Counts of latencies in log-scaled buckets
+    """
+    def __init__(self):
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        # sum of recorded microseconds
+        self.total = 0
+
+    def record(self, value: int):
+        """
+        :param value: microseconds
+        :return:
+        """
+        if value > MAX_VALUE:
+            value = MAX_VALUE
+        self.counts[bucket_index(value)] += 1
+        self.count += 1
+        self.total += value
+
+    def percentile(self, p: float) -> int:
+        """
+        :param p: percentile from 0 to 100
+        :return: upper bound of the bucket holding the percentile, microseconds
+        """
+        if not self.count:
+            return 0
+        rank = max(self.count * p / 100, 1)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return bucket_bounds(index)[1]
+        return MAX_VALUE
+
+    def cumulative(self) -> list:
+        """
+        :return: list of (upper bound of a bucket, number of values up to it)
+            for buckets holding values
+        """
+        result = []
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count:
+                seen += count
+                result.append((bucket_bounds(index)[1], seen))
+        return result
+
+
+class LatencyHistograms:
+    """
+    Histograms of commands by their names
+    """
+    def __init__(self):
+        self.commands = {}
+
+    def record(self, command: str, value: int):
+        """
+        :param command: lowercase name of a known command
+        :param value: microseconds
+        :return:
+        """
+        histogram = self.commands.get(command)
+        if histogram is None:
+            histogram = self.commands[command] = LatencyHistogram()
+        histogram.record(value)
+
+    def reset(self):
+        self.commands.clear()
@@ -0,0 +1,108 @@
+"""
+Lazy freeing of big values. Deallocating a list or hash of millions
+of elements takes the time of the event loop, a background thread
+doesn't help because deallocation holds the GIL. Detached values are
+freed in slices of a limited number of elements per reactor turn.
+"""
+import sys
+from collections import deque
+from twisted.internet import reactor
+
+# lists and hashes with more elements are freed lazily
+LAZY_FREE_THRESHOLD = 64
+
+
+def is_big(value) -> bool:
+    """
+    :param value:
+    :return: True if freeing the value is worth doing lazily
+    """
+    return type(value) in (list, dict) and len(value) > LAZY_FREE_THRESHOLD
+
+
+class LazyFreer:
+    """
+    Queue of detached values freed by slices
+    """
+    def __init__(self, clock=None, slice_size=10000):
+        """
+        :param clock: reactor, the global one by default
+        :param slice_size: elements freed per reactor turn
+        """
+        self.clock = clock or reactor
+        self.slice_size = slice_size
+        self._queue = deque()
+        self._call = None
+        # values handed over and elements left to free
+        self.freed_values = 0
+        self.pending_elements = 0
+        self.slices = 0
+
+    def free(self, value):
+        """
+        Free the value, big values are queued, small ones
+        are dropped at once. The value must not be used after the call.
+        :param value:
+        :return:
+        """
+        self.freed_values += 1
+        if not is_big(value):
+            return
+        self._queue.append(value)
+        self.pending_elements += len(value)
+        if self._call is None:
+            self._call = self.clock.callLater(0, self._run)
+
+    def freeAll(self, values):
+        """
+        Free values of a detached dict, e.g. the old keys dict after
+        FLUSHALL ASYNC. The dict itself is freed by slices too.
+        :param values: dict
+        :return:
+        """
+        self._queue.append(values)
+        self.pending_elements += len(values)
+        if self._call is None:
+            self._call = self.clock.callLater(0, self._run)
+
+    def _run(self):
+        """
+        Free a slice of elements
+        """
+        self._call = None
+        self.slices += 1
+        budget = self.slice_size
+        queue = self._queue
+        while queue and budget > 0:
+            value = queue[0]
+            # referenced elsewhere, e.g. by a snapshot written in a thread:
+            # the value must stay intact, the other holder frees it
+            if sys.getrefcount(value) > 3:
+                queue.popleft()
+                self.pending_elements -= len(value)
+                continue
+            count = min(budget, len(value))
+            if type(value) is list:
+                del value[-count:]
+            else:
+                popitem = value.popitem
+                for _ in range(count):
+                    item = popitem()[1]
+                    # big values of a freed dict are queued instead of freed inline
+                    if is_big(item):
+                        queue.append(item)
+                        self.pending_elements += len(item)
+                # the reference would look like another holder of the value
+                item = None
+            budget -= count
+            self.pending_elements -= count
+            if not value:
+                queue.popleft()
+        if queue:
+            self._call = self.clock.callLater(0, self._run)
+
+    def __len__(self):
+        """
+        :return: number of values waiting to be freed
+        """
+        return len(self._queue)
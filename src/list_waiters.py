@@ -0,0 +1,127 @@
+"""
+Connections blocked by BLPOP, BRPOP and BLMOVE. Every key has
+a FIFO queue of waiters. Push commands mark the key as ready and
+the waiters are served right after the command, idle waiters
+cost nothing but their place in the queues and a timer.
+"""
+from collections import deque
+from twisted.internet import reactor
+from src.exceptions.redis_command_parser_exceptions import RedisCommandParserException
+
+
+class ListWaiter:
+    """
+    Connection waiting for an element of one of the lists
+    """
+    def __init__(self, keys: list, command, callback):
+        """
+        :param keys: keys the connection waits for, in order of priority
+        :param command: function of a key returning the command popping
+            an element from it, e.g. ['lpop', key]
+        :param callback: called with key and result of the command when
+            the waiter is served, with None and None on timeout
+        """
+        self.keys = list(dict.fromkeys(keys))
+        self.command = command
+        self.callback = callback
+        self.timer = None
+
+
+class ListWaiters:
+    """
+    Queues of waiters for list keys
+    """
+    def __init__(self, clock=None):
+        """
+        :param clock: reactor for timeouts, the global one by default
+        """
+        self.clock = clock or reactor
+        # key: deque of ListWaiter
+        self.waiters = {}
+        # keys that got new elements, dict keeps order of signals
+        self.ready = {}
+        self._serving = False
+
+    def __len__(self):
+        """
+        :return: number of blocked waiters
+        """
+        return len(set(waiter for queue in self.waiters.values() for waiter in queue))
+
+    def block(self, waiter: ListWaiter, timeout: float = 0):
+        """
+        Put the waiter at the end of queues of its keys
+        :param waiter:
+        :param timeout: seconds to wait, 0 to wait forever
+        :return:
+        """
+        for key in waiter.keys:
+            self.waiters.setdefault(key, deque()).append(waiter)
+        if timeout > 0:
+            waiter.timer = self.clock.callLater(timeout, self._timeout, waiter)
+
+    def cancel(self, waiter: ListWaiter):
+        """
+        Remove the waiter from all queues and stop its timer,
+        called when it is served or its connection is lost
+        :param waiter:
+        :return:
+        """
+        for key in waiter.keys:
+            queue = self.waiters.get(key)
+            if queue is not None and waiter in queue:
+                queue.remove(waiter)
+                if not queue:
+                    del self.waiters[key]
+                    self.ready.pop(key, None)
+        if waiter.timer is not None:
+            if waiter.timer.active():
+                waiter.timer.cancel()
+            waiter.timer = None
+
+    def _timeout(self, waiter: ListWaiter):
+        waiter.timer = None
+        self.cancel(waiter)
+        waiter.callback(None, None)
+
+    def signal(self, key):
+        """
+        Mark the key as holding new elements, called by push commands
+        :param key:
+        :return:
+        """
+        if key in self.waiters:
+            self.ready[key] = None
+
+    def serve(self, parse, empty):
+        """
+        Give elements of ready keys to their waiters in FIFO order.
+        Elements are popped with the parse function of the command parser,
+        so the pops are propagated to replicas after the push that woke
+        the waiters. Calls made while serving return at once, keys they
+        signal are served by the outer call.
+        :param parse: function executing a command
+        :param empty: result of the pop command for an empty key
+        :return:
+        """
+        if self._serving:
+            return
+        self._serving = True
+        try:
+            while self.ready:
+                key = next(iter(self.ready))
+                del self.ready[key]
+                queue = self.waiters.get(key)
+                while queue:
+                    waiter = queue[0]
+                    try:
+                        result = parse(waiter.command(key))
+                    # key now holds another type, waiters keep waiting
+                    except RedisCommandParserException:
+                        break
+                    if result is empty:
+                        break
+                    self.cancel(waiter)
+                    waiter.callback(key, result)
+        finally:
+            self._serving = False
@@ -0,0 +1,259 @@
+"""
+Load generation for the benchmark client. Connections send pipelines
+of commands drawn from a weighted mix and time every reply from the
+write of its pipeline, like redis-benchmark. Replies are skipped with
+resp_reply_end instead of being decoded, so the client spends little
+time per reply and the server stays the bottleneck.
+"""
+import random
+import time
+from twisted.internet.defer import Deferred
+from twisted.internet.protocol import Protocol, ClientFactory
+from src.client_protocol import resp_reply_end
+from src.latency_histogram import LatencyHistograms
+from src.redis_client import encode_command
+
+COMMANDS = ('set', 'get', 'lpush', 'lrange', 'hset', 'keys')
+# percentiles of the report and their names
+PERCENTILES = ((50, 'p50'), (95, 'p95'), (99, 'p99'), (99.9, 'p999'), (100, 'max'))
+
+
+def parse_mix(s: str) -> list:
+    """
+    :param s: comma separated commands with optional weights, e.g. 'set:3,get:7' or 'set,get'
+    :return: list of (command, weight)
+    :exception ValueError: unknown command, weight is not a positive integer
+    """
+    mix = []
+    for part in s.split(','):
+        name, _, weight = part.strip().lower().partition(':')
+        if name not in COMMANDS:
+            raise ValueError(f'unknown command `{name}`, known commands are {", ".join(COMMANDS)}')
+        weight = int(weight) if weight else 1
+        if weight <= 0:
+            raise ValueError(f'weight of `{name}` must be positive')
+        mix.append((name, weight))
+    return mix
+
+
+class Workload:
+    """
+    Random commands of the mix on keys of a limited key space
+    """
+    def __init__(self, mix, keyspace=10000, value_size=3, ttl_ratio=0.0, ttl=60, lrange_count=100,
+                 keys_pattern=None, prefix='bench:', seed=None):
+        """
+        :param mix: list of (command, weight)
+        :param keyspace: number of keys of every type
+        :param value_size: bytes of values of SET, LPUSH and HSET
+        :param ttl_ratio: share of SET commands with EX
+        :param ttl: seconds of EX
+        :param lrange_count: elements read by LRANGE
+        :param keys_pattern: pattern of KEYS, keys of 1/10 of the key space by default
+        :param prefix: prefix of all keys
+        :param seed: seed of random numbers, runs with the same seed send the same commands
+        """
+        self.names = [name for name, _ in mix]
+        self.weights = [weight for _, weight in mix]
+        self.keyspace = keyspace
+        self.value = 'x' * value_size
+        self.ttl_ratio = ttl_ratio
+        self.ttl = str(ttl)
+        self.lrange_stop = str(lrange_count - 1)
+        self.prefix = prefix
+        self.keys_pattern = keys_pattern or f'{prefix}key:1*'
+        self.random = random.Random(seed)
+
+    def next(self) -> list:
+        """
+        :return: command and its arguments
+        """
+        rand = self.random
+        name = rand.choices(self.names, self.weights)[0]
+        number = rand.randrange(self.keyspace)
+        if name == 'set':
+            command = ['set', f'{self.prefix}key:{number}', self.value]
+            if self.ttl_ratio and rand.random() < self.ttl_ratio:
+                command += ['ex', self.ttl]
+            return command
+        if name == 'get':
+            return ['get', f'{self.prefix}key:{number}']
+        if name == 'lpush':
+            return ['lpush', f'{self.prefix}list:{number}', self.value]
+        if name == 'lrange':
+            return ['lrange', f'{self.prefix}list:{number}', '0', self.lrange_stop]
+        if name == 'hset':
+            return ['hset', f'{self.prefix}hash:{number}', f'field:{rand.randrange(self.keyspace)}', self.value]
+        return ['keys', self.keys_pattern]
+
+
+class LoadProtocol(Protocol):
+    """
+    Connection sending a pipeline and waiting for all its replies
+    before sending the next one
+    """
+    def __init__(self):
+        self._buffer = b''
+        # commands of the pipeline waiting for replies
+        self._waiting = []
+        self._replied = 0
+        self._sent_at = None
+
+    def connectionMade(self):
+        if hasattr(self.transport, 'setTcpNoDelay'):
+            self.transport.setTcpNoDelay(True)
+        self.factory.connectionMade(self)
+
+    def sendPipeline(self):
+        """
+        Send the next pipeline or close the connection if the run is over
+        :return:
+        """
+        commands = self.factory.nextPipeline()
+        if not commands:
+            self.transport.loseConnection()
+            return
+        self._waiting = [command[0] for command in commands]
+        self._replied = 0
+        self._sent_at = time.perf_counter_ns()
+        self.transport.write(b''.join(encode_command(command) for command in commands))
+
+    def dataReceived(self, data):
+        buffer = self._buffer + data
+        pos = 0
+        while pos < len(buffer):
+            end = resp_reply_end(buffer, pos)
+            if end == -1:
+                break
+            latency = (time.perf_counter_ns() - self._sent_at) // 1000
+            self.factory.replyReceived(self._waiting[self._replied], latency, buffer[pos] == ord('-'),
+                                       buffer[pos:end])
+            self._replied += 1
+            pos = end
+        self._buffer = buffer[pos:]
+        if self._replied == len(self._waiting):
+            self.sendPipeline()
+
+    def connectionLost(self, reason):
+        self.factory.connectionLost(self, reason)
+
+
+class LoadFactory(ClientFactory):
+    """
+    Run of the benchmark on several connections, sending starts
+    when all of them are connected
+    """
+    protocol = LoadProtocol
+
+    def __init__(self, workload: Workload, clients=50, requests=100000, pipeline=1, duration=None):
+        """
+        :param workload:
+        :param clients: number of connections
+        :param requests: number of commands to send
+        :param pipeline: commands in one write of a connection
+        :param duration: seconds to send commands for, used instead of requests
+        """
+        self.workload = workload
+        self.clients = clients
+        self.requests = requests
+        self.pipeline = pipeline
+        self.duration = duration
+        self.histograms = LatencyHistograms()
+        self.sent = 0
+        self.replies = 0
+        self.errors = 0
+        self.first_error = None
+        self.started = None
+        self.elapsed = None
+        self._connected = []
+        self._open = 0
+        self._deadline = None
+        # fires with the factory when all replies are received
+        self.finished = Deferred()
+
+    def connectionMade(self, proto):
+        self._connected.append(proto)
+        self._open += 1
+        if len(self._connected) < self.clients:
+            return
+        self.started = time.perf_counter()
+        if self.duration is not None:
+            self._deadline = self.started + self.duration
+        for connection in self._connected:
+            connection.sendPipeline()
+
+    def nextPipeline(self) -> list:
+        """
+        :return: commands for a connection, empty when the run is over
+        """
+        if self._deadline is not None:
+            if time.perf_counter() >= self._deadline:
+                return []
+            count = self.pipeline
+        else:
+            count = min(self.pipeline, self.requests - self.sent)
+        self.sent += count
+        return [self.workload.next() for _ in range(count)]
+
+    def replyReceived(self, command: str, latency: int, error: bool, reply: bytes):
+        """
+        :param command: name of the command
+        :param latency: microseconds from the write of the pipeline
+        :param error: the reply is an error
+        :param reply: encoded reply
+        :return:
+        """
+        self.replies += 1
+        self.histograms.record(command, latency)
+        if error:
+            self.errors += 1
+            if self.first_error is None:
+                self.first_error = reply[1:-2].decode('utf-8', 'replace')
+
+    def connectionLost(self, proto, reason):
+        self._open -= 1
+        if self._open or self.finished.called:
+            return
+        if self.started is None or self.replies < self.sent:
+            self.finished.errback(reason)
+            return
+        self.elapsed = time.perf_counter() - self.started
+        self.finished.callback(self)
+
+    def clientConnectionFailed(self, connector, reason):
+        if not self.finished.called:
+            self.finished.errback(reason)
+
+    def report(self) -> dict:
+        """
+        :return: requests per second and latency percentiles in milliseconds,
+            in total and per command
+        """
+        elapsed = self.elapsed or 0
+        commands = {}
+        for name, histogram in sorted(self.histograms.commands.items()):
+            stats = {'requests': histogram.count,
+                     'requests_per_sec': round(histogram.count / elapsed, 1) if elapsed else 0,
+                     'avg_ms': round(histogram.total / histogram.count / 1000, 3)}
+            stats.update((f'{label}_ms', histogram.percentile(p) / 1000) for p, label in PERCENTILES)
+            commands[name] = stats
+        return {'clients': self.clients, 'pipeline': self.pipeline, 'requests': self.replies,
+                'errors': self.errors, 'first_error': self.first_error, 'seconds': round(elapsed, 3),
+                'requests_per_sec': round(self.replies / elapsed, 1) if elapsed else 0,
+                'commands': commands}
+
+
+def format_report(report: dict) -> str:
+    """
+    :param report: LoadFactory.report
+    :return: text summary of the run
+    """
+    lines = [f"{report['requests']} requests, {report['clients']} clients, pipeline {report['pipeline']}, "
+             f"{report['seconds']:.2f}s, {report['requests_per_sec']:.0f} requests/s, {report['errors']} errors"]
+    if report['first_error'] is not None:
+        lines.append(f"first error: {report['first_error']}")
+    for name, stats in report['commands'].items():
+        percentiles = ' '.join(f"{label}={stats[f'{label}_ms']:.3f}" for _, label in PERCENTILES)
+        lines.append(f"{name.upper():>7}: {stats['requests_per_sec']:.0f} requests/s, "
+                     f"avg={stats['avg_ms']:.3f} {percentiles} ms")
+    return '\n'.join(lines)
@@ -0,0 +1,167 @@
+"""
+Event loop lag monitor. A reactor timer measures how late it fires,
+lags go to a histogram and lags over the threshold are events named
+after the code that blocked the loop. The code is found by a watchdog
+thread: when the timer is late, the thread looks at the stack of the
+reactor thread and names the command being executed by a connection
+or the outermost function of the server, e.g. a storage timer.
+Code holding the GIL, like freeing of a big list, can't be sampled,
+so commands running longer than the threshold name the stall themselves.
+"""
+import os
+import sys
+import threading
+import time
+from collections import deque
+from twisted.internet import reactor
+from src.latency_histogram import LatencyHistogram
+
+# directory of the server modules, their functions name stalls
+SOURCE_DIR = os.path.dirname(os.path.abspath(__file__)) + os.sep
+
+
+def describe_stack(frame, source_dir=SOURCE_DIR) -> str:
+    """
+    Name the code running in the stack
+    :param frame: the innermost frame
+    :param source_dir: directory of modules whose functions name the code
+    :return: 'command:<name>' if a connection executes a command,
+        otherwise qualified name of the outermost function of the modules,
+        e.g. ServerProtocol.dataReceived for parsing of a big pipeline
+    """
+    outermost = None
+    while frame is not None:
+        code = frame.f_code
+        if code.co_filename.startswith(source_dir):
+            if code.co_name == '_valueParsed':
+                command = getattr(frame.f_locals.get('self'), 'last_command', None)
+                if command is not None:
+                    return f'command:{command}'
+            outermost = getattr(code, 'co_qualname', code.co_name)
+        frame = frame.f_back
+    return outermost or 'unknown'
+
+
+class LoopMonitor:
+    """
+    Lag histogram and latency events of the reactor
+    """
+    def __init__(self, threshold=0.1, interval=0.1, history_len=160, clock=None):
+        """
+        :param threshold: seconds of lag making a latency event
+        :param interval: seconds between timer calls
+        :param history_len: events kept in the history of every name
+        :param clock: reactor, the global one by default
+        """
+        self.threshold = threshold
+        self.threshold_us = int(threshold * 1e6)
+        self.interval = interval
+        self.history_len = history_len
+        self.clock = clock or reactor
+        # lags in microseconds
+        self.histogram = LatencyHistogram()
+        self.max_lag = 0
+        self.stalls = 0
+        # event name: deque of (timestamp, milliseconds)
+        self.history = {}
+        # event name: maximum milliseconds
+        self.max_latency = {}
+        self._expected = None
+        self._beat = None
+        self._call = None
+        # name of the code found by the watchdog during the current stall
+        self._culprit = None
+        self._reactor_thread = None
+        self._stop = threading.Event()
+        self._watchdog = None
+
+    def start(self, watchdog=True):
+        """
+        Start the timer, called in the reactor thread
+        :param watchdog: start the thread naming the code of stalls
+        :return:
+        """
+        self._schedule()
+        if watchdog:
+            self._reactor_thread = threading.get_ident()
+            self._stop.clear()
+            self._watchdog = threading.Thread(target=self._watch, name='loop-monitor', daemon=True)
+            self._watchdog.start()
+
+    def stop(self):
+        if self._call is not None and self._call.active():
+            self._call.cancel()
+        self._call = None
+        self._stop.set()
+        if self._watchdog is not None:
+            self._watchdog.join()
+            self._watchdog = None
+
+    def _schedule(self):
+        self._beat = time.perf_counter()
+        self._expected = self.clock.seconds() + self.interval
+        self._call = self.clock.callLater(self.interval, self._tick)
+
+    def _tick(self):
+        lag = max(self.clock.seconds() - self._expected, 0)
+        lag_us = int(lag * 1e6)
+        self.histogram.record(lag_us)
+        if lag_us > self.max_lag:
+            self.max_lag = lag_us
+        if lag >= self.threshold:
+            self.stalls += 1
+            self.addEvent(self._culprit or 'unknown', int(lag * 1000))
+        self._culprit = None
+        self._schedule()
+
+    def _watch(self):
+        """
+        Watchdog thread, samples the stack of the reactor thread
+        once per stall when the timer is late for the threshold
+        """
+        period = min(self.threshold, self.interval) / 2
+        while not self._stop.wait(period):
+            late = time.perf_counter() - self._beat - self.interval
+            if late >= self.threshold and self._culprit is None:
+                frame = sys._current_frames().get(self._reactor_thread)
+                if frame is not None:
+                    self._culprit = describe_stack(frame)
+                del frame
+
+    def blame(self, name: str):
+        """
+        Name the current stall, called in the reactor thread
+        by code that knows it ran longer than the threshold
+        :param name:
+        :return:
+        """
+        self._culprit = name
+
+    def addEvent(self, name: str, latency: int):
+        """
+        :param name: name of the event
+        :param latency: milliseconds
+        :return:
+        """
+        history = self.history.get(name)
+        if history is None:
+            history = self.history[name] = deque(maxlen=self.history_len)
+        history.append((int(time.time()), latency))
+        self.max_latency[name] = max(latency, self.max_latency.get(name, 0))
+
+    def latest(self) -> list:
+        """
+        :return: LATENCY LATEST reply, [name, timestamp, latest ms, max ms] of every event
+        """
+        return [[name, *history[-1], self.max_latency[name]] for name, history in self.history.items()]
+
+    def reset(self, names=()) -> int:
+        """
+        :param names: names of events, all events if empty
+        :return: number of reset events
+        """
+        names = [name for name in names if name in self.history] if names else list(self.history)
+        for name in names:
+            del self.history[name]
+            del self.max_latency[name]
+        return len(names)
@@ -0,0 +1,111 @@
+"""
+Metrics in Prometheus text format served over HTTP with twisted.web.
+Latency histograms of commands are exported with fixed buckets, as
+Prometheus needs the same buckets in every series, their percentiles
+are exported as a summary. Numeric fields of INFO are exported as
+counters if they only grow and as gauges otherwise.
+"""
+from twisted.web.resource import Resource
+from twisted.web.server import Site
+from src.server_stats import SECTIONS
+
+# bucket bounds of exported histograms, microseconds
+EXPORTED_BUCKETS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000,
+                    100000, 250000, 500000, 1000000, 2500000, 5000000, 10000000)
+# percentiles and their labels
+QUANTILES = ((50, '0.5'), (99, '0.99'), (99.9, '0.999'))
+# INFO fields that only grow, besides total_* ones
+COUNTERS = frozenset((
+    'keyspace_hits', 'keyspace_misses', 'expired_keys', 'evicted_keys', 'rejected_connections',
+    'client_output_buffer_limit_disconnections', 'client_idle_disconnections', 'tracking_invalidations',
+    'lazyfreed_objects', 'scheduler_deferrals', 'scheduler_turns',
+    'used_cpu_sys', 'used_cpu_user', 'used_cpu_sys_children', 'used_cpu_user_children',
+    'used_cpu_sys_main_thread', 'used_cpu_user_main_thread',
+    'compressed_values', 'not_compressible_values', 'compressed_bytes_in', 'compressed_bytes_out',
+    'compress_cpu_ms', 'decompressed_values', 'decompress_cpu_ms', 'memory_hits', 'disk_hits'))
+
+
+def _number(value):
+    """
+    :return: int or float value of an INFO field or None if it's not a number
+    """
+    if isinstance(value, (int, float)):
+        return value
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def metric_type(name: str) -> str:
+    """
+    :param name: name of INFO field
+    :return: Prometheus type of the field, counter or gauge
+    """
+    return 'counter' if name.startswith('total_') or name in COUNTERS else 'gauge'
+
+
+def render_metrics(factory) -> str:
+    """
+    :param factory: ServerProtocolFactory
+    :return: metrics in Prometheus text format
+    """
+    lines = ['# HELP redis_command_latency_seconds Execution time of commands.',
+             '# TYPE redis_command_latency_seconds histogram']
+    histograms = sorted(factory.latency.commands.items())
+    for command, histogram in histograms:
+        cumulative = histogram.cumulative()
+        position = seen = 0
+        for bound in EXPORTED_BUCKETS:
+            # buckets of the histogram that end within the bound,
+            # a bucket crossing the bound is counted in the next one
+            while position < len(cumulative) and cumulative[position][0] <= bound:
+                seen = cumulative[position][1]
+                position += 1
+            lines.append(f'redis_command_latency_seconds_bucket{{command="{command}",le="{bound / 1e6}"}} {seen}')
+        lines.append(f'redis_command_latency_seconds_bucket{{command="{command}",le="+Inf"}} {histogram.count}')
+        lines.append(f'redis_command_latency_seconds_sum{{command="{command}"}} {histogram.total / 1e6}')
+        lines.append(f'redis_command_latency_seconds_count{{command="{command}"}} {histogram.count}')
+    lines += ['# HELP redis_command_latency_quantile_seconds Quantiles of execution time of commands.',
+              '# TYPE redis_command_latency_quantile_seconds summary']
+    for command, histogram in histograms:
+        for percentile, label in QUANTILES:
+            lines.append(f'redis_command_latency_quantile_seconds{{command="{command}",quantile="{label}"}} '
+                         f'{histogram.percentile(percentile) / 1e6}')
+        lines.append(f'redis_command_latency_quantile_seconds_sum{{command="{command}"}} {histogram.total / 1e6}')
+        lines.append(f'redis_command_latency_quantile_seconds_count{{command="{command}"}} {histogram.count}')
+    for section, fields in SECTIONS.items():
+        for name, value in fields(factory):
+            value = _number(value)
+            if value is None:
+                continue
+            lines += [f'# TYPE redis_{name} {metric_type(name)}', f'redis_{name} {value}']
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsResource(Resource):
+    """
+    /metrics page
+    """
+    isLeaf = True
+
+    def __init__(self, factory):
+        """
+        :param factory: ServerProtocolFactory
+        """
+        super().__init__()
+        self.factory = factory
+
+    def render_GET(self, request):
+        request.setHeader(b'content-type', b'text/plain; version=0.0.4; charset=utf-8')
+        return render_metrics(self.factory).encode('utf-8')
+
+
+def metrics_site(factory) -> Site:
+    """
+    :param factory: ServerProtocolFactory
+    :return: HTTP site serving metrics of the factory at /metrics
+    """
+    root = Resource()
+    root.putChild(b'metrics', MetricsResource(factory))
+    return Site(root)
@@ -0,0 +1,127 @@
+"""
+Profiling of the running server. cProfile records every call of the
+reactor thread and writes pstats, the sampling profiler records the
+stack of the main thread on SIGPROF every millisecond of CPU time and
+writes collapsed stacks for flame graphs. Sampling costs much less
+than cProfile under heavy traffic, but can't see inside C code
+holding the GIL: its time goes to the Python function calling it.
+"""
+import cProfile
+import os
+import signal
+import time
+from collections import Counter
+from twisted.internet import reactor
+from src.exceptions.profiler_exceptions import ProfilerStateError
+
+MODES = ('cprofile', 'sampling')
+# seconds of CPU time between samples
+SAMPLE_INTERVAL = 0.001
+
+
+def collapse(frame) -> str:
+    """
+    :param frame: the innermost frame
+    :return: functions of the stack from the outermost one, separated by ';'
+    """
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{os.path.basename(code.co_filename)}:{getattr(code, "co_qualname", code.co_name)}')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class SamplingProfiler:
+    """
+    Counts of stacks sampled by the profiling timer,
+    works only in the main thread
+    """
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        """
+        :param interval: seconds of CPU time between samples
+        """
+        self.interval = interval
+        self.stacks = Counter()
+        self._previous_handler = None
+
+    def enable(self):
+        self._previous_handler = signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def disable(self):
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.signal(signal.SIGPROF, self._previous_handler or signal.SIG_DFL)
+
+    def _sample(self, signum, frame):
+        self.stacks[collapse(frame)] += 1
+
+    def dump_stats(self, path: str):
+        """
+        Write collapsed stacks, a line of stack and number of samples
+        per stack, as flamegraph.pl and speedscope read them
+        :param path:
+        :return:
+        """
+        with open(path, 'w') as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write(f'{stack} {count}\n')
+
+
+class Profiler:
+    """
+    One profile of the server at a time, written to a file when stopped
+    """
+    def __init__(self, directory='.', clock=None):
+        """
+        :param directory: directory of written profiles
+        :param clock: reactor, the global one by default
+        """
+        self.directory = directory
+        self.clock = clock or reactor
+        self.profiles = 0
+        self.path = None
+        self._profile = None
+        self._call = None
+
+    @property
+    def running(self) -> bool:
+        return self._profile is not None
+
+    def start(self, seconds=None, mode='cprofile') -> str:
+        """
+        :param seconds: stop the profile after seconds, run until stopped if None
+        :param mode: cprofile or sampling
+        :return: path of the file the profile will be written to
+        :exception ProfilerStateError: a profile is running already
+        """
+        if self.running:
+            raise ProfilerStateError('profiler is running already')
+        if mode == 'sampling':
+            profile, extension = SamplingProfiler(), 'collapsed'
+        else:
+            profile, extension = cProfile.Profile(), 'pstats'
+        self.profiles += 1
+        self.path = os.path.join(self.directory,
+                                 f'profile-{int(time.time())}-{os.getpid()}-{self.profiles}.{extension}')
+        profile.enable()
+        self._profile = profile
+        if seconds:
+            self._call = self.clock.callLater(seconds, self.stop)
+        return self.path
+
+    def stop(self) -> str:
+        """
+        Stop the profile and write it
+        :return: path of the written file
+        :exception ProfilerStateError: no profile is running
+        """
+        if not self.running:
+            raise ProfilerStateError('profiler is not running')
+        if self._call is not None and self._call.active():
+            self._call.cancel()
+        self._call = None
+        profile, self._profile = self._profile, None
+        profile.disable()
+        profile.dump_stats(self.path)
+        return self.path
@@ -0,0 +1,191 @@
+"""
+Publish/subscribe. A published message is encoded once per channel
+or pattern and the same bytes are written to every subscriber.
+Pattern subscriptions are kept in an index by their literal prefix,
+so a message is matched only against patterns its channel can match.
+"""
+from src.redis_encoder import RedisEncoder
+from src.redis_pattern_matching import compile_pattern, pattern_prefix
+
+
+class PatternIndex:
+    """
+    Set of patterns redis style indexed by literal prefix,
+    patterns are compiled to regular expressions
+    """
+    def __init__(self):
+        # prefix: {pattern: compiled pattern}
+        self._buckets = {}
+        # prefix length: number of prefixes of this length
+        self._lengths = {}
+
+    def __contains__(self, pattern):
+        bucket = self._buckets.get(pattern_prefix(pattern))
+        return bucket is not None and pattern in bucket
+
+    def __len__(self):
+        return sum(len(bucket) for bucket in self._buckets.values())
+
+    def add(self, pattern: str):
+        """
+        :param pattern:
+        :return:
+        :exception StoragePatternError: there is an error in the pattern
+        """
+        prefix = pattern_prefix(pattern)
+        bucket = self._buckets.get(prefix)
+        if bucket is None:
+            bucket = self._buckets[prefix] = {}
+            self._lengths[len(prefix)] = self._lengths.get(len(prefix), 0) + 1
+        if pattern not in bucket:
+            bucket[pattern] = compile_pattern(pattern)
+
+    def discard(self, pattern: str):
+        prefix = pattern_prefix(pattern)
+        bucket = self._buckets.get(prefix)
+        if bucket is None or pattern not in bucket:
+            return
+        del bucket[pattern]
+        if not bucket:
+            del self._buckets[prefix]
+            self._lengths[len(prefix)] -= 1
+            if not self._lengths[len(prefix)]:
+                del self._lengths[len(prefix)]
+
+    def match(self, s: str) -> list:
+        """
+        :param s:
+        :return: list of patterns matching the string
+        """
+        matched = []
+        for length in self._lengths:
+            if length <= len(s):
+                bucket = self._buckets.get(s[:length])
+                if bucket is not None:
+                    for pattern, compiled in bucket.items():
+                        if compiled.fullmatch(s):
+                            matched.append(pattern)
+        return matched
+
+
+class PubSub:
+    """
+    Subscriptions of connections. Subscriber is any object
+    with sendData method, messages are written with it.
+    """
+    def __init__(self):
+        # channel: {subscriber: None}, dicts keep order of subscription
+        self.channels = {}
+        # pattern: {subscriber: None}
+        self.patterns = {}
+        self._pattern_index = PatternIndex()
+        # subscriber: (set of channels, set of patterns)
+        self._subscriptions = {}
+
+    def subscription_count(self, subscriber) -> int:
+        """
+        :param subscriber:
+        :return: number of channels and patterns the subscriber is subscribed to
+        """
+        channels, patterns = self._subscriptions.get(subscriber, ((), ()))
+        return len(channels) + len(patterns)
+
+    def subscriber_channels(self, subscriber) -> list:
+        return list(self._subscriptions.get(subscriber, ((), ()))[0])
+
+    def subscriber_patterns(self, subscriber) -> list:
+        return list(self._subscriptions.get(subscriber, ((), ()))[1])
+
+    def subscribe(self, subscriber, channel: str) -> int:
+        """
+        :param subscriber:
+        :param channel:
+        :return: number of subscriptions of the subscriber
+        """
+        self.channels.setdefault(channel, {})[subscriber] = None
+        self._subscriptions.setdefault(subscriber, (set(), set()))[0].add(channel)
+        return self.subscription_count(subscriber)
+
+    def unsubscribe(self, subscriber, channel: str) -> int:
+        """
+        :param subscriber:
+        :param channel:
+        :return: number of subscriptions of the subscriber
+        """
+        subscribers = self.channels.get(channel)
+        if subscribers is not None and subscriber in subscribers:
+            del subscribers[subscriber]
+            if not subscribers:
+                del self.channels[channel]
+            self._subscriptions[subscriber][0].discard(channel)
+            self._forget(subscriber)
+        return self.subscription_count(subscriber)
+
+    def psubscribe(self, subscriber, pattern: str) -> int:
+        """
+        :param subscriber:
+        :param pattern: pattern redis style
+        :return: number of subscriptions of the subscriber
+        :exception StoragePatternError: there is an error in the pattern
+        """
+        if pattern not in self.patterns:
+            self._pattern_index.add(pattern)
+        self.patterns.setdefault(pattern, {})[subscriber] = None
+        self._subscriptions.setdefault(subscriber, (set(), set()))[1].add(pattern)
+        return self.subscription_count(subscriber)
+
+    def punsubscribe(self, subscriber, pattern: str) -> int:
+        """
+        :param subscriber:
+        :param pattern:
+        :return: number of subscriptions of the subscriber
+        """
+        subscribers = self.patterns.get(pattern)
+        if subscribers is not None and subscriber in subscribers:
+            del subscribers[subscriber]
+            if not subscribers:
+                del self.patterns[pattern]
+                self._pattern_index.discard(pattern)
+            self._subscriptions[subscriber][1].discard(pattern)
+            self._forget(subscriber)
+        return self.subscription_count(subscriber)
+
+    def _forget(self, subscriber):
+        channels, patterns = self._subscriptions[subscriber]
+        if not channels and not patterns:
+            del self._subscriptions[subscriber]
+
+    def remove(self, subscriber):
+        """
+        Remove all subscriptions, called when connection is lost
+        :param subscriber:
+        :return:
+        """
+        for channel in self.subscriber_channels(subscriber):
+            self.unsubscribe(subscriber, channel)
+        for pattern in self.subscriber_patterns(subscriber):
+            self.punsubscribe(subscriber, pattern)
+
+    def publish(self, channel: str, message: str) -> int:
+        """
+        Send message to subscribers of the channel
+        and of patterns matching it
+        :param channel:
+        :param message:
+        :return: number of subscribers that got the message
+        """
+        count = 0
+        subscribers = self.channels.get(channel)
+        if subscribers:
+            data = RedisEncoder.encodeArray(['message', channel, message])
+            for subscriber in subscribers:
+                subscriber.sendData(data)
+            count += len(subscribers)
+        if self.patterns:
+            for pattern in self._pattern_index.match(channel):
+                subscribers = self.patterns[pattern]
+                data = RedisEncoder.encodeArray(['pmessage', pattern, channel, message])
+                for subscriber in subscribers:
+                    subscriber.sendData(data)
+                count += len(subscribers)
+        return count
@@ -0,0 +1,312 @@
+"""
+Non-interactive client for services. Commands return Deferreds firing
+with replies, so they can be chained with callbacks or awaited in
+coroutines run with twisted.internet.defer.ensureDeferred. Commands sent
+before replies to previous ones come are pipelined on the connection,
+replies are matched to commands in order.
+"""
+from collections import deque
+from twisted.internet import reactor, defer
+from twisted.internet.endpoints import TCP4ClientEndpoint, UNIXClientEndpoint, connectProtocol
+from src.redis_protocol import RedisProtocol
+from src.redis_encoder import RedisEncoder
+from src.redis_protocol_error import RedisProtocolError
+from src.client_tracking import INVALIDATE_CHANNEL
+from src.exceptions.redis_client_exceptions import *
+
+
+def encode_command(args) -> bytes:
+    """
+    :param args: command and its arguments, not strings are converted to strings
+    :return: command encoded as RESP array
+    """
+    return RedisEncoder.encodeArray([arg if type(arg) is str else str(arg) for arg in args])
+
+
+class RedisClientProtocol(RedisProtocol):
+    """
+    Client connection. Every command gets a Deferred,
+    the Deferreds are fired when replies come.
+    """
+    def __init__(self):
+        super().__init__()
+        # Deferreds of commands waiting for replies
+        self._waiting = deque()
+        # RedisClientPool the connection belongs to
+        self.pool = None
+        # function called with values coming when no command
+        # waits for a reply, e.g. pub/sub messages
+        self.message_callback = None
+
+    @property
+    def pending(self) -> int:
+        """
+        :return: number of commands waiting for replies
+        """
+        return len(self._waiting)
+
+    def execute(self, *args) -> defer.Deferred:
+        """
+        Send a command
+        :param args: command and its arguments
+        :return: deferred firing with the reply
+        :exception RedisReplyError: server replied with an error (in errback)
+        :exception RedisConnectionLost: connection is lost (in errback)
+        """
+        if not self.connected:
+            return defer.fail(RedisConnectionLost('not connected'))
+        d = defer.Deferred()
+        self._waiting.append(d)
+        self.sendData(encode_command(args))
+        return d
+
+    def pipeline(self, commands: list) -> defer.Deferred:
+        """
+        Send commands in one write
+        :param commands: list of lists of arguments
+        :return: deferred firing with list of replies, error replies
+            are RedisReplyError objects in the list
+        :exception RedisConnectionLost: connection is lost (in errback)
+        """
+        if not self.connected:
+            return defer.fail(RedisConnectionLost('not connected'))
+        ds = []
+        for _ in commands:
+            d = defer.Deferred()
+            d.addErrback(self._replyError)
+            self._waiting.append(d)
+            ds.append(d)
+        self.sendData(b''.join(encode_command(args) for args in commands))
+        d = defer.gatherResults(ds, consumeErrors=True)
+        d.addErrback(lambda failure: failure.value.subFailure)
+        return d
+
+    @staticmethod
+    def _replyError(failure):
+        failure.trap(RedisReplyError)
+        return failure.value
+
+    def _valueParsed(self, value):
+        super()._valueParsed(value)
+        if not self._waiting:
+            if self.message_callback is not None:
+                self.message_callback(value)
+            else:
+                print('Unexpected reply:', value)
+            return
+        d = self._waiting.popleft()
+        if type(value) is RedisProtocolError:
+            d.errback(RedisReplyError(str(value)))
+        else:
+            d.callback(value)
+
+    def connectionLost(self, reason):
+        self.connected = False
+        waiting = self._waiting
+        self._waiting = deque()
+        for d in waiting:
+            d.errback(RedisConnectionLost(reason.getErrorMessage()))
+        if self.pool is not None:
+            self.pool._connectionLost(self)
+
+    def close(self):
+        self.transport.loseConnection()
+
+
+def connect(host='127.0.0.1', port=6379, clock=None, unix_socket=None) -> defer.Deferred:
+    """
+    Connect to a server
+    :param host:
+    :param port:
+    :param clock: reactor, the global one by default
+    :param unix_socket: path of unix socket, used instead of host and port
+    :return: deferred firing with connected RedisClientProtocol
+    """
+    if unix_socket is None:
+        endpoint = TCP4ClientEndpoint(clock or reactor, host, port)
+    else:
+        endpoint = UNIXClientEndpoint(clock or reactor, unix_socket)
+    return connectProtocol(endpoint, RedisClientProtocol())
+
+
+class RedisClientPool:
+    """
+    Bounded pool of connections to one server. A command goes to an idle
+    connection, while the pool is not full new connections are opened
+    for busy ones, then commands are pipelined on the least busy connection.
+    """
+    def __init__(self, host='127.0.0.1', port=6379, size=4, clock=None, unix_socket=None):
+        """
+        :param host:
+        :param port:
+        :param size: maximum number of connections
+        :param clock: reactor, the global one by default
+        :param unix_socket: path of unix socket, used instead of host and port
+        """
+        self.host = host
+        self.port = port
+        self.unix_socket = unix_socket
+        self.size = size
+        self.clock = clock or reactor
+        self.connections = []
+        self.closed = False
+        self._connecting = 0
+        # Deferreds of commands waiting for the first connection
+        self._waiters = deque()
+
+    def execute(self, *args) -> defer.Deferred:
+        """
+        Send a command on one of the connections
+        :return: same as RedisClientProtocol.execute
+        :exception RedisPoolClosed: pool is closed (in errback)
+        """
+        return self._connection().addCallback(lambda connection: connection.execute(*args))
+
+    def pipeline(self, commands: list) -> defer.Deferred:
+        """
+        Send commands in one write on one of the connections
+        :return: same as RedisClientProtocol.pipeline
+        :exception RedisPoolClosed: pool is closed (in errback)
+        """
+        return self._connection().addCallback(lambda connection: connection.pipeline(commands))
+
+    def _connection(self) -> defer.Deferred:
+        """
+        :return: deferred firing with a connection for the next command
+        """
+        if self.closed:
+            return defer.fail(RedisPoolClosed())
+        connection = min(self.connections, key=lambda conn: conn.pending, default=None)
+        if connection is not None and connection.pending == 0:
+            return defer.succeed(connection)
+        if len(self.connections) + self._connecting < self.size:
+            self._connect()
+        if connection is not None:
+            return defer.succeed(connection)
+        d = defer.Deferred()
+        self._waiters.append(d)
+        return d
+
+    def _connect(self):
+        self._connecting += 1
+        d = connect(self.host, self.port, self.clock, self.unix_socket)
+        d.addCallbacks(self._connected, self._connectFailed)
+
+    def _connected(self, connection):
+        self._connecting -= 1
+        if self.closed:
+            connection.close()
+            return
+        connection.pool = self
+        self.connections.append(connection)
+        waiters = self._waiters
+        self._waiters = deque()
+        for d in waiters:
+            d.callback(connection)
+
+    def _connectFailed(self, failure):
+        self._connecting -= 1
+        # nobody else can serve the waiting commands
+        if not self.connections and not self._connecting:
+            waiters = self._waiters
+            self._waiters = deque()
+            for d in waiters:
+                d.errback(failure)
+
+    def _connectionLost(self, connection):
+        if connection in self.connections:
+            self.connections.remove(connection)
+
+    def close(self):
+        """
+        Close all connections, commands waiting for replies fail
+        :return:
+        """
+        self.closed = True
+        for connection in list(self.connections):
+            connection.close()
+        waiters = self._waiters
+        self._waiters = deque()
+        for d in waiters:
+            d.errback(RedisPoolClosed())
+
+
+class RedisClientCache:
+    """
+    Local cache of GET replies kept fresh by the server with
+    CLIENT TRACKING. Invalidation messages come on a second
+    connection subscribed to __redis__:invalidate.
+    """
+    def __init__(self, connection: RedisClientProtocol, invalidations: RedisClientProtocol, prefixes=None):
+        """
+        :param connection: connection for commands
+        :param invalidations: connection for invalidation messages only
+        :param prefixes: list of key prefixes to use broadcasting mode,
+            None to track keys read by the connection
+        """
+        self.connection = connection
+        self.invalidations = invalidations
+        self.prefixes = prefixes
+        self.cache = {}
+        # key: False if the key was invalidated while its GET was in flight
+        self._loading = {}
+        self.hits = 0
+        self.misses = 0
+        invalidations.message_callback = self._messageReceived
+
+    def start(self) -> defer.Deferred:
+        """
+        Subscribe to invalidations and turn tracking on
+        :return: deferred firing when the cache can be used
+        :exception RedisReplyError: server doesn't support tracking (in errback)
+        """
+        d = self.invalidations.execute('client', 'id')
+
+        def subscribe(client_id):
+            return self.invalidations.execute('subscribe', INVALIDATE_CHANNEL).addCallback(lambda _: client_id)
+
+        def tracking(client_id):
+            command = ['client', 'tracking', 'on', 'redirect', client_id]
+            if self.prefixes is not None:
+                command.append('bcast')
+                for prefix in self.prefixes:
+                    command.extend(('prefix', prefix))
+            return self.connection.execute(*command)
+        d.addCallback(subscribe)
+        d.addCallback(tracking)
+        return d
+
+    def get(self, key: str) -> defer.Deferred:
+        """
+        GET served from the local cache when possible
+        :param key:
+        :return: deferred firing with the value or None
+        """
+        if key in self.cache:
+            self.hits += 1
+            return defer.succeed(self.cache[key])
+        self.misses += 1
+        self._loading[key] = True
+        d = self.connection.execute('get', key)
+
+        def loaded(value):
+            if self._loading.pop(key, False):
+                self.cache[key] = value
+            return value
+
+        def failed(failure):
+            self._loading.pop(key, None)
+            return failure
+        d.addCallbacks(loaded, failed)
+        return d
+
+    def _messageReceived(self, value):
+        if type(value) is not list or len(value) != 3 or value[:2] != ['message', INVALIDATE_CHANNEL]:
+            return
+        keys = value[2]
+        if keys is None:
+            keys = list(self.cache)
+        for key in keys:
+            self.cache.pop(key, None)
+            if key in self._loading:
+                self._loading[key] = False
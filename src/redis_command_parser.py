@@ -1,6 +1,8 @@
 from src.storage import Storage
+from src.list_waiters import ListWaiters
 from src.exceptions.redis_command_parser_exceptions import *
 from src.exceptions.storage_exceptions import *
+import threading
 import time
 
 # Object to return in case of success
@@ -11,6 +13,21 @@ CommandParserSuccess = object()
 BulkStringNone = object()
 ArrayNone = object()
 
+# Positions of keys in command arguments: (first, last, step),
+# negative last is counted from the end. Commands without keys are absent.
+COMMAND_KEYS = {'get': (1, 1, 1), 'set': (1, 1, 1), 'del': (1, -1, 1),
+                'lrange': (1, 1, 1), 'lpush': (1, 1, 1), 'rpush': (1, 1, 1),
+                'lset': (1, 1, 1), 'lget': (1, 1, 1), 'hset': (1, 1, 1), 'hget': (1, 1, 1),
+                'expire': (1, 1, 1), 'pexpireat': (1, 1, 1), 'persist': (1, 1, 1),
+                'lpop': (1, 1, 1), 'rpop': (1, 1, 1), 'lmove': (1, 2, 1),
+                'blpop': (1, -2, 1), 'brpop': (1, -2, 1), 'blmove': (1, 2, 1),
+                'unlink': (1, -1, 1)}
+
+# Commands changing storage, they are propagated to replicas
+WRITE_COMMANDS = frozenset(('set', 'del', 'lpush', 'rpush', 'lset', 'hset',
+                            'expire', 'pexpireat', 'persist', 'lpop', 'rpop', 'lmove',
+                            'unlink', 'flushall'))
+
 
 class RedisCommandParser:
     """
@@ -28,27 +45,133 @@ class RedisCommandParser:
 
         self.storage = storage
         self.astonished = False
+        # LRANGE returning at least this number of elements is slow
+        self.slow_lrange_threshold = 1000
+        self.bgsave_in_progress = False
+        # Replication object, write commands are fed to it
+        self.replication = None
+        # connections blocked by BLPOP, BRPOP and BLMOVE
+        self.list_waiters = ListWaiters()
 
     def parse(self, args: list):
         """
         Parses string command and returns a result of it's execution.
-        Available commands: GET, SET, DEL, KEY, LRANGE, LPUSH, RPUSH, LSET, LGET, HSET, HGET, EXPIRE, PERSIST
+        Available commands: GET, SET, DEL, KEY, LRANGE, LPUSH, RPUSH, LSET, LGET, HSET, HGET, EXPIRE,
+        PEXPIREAT, PERSIST, LPOP, RPOP, LMOVE, UNLINK, FLUSHALL. Connections blocked on keys
+        the command pushed to are served after it.
         :return: result of the specified command
         :exception RedisCommandParserException: specific exceptions are in _parse_ methods
         :exception WrongCommand: when the specified command isn't found
+        :exception CommandReadOnly: write command sent to a replica
         """
         # just one time print when there is A LOT of arguments
         if not self.astonished and len(args) > 100:
             print('dude wtf')
             self.astonished = True
 
+        replication = self.replication
+        if replication is not None and args[0].lower() in WRITE_COMMANDS:
+            if replication.readonly:
+                raise CommandReadOnly()
+            result = self.execute(args)
+            if replication.feeding:
+                replication.feed(self.propagated(args))
+        else:
+            result = self.execute(args)
+        if self.list_waiters.ready:
+            self.list_waiters.serve(self.parse, BulkStringNone)
+        return result
+
+    def execute(self, args: list):
+        """
+        Execute command without replication checks, commands
+        received by a replica from its primary are executed this way.
+        :return: result of the specified command
+        :exception RedisCommandParserException: same as in parse
+        :exception CommandStorageError: a value spilled to the disk tier can't be read
+        """
         command = args[0].lower()
         try:
             op = getattr(self,'_parse_' + command)
         except AttributeError:
             raise WrongCommand(f"unknown command `{command}`")
-        else:
+        if self.storage.saving and command in WRITE_COMMANDS:
+            self.storage.before_write(self.command_keys(args))
+        try:
+            return op(args[1:])
+        except StorageFileError as err:
+            raise CommandStorageError(str(err))
+
+    def parse_slow(self, args: list):
+        """
+        Check if the command is slow, and if it is, take a consistent view
+        of the data it reads. The result is computed from the view
+        by the returned function, which may be called in another thread.
+        Slow commands only read data, their _prepare_ methods
+        return None when the command is cheap enough to be parsed inline.
+        :param args: command with arguments
+        :return: function returning result of the command or None
+        :exception RedisCommandParserException: same as in parse
+        """
+        try:
+            op = getattr(self, '_prepare_' + args[0].lower())
+        except AttributeError:
+            return None
+        try:
             return op(args[1:])
+        except StorageFileError as err:
+            raise CommandStorageError(str(err))
+
+    def check_keys(self, args: list):
+        """
+        Check that keys of the command are served here, before the command
+        is handled by the connection, e.g. a blocking pop. A single server
+        serves all keys, cluster nodes check their slots.
+        :param args: command with arguments
+        :return:
+        """
+        pass
+
+    @staticmethod
+    def propagated(args: list) -> list:
+        """
+        Get the form of a write command sent to replicas. Relative
+        expiration times are replaced with absolute ones, so the key
+        expires at the same moment on every replica.
+        :param args: command with arguments
+        :return: command with arguments
+        """
+        command = args[0].lower()
+        if command == 'expire' and len(args) == 3:
+            try:
+                return ['pexpireat', args[1], str(int((time.time() + int(args[2])) * 1000))]
+            except ValueError:
+                return args
+        if command == 'set':
+            for pos in range(3, len(args) - 1):
+                opt = args[pos].lower()
+                if opt in ('ex', 'px'):
+                    try:
+                        ttl = int(args[pos + 1]) * (1000 if opt == 'ex' else 1)
+                    except ValueError:
+                        return args
+                    return args[:pos] + ['pxat', str(int(time.time() * 1000) + ttl)] + args[pos + 2:]
+        return args
+
+    @staticmethod
+    def command_keys(args: list) -> list:
+        """
+        Get keys a command operates on
+        :param args: command with arguments
+        :return: list of keys, empty for commands without keys
+        """
+        positions = COMMAND_KEYS.get(args[0].lower())
+        if positions is None:
+            return []
+        first, last, step = positions
+        if last < 0:
+            last += len(args)
+        return args[first:last + 1:step]
 
     def _parse_set(self, args):
         """
@@ -190,6 +313,24 @@ class RedisCommandParser:
         else:
             return ans
 
+    def _prepare_keys(self, args):
+        """
+        Slow KEYS: the keys are copied now and matched later.
+        :param args:
+        :return: function returning list of keys
+        :exception CommandWrongArgumentNumber: not exactly 1 argument given
+        """
+        if len(args) != 1:
+            raise CommandWrongArgumentNumber(f'`keys` command needs 1 argument, found {len(args)}')
+        match = self.storage.keys_view(args[0])
+
+        def keys():
+            try:
+                return match()
+            except StoragePatternError:
+                raise CommandSyntaxError('error in pattern')
+        return keys
+
     def _parse_del(self, args):
         """
         Parse arguments for DEL command.
@@ -203,6 +344,19 @@ class RedisCommandParser:
             raise CommandWrongArgumentNumber('`del` command needs at least 1 argument')
         return self.storage.delete(args)
 
+    def _parse_unlink(self, args):
+        """
+        Parse arguments for UNLINK command.
+        Deletes a set of keys, big values are freed later by slices.
+        Usage: UNLINK key1 [key2 ...]
+        :param args:
+        :return: The number of deleted keys
+        :exception CommandWrongArgumentNumber: less than 1 argument was given
+        """
+        if not len(args):
+            raise CommandWrongArgumentNumber('`unlink` command needs at least 1 argument')
+        return self.storage.unlink(args)
+
     def _parse_lrange(self, args):
         """
         Parse arguments for LRANGE command.
@@ -237,6 +391,33 @@ class RedisCommandParser:
                 ans = ans[start:stop+1]
         return ans
 
+    def _prepare_lrange(self, args):
+        """
+        Slow LRANGE: if the range is big, it's sliced now
+        and encoded later.
+        :param args:
+        :return: function returning the slice or None for small ranges
+        """
+        if len(args) != 3:
+            return None
+        try:
+            # small ranges are read again by parse, which counts the hit
+            lval = self.storage.get(args[0], count=False)
+            start = int(args[1])
+            stop = int(args[2])
+        except (StorageKeyError, ValueError):
+            return None
+        if type(lval) is not list:
+            return None
+        if stop == -1:
+            stop = None
+        else:
+            stop += 1
+        if len(range(*slice(start, stop).indices(len(lval)))) < self.slow_lrange_threshold:
+            return None
+        ans = self.storage.get(args[0])[start:stop]
+        return lambda: ans
+
     def _parse_lpush(self,args):
         """
         Parse arguments for LPUSH command
@@ -255,14 +436,14 @@ class RedisCommandParser:
         except StorageKeyError:
             val = args[-1:0:-1]
             self.storage.set(args[0], val)
-            return len(val)
         else:
             if type(val) is not list:
                 raise CommandWrongType(f'`lpush` command only operates with keys holding list values')
             else:
                 val = args[-1:0:-1] + val
                 self.storage.set(args[0], val, keep_moe=True)
-                return len(val)
+        self.list_waiters.signal(args[0])
+        return len(val)
 
     def _parse_rpush(self,args):
         """
@@ -282,13 +463,105 @@ class RedisCommandParser:
         except StorageKeyError:
             val = args[1:]
             self.storage.set(args[0], val)
-            return len(val)
         else:
             if type(val) is not list:
                 raise CommandWrongType(f'`rpush` command only operates with keys holding list values')
             else:
                 val.extend(args[1:])
-                return len(val)
+                self.storage.set(args[0], val, keep_moe=True)
+        self.list_waiters.signal(args[0])
+        return len(val)
+
+    def _parse_lpop(self, args):
+        """
+        Remove and return the first element of the list
+        Usage: LPOP key
+        :param args:
+        :return: the first element, BulkStringNone if there is no such key
+        :exception CommandWrongArgumentNumber: not exactly 1 argument given
+        :exception CommandWrongType: specified key holds non-list value
+        """
+        if len(args) != 1:
+            raise CommandWrongArgumentNumber(f'`lpop` command needs 1 argument, found {len(args)}')
+        return self._listPop('lpop', args[0], 'left')
+
+    def _parse_rpop(self, args):
+        """
+        Remove and return the last element of the list
+        Usage: RPOP key
+        :param args:
+        :return: the last element, BulkStringNone if there is no such key
+        :exception CommandWrongArgumentNumber: not exactly 1 argument given
+        :exception CommandWrongType: specified key holds non-list value
+        """
+        if len(args) != 1:
+            raise CommandWrongArgumentNumber(f'`rpop` command needs 1 argument, found {len(args)}')
+        return self._listPop('rpop', args[0], 'right')
+
+    def _parse_lmove(self, args):
+        """
+        Pop an element from one end of the source list
+        and push it to one end of the destination list.
+        Usage: LMOVE source destination LEFT|RIGHT LEFT|RIGHT
+        :param args:
+        :return: the moved element, BulkStringNone if there is no source key
+        :exception CommandWrongArgumentNumber: not exactly 4 arguments given
+        :exception CommandWrongType: source or destination holds non-list value
+        :exception CommandSyntaxError: ends are not LEFT or RIGHT
+        """
+        if len(args) != 4:
+            raise CommandWrongArgumentNumber(f'`lmove` command needs 4 arguments, found {len(args)}')
+        source, destination = args[0], args[1]
+        wherefrom, whereto = args[2].lower(), args[3].lower()
+        if wherefrom not in ('left', 'right') or whereto not in ('left', 'right'):
+            raise CommandSyntaxError('list ends must be LEFT or RIGHT')
+        try:
+            dval = self.storage.get(destination)
+        except StorageKeyError:
+            dval = None
+        else:
+            if type(dval) is not list:
+                raise CommandWrongType(f'`lmove` command only operates with keys holding list values')
+        value = self._listPop('lmove', source, wherefrom)
+        if value is BulkStringNone:
+            return value
+        if source == destination:
+            try:
+                dval = self.storage.get(destination)
+            except StorageKeyError:
+                dval = None
+        if dval is None:
+            self.storage.set(destination, [value])
+        else:
+            if whereto == 'left':
+                dval.insert(0, value)
+            else:
+                dval.append(value)
+            self.storage.set(destination, dval, keep_moe=True)
+        self.list_waiters.signal(destination)
+        return value
+
+    def _listPop(self, command, key, where):
+        """
+        Pop an element from the list, the key is deleted with the last element
+        :param command: name of the command for error messages
+        :param key:
+        :param where: 'left' or 'right'
+        :return: the element, BulkStringNone if there is no such key
+        :exception CommandWrongType: specified key holds non-list value
+        """
+        try:
+            lval = self.storage.get(key)
+        except StorageKeyError:
+            return BulkStringNone
+        if type(lval) is not list:
+            raise CommandWrongType(f'`{command}` command only operates with keys holding list values')
+        value = lval.pop(0 if where == 'left' else -1)
+        if lval:
+            self.storage.set(key, lval, keep_moe=True)
+        else:
+            self.storage.delete([key])
+        return value
 
     def _parse_lset(self, args):
         """
@@ -320,6 +593,7 @@ class RedisCommandParser:
                 raise CommandOutOfRange(f'index {index} is out of range, array of size {len(lval)}')
             else:
                 lval[index] = val
+                self.storage.set(args[0], lval, keep_moe=True)
                 return CommandParserSuccess
 
     def _parse_lget(self, args):
@@ -384,6 +658,7 @@ class RedisCommandParser:
             if key not in hval:
                 count += 1
         hval.update(new_vals)
+        self.storage.set(args[0], hval, keep_moe=True)
         return count
 
     def _parse_hget(self, args):
@@ -434,6 +709,44 @@ class RedisCommandParser:
         else:
             return 1
 
+    def _parse_pexpireat(self, args):
+        """
+        Set the Unix time in milliseconds at which the key will expire.
+        Usage: PEXPIREAT key milliseconds-timestamp
+        :param args:
+        :return: 1 if the timeout was set
+                 0 if key does not exist
+        :exception CommandWrongArgumentNumber: not exactly 2 arguments given
+        :exception CommandSyntaxError: timestamp is not int
+        """
+        if len(args) != 2:
+            raise CommandWrongArgumentNumber(f'`pexpireat` command needs 2 arguments, found {len(args)}')
+        try:
+            moe = int(args[1]) * 1e-3
+        except ValueError:
+            raise CommandSyntaxError('timestamp must be integer')
+        try:
+            self.storage.set_moe(args[0], moe)
+        except StorageKeyError:
+            return 0
+        else:
+            return 1
+
+    def _parse_role(self, args):
+        """
+        Replication role of the server.
+        Usage: ROLE
+        :param args:
+        :return: ['master', offset, [[host, port], ...]] on a primary,
+            ['slave', host, port, state, offset] on a replica
+        :exception CommandWrongArgumentNumber: arguments given
+        """
+        if len(args):
+            raise CommandWrongArgumentNumber(f'`role` command needs no arguments, found {len(args)}')
+        if self.replication is None:
+            return ['master', 0, []]
+        return self.replication.role()
+
     def _parse_persist(self, args):
         """
         Remove the existing timeout on key
@@ -455,3 +768,52 @@ class RedisCommandParser:
             else:
                 self.storage.set_moe(args[0], None)
                 return 1
+
+    def _parse_flushall(self, args):
+        """
+        Remove all keys.
+        Usage: FLUSHALL [ASYNC|SYNC]
+        :param args:
+        :return: CommandParserSuccess
+        :exception CommandWrongArgumentNumber: more than 1 argument given
+        :exception CommandSyntaxError: unknown option
+        """
+        if len(args) > 1:
+            raise CommandWrongArgumentNumber(f'`flushall` command needs at most 1 argument, found {len(args)}')
+        mode = args[0].lower() if args else 'sync'
+        if mode not in ('async', 'sync'):
+            raise CommandSyntaxError(f'unknown option `{args[0]}`')
+        self.storage.flush(lazy=mode == 'async')
+        return CommandParserSuccess
+
+    def _parse_bgsave(self, args):
+        """
+        Save storage to disk in a background thread.
+        Usage: BGSAVE
+        :param args:
+        :return: status message
+        :exception CommandWrongArgumentNumber: arguments given
+        :exception CommandSyntaxError: saving is disabled or already in progress
+        """
+        if len(args):
+            raise CommandWrongArgumentNumber(f'`bgsave` command needs no arguments, found {len(args)}')
+        if not self.storage.file_prefix:
+            raise CommandSyntaxError('saving is disabled')
+        if self.bgsave_in_progress:
+            raise CommandSyntaxError('background save already in progress')
+        self.bgsave_in_progress = True
+        threading.Thread(target=self._bgsave, args=(self.storage.save_view(),), name='bgsave').start()
+        return 'Background saving started'
+
+    def _bgsave(self, write):
+        """
+        Called in a thread, doesn't depend on event loop
+        :param write: function writing the snapshot
+        :return:
+        """
+        try:
+            write()
+        except StorageFileError as err:
+            print('Background save failed:', err)
+        finally:
+            self.bgsave_in_progress = False
@@ -76,36 +76,35 @@ class RedisDataStringParser(IDataParser):
     Simple strings start with '+'.
     """
     def __init__(self):
-        self._s = ''
+        # bytes of the line received so far
+        self._s = b''
         self.defer = Deferred()
 
     def fireDeferred(self, result):
         d = self.defer
         self.defer = Deferred()
         d.callback(result)
-        self._s = ''
         return result
 
     def parse(self, data: bytes) -> (str,bytes,bool):
         if data:
-            try:
-                decoded = data.decode('utf-8')
-            except UnicodeDecodeError:
-                return data
+            # only the line is decoded, not the data after it
+            if self._s.endswith(b'\r') and data[0] == ord('\n'):
+                line = self._s[:-1]
+                data = data[1:]
             else:
-                crlf_pos = decoded.find('\r\n')
+                crlf_pos = data.find(b'\r\n')
                 if crlf_pos == -1:
-                    if len(self._s) and self._s[-1] == '\r' and decoded[0] == '\n':
-                        self._s = self._s[:-1]
-                        data = data[1:]
-                        self.fireDeferred(self._s)
-                    else:
-                        self._s += decoded
-                        data = b''
-                else:
-                    self._s += decoded[0:crlf_pos]
-                    data = decoded[crlf_pos + 2:].encode('utf-8')
-                    self.fireDeferred(self._s)
+                    self._s += data
+                    return b''
+                line = self._s + data[:crlf_pos]
+                data = data[crlf_pos + 2:]
+            try:
+                decoded = line.decode('utf-8')
+            except UnicodeDecodeError:
+                raise ParserValueError(f'decoding of {line} failed')
+            self._s = b''
+            self.fireDeferred(decoded)
         return data
 
 
@@ -98,7 +98,7 @@ class RedisEncoder:
             raise RedisEncoderWrongType(f"encodeArray takes list as argument, got {type(arr)}")
         parts = []
         for item in arr:
-            if type(item) is str:
+            if type(item) is str or item is None:
                 parts.append(RedisEncoder.encodeBulkString(item))
             elif type(item) is int:
                 parts.append(RedisEncoder.encodeInt(item))
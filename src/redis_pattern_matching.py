@@ -2,6 +2,7 @@
 Function for matching strings to patterns
 redis style
 """
+import re
 from src.exceptions.storage_exceptions import StoragePatternError
 
 
@@ -154,3 +155,73 @@ def pattern_length(pattern:str) -> int:
             count += 1
             pat_pos += 1
     return count
+
+
+def compile_pattern(pattern: str):
+    """
+    Translate a pattern redis style into a compiled regular expression
+    with the same meaning as str_match_pattern_redis
+    :param pattern:
+    :return: compiled regular expression, use fullmatch
+    :exception StoragePatternError: there is an error in the pattern
+    """
+    parts = []
+    pat_pos = 0
+    while pat_pos < len(pattern):
+        char = pattern[pat_pos]
+        if char == '?':
+            parts.append('.')
+        elif char == '*':
+            parts.append('.*')
+        elif char == '\\' and pat_pos + 1 < len(pattern):
+            pat_pos += 1
+            parts.append(re.escape(pattern[pat_pos]))
+        elif char == '[':
+            closing_bracket = pattern[pat_pos:].find(']')
+            if closing_bracket == -1:
+                raise StoragePatternError('no closing bracket found')
+            parts.append(_compile_brackets(pattern[pat_pos + 1:pat_pos + closing_bracket]))
+            pat_pos += closing_bracket
+        else:
+            parts.append(re.escape(char))
+        pat_pos += 1
+    return re.compile(''.join(parts), re.DOTALL)
+
+
+def _compile_brackets(pattern: str) -> str:
+    """
+    Translate [] pattern the way char_match_pattern reads it
+    :param pattern: pattern without brackets
+    :return: regular expression matching one character
+    """
+    if not pattern:
+        return '(?!)'
+    inverse = pattern[0] == '^'
+    if inverse:
+        pattern = pattern[1:]
+    items = []
+    pat_pos = 0
+    while pat_pos < len(pattern):
+        if pattern[pat_pos] == '-' and pat_pos - 1 >= 0 and pat_pos + 1 < len(pattern):
+            left, right = sorted((pattern[pat_pos - 1], pattern[pat_pos + 1]))
+            items.append(re.escape(left) + '-' + re.escape(right))
+            pat_pos += 2
+        else:
+            items.append(re.escape(pattern[pat_pos]))
+            pat_pos += 1
+    if not items:
+        return '.' if inverse else '(?!)'
+    return '[' + ('^' if inverse else '') + ''.join(items) + ']'
+
+
+def pattern_prefix(pattern: str) -> str:
+    """
+    Literal beginning of a pattern, every string matching
+    the pattern starts with it
+    :param pattern:
+    :return:
+    """
+    for pat_pos, char in enumerate(pattern):
+        if char in '?*[\\':
+            return pattern[:pat_pos]
+    return pattern
@@ -2,6 +2,37 @@ from twisted.internet.protocol import Protocol
 from src.redis_data_parser import RedisDataParser
 from src.exceptions.redis_data_parser_exceptions import RedisDataParserException
 
+# bytes of the buffer given to the parser at once
+PARSE_WINDOW = 4096
+
+
+def parse_buffer(parser: RedisDataParser, data: bytes, pos: int, more) -> int:
+    """
+    Parse values of the buffer one by one, so all pipelined commands
+    of it are handled. The parser copies the data it returns, so it gets
+    a window of the buffer instead of the whole rest of it,
+    the window grows while a value doesn't fit in it.
+    :param parser: its deferred fires with every parsed value
+    :param data: buffer
+    :param pos: position of the first unparsed byte
+    :param more: function called before parsing every value,
+        returning False to leave the rest of the buffer for later
+    :return: position of the first unparsed byte
+    :exception RedisDataParserException: wrong data
+    """
+    window = PARSE_WINDOW
+    while pos < len(data) and more():
+        chunk = data[pos:pos + window]
+        consumed = len(chunk) - len(parser.parse(chunk))
+        if consumed:
+            pos += consumed
+            window = PARSE_WINDOW
+        elif pos + window < len(data):
+            window *= 2
+        else:
+            break
+    return pos
+
 
 class RedisProtocol(Protocol):
     """
@@ -9,12 +40,20 @@ class RedisProtocol(Protocol):
     """
     def __init__(self):
         self._data_buffer = b''
+        # position of the first unparsed byte of the buffer
+        self._buffer_pos = 0
         self._parser = RedisDataParser()
         self._parser_defer = self._parser.getDeferred()
         self._parser_defer.addCallback(self._valueParsed)
+        # stop parsing buffered commands, e.g. while replies are not drained
+        self.paused = False
 
     def dataReceived(self, data):
-        self._data_buffer += data
+        if self._buffer_pos:
+            self._data_buffer = self._data_buffer[self._buffer_pos:] + data
+            self._buffer_pos = 0
+        else:
+            self._data_buffer += data
         self._parseBuffer()
 
     def sendData(self, data: bytes):
@@ -24,17 +63,41 @@ class RedisProtocol(Protocol):
         """
         Parse data buffer with RedisDataParser class.
         When some value is completely parsed, _valueParsed is called
-        with the value as argument.
+        with the value as argument. The buffer may hold several values,
+        see parse_buffer.
         :return:
         """
+        data = self._data_buffer
         try:
-            self._data_buffer = self._parser.parse(self._data_buffer)
+            pos = parse_buffer(self._parser, data, self._buffer_pos, self._parseMore)
         except RedisDataParserException as err:
             print(err)
             self._data_buffer = b''
+            self._buffer_pos = 0
             self._parser = RedisDataParser()
             self._parser_defer = self._parser.getDeferred()
             self._parser_defer.addCallback(self._valueParsed)
+        else:
+            # the rest of the buffer is kept in place, it's copied
+            # only when more data is received
+            if pos == len(data):
+                self._data_buffer = b''
+                self._buffer_pos = 0
+            else:
+                self._buffer_pos = pos
+
+    def bufferedBytes(self) -> int:
+        """
+        :return: size of received data which is not parsed yet
+        """
+        return len(self._data_buffer) - self._buffer_pos
+
+    def _parseMore(self) -> bool:
+        """
+        Called before parsing every value of the buffer
+        :return: False to leave the rest of the buffer for later
+        """
+        return not self.paused
 
     def _valueParsed(self, value):
         """
@@ -0,0 +1,399 @@
+"""
+Primary/replica replication. Primary sends every write command
+to its replicas and keeps the last of them in a bounded backlog.
+A replica connects with PSYNC replid offset: if the primary has the
+data after offset in the backlog, only that data is sent (partial resync),
+otherwise replica gets the whole storage as a stream of commands
+(full resync) followed by new write commands.
+Like in Redis, the backlog is created when the first replica connects
+or the server becomes a replica, until then write commands are not
+encoded and the offset doesn't grow.
+
+Replication stream:
+    +FULLRESYNC replid offset, snapshot commands, +SYNCED, write commands
+    +CONTINUE replid, write commands
+"""
+import os
+from collections import deque
+from twisted.internet import reactor, task
+from twisted.internet.protocol import ReconnectingClientFactory
+from src.redis_protocol import RedisProtocol
+from src.redis_encoder import RedisEncoder
+from src.redis_protocol_error import RedisProtocolError
+from src.value_compression import CompressedValue
+from src.exceptions.redis_command_parser_exceptions import RedisCommandParserException
+
+
+def new_replid() -> str:
+    """
+    :return: random id of replication history
+    """
+    return os.urandom(20).hex()
+
+
+def snapshot_commands(items: list):
+    """
+    Commands recreating the keys on a replica
+    :param items: list of (key, value, moe) from Storage.items_view
+    :return: generator of commands
+    """
+    for key, value, moe in items:
+        if type(value) is CompressedValue:
+            value = value.decompress()
+        if type(value) is str:
+            if moe is None:
+                yield ['set', key, value]
+            else:
+                yield ['set', key, value, 'pxat', str(int(moe * 1000))]
+            continue
+        if type(value) is list:
+            if not value:
+                continue
+            yield ['rpush', key] + value
+        elif type(value) is dict:
+            if not value:
+                continue
+            command = ['hset', key]
+            for field, field_value in value.items():
+                command += [field, field_value]
+            yield command
+        else:
+            continue
+        if moe is not None:
+            yield ['pexpireat', key, str(int(moe * 1000))]
+
+
+class ReplicationBacklog:
+    """
+    Last bytes of replication stream. Offset is the number of bytes
+    sent since the beginning of replication history.
+    """
+    def __init__(self, size=1 << 20):
+        """
+        :param size: number of bytes kept, whole commands are dropped,
+            so the backlog may be a bit bigger
+        """
+        self.size = size
+        self.offset = 0
+        self._chunks = deque()
+        self._length = 0
+
+    def __len__(self):
+        return self._length
+
+    @property
+    def start(self) -> int:
+        """
+        :return: offset of the first byte in the backlog
+        """
+        return self.offset - self._length
+
+    def append(self, data: bytes):
+        self._chunks.append(data)
+        self._length += len(data)
+        self.offset += len(data)
+        while self._length - len(self._chunks[0]) >= self.size:
+            self._length -= len(self._chunks.popleft())
+
+    def since(self, offset: int):
+        """
+        :param offset:
+        :return: bytes of the stream from offset to the end,
+            None if they are not in the backlog
+        """
+        if offset < self.start or offset > self.offset:
+            return None
+        chunks = []
+        pos = self.offset
+        for chunk in reversed(self._chunks):
+            if pos <= offset:
+                break
+            chunks.append(chunk)
+            pos -= len(chunk)
+        return b''.join(reversed(chunks))[offset - pos:]
+
+    def reset(self, offset: int):
+        """
+        Drop the data and start from offset
+        :param offset:
+        :return:
+        """
+        self._chunks.clear()
+        self._length = 0
+        self.offset = offset
+
+
+class ReplicaLink:
+    """
+    Primary side of a connection with a replica
+    """
+    def __init__(self, replication, transport, written=None):
+        """
+        :param replication:
+        :param transport: transport of the connection
+        :param written: function called after writes, e.g. checking output buffer limits
+        """
+        self.replication = replication
+        self.transport = transport
+        self.written = written
+        # data written while snapshot is sent goes after it
+        self._pending = None
+        self._task = None
+
+    def _write(self, data: bytes):
+        self.transport.write(data)
+        if self.written is not None:
+            self.written()
+
+    def send(self, data: bytes):
+        if self._pending is None:
+            self._write(data)
+        else:
+            self._pending.append(data)
+
+    def pause(self):
+        """
+        Stop sending snapshot while the replica doesn't drain it
+        """
+        if self._task is not None and self._pending is not None:
+            self._task.pause()
+
+    def resume(self):
+        if self._task is not None and self._pending is not None:
+            self._task.resume()
+
+    def fullSync(self, items: list, batch_size=1000):
+        """
+        Send keys as a stream of commands, a batch per reactor iteration
+        :param items: list of (key, value, moe)
+        :param batch_size: number of commands written at once
+        :return: deferred firing when the snapshot is sent
+        """
+        self._pending = []
+
+        def stream():
+            batch = []
+            for command in snapshot_commands(items):
+                batch.append(RedisEncoder.encodeArray(command))
+                if len(batch) >= batch_size:
+                    self._write(b''.join(batch))
+                    batch = []
+                    yield
+            batch.append(b'+SYNCED\r\n')
+            self._write(b''.join(batch + self._pending))
+            self._pending = None
+
+        self._task = task.cooperate(stream())
+        d = self._task.whenDone()
+        # stopped when the replica disconnects
+        d.addErrback(lambda failure: failure.trap(task.TaskStopped))
+        return d
+
+    def stop(self):
+        """
+        Called when connection is lost
+        :return:
+        """
+        if self._task is not None and self._pending is not None:
+            self._task.stop()
+        self.replication.replicas.remove(self)
+
+
+class MasterLinkProtocol(RedisProtocol):
+    """
+    Replica side of a connection with the primary
+    """
+    def connectionMade(self):
+        self.factory.resetDelay()
+        replication = self.factory.replication
+        replication.link_state = 'connected'
+        # data of an interrupted full resync can't be continued
+        replid = '?' if replication.loading else replication.replid
+        self.sendData(RedisEncoder.encodeArray(['psync', replid, str(replication.offset)]))
+
+    def connectionLost(self, reason):
+        self.factory.replication.link_state = 'connect'
+
+    def _valueParsed(self, value):
+        super()._valueParsed(value)
+        replication = self.factory.replication
+        if type(value) is list:
+            replication.apply(value)
+        elif type(value) is RedisProtocolError:
+            print('Primary replied with error:', value)
+            self.transport.loseConnection()
+        else:
+            words = str(value).split()
+            if not words:
+                return
+            if words[0] == 'FULLRESYNC':
+                replication.fullSyncStarted(words[1], int(words[2]))
+            elif words[0] == 'SYNCED':
+                replication.fullSyncFinished()
+            elif words[0] == 'CONTINUE':
+                replication.replid = words[1]
+
+
+class MasterLinkFactory(ReconnectingClientFactory):
+    protocol = MasterLinkProtocol
+    initialDelay = 0.1
+    maxDelay = 5
+
+    def __init__(self, replication):
+        self.replication = replication
+
+
+class Replication:
+    """
+    Replication state of a server, shared by the command parser
+    and connections. A server is a primary until REPLICAOF is called.
+    """
+    def __init__(self, parser, backlog_size=1 << 20, sync_batch=1000, clock=None):
+        """
+        :param parser: RedisCommandParser executing commands
+        :param backlog_size: bytes of replication stream kept for partial resyncs
+        :param sync_batch: number of commands of a full resync written at once
+        :param clock: reactor used for connecting to the primary
+        """
+        self.parser = parser
+        self.replid = new_replid()
+        self.backlog_size = backlog_size
+        # ReplicationBacklog, None until replication starts
+        self.backlog = None
+        self.sync_batch = sync_batch
+        self.clock = clock or reactor
+        self.replicas = []
+        # (host, port) of the primary when the server is a replica
+        self.master = None
+        # connect, sync or connected, like in ROLE reply of Redis
+        self.link_state = None
+        self.loading = False
+        self.full_syncs = 0
+        self.partial_syncs = 0
+        self._connector = None
+
+    @property
+    def offset(self) -> int:
+        return self.backlog.offset if self.backlog is not None else 0
+
+    @property
+    def feeding(self) -> bool:
+        """
+        :return: write commands have to be fed to the stream
+        """
+        return self.backlog is not None
+
+    def _createBacklog(self):
+        if self.backlog is None:
+            self.backlog = ReplicationBacklog(self.backlog_size)
+
+    @property
+    def readonly(self) -> bool:
+        return self.master is not None
+
+    def feed(self, args: list):
+        """
+        Add write command to the stream, skipped until the backlog is created
+        :param args: command with arguments
+        :return:
+        """
+        if self.backlog is None:
+            return
+        data = RedisEncoder.encodeArray(args)
+        self.backlog.append(data)
+        for replica in self.replicas:
+            replica.send(data)
+
+    def addReplica(self, transport, replid: str, offset: int, written=None) -> ReplicaLink:
+        """
+        Start sending replication stream to a connection
+        :param transport: transport of the connection
+        :param written: function called after writes to the connection
+        :param replid: replication id the replica follows
+        :param offset: offset the replica has data to
+        :return: the link, it must be stopped when connection is lost
+        """
+        self._createBacklog()
+        link = ReplicaLink(self, transport, written)
+        data = self.backlog.since(offset) if replid == self.replid else None
+        if data is None:
+            self.full_syncs += 1
+            transport.write(f'+FULLRESYNC {self.replid} {self.offset}\r\n'.encode('utf-8'))
+            link.fullSync(self.parser.storage.items_view(), self.sync_batch)
+        else:
+            self.partial_syncs += 1
+            transport.write(f'+CONTINUE {self.replid}\r\n'.encode('utf-8') + data)
+        self.replicas.append(link)
+        return link
+
+    def replicaOf(self, host=None, port=None):
+        """
+        Start following a primary or become a primary
+        :param host: host of the primary, None to stop replication
+        :param port: port of the primary
+        :return:
+        """
+        if self._connector is not None:
+            self._connector.factory.stopTrying()
+            self._connector.disconnect()
+            self._connector = None
+        if host is None:
+            if self.master is not None:
+                # writes of this server start a new history
+                self.replid = new_replid()
+            self.master = None
+            self.link_state = None
+            self.loading = False
+            return
+        self._createBacklog()
+        self.master = (host, port)
+        self.link_state = 'connect'
+        self._connector = self.clock.connectTCP(host, port, MasterLinkFactory(self))
+
+    def fullSyncStarted(self, replid: str, offset: int):
+        """
+        Drop all keys before loading them from the primary, old values
+        are freed by slices while the snapshot is loaded.
+        Replicas of this server have to resync too.
+        :param replid:
+        :param offset: offset of the primary the snapshot is taken at
+        :return:
+        """
+        self.parser.storage.flush(lazy=True)
+        for replica in list(self.replicas):
+            replica.transport.loseConnection()
+        self.replid = replid
+        self._createBacklog()
+        self.backlog.reset(offset)
+        self.loading = True
+        self.link_state = 'sync'
+
+    def fullSyncFinished(self):
+        self.loading = False
+        self.link_state = 'connected'
+
+    def apply(self, args: list):
+        """
+        Execute write command received from the primary. Commands
+        of a snapshot are not the part of replication stream.
+        :param args: command with arguments
+        :return:
+        """
+        try:
+            self.parser.execute(args)
+        except RedisCommandParserException as err:
+            print('Error in replicated command:', err)
+        if not self.loading:
+            self.feed(args)
+
+    def role(self) -> list:
+        """
+        :return: ROLE reply
+        """
+        if self.master is None:
+            replicas = []
+            for replica in self.replicas:
+                peer = replica.transport.getPeer()
+                replicas.append([peer.host, str(peer.port)])
+            return ['master', self.offset, replicas]
+        return ['slave', self.master[0], self.master[1], self.link_state, self.offset]
@@ -1,54 +1,999 @@
 from src.redis_protocol import RedisProtocol
 from twisted.internet.protocol import ServerFactory
+from twisted.internet.interfaces import IPushProducer
+from twisted.internet import threads
+from zope.interface import implementer
+from collections import deque
+import math
+import socket
+import time
 from src.redis_command_parser import *
 from src.redis_encoder import RedisEncoder
+from src.pubsub import PubSub
+from src.list_waiters import ListWaiter
+from src.client_tracking import ClientTracking
+from src.fair_scheduler import FairScheduler
+from src.timer_wheel import TimerWheel
+from src.server_stats import ServerStats, info
+from src.slowlog import SlowLog
+from src.latency_histogram import LatencyHistograms
+from src.profiler import Profiler, MODES as PROFILER_MODES
 from src.exceptions.redis_command_parser_exceptions import *
 from src.exceptions.server_protocol_exceptions import *
+from src.exceptions.storage_exceptions import StoragePatternError
+from src.exceptions.profiler_exceptions import ProfilerStateError
 
 
+def encode_result(result) -> bytes:
+    """
+    Encode result of RedisCommandParser as bytes according
+    to Redis protocol
+    :param result:
+    :return:
+    """
+    if result is BulkStringNone:
+        ans = RedisEncoder.encodeBulkString(None)
+    elif result is ArrayNone:
+        ans = RedisEncoder.encodeArray(None)
+    elif result is CommandParserSuccess:
+        ans = RedisEncoder.encodeString('OK')
+    elif isinstance(result, Exception):
+        ans = RedisEncoder.encodeError(result)
+    elif isinstance(result, list):
+        ans = RedisEncoder.encodeArray(result)
+    elif isinstance(result, int):
+        ans = RedisEncoder.encodeInt(result)
+    elif isinstance(result, str):
+        ans = RedisEncoder.encodeBulkString(result)
+    else:
+        raise UnidentifiedParserResult(f"Don't know to encode result of type {type(result)}.")
+    return ans
+
+
+# Output buffer limits of client classes: (hard limit, soft limit, soft seconds).
+# A client is disconnected when its output buffer is bigger than the hard limit
+# or stays bigger than the soft limit for soft seconds, 0 disables a limit.
+OUTPUT_BUFFER_LIMITS = {'normal': (0, 0, 0),
+                        'replica': (256 << 20, 64 << 20, 60),
+                        'pubsub': (32 << 20, 8 << 20, 60)}
+
+MEMORY_UNITS = {'b': 1, 'kb': 1 << 10, 'mb': 1 << 20, 'gb': 1 << 30}
+
+
+def parse_memory(s: str) -> int:
+    """
+    :param s: number of bytes with optional unit: b, kb, mb or gb
+    :return: number of bytes
+    :exception ValueError: wrong format
+    """
+    s = s.strip().lower()
+    for unit in ('kb', 'mb', 'gb', 'b'):
+        if s.endswith(unit):
+            return int(s[:-len(unit)]) * MEMORY_UNITS[unit]
+    return int(s)
+
+
+def parse_output_buffer_limit(s: str) -> tuple:
+    """
+    :param s: limit of a client class: 'class hard soft seconds', e.g. 'pubsub 32mb 8mb 60'
+    :return: (client class, (hard limit, soft limit, soft seconds))
+    :exception ValueError: wrong format or unknown class
+    """
+    parts = s.split()
+    if len(parts) != 4 or parts[0] not in OUTPUT_BUFFER_LIMITS:
+        raise ValueError(f'wrong output buffer limit `{s}`')
+    return parts[0], (parse_memory(parts[1]), parse_memory(parts[2]), int(parts[3]))
+
+
+def output_buffer_size(transport) -> int:
+    """
+    :param transport:
+    :return: number of bytes written to the transport but not sent yet,
+        0 for transports not buffering like twisted ones
+    """
+    try:
+        return len(transport.dataBuffer) - transport.offset + transport._tempDataLen
+    except AttributeError:
+        return 0
+
+
+def set_keepalive(transport, interval: int):
+    """
+    Turn TCP keepalive on for the connection, the first probe is sent
+    after interval seconds of silence, the peer is dropped after
+    3 unanswered probes sent every interval / 3 seconds
+    :param transport:
+    :param interval: seconds, 0 leaves keepalive off
+    :return:
+    """
+    # unix sockets and test transports have no keepalive
+    if not interval or not hasattr(transport.getHost(), 'port') or not hasattr(transport, 'setTcpKeepAlive'):
+        return
+    transport.setTcpKeepAlive(1)
+    if hasattr(socket, 'TCP_KEEPIDLE'):
+        sock = transport.getHandle()
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, interval)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, max(interval // 3, 1))
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 3)
+
+
+@implementer(IPushProducer)
 class ServerProtocol(RedisProtocol):
+    """
+    Connection with a client. The connection is a producer of the transport:
+    reading of commands is paused while replies are not drained.
+    """
     def __init__(self, factory):
         super().__init__()
         self.factory = factory
+        # replies waiting for a slow command before them,
+        # a reply is a list holding encoded data or None until it's ready
+        self._pending_replies = deque()
+        # ReplicaLink when the connection is used by a replica
+        self.replica_link = None
+        # ListWaiter objects of blocking pops waiting for elements
+        self.blocked_pops = set()
+        # unique id of the connection, given when it's made
+        self.client_id = None
+        self.created = time.time()
+        self.last_interaction = self.created
+        self.last_command = 'NULL'
+        # moment the output buffer got bigger than the soft limit
+        self._soft_limit_since = None
+        self.closing = False
+        # waiting for a turn of the FairScheduler
+        self.scheduled = False
+        self.deferred_at = None
+        self.deferrals = 0
+        self._turn_commands = 0
+        self._turn_started = None
 
     def connectionMade(self):
-        self.factory.proto_count += 1
+        factory = self.factory
+        factory.proto_count += 1
+        if factory.max_clients and len(factory.clients) >= factory.max_clients:
+            factory.rejected_connections += 1
+            self.closing = True
+            self.transport.write(RedisEncoder.encodeError(MaxClientsReached()))
+            self.transport.loseConnection()
+            return
+        factory.stats.connections_received += 1
+        factory.last_client_id += 1
+        self.client_id = factory.last_client_id
+        factory.clients[self.client_id] = self
+        self.transport.registerProducer(self, True)
+        set_keepalive(self.transport, factory.tcp_keepalive)
+        if factory.idle_wheel is not None:
+            factory.idle_wheel.add(self)
 
     def connectionLost(self, reason):
+        self.closing = True
         self.factory.proto_count -= 1
+        self.factory.clients.pop(self.client_id, None)
+        if self.factory.idle_wheel is not None:
+            self.factory.idle_wheel.remove(self)
+        self.factory.tracking.disable(self.client_id)
+        if self.replica_link is not None:
+            self.replica_link.stop()
+            self.replica_link = None
+        self.factory.pubsub.remove(self)
+        for waiter in self.blocked_pops:
+            self.factory.parser.list_waiters.cancel(waiter)
+        self.blocked_pops.clear()
+
+    def dataReceived(self, data):
+        self.factory.stats.net_input_bytes += len(data)
+        super().dataReceived(data)
 
     def _valueParsed(self, value):
         super()._valueParsed(value)
+        if self.closing:
+            return
+        self.factory.stats.commands += 1
+        self._turn_commands += 1
+        self.last_interaction = time.time()
+        self.last_command = value[0].lower()
+        slow = None
+        known = True
+        started = time.perf_counter_ns()
         try:
-            result = self.factory.parser.parse(value)
+            # commands working with the connection itself
+            handler = getattr(self, '_handle_' + value[0].lower(), None)
+            if handler is not None:
+                result = handler(value[1:])
+                self._commandTimed(value, started)
+                if result is not None:
+                    self._reply(self._encodeResult(result))
+                return
+            slow = self.factory.parser.parse_slow(value)
+            if slow is None:
+                result = self.factory.parser.parse(value)
+            if self.client_id in self.factory.tracking.clients and value[0].lower() not in WRITE_COMMANDS:
+                self.factory.tracking.track(self.client_id, self.factory.parser.command_keys(value))
         except RedisCommandParserException as err:
             result = err
-        data = self._encodeResult(result)
-        self.sendData(data)
+            # names of unknown commands don't get histograms
+            known = not isinstance(err, WrongCommand)
+        self._commandTimed(value, started, known)
+        if slow is None:
+            self._reply(self._encodeResult(result))
+        else:
+            self._replyLater(slow)
 
-    def _encodeResult(self, result):
+    def _commandTimed(self, value, started: int, known=True):
         """
-        Method for encoding result as bytes according
-        to Redis protocol
+        Record time of the command execution in its latency histogram,
+        in the slow log and in the loop monitor if the command blocked
+        the loop for long, writing of the reply is not counted
+        :param value: command with arguments
+        :param started: perf_counter_ns before the execution
+        :param known: the command exists
         :return:
         """
-        if result is BulkStringNone:
-            ans = RedisEncoder.encodeBulkString(None)
-        elif result is ArrayNone:
-            ans = RedisEncoder.encodeArray(None)
-        elif result is CommandParserSuccess:
-            ans = RedisEncoder.encodeString('OK')
-        elif isinstance(result, Exception):
-            ans = RedisEncoder.encodeError(result)
-        elif isinstance(result, list):
-            ans = RedisEncoder.encodeArray(result)
-        elif isinstance(result, int):
-            ans = RedisEncoder.encodeInt(result)
-        elif isinstance(result, str):
-            ans = RedisEncoder.encodeBulkString(result)
+        duration = (time.perf_counter_ns() - started) // 1000
+        factory = self.factory
+        if known:
+            factory.latency.record(self.last_command, duration)
+        factory.slowlog.record(duration, value, self.address)
+        if factory.loop_monitor is not None and duration >= factory.loop_monitor.threshold_us:
+            factory.loop_monitor.blame(f'command:{self.last_command}')
+
+    def _parseBuffer(self):
+        """
+        Parse a turn of commands, the rest is left
+        for the next turn of the scheduler
+        """
+        if self.scheduled:
+            return
+        self._turn_commands = 0
+        self._turn_started = self.factory.scheduler.turnStarted()
+        super()._parseBuffer()
+
+    def _parseMore(self) -> bool:
+        # a blocked client executes nothing until it's served
+        if self.paused or self.closing or self.blocked_pops:
+            return False
+        scheduler = self.factory.scheduler
+        if scheduler.overBudget(self._turn_commands, self._turn_started):
+            self.scheduled = True
+            self.deferrals += 1
+            scheduler.defer(self)
+            self._updateReading()
+            return False
+        return True
+
+    def continueParsing(self):
+        """
+        Called by the scheduler on the turn of the connection
+        """
+        self.scheduled = False
+        if not self.closing:
+            self._updateReading()
+            self._parseBuffer()
+
+    def _updateReading(self):
+        """
+        Stop reading from the socket while buffered commands can't be parsed:
+        replies are not drained, the connection waits for its turn
+        or is blocked, so the buffer doesn't grow without a limit
+        :return:
+        """
+        if self.closing:
+            return
+        if self.paused or self.scheduled or self.blocked_pops:
+            self.transport.pauseProducing()
+        else:
+            self.transport.resumeProducing()
+
+    def sendData(self, data: bytes):
+        self.factory.stats.net_output_bytes += len(data)
+        self.transport.write(data)
+        self.checkOutputBuffer()
+
+    def clientClass(self) -> str:
+        """
+        :return: class of the client for output buffer limits
+        """
+        if self.replica_link is not None:
+            return 'replica'
+        if self.factory.pubsub.subscription_count(self):
+            return 'pubsub'
+        return 'normal'
+
+    def checkOutputBuffer(self):
+        """
+        Disconnect the client if its output buffer is over the limits
+        of its class. Called after writes.
+        :return:
+        """
+        if self.closing:
+            return
+        hard, soft, soft_seconds = self.factory.output_limits[self.clientClass()]
+        if not hard and not soft:
+            return
+        size = output_buffer_size(self.transport)
+        if hard and size > hard:
+            self._closeOverLimit(f'output buffer of {size} bytes is over hard limit')
+        elif soft and size > soft:
+            now = time.time()
+            if self._soft_limit_since is None:
+                self._soft_limit_since = now
+            elif now - self._soft_limit_since >= soft_seconds:
+                self._closeOverLimit(f'output buffer was over soft limit for {soft_seconds}s')
+        else:
+            self._soft_limit_since = None
+
+    def kill(self):
+        """
+        Close the connection, replies already written are sent
+        :return:
+        """
+        if not self.closing:
+            self.closing = True
+            self.transport.loseConnection()
+
+    def _closeOverLimit(self, reason):
+        print(f'Closing client {self.client_id}:', reason)
+        self.closing = True
+        self.factory.clients_closed_over_limit += 1
+        self.transport.abortConnection()
+
+    def pauseProducing(self):
+        """
+        Called by the transport when replies are not drained,
+        stop reading commands
+        """
+        self.paused = True
+        self._updateReading()
+        if self.replica_link is not None:
+            self.replica_link.pause()
+
+    def resumeProducing(self):
+        """
+        Called by the transport when replies are sent
+        """
+        self.paused = False
+        self._updateReading()
+        if self.replica_link is not None:
+            self.replica_link.resume()
+        self._parseBuffer()
+        self.checkOutputBuffer()
+
+    def stopProducing(self):
+        pass
+
+    def _replication(self):
+        """
+        :return: Replication object of the parser
+        :exception WrongCommand: replication is disabled
+        """
+        replication = self.factory.parser.replication
+        if replication is None:
+            raise WrongCommand('replication is disabled')
+        return replication
+
+    def _handle_psync(self, args):
+        """
+        Turn the connection into a replication link.
+        Usage: PSYNC replid offset
+        :param args:
+        :return: None, replication stream is sent instead of a reply
+        :exception CommandWrongArgumentNumber: not exactly 2 arguments given
+        :exception CommandSyntaxError: offset is not int
+        :exception CommandLoading: server is loading keys from its primary
+        """
+        replication = self._replication()
+        if len(args) != 2:
+            raise CommandWrongArgumentNumber(f'`psync` command needs 2 arguments, found {len(args)}')
+        try:
+            offset = int(args[1])
+        except ValueError:
+            raise CommandSyntaxError('offset must be integer')
+        if replication.loading:
+            raise CommandLoading()
+        self.replica_link = replication.addReplica(self.transport, args[0], offset, self.checkOutputBuffer)
+
+    def _handle_replicaof(self, args):
+        """
+        Make the server a replica of another server,
+        or stop replication and make it a primary.
+        Usage: REPLICAOF host port | REPLICAOF NO ONE
+        :param args:
+        :return: CommandParserSuccess
+        :exception CommandWrongArgumentNumber: not exactly 2 arguments given
+        :exception CommandSyntaxError: port is not int
+        """
+        replication = self._replication()
+        if len(args) != 2:
+            raise CommandWrongArgumentNumber(f'`replicaof` command needs 2 arguments, found {len(args)}')
+        if args[0].lower() == 'no' and args[1].lower() == 'one':
+            replication.replicaOf(None)
         else:
-            raise UnidentifiedParserResult(f"Don't know to encode result of type {type(result)}.")
-        return ans
+            try:
+                port = int(args[1])
+            except ValueError:
+                raise CommandSyntaxError('port must be integer')
+            replication.replicaOf(args[0], port)
+        return CommandParserSuccess
+
+    def _handle_subscribe(self, args):
+        """
+        Subscribe to channels.
+        Usage: SUBSCRIBE channel [channel ...]
+        :param args:
+        :return: None, ['subscribe', channel, count] is sent for every channel
+        :exception CommandWrongArgumentNumber: no channels given
+        """
+        if not args:
+            raise CommandWrongArgumentNumber('`subscribe` command needs at least 1 argument')
+        for channel in args:
+            count = self.factory.pubsub.subscribe(self, channel)
+            self._reply(RedisEncoder.encodeArray(['subscribe', channel, count]))
+
+    def _handle_unsubscribe(self, args):
+        """
+        Unsubscribe from channels, from all channels if none given.
+        Usage: UNSUBSCRIBE [channel ...]
+        :param args:
+        :return: None, ['unsubscribe', channel, count] is sent for every channel
+        """
+        pubsub = self.factory.pubsub
+        channels = args or pubsub.subscriber_channels(self)
+        for channel in channels:
+            count = pubsub.unsubscribe(self, channel)
+            self._reply(RedisEncoder.encodeArray(['unsubscribe', channel, count]))
+        if not channels:
+            self._reply(RedisEncoder.encodeArray(['unsubscribe', None, pubsub.subscription_count(self)]))
+
+    def _handle_psubscribe(self, args):
+        """
+        Subscribe to channels matching patterns.
+        Usage: PSUBSCRIBE pattern [pattern ...]
+        :param args:
+        :return: None, ['psubscribe', pattern, count] is sent for every pattern
+        :exception CommandWrongArgumentNumber: no patterns given
+        :exception CommandSyntaxError: error in a pattern
+        """
+        if not args:
+            raise CommandWrongArgumentNumber('`psubscribe` command needs at least 1 argument')
+        for pattern in args:
+            try:
+                count = self.factory.pubsub.psubscribe(self, pattern)
+            except StoragePatternError:
+                raise CommandSyntaxError(f'error in pattern `{pattern}`')
+            self._reply(RedisEncoder.encodeArray(['psubscribe', pattern, count]))
+
+    def _handle_punsubscribe(self, args):
+        """
+        Unsubscribe from patterns, from all patterns if none given.
+        Usage: PUNSUBSCRIBE [pattern ...]
+        :param args:
+        :return: None, ['punsubscribe', pattern, count] is sent for every pattern
+        """
+        pubsub = self.factory.pubsub
+        patterns = args or pubsub.subscriber_patterns(self)
+        for pattern in patterns:
+            count = pubsub.punsubscribe(self, pattern)
+            self._reply(RedisEncoder.encodeArray(['punsubscribe', pattern, count]))
+        if not patterns:
+            self._reply(RedisEncoder.encodeArray(['punsubscribe', None, pubsub.subscription_count(self)]))
+
+    def _handle_publish(self, args):
+        """
+        Post a message to a channel.
+        Usage: PUBLISH channel message
+        :param args:
+        :return: number of subscribers that got the message
+        :exception CommandWrongArgumentNumber: not exactly 2 arguments given
+        """
+        if len(args) != 2:
+            raise CommandWrongArgumentNumber(f'`publish` command needs 2 arguments, found {len(args)}')
+        return self.factory.pubsub.publish(args[0], args[1])
+
+    def _handle_info(self, args):
+        """
+        Information and statistics about the server.
+        Usage: INFO [section ...]
+        :param args: sections: server, clients, persistence, stats,
+            replication, cpu, compression, tiering, keyspace, all
+        :return: lines of fields grouped in sections
+        """
+        return info(self.factory, args)
+
+    def _handle_slowlog(self, args):
+        """
+        Read or reset the slow log.
+        Usage: SLOWLOG GET [count] | SLOWLOG LEN | SLOWLOG RESET
+        :param args:
+        :return: entries [id, timestamp, microseconds, arguments, address, name],
+            the newest first, number of entries or CommandParserSuccess
+        :exception CommandWrongArgumentNumber: no subcommand or wrong number of arguments
+        :exception CommandSyntaxError: unknown subcommand, count is not an integer
+        """
+        if not args:
+            raise CommandWrongArgumentNumber('`slowlog` command needs a subcommand')
+        subcommand = args[0].lower()
+        slowlog = self.factory.slowlog
+        if subcommand == 'get' and len(args) <= 2:
+            try:
+                count = int(args[1]) if len(args) == 2 else 10
+            except ValueError:
+                raise CommandSyntaxError('count must be an integer')
+            return slowlog.get(count)
+        if subcommand in ('len', 'reset') and len(args) > 1:
+            raise CommandWrongArgumentNumber(f'`slowlog {subcommand}` needs no arguments')
+        if subcommand == 'len':
+            return len(slowlog)
+        if subcommand == 'reset':
+            slowlog.reset()
+            return CommandParserSuccess
+        if subcommand == 'get':
+            raise CommandWrongArgumentNumber('`slowlog get` needs at most 1 argument')
+        raise CommandSyntaxError(f'unknown `slowlog` subcommand `{args[0]}`')
+
+    def _handle_latency(self, args):
+        """
+        Latency statistics.
+        Usage: LATENCY HISTOGRAM [command ...] | LATENCY LATEST | LATENCY HISTORY event |
+            LATENCY RESET [event ...]
+        :param args:
+        :return: result of the subcommand
+        :exception CommandWrongArgumentNumber: no subcommand given
+        :exception CommandSyntaxError: unknown subcommand
+        """
+        if not args:
+            raise CommandWrongArgumentNumber('`latency` command needs a subcommand')
+        handler = getattr(self, '_latency_' + args[0].lower(), None)
+        if handler is None:
+            raise CommandSyntaxError(f'unknown `latency` subcommand `{args[0]}`')
+        return handler(args[1:])
+
+    def _latency_histogram(self, args):
+        """
+        :param args: names of commands, all commands if empty
+        :return: [command, ['calls', n, 'p50_usec', p50, 'p99_usec', p99, 'p999_usec', p999,
+            'histogram_usec', [bucket bound, number of calls up to it, ...]], ...]
+            for commands called at least once
+        """
+        histograms = self.factory.latency.commands
+        names = [arg.lower() for arg in args] if args else sorted(histograms)
+        reply = []
+        for name in names:
+            histogram = histograms.get(name)
+            if histogram is None:
+                continue
+            buckets = [value for bucket in histogram.cumulative() for value in bucket]
+            reply.extend([name, ['calls', histogram.count,
+                                 'p50_usec', histogram.percentile(50), 'p99_usec', histogram.percentile(99),
+                                 'p999_usec', histogram.percentile(99.9), 'histogram_usec', buckets]])
+        return reply
+
+    def _latency_latest(self, args):
+        """
+        :return: [event, timestamp, latest ms, max ms] of every event loop stall
+            event, an event is named after the command or the function blocking the loop
+        :exception CommandWrongArgumentNumber: arguments given
+        """
+        if args:
+            raise CommandWrongArgumentNumber(f'`latency latest` needs no arguments, found {len(args)}')
+        monitor = self.factory.loop_monitor
+        return monitor.latest() if monitor is not None else []
+
+    def _latency_history(self, args):
+        """
+        :return: [timestamp, ms] of the latest stalls of the event
+        :exception CommandWrongArgumentNumber: not exactly 1 argument given
+        """
+        if len(args) != 1:
+            raise CommandWrongArgumentNumber(f'`latency history` needs 1 argument, found {len(args)}')
+        monitor = self.factory.loop_monitor
+        if monitor is None or args[0] not in monitor.history:
+            return []
+        return [list(event) for event in monitor.history[args[0]]]
+
+    def _latency_reset(self, args):
+        """
+        :return: number of reset events
+        """
+        monitor = self.factory.loop_monitor
+        return monitor.reset(args) if monitor is not None else 0
+
+    def _handle_debug(self, args):
+        """
+        Debugging commands.
+        Usage: DEBUG PROFILE START [seconds] [CPROFILE|SAMPLING] | DEBUG PROFILE STOP
+        :param args:
+        :return: result of the subcommand
+        :exception CommandWrongArgumentNumber: no subcommand given
+        :exception CommandSyntaxError: unknown subcommand
+        """
+        if not args:
+            raise CommandWrongArgumentNumber('`debug` command needs a subcommand')
+        handler = getattr(self, '_debug_' + args[0].lower(), None)
+        if handler is None:
+            raise CommandSyntaxError(f'unknown `debug` subcommand `{args[0]}`')
+        return handler(args[1:])
+
+    def _debug_profile(self, args):
+        """
+        Start profiling of the server or stop it and write the profile,
+        pstats of cProfile or collapsed stacks of the sampling profiler
+        :param args: START [seconds] [CPROFILE|SAMPLING] or STOP
+        :return: path of the profile file
+        :exception CommandWrongArgumentNumber: no action or wrong number of arguments
+        :exception CommandSyntaxError: unknown action, seconds are not a finite positive number,
+            unknown mode, profiler is running already or is not running,
+            the profile can't be written
+        """
+        if not args:
+            raise CommandWrongArgumentNumber('`debug profile` needs START or STOP')
+        action = args[0].lower()
+        profiler = self.factory.profiler
+        try:
+            if action == 'stop':
+                if len(args) > 1:
+                    raise CommandWrongArgumentNumber('`debug profile stop` needs no arguments')
+                return profiler.stop()
+            if action != 'start':
+                raise CommandSyntaxError(f'unknown `debug profile` action `{args[0]}`')
+            if len(args) > 3:
+                raise CommandWrongArgumentNumber('`debug profile start` needs at most 2 arguments')
+            seconds = None
+            mode = 'cprofile'
+            for arg in args[1:]:
+                if arg.lower() in PROFILER_MODES:
+                    mode = arg.lower()
+                    continue
+                try:
+                    seconds = float(arg)
+                except ValueError:
+                    raise CommandSyntaxError(f'unknown profiler mode `{arg}`')
+                if not math.isfinite(seconds) or seconds <= 0:
+                    raise CommandSyntaxError('seconds must be a positive number')
+            return profiler.start(seconds, mode)
+        except (ProfilerStateError, OSError) as err:
+            raise CommandSyntaxError(str(err))
+
+    def _handle_client(self, args):
+        """
+        Commands about connections.
+        Usage: CLIENT ID | CLIENT LIST [TYPE type] [ID id ...] | CLIENT KILL ... |
+            CLIENT TRACKING ON|OFF [REDIRECT id] [BCAST] [PREFIX prefix ...]
+        :param args:
+        :return: result of the subcommand
+        :exception CommandWrongArgumentNumber: no subcommand given
+        :exception CommandSyntaxError: unknown subcommand
+        """
+        if not args:
+            raise CommandWrongArgumentNumber('`client` command needs a subcommand')
+        handler = getattr(self, '_client_' + args[0].lower(), None)
+        if handler is None:
+            raise CommandSyntaxError(f'unknown `client` subcommand `{args[0]}`')
+        return handler(args[1:])
+
+    def _client_id(self, args):
+        """
+        :return: id of the connection
+        :exception CommandWrongArgumentNumber: arguments given
+        """
+        if args:
+            raise CommandWrongArgumentNumber(f'`client id` needs no arguments, found {len(args)}')
+        return self.client_id
+
+    def _client_list(self, args):
+        """
+        Usage: CLIENT LIST [TYPE normal|replica|pubsub] [ID id ...]
+        :return: line of properties of every connection matching the filter
+        :exception CommandSyntaxError: unknown filter or type, id is not an integer
+        """
+        clients = self.factory.clients.values()
+        if args:
+            option = args[0].lower()
+            if option == 'type' and len(args) == 2:
+                client_type = self._clientType(args[1])
+                clients = [client for client in clients if client.clientClass() == client_type]
+            elif option == 'id' and len(args) > 1:
+                clients = [self.factory.clients[client_id] for client_id in self._clientIds(args[1:])
+                           if client_id in self.factory.clients]
+            else:
+                raise CommandSyntaxError('syntax error')
+        return ''.join(client.info() + '\n' for client in clients)
+
+    def _client_kill(self, args):
+        """
+        Close connections.
+        Usage: CLIENT KILL addr |
+            CLIENT KILL [ID id] [ADDR addr] [TYPE normal|replica|pubsub] [SKIPME yes|no]
+        :param args:
+        :return: CommandParserSuccess for the address form, number
+            of closed connections for the filter form
+        :exception CommandWrongArgumentNumber: no arguments given
+        :exception CommandSyntaxError: no client with the address,
+            unknown filter or wrong filter value
+        """
+        if not args:
+            raise CommandWrongArgumentNumber('`client kill` needs arguments')
+        if len(args) == 1:
+            for client in self.factory.clients.values():
+                if not client.closing and client.address() == args[0]:
+                    client.kill()
+                    return CommandParserSuccess
+            raise CommandSyntaxError('No such client')
+        if len(args) % 2:
+            raise CommandSyntaxError('syntax error')
+        client_id = addr = client_type = None
+        skipme = True
+        for name, value in zip(args[::2], args[1::2]):
+            name = name.lower()
+            if name == 'id':
+                client_id = self._clientIds([value])[0]
+            elif name == 'addr':
+                addr = value
+            elif name == 'type':
+                client_type = self._clientType(value)
+            elif name == 'skipme' and value.lower() in ('yes', 'no'):
+                skipme = value.lower() == 'yes'
+            else:
+                raise CommandSyntaxError('syntax error')
+        killed = 0
+        for client in list(self.factory.clients.values()):
+            if client.closing or skipme and client is self or \
+                    client_id is not None and client.client_id != client_id or \
+                    addr is not None and client.address() != addr or \
+                    client_type is not None and client.clientClass() != client_type:
+                continue
+            client.kill()
+            killed += 1
+        return killed
+
+    @staticmethod
+    def _clientType(name: str) -> str:
+        """
+        :exception CommandSyntaxError: unknown client type
+        """
+        client_type = name.lower()
+        if client_type == 'slave':
+            client_type = 'replica'
+        if client_type not in OUTPUT_BUFFER_LIMITS:
+            raise CommandSyntaxError(f'unknown client type `{name}`')
+        return client_type
+
+    @staticmethod
+    def _clientIds(args: list) -> list:
+        """
+        :exception CommandSyntaxError: id is not an integer
+        """
+        try:
+            return [int(arg) for arg in args]
+        except ValueError:
+            raise CommandSyntaxError('client id must be an integer')
+
+    def address(self) -> str:
+        """
+        :return: address of the peer, host:port
+        """
+        peer = self.transport.getPeer()
+        if hasattr(peer, 'host'):
+            return f'{peer.host}:{peer.port}'
+        # peers of unix socket have no names, the socket path is shown
+        name = self.transport.getHost().name
+        return (name.decode('utf-8') if isinstance(name, bytes) else name) + ':0'
+
+    def info(self) -> str:
+        """
+        :return: properties of the connection for CLIENT LIST
+        """
+        now = time.time()
+        addr = self.address()
+        flags = {'normal': 'N', 'replica': 'S', 'pubsub': 'P'}[self.clientClass()]
+        if self.blocked_pops:
+            flags += 'b'
+        if self.paused:
+            flags += 'p'
+        if self.scheduled:
+            flags += 's'
+        pubsub = self.factory.pubsub
+        return (f'id={self.client_id} addr={addr} '
+                f'age={int(now - self.created)} idle={int(now - self.last_interaction)} flags={flags} '
+                f'sub={len(pubsub.subscriber_channels(self))} psub={len(pubsub.subscriber_patterns(self))} '
+                f'qbuf={self.bufferedBytes()} omem={output_buffer_size(self.transport)} '
+                f'deferrals={self.deferrals} cmd={self.last_command}')
+
+    def _client_tracking(self, args):
+        """
+        Turn client side caching on or off. Invalidation messages are sent
+        to the REDIRECT connection, which has to be subscribed
+        to __redis__:invalidate.
+        :param args:
+        :return: CommandParserSuccess
+        :exception CommandWrongArgumentNumber: no arguments given
+        :exception CommandSyntaxError: wrong option, no REDIRECT connection,
+            PREFIX without BCAST
+        """
+        if not args:
+            raise CommandWrongArgumentNumber('`client tracking` needs ON or OFF')
+        state = args[0].lower()
+        if state == 'off':
+            self.factory.tracking.disable(self.client_id)
+            return CommandParserSuccess
+        if state != 'on':
+            raise CommandSyntaxError('`client tracking` needs ON or OFF')
+        redirect = None
+        bcast = False
+        prefixes = []
+        pos = 1
+        while pos < len(args):
+            opt = args[pos].lower()
+            if opt == 'bcast':
+                bcast = True
+            elif opt in ('redirect', 'prefix') and pos + 1 < len(args):
+                pos += 1
+                if opt == 'prefix':
+                    prefixes.append(args[pos])
+                else:
+                    try:
+                        redirect = int(args[pos])
+                    except ValueError:
+                        raise CommandSyntaxError('client id must be integer')
+            else:
+                raise CommandSyntaxError(f'wrong option `{args[pos]}`')
+            pos += 1
+        if redirect is None:
+            raise CommandSyntaxError('REDIRECT to a connection subscribed to __redis__:invalidate is required')
+        if redirect not in self.factory.clients:
+            raise CommandSyntaxError(f'no connection with id {redirect}')
+        if prefixes and not bcast:
+            raise CommandSyntaxError('PREFIX needs BCAST')
+        self.factory.tracking.enable(self.client_id, redirect, bcast, prefixes)
+        return CommandParserSuccess
+
+    def _handle_blpop(self, args):
+        """
+        Pop the first element of the first non-empty list,
+        block until one of the lists gets an element if all are empty.
+        Usage: BLPOP key [key ...] timeout
+        :param args:
+        :return: [key, element] or None if the connection is blocked
+        :exception CommandWrongArgumentNumber: less than 2 arguments given
+        :exception CommandSyntaxError: timeout is not a number or negative
+        :exception CommandWrongType: a key holds non-list value
+        :exception CommandCrossSlot: keys belong to different cluster slots
+        :exception CommandMoved: keys belong to another cluster node
+        """
+        keys, timeout = self._blockingArgs('blpop', args)
+        self.factory.parser.check_keys(['blpop'] + args)
+        return self._blockingPop(keys, timeout, lambda key: ['lpop', key],
+                                 lambda key, value: [key, value], ArrayNone)
+
+    def _handle_brpop(self, args):
+        """
+        Same as BLPOP, but pops the last element.
+        Usage: BRPOP key [key ...] timeout
+        """
+        keys, timeout = self._blockingArgs('brpop', args)
+        self.factory.parser.check_keys(['brpop'] + args)
+        return self._blockingPop(keys, timeout, lambda key: ['rpop', key],
+                                 lambda key, value: [key, value], ArrayNone)
+
+    def _handle_blmove(self, args):
+        """
+        Blocking LMOVE.
+        Usage: BLMOVE source destination LEFT|RIGHT LEFT|RIGHT timeout
+        :param args:
+        :return: the moved element or None if the connection is blocked
+        :exception CommandWrongArgumentNumber: not exactly 5 arguments given
+        :exception CommandSyntaxError: timeout is not a number or negative,
+            ends are not LEFT or RIGHT
+        :exception CommandWrongType: source or destination holds non-list value
+        :exception CommandCrossSlot: keys belong to different cluster slots
+        :exception CommandMoved: keys belong to another cluster node
+        """
+        if len(args) != 5:
+            raise CommandWrongArgumentNumber(f'`blmove` command needs 5 arguments, found {len(args)}')
+        _, timeout = self._blockingArgs('blmove', args[-1:], 1)
+        if args[2].lower() not in ('left', 'right') or args[3].lower() not in ('left', 'right'):
+            raise CommandSyntaxError('list ends must be LEFT or RIGHT')
+        self.factory.parser.check_keys(['blmove'] + args)
+        return self._blockingPop(args[:1], timeout, lambda key: ['lmove'] + args[:4],
+                                 lambda key, value: value, BulkStringNone)
+
+    @staticmethod
+    def _blockingArgs(command, args, min_args=2):
+        """
+        :param command: name of the command for error messages
+        :param args: keys and timeout in seconds
+        :param min_args:
+        :return: list of keys and timeout
+        :exception CommandWrongArgumentNumber: less than min_args arguments given
+        :exception CommandSyntaxError: timeout is not a number or negative
+        """
+        if len(args) < min_args:
+            raise CommandWrongArgumentNumber(f'`{command}` command needs at least {min_args} arguments, '
+                                             f'found {len(args)}')
+        try:
+            timeout = float(args[-1])
+        except ValueError:
+            raise CommandSyntaxError('timeout is not a number')
+        if timeout < 0:
+            raise CommandSyntaxError('timeout is negative')
+        return args[:-1], timeout
+
+    def _blockingPop(self, keys, timeout, command, reply, timeout_result):
+        """
+        Pop from the first non-empty key or put the connection
+        in the waiter queues of the keys. Commands after the blocked
+        one are not executed until it's served or timed out, like in Redis.
+        :param keys:
+        :param timeout: seconds to wait, 0 to wait forever
+        :param command: function of a key returning the popping command
+        :param reply: function of a key and popped element returning the result
+        :param timeout_result: result sent on timeout
+        :return: result or None if the connection is blocked
+        """
+        parser = self.factory.parser
+        for key in keys:
+            value = parser.parse(command(key))
+            if value is not BulkStringNone:
+                return reply(key, value)
+        pending = [None]
+        self._pending_replies.append(pending)
+
+        def served(key, value):
+            self.blocked_pops.discard(waiter)
+            result = timeout_result if key is None else reply(key, value)
+            self._slowDone(self._encodeResult(result), pending)
+            if not self.closing:
+                self._updateReading()
+                self._parseBuffer()
+
+        waiter = ListWaiter(keys, command, served)
+        self.blocked_pops.add(waiter)
+        parser.list_waiters.block(waiter, timeout)
+        self._updateReading()
+
+    def _reply(self, data: bytes):
+        """
+        Send reply or queue it after replies of slow commands
+        :param data: encoded reply
+        :return:
+        """
+        if self._pending_replies:
+            self._pending_replies.append([data])
+        else:
+            self.sendData(data)
+
+    def _replyLater(self, slow):
+        """
+        Run slow command in a thread, its reply and replies
+        of commands after it are sent when it's done.
+        :param slow: function returning result of the command
+        :return: deferred firing when the command is done
+        """
+        reply = [None]
+        self._pending_replies.append(reply)
+        d = threads.deferToThread(self._runSlow, slow)
+        d.addCallback(self._slowDone, reply)
+        return d
+
+    def _runSlow(self, slow) -> bytes:
+        """
+        Called in a thread
+        :return: encoded result of the slow command
+        """
+        try:
+            result = slow()
+        # any failure must become a reply, or replies after it are never sent
+        except Exception as err:
+            result = err
+        return self._encodeResult(result)
+
+    def _slowDone(self, data, reply):
+        reply[0] = data
+        while self._pending_replies and self._pending_replies[0][0] is not None:
+            self.sendData(self._pending_replies.popleft()[0])
+
+    def _encodeResult(self, result):
+        return encode_result(result)
 
 
 class ServerProtocolFactory(ServerFactory):
@@ -62,9 +1007,62 @@ class ServerProtocolFactory(ServerFactory):
             set None to disable saving/loading
         """
         self.proto_count = 0
+        # connections by their ids
+        self.clients = {}
+        self.last_client_id = 0
+        self.pubsub = PubSub()
         if parser is None:
             parser = RedisCommandParser()
         self.parser = parser
+        self.tracking = ClientTracking(parser.storage, self.clients)
+        # output buffer limits of client classes, see OUTPUT_BUFFER_LIMITS
+        self.output_limits = dict(OUTPUT_BUFFER_LIMITS)
+        self.clients_closed_over_limit = 0
+        # limits commands parsed per connection per reactor turn
+        self.scheduler = FairScheduler()
+        # connections over the limit are refused, 0 for no limit
+        self.max_clients = 10000
+        self.rejected_connections = 0
+        # seconds of TCP keepalive, 0 to leave it off
+        self.tcp_keepalive = 300
+        # TimerWheel closing idle connections, see setIdleTimeout
+        self.idle_wheel = None
+        # counters for INFO
+        self.stats = ServerStats()
+        # commands executed slower than a threshold
+        self.slowlog = SlowLog()
+        # latency histograms of commands
+        self.latency = LatencyHistograms()
+        # LoopMonitor measuring lag of the reactor or None
+        self.loop_monitor = None
+        # DEBUG PROFILE
+        self.profiler = Profiler()
+
+    def setIdleTimeout(self, timeout: float, clock=None):
+        """
+        Close normal connections without commands for timeout seconds.
+        Replicas, subscribers and blocked connections are not closed.
+        :param timeout: seconds, 0 to disable
+        :param clock: reactor, the global one by default
+        :return:
+        """
+        if self.idle_wheel is not None:
+            self.idle_wheel.stop()
+            self.idle_wheel = None
+        if timeout:
+            self.idle_wheel = TimerWheel(timeout, self._closeIdle, clock)
+            for client in self.clients.values():
+                self.idle_wheel.add(client)
+
+    @staticmethod
+    def _closeIdle(connection) -> bool:
+        """
+        :return: True if the connection was closed
+        """
+        if connection.clientClass() != 'normal' or connection.blocked_pops:
+            return False
+        connection.kill()
+        return True
 
     def buildProtocol(self, addr):
         return self.protocol(self)
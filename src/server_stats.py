@@ -0,0 +1,230 @@
+"""
+Counters of the server and the INFO command. Hot paths only
+increment integers, everything else is computed when INFO is called.
+Instantaneous rates are averages of the last 16 samples taken
+every 100 ms, like in Redis.
+"""
+import os
+import platform
+import resource
+import time
+import twisted
+from twisted.internet import reactor
+
+# number of samples of instantaneous metrics
+SAMPLES = 16
+
+# sections of INFO without arguments
+DEFAULT_SECTIONS = ('server', 'clients', 'persistence', 'stats', 'replication', 'cpu', 'compression', 'tiering',
+                    'keyspace')
+
+
+class ServerStats:
+    """
+    Counters incremented by connections
+    """
+    def __init__(self):
+        self.started = time.time()
+        self.commands = 0
+        self.connections_received = 0
+        self.net_input_bytes = 0
+        self.net_output_bytes = 0
+        # metric: per second values of the last samples
+        self._samples = {'ops': [0] * SAMPLES, 'input': [0] * SAMPLES, 'output': [0] * SAMPLES}
+        self._sample_index = 0
+        self._last = None
+        self._call = None
+        self.clock = None
+        self.interval = None
+
+    def startSampling(self, clock=None, interval=0.1):
+        """
+        Start sampling of instantaneous metrics, they are 0 until then
+        :param clock: reactor, the global one by default
+        :param interval: seconds between samples
+        :return:
+        """
+        self.clock = clock or reactor
+        self.interval = interval
+        self._last = (self.clock.seconds(), self.commands, self.net_input_bytes, self.net_output_bytes)
+        self._call = self.clock.callLater(interval, self._sample)
+
+    def stopSampling(self):
+        if self._call is not None and self._call.active():
+            self._call.cancel()
+        self._call = None
+
+    def _sample(self):
+        now = self.clock.seconds()
+        then, commands, input_bytes, output_bytes = self._last
+        elapsed = now - then
+        if elapsed > 0:
+            index = self._sample_index % SAMPLES
+            self._samples['ops'][index] = (self.commands - commands) / elapsed
+            self._samples['input'][index] = (self.net_input_bytes - input_bytes) / elapsed
+            self._samples['output'][index] = (self.net_output_bytes - output_bytes) / elapsed
+            self._sample_index += 1
+        self._last = (now, self.commands, self.net_input_bytes, self.net_output_bytes)
+        self._call = self.clock.callLater(self.interval, self._sample)
+
+    def instantaneous(self, metric: str) -> float:
+        """
+        :param metric: ops, input or output
+        :return: average per second value of the last samples
+        """
+        samples = self._samples[metric]
+        return sum(samples) / len(samples)
+
+
+def info(factory, sections=()) -> str:
+    """
+    Text of INFO reply
+    :param factory: ServerProtocolFactory
+    :param sections: names of sections, 'all' or 'everything' for all of them,
+        default sections if empty
+    :return: sections of key:value lines
+    """
+    sections = [section.lower() for section in sections]
+    if not sections or {'default', 'all', 'everything'}.intersection(sections):
+        sections = DEFAULT_SECTIONS
+    parts = []
+    for section in sections:
+        fields = SECTIONS.get(section)
+        if fields is None:
+            continue
+        lines = [f'# {section.capitalize()}']
+        lines.extend(f'{name}:{value}' for name, value in fields(factory))
+        parts.append('\r\n'.join(lines) + '\r\n')
+    return '\r\n'.join(parts)
+
+
+def _server(factory):
+    uptime = int(time.time() - factory.stats.started)
+    return [('redis_mode', 'cluster' if hasattr(factory.parser, 'layout') else 'standalone'),
+            ('os', f'{platform.system()} {platform.release()} {platform.machine()}'),
+            ('process_id', os.getpid()),
+            ('python_version', platform.python_version()),
+            ('twisted_version', twisted.__version__),
+            ('uptime_in_seconds', uptime),
+            ('uptime_in_days', uptime // 86400)]
+
+
+def _clients(factory):
+    pubsub = factory.pubsub
+    return [('connected_clients', len(factory.clients)),
+            ('maxclients', factory.max_clients),
+            ('blocked_clients', len(factory.parser.list_waiters)),
+            ('tracking_clients', len(factory.tracking.clients)),
+            ('pubsub_clients', sum(1 for client in factory.clients.values() if pubsub.subscription_count(client))),
+            ('scheduled_clients', len(factory.scheduler))]
+
+
+def _persistence(factory):
+    replication = factory.parser.replication
+    return [('loading', int(replication is not None and replication.loading)),
+            ('rdb_bgsave_in_progress', int(factory.parser.bgsave_in_progress))]
+
+
+def _stats(factory):
+    stats = factory.stats
+    storage = factory.parser.storage
+    uptime = time.time() - stats.started
+    scheduler = factory.scheduler.stats()
+    idle_wheel = factory.idle_wheel
+    return [('total_connections_received', stats.connections_received),
+            ('total_commands_processed', stats.commands),
+            ('instantaneous_ops_per_sec', round(stats.instantaneous('ops'))),
+            ('average_ops_per_sec', round(stats.commands / uptime) if uptime > 0 else 0),
+            ('total_net_input_bytes', stats.net_input_bytes),
+            ('total_net_output_bytes', stats.net_output_bytes),
+            ('instantaneous_input_kbps', round(stats.instantaneous('input') / 1024, 2)),
+            ('instantaneous_output_kbps', round(stats.instantaneous('output') / 1024, 2)),
+            ('rejected_connections', factory.rejected_connections),
+            ('client_output_buffer_limit_disconnections', factory.clients_closed_over_limit),
+            ('client_idle_disconnections', idle_wheel.expired if idle_wheel is not None else 0),
+            ('expired_keys', storage.expired_keys),
+            # keys are spilled to the disk tier, never evicted
+            ('evicted_keys', 0),
+            ('keyspace_hits', storage.keyspace_hits),
+            ('keyspace_misses', storage.keyspace_misses),
+            ('pubsub_channels', len(factory.pubsub.channels)),
+            ('pubsub_patterns', len(factory.pubsub.patterns)),
+            ('tracking_total_keys', len(factory.tracking.table)),
+            ('tracking_invalidations', factory.tracking.invalidations),
+            ('lazyfree_pending_objects', len(storage.lazy_freer)),
+            ('lazyfreed_objects', storage.lazy_freer.freed_values),
+            ('scheduler_deferrals', scheduler['deferrals']),
+            ('scheduler_turns', scheduler['turns']),
+            ('scheduler_max_queue', scheduler['max_queue']),
+            ('scheduler_wait_max_ms', scheduler['wait_max_ms']),
+            ('scheduler_wait_avg_ms', scheduler['wait_avg_ms'])] + _loop_lag(factory.loop_monitor)
+
+
+def _loop_lag(monitor):
+    if monitor is None:
+        return []
+    histogram = monitor.histogram
+    return [('eventloop_lag_p50_usec', histogram.percentile(50)),
+            ('eventloop_lag_p99_usec', histogram.percentile(99)),
+            ('eventloop_lag_max_usec', monitor.max_lag),
+            ('eventloop_stalls', monitor.stalls)]
+
+
+def _replication(factory):
+    replication = factory.parser.replication
+    if replication is None:
+        return [('role', 'master'), ('connected_slaves', 0)]
+    role = replication.role()
+    if role[0] == 'master':
+        fields = [('role', 'master'), ('connected_slaves', len(role[2]))]
+        fields.extend((f'slave{i}', f'ip={host},port={port}') for i, (host, port) in enumerate(role[2]))
+    else:
+        fields = [('role', 'slave'), ('master_host', role[1]), ('master_port', role[2]),
+                  ('master_link_status', 'up' if role[3] == 'connected' else 'down')]
+    fields += [('master_replid', replication.replid), ('master_repl_offset', replication.offset),
+               ('full_syncs', replication.full_syncs), ('partial_syncs', replication.partial_syncs)]
+    return fields
+
+
+def _cpu(factory):
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    fields = [('used_cpu_sys', f'{usage.ru_stime:.6f}'), ('used_cpu_user', f'{usage.ru_utime:.6f}'),
+              ('used_cpu_sys_children', f'{children.ru_stime:.6f}'),
+              ('used_cpu_user_children', f'{children.ru_utime:.6f}')]
+    # INFO is handled by the reactor thread, threads of slow commands are not counted
+    if hasattr(resource, 'RUSAGE_THREAD'):
+        thread = resource.getrusage(resource.RUSAGE_THREAD)
+        fields += [('used_cpu_sys_main_thread', f'{thread.ru_stime:.6f}'),
+                   ('used_cpu_user_main_thread', f'{thread.ru_utime:.6f}')]
+    return fields
+
+
+def _compression(factory):
+    compressor = factory.parser.storage.compressor
+    if compressor is None:
+        return [('compression_enabled', 0)]
+    stats = compressor.stats()
+    # names of INFO fields are global, the codec and the threshold get a prefix
+    stats['compression_codec'] = stats.pop('codec')
+    stats['compression_threshold'] = stats.pop('threshold')
+    return [('compression_enabled', 1)] + sorted(stats.items())
+
+
+def _tiering(factory):
+    storage = factory.parser.storage
+    if storage.disk_tier is None:
+        return [('disk_tier_enabled', 0)]
+    return [('disk_tier_enabled', 1)] + list(storage.tier_info().items())
+
+
+def _keyspace(factory):
+    keys, expires = factory.parser.storage.keyspace()
+    if not keys:
+        return []
+    return [('db0', f'keys={keys},expires={expires}')]
+
+
+SECTIONS = {'server': _server, 'clients': _clients, 'persistence': _persistence, 'stats': _stats,
+            'replication': _replication, 'cpu': _cpu, 'compression': _compression,
+            'tiering': _tiering, 'keyspace': _keyspace}
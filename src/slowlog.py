@@ -0,0 +1,62 @@
+"""
+Log of commands executed slower than a threshold, kept in a ring
+buffer of limited length. Arguments are truncated like in Redis,
+so a huge command doesn't take memory of the log.
+"""
+import time
+from collections import deque
+
+# arguments and bytes of an argument kept in an entry
+MAX_ARGS = 32
+MAX_ARG_LENGTH = 128
+
+
+class SlowLog:
+    """
+    Ring buffer of slow commands, the newest first
+    """
+    def __init__(self, threshold_us=10000, max_len=128):
+        """
+        :param threshold_us: microseconds of execution to get to the log,
+            0 logs every command, negative disables the log
+        :param max_len: number of kept entries, the oldest are dropped
+        """
+        self.threshold_us = threshold_us
+        self.entries = deque(maxlen=max_len)
+        self._next_id = 0
+
+    def __len__(self):
+        """
+        :return: number of entries
+        """
+        return len(self.entries)
+
+    def record(self, duration_us: int, args: list, addr):
+        """
+        Add the command if it was slow enough
+        :param duration_us: microseconds of execution
+        :param args: command with arguments
+        :param addr: function returning address of the client,
+            called only for slow commands
+        :return:
+        """
+        if self.threshold_us < 0 or duration_us < self.threshold_us:
+            return
+        if len(args) > MAX_ARGS:
+            args = args[:MAX_ARGS - 1] + [f'... ({len(args) - MAX_ARGS + 1} more arguments)']
+        args = [arg if len(arg) <= MAX_ARG_LENGTH else
+                f'{arg[:MAX_ARG_LENGTH]}... ({len(arg) - MAX_ARG_LENGTH} more bytes)' for arg in args]
+        self.entries.appendleft([self._next_id, int(time.time()), duration_us, args, addr(), ''])
+        self._next_id += 1
+
+    def get(self, count=10) -> list:
+        """
+        :param count: number of entries, negative for all
+        :return: the newest entries, SLOWLOG GET reply
+        """
+        if count < 0:
+            return list(self.entries)
+        return [entry for entry, _ in zip(self.entries, range(count))]
+
+    def reset(self):
+        self.entries.clear()
@@ -0,0 +1,262 @@
+"""
+Sharded snapshot format for Storage persistence.
+
+Snapshot consists of a manifest file and a number of independent
+shard files. Every key belongs to exactly one shard (crc32 of the key).
+Shard file is a stream of pickled record batches, each batch is a tuple
+of three lists of equal length: keys, values and moes (None for keys
+without moe). Shards can be decoded in parallel by separate processes
+and batches can be read one by one without loading the whole file.
+"""
+import os
+import pickle
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from src.exceptions.storage_exceptions import StorageFileError
+
+SNAPSHOT_VERSION = 1
+DEFAULT_BATCH_SIZE = 1000
+
+
+def manifest_path(file_prefix: str) -> str:
+    return file_prefix + '_manifest.pkl'
+
+
+def shard_path(file_prefix: str, shard: int) -> str:
+    return f'{file_prefix}_shard{shard}.pkl'
+
+
+def key_shard(key, shards: int) -> int:
+    """
+    Shard number of a key. Doesn't depend on python hash seed,
+    so snapshots can be written and read by different processes.
+    :param key:
+    :param shards: number of shards
+    :return: shard number from 0 to shards - 1
+    """
+    return zlib.crc32(str(key).encode('utf-8')) % shards
+
+
+class SnapshotWriter:
+    """
+    Writes snapshot record by record. Keeps at most one
+    unfinished batch per shard in memory. Files are written under
+    temporary names and renamed on close, manifest is renamed last.
+    """
+    def __init__(self, file_prefix: str, shards=1, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        :param file_prefix: prefix of snapshot file names
+        :param shards: number of shard files
+        :param batch_size: number of records in one pickled batch
+        :exception StorageFileError: can't create shard files
+        """
+        if shards < 1:
+            raise StorageFileError(f'number of shards must be positive, got {shards}')
+        self.file_prefix = file_prefix
+        self.shards = shards
+        self.batch_size = batch_size
+        self.records = 0
+        self._batches = [([], [], []) for _ in range(shards)]
+        self._files = []
+        try:
+            for shard in range(shards):
+                self._files.append(open(shard_path(file_prefix, shard) + '.tmp', 'wb'))
+        except OSError:
+            self.abort()
+            raise StorageFileError(f"can't create shard files with prefix {file_prefix}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def add(self, key, value, moe=None):
+        """
+        Add one record to the snapshot
+        :param key:
+        :param value:
+        :param moe: moment of expiration or None
+        :return:
+        """
+        shard = key_shard(key, self.shards)
+        keys, values, moes = self._batches[shard]
+        keys.append(key)
+        values.append(value)
+        moes.append(moe)
+        self.records += 1
+        if len(keys) >= self.batch_size:
+            self._flush(shard)
+
+    def _flush(self, shard):
+        batch = self._batches[shard]
+        if batch[0]:
+            try:
+                pickle.dump(batch, self._files[shard], pickle.HIGHEST_PROTOCOL)
+            except (OSError, pickle.PickleError):
+                raise StorageFileError(f"can't write shard {shard_path(self.file_prefix, shard)}")
+            self._batches[shard] = ([], [], [])
+
+    def close(self):
+        """
+        Flush remaining batches, rename shards and write manifest.
+        :return:
+        :exception StorageFileError: can't write files
+        """
+        try:
+            for shard in range(self.shards):
+                self._flush(shard)
+                self._files[shard].close()
+            for shard in range(self.shards):
+                path = shard_path(self.file_prefix, shard)
+                os.replace(path + '.tmp', path)
+            manifest = {'version': SNAPSHOT_VERSION,
+                        'shards': self.shards,
+                        'records': self.records}
+            path = manifest_path(self.file_prefix)
+            with open(path + '.tmp', 'wb') as f:
+                pickle.dump(manifest, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(path + '.tmp', path)
+        except StorageFileError:
+            self.abort()
+            raise
+        except OSError:
+            self.abort()
+            raise StorageFileError(f"can't write snapshot with prefix {self.file_prefix}")
+        # shards left from a previous snapshot with more shards
+        shard = self.shards
+        while os.path.exists(shard_path(self.file_prefix, shard)):
+            os.remove(shard_path(self.file_prefix, shard))
+            shard += 1
+
+    def abort(self):
+        """
+        Close and remove temporary files
+        :return:
+        """
+        for shard, f in enumerate(self._files):
+            f.close()
+            try:
+                os.remove(shard_path(self.file_prefix, shard) + '.tmp')
+            except OSError:
+                pass
+
+
+def read_manifest(file_prefix: str):
+    """
+    Read snapshot manifest
+    :param file_prefix:
+    :return: manifest dict or None if there is no snapshot
+    :exception StorageFileError: manifest is not readable
+    """
+    path = manifest_path(file_prefix)
+    try:
+        with open(path, 'rb') as f:
+            manifest = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, EOFError, pickle.UnpicklingError):
+        raise StorageFileError(f"can't read {path}")
+    if not isinstance(manifest, dict) or manifest.get('version') != SNAPSHOT_VERSION:
+        raise StorageFileError(f'unknown snapshot version in {path}')
+    return manifest
+
+
+def iter_shard_batches(path: str):
+    """
+    Iterate over record batches of one shard file.
+    Only one batch is kept in memory at a time.
+    :param path: path to the shard file
+    :return: generator of (keys, values, moes) tuples
+    """
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                batch = pickle.load(f)
+            except EOFError:
+                return
+            yield batch
+
+
+def iter_snapshot_batches(file_prefix: str):
+    """
+    Iterate over record batches of all shards of a snapshot
+    :param file_prefix:
+    :return: generator of (keys, values, moes) tuples
+    :exception StorageFileError: there is no snapshot or it's not readable
+    """
+    manifest = read_manifest(file_prefix)
+    if manifest is None:
+        raise StorageFileError(f'no snapshot found at {manifest_path(file_prefix)}')
+    for shard in range(manifest['shards']):
+        path = shard_path(file_prefix, shard)
+        try:
+            yield from iter_shard_batches(path)
+        except (OSError, pickle.UnpicklingError):
+            raise StorageFileError(f"can't read {path}")
+
+
+def decode_shard(path: str) -> tuple:
+    """
+    Decode the whole shard into one compact batch.
+    Runs in worker processes when loading in parallel.
+    :param path: path to the shard file
+    :return: (keys, values, moes) lists
+    """
+    keys, values, moes = [], [], []
+    for batch_keys, batch_values, batch_moes in iter_shard_batches(path):
+        keys.extend(batch_keys)
+        values.extend(batch_values)
+        moes.extend(batch_moes)
+    return keys, values, moes
+
+
+def load_snapshot(file_prefix: str, workers=1):
+    """
+    Load snapshot into dicts. Shards are decoded by a pool of
+    worker processes if workers > 1, then merged in this process.
+    :param file_prefix:
+    :param workers: number of decoding processes
+    :return: (keys_dict, moe_dict) or None if there is no snapshot
+    :exception StorageFileError: snapshot is not readable or incomplete
+    """
+    manifest = read_manifest(file_prefix)
+    if manifest is None:
+        return None
+    paths = [shard_path(file_prefix, shard) for shard in range(manifest['shards'])]
+    keys_dict = {}
+    moe_dict = {}
+    records = 0
+    workers = min(workers, len(paths))
+    try:
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                for keys, values, moes in executor.map(decode_shard, paths):
+                    records += _merge_batch(keys_dict, moe_dict, keys, values, moes)
+        else:
+            for keys, values, moes in map(decode_shard, paths):
+                records += _merge_batch(keys_dict, moe_dict, keys, values, moes)
+    except (OSError, pickle.UnpicklingError) as err:
+        raise StorageFileError(f"can't decode snapshot shards with prefix {file_prefix}: {err}")
+    if records != manifest['records']:
+        raise StorageFileError(f"snapshot is incomplete, expected {manifest['records']} records, "
+                               f"found {records}")
+    return keys_dict, moe_dict
+
+
+def _merge_batch(keys_dict, moe_dict, keys, values, moes) -> int:
+    """
+    Merge batch into dicts. All records of a key are in the same shard,
+    so the last record of a key wins.
+    :return: number of merged records
+    """
+    keys_dict.update(zip(keys, values))
+    for key, moe in zip(keys, moes):
+        if moe is None:
+            moe_dict.pop(key, None)
+        else:
+            moe_dict[key] = moe
+    return len(keys)
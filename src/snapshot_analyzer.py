@@ -0,0 +1,186 @@
+"""
+Offline analysis of storage snapshots. Snapshot is read batch
+by batch, analyzer keeps only aggregated counters, the top-N
+biggest keys and a bounded number of key prefixes.
+
+Records are not matched with each other, that would need memory for
+every key. Snapshots of the server hold one record per key, but
+a snapshot of the bulk loader holds all records of a key repeated
+in the input, so for it statistics are approximate: every record
+is counted as a key, a key may be in the biggest keys more than once.
+"""
+import heapq
+import sys
+import time
+from src.snapshot import iter_snapshot_batches
+from src.value_compression import CompressedValue
+
+# upper bounds of ttl histogram buckets in seconds
+TTL_BUCKETS = ((60, '<1m'), (3600, '<1h'), (86400, '<1d'), (604800, '<1w'))
+TTL_LAST_BUCKET = '>=1w'
+NO_PREFIX = '(no prefix)'
+OTHER_PREFIXES = '(other)'
+
+
+def value_type(value) -> str:
+    """
+    Name of the type of a storage value
+    :param value:
+    :return: 'string', 'list', 'hash' or python type name
+    """
+    if isinstance(value, (str, CompressedValue)):
+        return 'string'
+    elif isinstance(value, list):
+        return 'list'
+    elif isinstance(value, dict):
+        return 'hash'
+    return type(value).__name__
+
+
+def value_encoding(value) -> str:
+    """
+    Name of the way a storage value is kept in memory
+    :param value:
+    :return: 'compressed:<codec>' for compressed strings, 'plain' otherwise
+    """
+    if isinstance(value, CompressedValue):
+        return 'compressed:' + value.codec
+    return 'plain'
+
+
+def estimate_size(key, value) -> int:
+    """
+    Estimate memory used by a key and its value in bytes
+    :param key:
+    :param value:
+    :return:
+    """
+    size = sys.getsizeof(key) + sys.getsizeof(value)
+    if isinstance(value, list):
+        for item in value:
+            size += sys.getsizeof(item)
+    elif isinstance(value, dict):
+        for field, item in value.items():
+            size += sys.getsizeof(field) + sys.getsizeof(item)
+    elif isinstance(value, CompressedValue):
+        size += sys.getsizeof(value.data)
+    return size
+
+
+class SnapshotAnalyzer:
+    """
+    Collects statistics of keys added one by one
+    """
+    def __init__(self, top=10, separator=':', max_prefixes=1000, now=None):
+        """
+        :param top: number of biggest keys to keep
+        :param separator: key prefix is the part of a key before the first separator
+        :param max_prefixes: number of distinct prefixes to count separately,
+            the rest are counted as OTHER_PREFIXES
+        :param now: moment ttls are counted from, current time by default
+        """
+        self.top = top
+        self.separator = separator
+        self.max_prefixes = max_prefixes
+        self.now = time.time() if now is None else now
+        self.keys = 0
+        self.total_size = 0
+        self.types = {}
+        self.encodings = {}
+        self.prefixes = {}
+        self.ttl_histogram = dict.fromkeys(['no ttl', 'expired'] +
+                                           [name for _, name in TTL_BUCKETS] + [TTL_LAST_BUCKET], 0)
+        self._biggest = []
+        # tie breaker for equal sizes in heap
+        self._counter = 0
+
+    def add(self, key, value, moe=None):
+        """
+        Account one key
+        :param key:
+        :param value:
+        :param moe: moment of expiration or None
+        :return:
+        """
+        size = estimate_size(key, value)
+        vtype = value_type(value)
+        self.keys += 1
+        self.total_size += size
+
+        type_stats = self.types.setdefault(vtype, {'keys': 0, 'bytes': 0})
+        type_stats['keys'] += 1
+        type_stats['bytes'] += size
+
+        encoding_stats = self.encodings.setdefault(value_encoding(value), {'keys': 0, 'bytes': 0})
+        encoding_stats['keys'] += 1
+        encoding_stats['bytes'] += size
+
+        prefix = self._prefix(str(key))
+        prefix_stats = self.prefixes.get(prefix)
+        if prefix_stats is None:
+            if len(self.prefixes) >= self.max_prefixes:
+                prefix = OTHER_PREFIXES
+            prefix_stats = self.prefixes.setdefault(prefix, {'keys': 0, 'bytes': 0})
+        prefix_stats['keys'] += 1
+        prefix_stats['bytes'] += size
+
+        self.ttl_histogram[self._ttl_bucket(moe)] += 1
+
+        self._counter += 1
+        item = (size, self._counter, key, vtype)
+        if len(self._biggest) < self.top:
+            heapq.heappush(self._biggest, item)
+        elif self.top and size > self._biggest[0][0]:
+            heapq.heapreplace(self._biggest, item)
+
+    def _prefix(self, key: str) -> str:
+        pos = key.find(self.separator)
+        if pos == -1:
+            return NO_PREFIX
+        return key[:pos]
+
+    def _ttl_bucket(self, moe) -> str:
+        if moe is None:
+            return 'no ttl'
+        ttl = moe - self.now
+        if ttl <= 0:
+            return 'expired'
+        for bound, name in TTL_BUCKETS:
+            if ttl < bound:
+                return name
+        return TTL_LAST_BUCKET
+
+    def biggest_keys(self) -> list:
+        """
+        :return: list of (key, type, size) sorted by size descending
+        """
+        return [(key, vtype, size) for size, _, key, vtype in sorted(self._biggest, reverse=True)]
+
+    def report(self) -> dict:
+        """
+        :return: dict with all collected statistics
+        """
+        prefixes = sorted(self.prefixes.items(), key=lambda item: item[1]['bytes'], reverse=True)
+        return {'keys': self.keys,
+                'bytes': self.total_size,
+                'types': self.types,
+                'encodings': self.encodings,
+                'prefixes': dict(prefixes),
+                'ttl': self.ttl_histogram,
+                'biggest_keys': [{'key': key, 'type': vtype, 'bytes': size}
+                                 for key, vtype, size in self.biggest_keys()]}
+
+
+def analyze_snapshot(file_prefix: str, **kwargs) -> SnapshotAnalyzer:
+    """
+    Stream a snapshot through the analyzer
+    :param file_prefix: prefix of snapshot file names
+    :param kwargs: SnapshotAnalyzer arguments
+    :return: SnapshotAnalyzer with collected statistics
+    :exception StorageFileError: there is no snapshot or it's not readable
+    """
+    analyzer = SnapshotAnalyzer(**kwargs)
+    for keys, values, moes in iter_snapshot_batches(file_prefix):
+        for key, value, moe in zip(keys, values, moes):
+            analyzer.add(key, value, moe)
+    return analyzer
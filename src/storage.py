@@ -1,9 +1,18 @@
 import time
 from src.exceptions.storage_exceptions import *
 from src.redis_pattern_matching import *
+from src.snapshot import SnapshotWriter, load_snapshot
+from src.value_compression import CompressedValue
+from src.disk_tier import Spilled
+from src.lazy_free import LazyFreer
 from twisted.internet import reactor
+from collections import OrderedDict
 import random
 import pickle
+import threading
+
+# marks a list or hash the snapshot writer has copied already
+_SAVED = object()
 
 
 class Storage(object):
@@ -11,21 +20,62 @@ class Storage(object):
     Class for keys and values storing.
     has ttl functionality.
     """
-    def __init__(self, gc=False, file_prefix=None):
+    def __init__(self, gc=False, file_prefix=None, shards=1, load_workers=1, compressor=None,
+                 disk_tier=None, spill_after=None, clock=None, lazy_expire=True):
         """
         self.key_dict: dictionary for storing keys and values
         self.moe_dict: dictionary for storing moments of expiration of keys
         :param gc: enables garbage collector
         :param file_prefix: prefix of file names for saving/loading keys and moes,
             set None to disable saving
+        :param shards: number of snapshot shards written on save
+        :param load_workers: number of processes decoding snapshot shards on load
+        :param compressor: ValueCompressor for big string values or None
+        :param disk_tier: DiskTier for values of idle keys or None
+        :param spill_after: seconds without access after which value
+            is moved to the disk tier
+        :param clock: object with callLater method scheduling timers of
+            garbage collector, spiller and lazy freer, twisted reactor by default
+        :param lazy_expire: free big values of expired keys by slices
         """
         self._keys_dict = {}
         self._moe_dict = {}
         self.file_prefix = file_prefix
+        self.shards = shards
+        self.load_workers = load_workers
+        self.compressor = compressor
+        self.disk_tier = disk_tier
+        self.spill_after = spill_after
+        # moments of last access of keys held in memory, oldest first
+        self._atime_dict = OrderedDict()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        # lookups of get and keys removed by expiration
+        self.keyspace_hits = 0
+        self.keyspace_misses = 0
+        self.expired_keys = 0
+        # function called with a key when its value or moe is set or the key is removed,
+        # called once with None when all keys are flushed
+        self.change_listener = None
+        self.lazy_expire = lazy_expire
+        self.lazy_freer = LazyFreer(clock)
+        # held while a snapshot is written, so a shutdown save and BGSAVE
+        # don't write the same temporary shard files
+        self._save_lock = threading.Lock()
+        # (keys dict, copies) of save views being written, copies holds values
+        # of lists and hashes as they were when the view was taken
+        self._save_views = []
+        self._copies_lock = threading.Lock()
         if file_prefix:
             self.load()
+        if disk_tier is not None:
+            now = time.time()
+            for key in self._keys_dict:
+                self._atime_dict[key] = now
         if gc:
-            self.garbage_collector = StorageGarbageCollector(self)
+            self.garbage_collector = StorageGarbageCollector(self, clock=clock)
+            if disk_tier is not None and spill_after is not None:
+                self.spiller = StorageSpiller(self, clock=clock)
 
     def set(self, key, value, moe=None, keep_moe=False, get=False):
         """
@@ -42,7 +92,18 @@ class Storage(object):
         prev = None
         if get:
             prev = self._keys_dict.get(key)
+            if prev is Spilled:
+                prev = self.disk_tier.get(key)
+            if type(prev) is CompressedValue:
+                prev = self._decompress(prev)
+        if self.compressor is not None and type(value) is str:
+            value = self.compressor.compress(value)
+        if self.disk_tier is not None:
+            self.disk_tier.discard(key)
+            self._touch(key)
         self._keys_dict[key] = value
+        if self.change_listener is not None:
+            self.change_listener(key)
         if not keep_moe:
             if moe is None:
                 if key in self._moe_dict:
@@ -51,26 +112,134 @@ class Storage(object):
                 self._moe_dict[key] = moe
         return prev
 
-    def get(self, key):
+    def get(self, key, count=True):
         """
         Return the value of the key. Checks key
         expiration beforehand.
         :param key:
+        :param count: count the read in keyspace and tier hits,
+            False for reads before the command itself reads the key
         :return:
         :exception StorageKeyError: no such key or it's expired
         """
         now = time.time()
         if key in self._moe_dict and \
                 self._moe_dict[key] <= now:
-            self._moe_dict.pop(key)
-            self._keys_dict.pop(key)
+            self._expire(key)
         try:
             val = self._keys_dict[key]
         except KeyError:
+            if count:
+                self.keyspace_misses += 1
             raise StorageKeyError(f'no key {key}')
         else:
+            if count:
+                self.keyspace_hits += 1
+            if self.disk_tier is not None:
+                val = self._tier_access(key, val, count)
+            if type(val) is CompressedValue:
+                val = self._decompress(val)
             return val
 
+    def _remove(self, key, lazy=False):
+        """
+        Remove existing key with its moe and disk tier record
+        :param key:
+        :param lazy: hand the value over to the lazy freer
+        :return: removed value
+        """
+        val = self._keys_dict.pop(key)
+        self._moe_dict.pop(key, None)
+        if self.disk_tier is not None:
+            self.disk_tier.discard(key)
+            self._atime_dict.pop(key, None)
+        if self.change_listener is not None:
+            self.change_listener(key)
+        if lazy:
+            self.lazy_freer.free(val)
+            return None
+        return val
+
+    def _expire(self, key):
+        """
+        Remove expired key
+        """
+        self.expired_keys += 1
+        self._remove(key, self.lazy_expire)
+
+    def _touch(self, key):
+        """
+        Mark key as just accessed
+        """
+        self._atime_dict[key] = time.time()
+        self._atime_dict.move_to_end(key)
+
+    def _tier_access(self, key, val, count=True):
+        """
+        Count tier hit for a key being read,
+        move its value back to memory if it was spilled.
+        :param key:
+        :param val: value in key_dict
+        :param count: count the hit, spilled values read
+            without counting stay on disk
+        :return: value of the key
+        """
+        if not count:
+            return self.disk_tier.get(key) if val is Spilled else val
+        if val is Spilled:
+            val = self.disk_tier.pop(key)
+            self._keys_dict[key] = val
+            self.disk_hits += 1
+        else:
+            self.memory_hits += 1
+        self._touch(key)
+        return val
+
+    def spill_idle(self, limit=1000) -> int:
+        """
+        Move values of keys idle for more than spill_after
+        seconds to the disk tier, least recently used first.
+        :param limit: maximum number of values to move
+        :return: number of moved values
+        """
+        if self.disk_tier is None or self.spill_after is None:
+            return 0
+        border = time.time() - self.spill_after
+        count = 0
+        while self._atime_dict and count < limit:
+            key, atime = next(iter(self._atime_dict.items()))
+            if atime > border:
+                break
+            self.disk_tier.put(key, self._keys_dict[key])
+            self._keys_dict[key] = Spilled
+            self._atime_dict.pop(key)
+            count += 1
+        return count
+
+    def tier_info(self) -> dict:
+        """
+        :return: dict with disk tier metrics
+        """
+        hits = self.memory_hits + self.disk_hits
+        return {'memory_keys': len(self._keys_dict) - len(self.disk_tier),
+                'disk_keys': len(self.disk_tier),
+                'disk_log_bytes': self.disk_tier.size,
+                'disk_dead_bytes': self.disk_tier.dead_bytes,
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'memory_hit_rate': round(self.memory_hits / hits, 4) if hits else 0,
+                'disk_hit_rate': round(self.disk_hits / hits, 4) if hits else 0}
+
+    def _decompress(self, value: CompressedValue) -> str:
+        """
+        Decompress value, counting metrics if compressor is set.
+        Values may be compressed even without compressor,
+        if they were loaded from a snapshot.
+        """
+        if self.compressor is None:
+            return value.decompress()
+        return self.compressor.decompress(value)
+
     def delete(self, keys: list) -> int:
         """
         Delete a number of keys from storage,
@@ -83,15 +252,84 @@ class Storage(object):
         count = 0
         for key in keys:
             if key in self._keys_dict:
-                self._keys_dict.pop(key)
-                if key in self._moe_dict:
-                    if self._moe_dict[key] > now:
-                        count += 1
-                    self._moe_dict.pop(key)
-                else:
+                if key not in self._moe_dict or self._moe_dict[key] > now:
                     count += 1
+                self._remove(key)
         return count
 
+    def unlink(self, keys: list) -> int:
+        """
+        Delete a number of keys like delete, but big values
+        are only detached and freed later by slices.
+        :param keys: list of keys to delete
+        :return: number of deleted keys
+        """
+        now = time.time()
+        count = 0
+        for key in keys:
+            if key in self._keys_dict:
+                if key not in self._moe_dict or self._moe_dict[key] > now:
+                    count += 1
+                self._remove(key, lazy=True)
+        return count
+
+    def clear(self):
+        """
+        Remove all keys
+        :return:
+        """
+        for key in list(self._keys_dict):
+            self._remove(key)
+
+    def flush(self, lazy=False):
+        """
+        Remove all keys at once, dicts are replaced with empty ones.
+        :param lazy: free the old keys and values later by slices
+        :return:
+        """
+        keys_dict = self._keys_dict
+        self._keys_dict = {}
+        self._moe_dict = {}
+        self._atime_dict = OrderedDict()
+        if self.disk_tier is not None:
+            for key, value in keys_dict.items():
+                if value is Spilled:
+                    self.disk_tier.discard(key)
+        if self.change_listener is not None:
+            self.change_listener(None)
+        if lazy:
+            self.lazy_freer.freeAll(keys_dict)
+
+    def keyspace(self) -> tuple:
+        """
+        :return: number of keys and number of keys with moe,
+            expired keys not removed yet are counted too
+        """
+        return len(self._keys_dict), len(self._moe_dict)
+
+    def items_view(self) -> list:
+        """
+        Take a copy of not expired keys for sending them to a replica.
+        Lists and hashes are copied too, so later in-place changes
+        don't get into the view. Spilled values are read from disk,
+        compressed values are left compressed.
+        :return: list of (key, value, moe)
+        """
+        now = time.time()
+        items = []
+        for key, value in self._keys_dict.items():
+            moe = self._moe_dict.get(key)
+            if moe is not None and moe <= now:
+                continue
+            if value is Spilled:
+                value = self.disk_tier.get(key)
+            elif type(value) is list:
+                value = list(value)
+            elif type(value) is dict:
+                value = dict(value)
+            items.append((key, value, moe))
+        return items
+
     def keys(self, pattern: str) -> list:
         """
         Return all keys matching the pattern
@@ -111,10 +349,29 @@ class Storage(object):
                 else:
                     keys.append(key)
         for key in expired_keys:
-            self._moe_dict.pop(key)
-            self._keys_dict.pop(key)
+            self._expire(key)
         return keys
 
+    def keys_view(self, pattern: str):
+        """
+        Take a consistent view of keys for matching them later,
+        possibly in another thread. Expired keys are skipped
+        but not removed.
+        :param pattern:
+        :return: function returning list of keys of the view that match the pattern
+        """
+        keys = list(self._keys_dict)
+        moes = self._moe_dict.copy()
+        now = time.time()
+
+        def match():
+            """
+            :exception StoragePatternError: there is an error in the pattern
+            """
+            return [key for key in keys if str_match_pattern_redis(str(key), pattern) == -1
+                    and not (key in moes and moes[key] <= now)]
+        return match
+
     def get_val_and_moe(self, key):
         """
         Get value and moe of a key. Raise KeyValue, is there is no such key
@@ -137,61 +394,152 @@ class Storage(object):
         if key not in self._keys_dict:
             raise StorageKeyError('no such key')
         elif moe is None:
-            if key in self._moe_dict:
-                self._moe_dict.pop(key)
+            if key not in self._moe_dict:
+                return
+            self._moe_dict.pop(key)
         else:
             self._moe_dict[key] = moe
+        if self.change_listener is not None:
+            self.change_listener(key)
 
     def save(self):
         """
-        Save keys and moes to disk
+        Save keys and moes to disk as a sharded snapshot.
+        Expired keys are not saved. Waits for a background save
+        writing the snapshot to finish first.
         :return:
+        :exception StorageFileError: can't write snapshot files
         """
         if self.file_prefix:
+            self.save_view()()
+
+    @property
+    def saving(self) -> bool:
+        """
+        :return: a save view is being written, see before_write
+        """
+        return bool(self._save_views)
+
+    def before_write(self, keys: list):
+        """
+        Called before lists and hashes of the keys are changed in place
+        while a save view is written. Values the writer hasn't copied yet
+        are copied now, so only the keys changed during the save are copied
+        on the event loop.
+        :param keys:
+        :return:
+        """
+        with self._copies_lock:
+            for key in keys:
+                value = self._keys_dict.get(key)
+                if type(value) is not list and type(value) is not dict:
+                    continue
+                for keys_dict, copies in self._save_views:
+                    if key not in copies and keys_dict.get(key) is value:
+                        copies[key] = value.copy()
+
+    def save_view(self):
+        """
+        Take a consistent view of keys and moes for saving them later,
+        possibly in another thread. Only the dicts are copied here, lists
+        and hashes are copied by the writer one by one, or by before_write
+        if they are changed first, so in-place changes made before the save
+        finishes don't get into the snapshot. Spilled values are read from
+        records of the disk tier, which stay valid until the save ends.
+        The returned function must be called.
+        :return: function writing the snapshot, writes of several views are serialized
+        """
+        keys_dict = self._keys_dict.copy()
+        moe_dict = self._moe_dict.copy()
+        copies = {}
+        view = (keys_dict, copies)
+        with self._copies_lock:
+            self._save_views.append(view)
+        tier = self.disk_tier
+        tier_index = tier.index_view() if tier is not None else None
+        now = time.time()
+
+        def saved_value(key, value):
+            """
+            :return: copy of a list or hash as it was when the view was taken
+            """
+            with self._copies_lock:
+                copy = copies.get(key)
+                if copy is None:
+                    copy = value.copy()
+                copies[key] = _SAVED
+            return copy
+
+        def write():
+            """
+            :exception StorageFileError: can't write snapshot files
+            """
             try:
-                with open(self.file_prefix + '_keys.pkl', 'wb') as f:
-                    pickle.dump(self._keys_dict, f, pickle.HIGHEST_PROTOCOL)
-            except (OSError, pickle.PickleError) as err:
-                raise StorageFileError("can't save keys")
-            try:
-                with open(self.file_prefix + '_moes.pkl', 'wb') as f:
-                    pickle.dump(self._moe_dict, f, pickle.HIGHEST_PROTOCOL)
-            except (OSError, pickle.PickleError) as err:
-                raise StorageFileError("can't save keys' moes")
+                if self.file_prefix:
+                    with self._save_lock, SnapshotWriter(self.file_prefix, self.shards) as writer:
+                        for key, value in keys_dict.items():
+                            moe = moe_dict.get(key)
+                            if moe is None or moe > now:
+                                if value is Spilled:
+                                    value = tier.read_record(tier_index[key])
+                                elif type(value) is list or type(value) is dict:
+                                    value = saved_value(key, value)
+                                writer.add(key, value, moe)
+            finally:
+                with self._copies_lock:
+                    self._save_views.remove(view)
+                if tier is not None:
+                    tier.release_view()
+        return write
 
     def load(self):
         """
-        Load keys and moes from disk
+        Load keys and moes from disk. Sharded snapshot is
+        preferred, pickled dicts of older versions are loaded
+        if there is no snapshot.
         :return:
+        :exception StorageFileError: snapshot files are not readable
         """
         if self.file_prefix:
-            file_path = self.file_prefix + '_keys.pkl'
+            loaded = load_snapshot(self.file_prefix, self.load_workers)
+            if loaded is None:
+                self._load_dicts()
+            else:
+                self._keys_dict, self._moe_dict = loaded
+
+    def _load_dicts(self):
+        """
+        Load keys and moes from pickled dicts
+        :return:
+        """
+        file_path = self.file_prefix + '_keys.pkl'
+        try:
+            with open(file_path, 'rb') as f:
+                self._keys_dict = pickle.load(f)
+        # if no file was found, create empty dicts
+        except FileNotFoundError:
+            self._keys_dict = {}
+            self._moe_dict = {}
+        # if file is not accessible, raise an exception
+        except IOError:
+            raise StorageFileError(f"can't read {file_path}")
+        except pickle.UnpicklingError:
+            raise StorageFileError(f"can't unpickle {file_path}")
+        # if keys were loaded, load moes
+        else:
+            file_path = self.file_prefix + '_moes.pkl'
             try:
-                with open(file_path, 'rb') as f:
-                    self._keys_dict = pickle.load(f)
-            # if no file was found, create empty dicts
+                with open(self.file_prefix + '_moes.pkl', 'rb') as f:
+                    self._moe_dict = pickle.load(f)
+            # both files must be present
             except FileNotFoundError:
-                self._keys_dict = {}
-                self._moe_dict = {}
-            # if file is not accessible, raise an exception
+                raise StorageFileError(f"can't load moes, {file_path} does not exist")
             except IOError:
                 raise StorageFileError(f"can't read {file_path}")
             except pickle.UnpicklingError:
-                raise StorageFileError(f"can't unpickle {file_path}")
-            # if keys were loaded, load moes
-            else:
-                file_path = self.file_prefix + '_moes.pkl'
-                try:
-                    with open(self.file_prefix + '_moes.pkl', 'rb') as f:
-                        self._moe_dict = pickle.load(f)
-                # both files must be present
-                except FileNotFoundError:
-                    raise StorageFileError(f"can't load moes, {file_path} does not exist")
-                except IOError:
-                    raise StorageFileError(f"can't read {file_path}")
-                except pickle.UnpicklingError:
-                    raise StorageFileError(f"can't unpickle {file_path} file")
-                for key in self._moe_dict:
+                raise StorageFileError(f"can't unpickle {file_path} file")
+            for key in self._moe_dict:
+                if key not in self._keys_dict:
                     raise StorageFileError(f"found moe for a key {key} that does not exist")
 
 
@@ -199,17 +547,23 @@ class StorageGarbageCollector:
     """
     Primitive garbage collector for expired keys
     """
-    def __init__(self, storage, call_interval=0.1):
+    def __init__(self, storage, call_interval=0.1, clock=None):
+        """
+        :param storage:
+        :param call_interval: seconds between calls
+        :param clock: object with callLater method, twisted reactor by default
+        """
         self.storage = storage
         self.base_call_interval = call_interval
-        reactor.callLater(self.base_call_interval, self.expire_random)
+        self.clock = clock or reactor
+        self.clock.callLater(self.base_call_interval, self.expire_random)
 
     def expire_random(self):
         """
         Chooses 20 random keys from storage volatile keys
         and checks if any should be expired. If more than 25% of chosen
         keys are expired, chooses again.
-        Calls itself later using twisted reactor with self.call_interval delay.
+        Calls itself later using self.clock with self.call_interval delay.
         :return:
         """
         if len(self.storage._moe_dict) > 0:
@@ -222,9 +576,33 @@ class StorageGarbageCollector:
                 count = 0
                 for key in keys_to_check:
                     if time.time() >= self.storage._moe_dict[key]:
-                        self.storage._moe_dict.pop(key)
-                        self.storage._keys_dict.pop(key)
+                        self.storage._expire(key)
                         count += 1
                 if count < 5:
                     check = False
-        reactor.callLater(self.base_call_interval, self.expire_random)
+        self.clock.callLater(self.base_call_interval, self.expire_random)
+
+
+class StorageSpiller:
+    """
+    Periodically moves values of idle keys to the disk tier
+    """
+    def __init__(self, storage, call_interval=1, limit=1000, clock=None):
+        """
+        :param storage:
+        :param call_interval: seconds between calls
+        :param limit: maximum number of values moved per call,
+            if reached, next call is made immediately
+        :param clock: object with callLater method, twisted reactor by default
+        """
+        self.storage = storage
+        self.base_call_interval = call_interval
+        self.limit = limit
+        self.clock = clock or reactor
+        self.clock.callLater(self.base_call_interval, self.spill)
+
+    def spill(self):
+        if self.storage.spill_idle(self.limit) >= self.limit:
+            self.clock.callLater(0, self.spill)
+        else:
+            self.clock.callLater(self.base_call_interval, self.spill)
@@ -0,0 +1,107 @@
+"""
+Idle timeout of connections on a timer wheel. One timer ticks every
+resolution seconds and looks only at the slot of the current tick.
+Commands just update last_interaction of the connection, nothing
+is rescheduled per command: a connection found active when its slot
+comes is moved to the slot of its new deadline.
+"""
+import math
+from twisted.internet import reactor
+
+
+class TimerWheel:
+    """
+    Connections bucketed by the tick of their idle deadline
+    """
+    def __init__(self, timeout: float, on_idle, clock=None, resolution=1.0):
+        """
+        :param timeout: seconds without commands after which a connection is idle
+        :param on_idle: called with an idle connection, returns True if it was closed,
+            otherwise the connection is checked again after timeout seconds
+        :param clock: reactor, the global one by default
+        :param resolution: seconds between ticks, deadlines are rounded up to ticks
+        """
+        self.timeout = timeout
+        self.on_idle = on_idle
+        self.clock = clock or reactor
+        self.resolution = resolution
+        self._buckets = [set() for _ in range(math.ceil(timeout / resolution) + 2)]
+        # connection: index of its bucket
+        self._slots = {}
+        # last processed tick
+        self._tick = math.floor(self.clock.seconds() / resolution)
+        self._call = None
+        # connections reported idle
+        self.expired = 0
+
+    def __len__(self):
+        """
+        :return: number of watched connections
+        """
+        return len(self._slots)
+
+    def add(self, connection):
+        """
+        Watch the connection, its last_interaction attribute
+        is the moment of its last command
+        :param connection:
+        :return:
+        """
+        self._insert(connection, connection.last_interaction + self.timeout)
+        if self._call is None:
+            self._call = self.clock.callLater(self.resolution, self._run)
+
+    def remove(self, connection):
+        """
+        Stop watching the connection, called when it's closed
+        :param connection:
+        :return:
+        """
+        index = self._slots.pop(connection, None)
+        if index is not None:
+            self._buckets[index].discard(connection)
+
+    def _insert(self, connection, deadline: float):
+        # deadlines in a processed tick go to the next one
+        tick = max(math.ceil(deadline / self.resolution), self._tick + 1)
+        index = tick % len(self._buckets)
+        self._buckets[index].add(connection)
+        self._slots[connection] = index
+
+    def _run(self):
+        """
+        Check buckets of ticks passed since the previous run
+        """
+        self._call = None
+        now = self.clock.seconds()
+        current = math.floor(now / self.resolution)
+        # a late tick doesn't need more than a revolution
+        first = max(self._tick + 1, current - len(self._buckets) + 1)
+        for tick in range(first, current + 1):
+            self._tick = tick
+            index = tick % len(self._buckets)
+            bucket = self._buckets[index]
+            self._buckets[index] = set()
+            for connection in bucket:
+                # removed by on_idle of another connection
+                if self._slots.pop(connection, None) is None:
+                    continue
+                deadline = connection.last_interaction + self.timeout
+                if deadline > now:
+                    self._insert(connection, deadline)
+                elif self.on_idle(connection):
+                    self.expired += 1
+                else:
+                    self._insert(connection, now + self.timeout)
+        self._tick = max(self._tick, current)
+        if self._slots:
+            self._call = self.clock.callLater(self.resolution, self._run)
+
+    def stop(self):
+        """
+        Stop the timer
+        :return:
+        """
+        if self._call is not None and self._call.active():
+            self._call.cancel()
+        self._call = None
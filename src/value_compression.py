@@ -0,0 +1,109 @@
+"""
+Optional compression of big string values in Storage.
+Strings whose utf-8 size is over the threshold are kept
+compressed and decompressed when they are read.
+"""
+import lzma
+import time
+import zlib
+
+# codec name: (compress, decompress)
+CODECS = {'zlib': (zlib.compress, zlib.decompress),
+          'lzma': (lzma.compress, lzma.decompress)}
+
+
+class CompressedValue:
+    """
+    Compressed string value. Stored in Storage and in
+    snapshots as is.
+    """
+    __slots__ = ('codec', 'data', 'size')
+
+    def __init__(self, codec: str, data: bytes, size: int):
+        """
+        :param codec: name of the codec from CODECS
+        :param data: compressed utf-8 bytes of the string
+        :param size: size of uncompressed bytes
+        """
+        self.codec = codec
+        self.data = data
+        self.size = size
+
+    def decompress(self) -> str:
+        return CODECS[self.codec][1](self.data).decode('utf-8')
+
+    def __eq__(self, other):
+        return isinstance(other, CompressedValue) and \
+            (self.codec, self.data, self.size) == (other.codec, other.data, other.size)
+
+
+class ValueCompressor:
+    """
+    Compresses and decompresses string values,
+    counts compression ratio and time spent.
+    """
+    def __init__(self, codec='zlib', threshold=4096):
+        """
+        :param codec: name of the codec from CODECS
+        :param threshold: minimal size of utf-8 string in bytes to compress
+        :exception ValueError: unknown codec
+        """
+        if codec not in CODECS:
+            raise ValueError(f'unknown codec {codec}, available: {", ".join(CODECS)}')
+        self.codec = codec
+        self.threshold = threshold
+        self._compress = CODECS[codec][0]
+        self.compressed = 0
+        self.not_compressible = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.compress_ns = 0
+        self.decompressed = 0
+        self.decompress_ns = 0
+
+    def compress(self, value: str):
+        """
+        Compress a string if it's big enough and compression
+        makes it smaller.
+        :param value:
+        :return: CompressedValue or the value itself
+        """
+        # a character takes at most 4 bytes of UTF-8, so short strings
+        # are skipped without encoding
+        if len(value) * 4 < self.threshold:
+            return value
+        data = value.encode('utf-8')
+        if len(data) < self.threshold:
+            return value
+        start = time.perf_counter_ns()
+        compressed = self._compress(data)
+        self.compress_ns += time.perf_counter_ns() - start
+        if len(compressed) >= len(data):
+            self.not_compressible += 1
+            return value
+        self.compressed += 1
+        self.bytes_in += len(data)
+        self.bytes_out += len(compressed)
+        return CompressedValue(self.codec, compressed, len(data))
+
+    def decompress(self, value: CompressedValue) -> str:
+        start = time.perf_counter_ns()
+        result = value.decompress()
+        self.decompress_ns += time.perf_counter_ns() - start
+        self.decompressed += 1
+        return result
+
+    def stats(self) -> dict:
+        """
+        :return: dict of compression metrics
+        """
+        return {'codec': self.codec,
+                'threshold': self.threshold,
+                'compressed_values': self.compressed,
+                'not_compressible_values': self.not_compressible,
+                'compressed_bytes_in': self.bytes_in,
+                'compressed_bytes_out': self.bytes_out,
+                'compression_ratio': round(self.bytes_in / self.bytes_out, 3) if self.bytes_out else 0,
+                'compress_cpu_ms': round(self.compress_ns / 1e6, 3),
+                'decompressed_values': self.decompressed,
+                'decompress_cpu_ms': round(self.decompress_ns / 1e6, 3)}
@@ -0,0 +1,147 @@
+import unittest
+import asyncio
+import os
+import stat
+import tempfile
+import time
+from src.asyncio_server import AsyncioServer, AsyncioClock
+from src.redis_encoder import RedisEncoder
+from src.redis_command_parser import RedisCommandParser
+from src.storage import Storage
+
+
+class FakeTransport:
+    """
+    Transport keeping written data
+    """
+    def __init__(self):
+        self.data = b''
+        self.reading = True
+
+    def write(self, data):
+        self.data += data
+
+    def pause_reading(self):
+        self.reading = False
+
+    def resume_reading(self):
+        self.reading = True
+
+
+class TestAsyncioServer(unittest.IsolatedAsyncioTestCase):
+    """
+    Class for testing asyncio backend over a real connection
+    """
+    async def asyncSetUp(self) -> None:
+        self.server = AsyncioServer(loop=asyncio.get_running_loop())
+        await self.server.start(0, '127.0.0.1')
+        port = self.server.server.sockets[0].getsockname()[1]
+        self.reader, self.writer = await asyncio.open_connection('127.0.0.1', port)
+
+    async def asyncTearDown(self) -> None:
+        self.writer.close()
+        await self.writer.wait_closed()
+        self.server.stop()
+        await self.server.server.wait_closed()
+
+    async def request(self, commands: list, reply: bytes) -> bytes:
+        self.writer.write(b''.join(RedisEncoder.encodeArray(command) for command in commands))
+        return await asyncio.wait_for(self.reader.readexactly(len(reply)), 5)
+
+    async def test_set_get(self):
+        """
+        Set and then get key
+        :return:
+        """
+        self.assertEqual(b'+OK\r\n', await self.request([['set', '1', 'one']], b'+OK\r\n'))
+        self.assertEqual(b'$3\r\none\r\n', await self.request([['get', '1']], b'$3\r\none\r\n'))
+        self.assertEqual(1, self.server.proto_count)
+
+    async def test_unix_socket(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'server.sock')
+            await self.server.startUnix(path, 0o600)
+            self.assertEqual(0o600, stat.S_IMODE(os.stat(path).st_mode))
+            reader, writer = await asyncio.open_unix_connection(path)
+            writer.write(RedisEncoder.encodeArray(['set', 'a', '1']))
+            self.assertEqual(b'+OK\r\n', await asyncio.wait_for(reader.readexactly(5), 5))
+            writer.close()
+            await writer.wait_closed()
+            self.server.unix_server.close()
+            await self.server.unix_server.wait_closed()
+
+    async def test_pipeline(self):
+        """
+        All commands of one write are answered
+        :return:
+        """
+        reply = b'+OK\r\n$1\r\n1\r\n-Wrong command: unknown command `nope`\r\n'
+        self.assertEqual(reply, await self.request([['set', 'a', '1'], ['get', 'a'], ['nope']], reply))
+
+    async def test_backpressure(self):
+        """
+        Commands are not parsed while the transport can't send replies,
+        big values split between reads are parsed
+        :return:
+        """
+        proto = self.server.buildProtocol()
+        transport = FakeTransport()
+        proto.connection_made(transport)
+        proto.pause_writing()
+        self.assertFalse(transport.reading)
+        value = 'x' * 10000
+        data = RedisEncoder.encodeArray(['set', 'a', value]) + RedisEncoder.encodeArray(['get', 'a'])
+        proto.data_received(data[:5000])
+        proto.data_received(data[5000:])
+        self.assertEqual(b'', transport.data)
+        proto.resume_writing()
+        self.assertTrue(transport.reading)
+        self.assertEqual(b'+OK\r\n' + RedisEncoder.encodeBulkString(value), transport.data)
+        self.assertEqual(b'', proto._data_buffer)
+        proto.connection_lost(None)
+
+    async def test_twisted_only_commands(self):
+        """
+        Commands of twisted connections are rejected with a clear error
+        :return:
+        """
+        reply = b'-Wrong command: `info` command is supported only by twisted backend\r\n' \
+                b'-Wrong command: `blpop` command is supported only by twisted backend\r\n$-1\r\n'
+        self.assertEqual(reply, await self.request([['INFO'], ['blpop', 'l', '0'], ['get', 'l']], reply))
+
+    async def test_slow_command_order(self):
+        """
+        Replies after a slow command wait for it
+        :return:
+        """
+        reply = b'+OK\r\n*1\r\n$1\r\na\r\n$1\r\n1\r\n'
+        self.assertEqual(reply, await self.request([['set', 'a', '1'], ['keys', '*'], ['get', 'a']], reply))
+
+
+class TestAsyncioClock(unittest.IsolatedAsyncioTestCase):
+    """
+    Class for testing storage timers on asyncio loop
+    """
+    async def test_garbage_collector(self):
+        """
+        Expired keys are removed by garbage collector running on the loop
+        :return:
+        """
+        storage = Storage(gc=True, clock=AsyncioClock(asyncio.get_running_loop()))
+        storage.set('1', 'one', moe=time.time() + 0.05)
+        storage.set('2', 'two')
+        await asyncio.sleep(0.3)
+        self.assertEqual({'2': 'two'}, storage._keys_dict)
+
+    async def test_shared_parser(self):
+        """
+        Server uses given command parser
+        :return:
+        """
+        parser = RedisCommandParser()
+        server = AsyncioServer(parser=parser, loop=asyncio.get_running_loop())
+        self.assertIs(parser, server.parser)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,95 @@
+import unittest
+import os
+import tempfile
+from src.bulk_loader import *
+from src.snapshot import read_manifest
+from src.storage import Storage
+from src.exceptions.bulk_loader_exceptions import *
+
+
+class TestBulkLoader(unittest.TestCase):
+    """
+    Class for testing snapshot building from CSV and JSON lines
+    """
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.prefix = os.path.join(self.tmp_dir.name, 'storage')
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_make_record(self):
+        """
+        Test conversion of fields of all types
+        :return:
+        """
+        self.assertEqual(('1', 'one', None), make_record('1', 'string', 'one'))
+        self.assertEqual(('1', '5', 15.0), make_record(1, 'STRING', 5, '10', now=5))
+        self.assertEqual(('l', ['1', 'a'], None), make_record('l', 'list', '[1, "a"]', ''))
+        self.assertEqual(('h', {'f': '1'}, None), make_record('h', 'hash', {'f': 1}))
+
+    def test_make_record_failure(self):
+        """
+        Test wrong fields
+        :return:
+        """
+        self.assertRaises(BulkLoaderRecordError, make_record, '', 'string', 'one')
+        self.assertRaises(BulkLoaderRecordError, make_record, '1', 'set', 'one')
+        self.assertRaises(BulkLoaderRecordError, make_record, '1', 'list', '[1, 2')
+        self.assertRaises(BulkLoaderRecordError, make_record, '1', 'hash', '[1, 2]')
+        self.assertRaises(BulkLoaderRecordError, make_record, '1', 'string', ['a'])
+        self.assertRaises(BulkLoaderRecordError, make_record, '1', 'string', 'one', 'abc')
+
+    def test_csv(self):
+        """
+        Test CSV parsing with header and optional ttl
+        :return:
+        """
+        lines = ['key,type,value,ttl\n',
+                 's,string,"hello, world",\n',
+                 'l,list,"[""a"", ""b""]",10\n',
+                 '\n',
+                 'h,hash,"{""f"": ""v""}"\n']
+        self.assertEqual([('s', 'hello, world', None),
+                          ('l', ['a', 'b'], 110.0),
+                          ('h', {'f': 'v'}, None)],
+                         list(iter_csv_records(lines, now=100)))
+        self.assertRaises(BulkLoaderRecordError, list, iter_csv_records(['a,string\n']))
+
+    def test_jsonl(self):
+        """
+        Test JSON lines parsing
+        :return:
+        """
+        lines = ['{"key": "s", "value": "one"}\n',
+                 '{"key": "l", "type": "list", "value": [1, 2], "ttl": 5}\n']
+        self.assertEqual([('s', 'one', None), ('l', ['1', '2'], 105.0)],
+                         list(iter_jsonl_records(lines, now=100)))
+        self.assertRaises(BulkLoaderRecordError, list, iter_jsonl_records(['[1, 2]']))
+        self.assertRaises(BulkLoaderRecordError, list, iter_jsonl_records(['{"key": ']))
+
+    def test_build_snapshot(self):
+        """
+        Build snapshot and load it into Storage,
+        the last record of a key wins
+        :return:
+        """
+        lines = ['a,string,1\n', 'b,list,"[""x""]"\n', 'a,string,2\n']
+        count = build_snapshot(iter_csv_records(lines), self.prefix, shards=2)
+        self.assertEqual(3, count)
+        storage = Storage(file_prefix=self.prefix)
+        self.assertEqual({'a': '2', 'b': ['x']}, storage._keys_dict)
+
+    def test_build_snapshot_failure(self):
+        """
+        Snapshot is not written when input is wrong
+        :return:
+        """
+        lines = ['a,string,1\n', 'b,list,[\n']
+        self.assertRaises(BulkLoaderRecordError, build_snapshot, iter_csv_records(lines), self.prefix)
+        self.assertEqual(None, read_manifest(self.prefix))
+        self.assertEqual([], os.listdir(self.tmp_dir.name))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -1,4 +1,6 @@
-from src.client_protocol import ClientProtocolFactory
+from src.client_protocol import *
+from src.exceptions.redis_data_parser_exceptions import *
+import io
 from twisted.trial import unittest
 from twisted.internet.testing import StringTransport
 from twisted.internet.address import IPv4Address
@@ -71,6 +73,64 @@ class TestServerProtocol(unittest.TestCase):
                 self.assertEqual(True, self.tr.disconnecting)
 
 
+
+class TestPipeClient(unittest.TestCase):
+    def test_resp_commands(self):
+        """
+        Commands are split correctly when they cross read chunks
+        :return:
+        """
+        commands = [RedisEncoder.encodeArray(['set', str(i), 'v' * i]) for i in range(20)]
+        stream = io.BufferedReader(io.BytesIO(b''.join(commands)))
+        self.assertEqual(commands, list(iter_pipe_commands(stream)))
+        stream = io.BytesIO(b''.join(commands))
+        self.assertEqual(commands, list(iter_resp_commands(stream, chunk_size=7)))
+        stream = io.BytesIO(b''.join(commands)[:-1])
+        self.assertRaises(ParserValueError, list, iter_resp_commands(stream))
+
+    def test_reply_end(self):
+        """
+        Ends of replies of every type are found, incomplete replies give -1
+        :return:
+        """
+        replies = [b'+OK\r\n', b'-Wrong command\r\n', b':42\r\n', b'$3\r\nabc\r\n', b'$-1\r\n', b'*-1\r\n',
+                   b'*0\r\n', b'*3\r\n$1\r\na\r\n*2\r\n:1\r\n$-1\r\n+x\r\n']
+        for reply in replies:
+            self.assertEqual(len(reply), resp_reply_end(reply, 0))
+            self.assertEqual(len(reply) + 2, resp_reply_end(b'+a' + reply + b':1', 2))
+            for end in range(1, len(reply)):
+                self.assertEqual(-1, resp_reply_end(reply[:end], 0), reply[:end])
+        self.assertRaises(ParserFirstByteNotRecognized, resp_reply_end, b'?\r\n', 0)
+        self.assertRaises(ParserValueError, resp_reply_end, b'$x\r\n', 0)
+
+    def test_text_commands(self):
+        stream = io.BufferedReader(io.BytesIO(b'set a "b c"\n\nget a\n'))
+        self.assertEqual([RedisEncoder.encodeArray(['set', 'a', 'b c']), RedisEncoder.encodeArray(['get', 'a'])],
+                         list(iter_pipe_commands(stream)))
+
+    def test_window(self):
+        """
+        No more than window commands wait for replies,
+        replies are counted
+        :return:
+        """
+        commands = [RedisEncoder.encodeArray(['get', str(i)]) for i in range(10)]
+        factory = PipeClientFactory(iter(commands), window=4)
+        proto = factory.buildProtocol(IPv4Address('TCP', '127.0.0.1', 50000))
+        tr = StringTransport()
+        proto.makeConnection(tr)
+        self.assertEqual(b''.join(commands[:4]), tr.value())
+        proto.dataReceived(b'$-1\r\n')
+        self.assertEqual(4, proto.sent)
+        proto.dataReceived(b'$-1\r\n-Wrong\r\n')
+        self.assertEqual(6, proto.sent)
+        proto.dataReceived(b'$-1\r\n' * 6)
+        self.assertFalse(factory.finished.called)
+        proto.dataReceived(b'$-1\r\n')
+        self.assertEqual(proto, self.successResultOf(factory.finished))
+        self.assertEqual((10, 10, 1, 'Wrong'), (proto.sent, proto.replies, proto.errors, proto.first_error))
+        self.assertEqual(True, tr.disconnecting)
+
 if __name__ == '__main__':
     import unittest as unit
     unit.main(verbosity=2)
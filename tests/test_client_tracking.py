@@ -0,0 +1,161 @@
+from twisted.trial import unittest
+from twisted.internet import reactor, task
+from twisted.internet.testing import StringTransport
+from src.client_tracking import ClientTracking, INVALIDATE_CHANNEL
+from src.redis_client import RedisClientCache, connect
+from src.redis_encoder import RedisEncoder
+from src.server_protocol import ServerProtocolFactory
+from src.storage import Storage
+from tests.test_replication import wait_for
+
+
+def invalidation(keys):
+    return RedisEncoder.encodeArray(['message', INVALIDATE_CHANNEL, keys])
+
+
+class Connection:
+    def __init__(self):
+        self.transport = StringTransport()
+
+    def sendData(self, data):
+        self.transport.write(data)
+
+
+class TestClientTracking(unittest.TestCase):
+    """
+    Class for testing ClientTracking with fake connections
+    """
+    def setUp(self) -> None:
+        self.storage = Storage()
+        self.clock = task.Clock()
+        self.target = Connection()
+        self.tracking = ClientTracking(self.storage, {10: self.target}, clock=self.clock, max_keys=3)
+
+    def test_tracked_keys(self):
+        """
+        Read keys are invalidated once when changed, removed or expired
+        :return:
+        """
+        self.assertIsNone(self.storage.change_listener)
+        self.tracking.enable(1, 10)
+        self.tracking.enable(2, 10)
+        self.storage.set('a', '1')
+        self.storage.set('b', '2', moe=1)
+        self.tracking.track(1, ['a', 'b'])
+        self.tracking.track(2, ['a'])
+        self.storage.set('a', '3')
+        self.assertEqual(invalidation(['a']) * 2, self.target.transport.value())
+        self.target.transport.clear()
+        self.storage.set('a', '4')
+        self.assertEqual(b'', self.target.transport.value())
+        self.assertEqual(0, self.storage.delete(['b']))
+        self.assertEqual(invalidation(['b']), self.target.transport.value())
+        self.tracking.disable(1)
+        self.tracking.disable(2)
+        self.assertIsNone(self.storage.change_listener)
+        self.assertEqual({}, self.tracking.table)
+
+    def test_max_keys(self):
+        self.tracking.enable(1, 10)
+        self.tracking.track(1, ['a', 'b', 'c', 'd'])
+        self.assertEqual(['b', 'c', 'd'], list(self.tracking.table))
+        self.assertEqual(invalidation(['a']), self.target.transport.value())
+
+    def test_bcast(self):
+        """
+        Keys with subscribed prefixes are sent once per reactor turn
+        :return:
+        """
+        self.tracking.enable(1, 10, bcast=True, prefixes=['user:', 'job:'])
+        self.tracking.track(1, ['user:1'])
+        self.assertEqual({}, self.tracking.table)
+        self.storage.set('user:1', 'a')
+        self.storage.set('other', 'b')
+        self.storage.set('job:1', 'c')
+        self.storage.set('user:1', 'd')
+        self.assertEqual(b'', self.target.transport.value())
+        self.clock.advance(0)
+        self.assertEqual(invalidation(['user:1', 'job:1']), self.target.transport.value())
+        self.assertEqual(1, self.tracking.invalidations)
+
+    def test_flush_and_expire(self):
+        """
+        EXPIRE and PERSIST invalidate tracked keys, flush sends one
+        message with null to every tracking connection
+        :return:
+        """
+        self.tracking.enable(1, 10)
+        self.tracking.enable(2, 10, bcast=True)
+        self.storage.set('a', '1')
+        self.tracking.track(1, ['a', 'b'])
+        self.storage.set_moe('a', 10 ** 10)
+        self.assertEqual(invalidation(['a']), self.target.transport.value())
+        self.target.transport.clear()
+        self.storage.flush()
+        self.assertEqual(invalidation(None) * 2, self.target.transport.value())
+        self.assertEqual({}, self.tracking.table)
+        self.clock.advance(0)
+        self.assertEqual(invalidation(None) * 2, self.target.transport.value())
+
+    def test_broken_redirect(self):
+        self.tracking.enable(1, 11)
+        self.tracking.track(1, ['a'])
+        self.storage.set('a', '1')
+        self.assertEqual(0, self.tracking.invalidations)
+
+
+class TestServerTracking(unittest.TestCase):
+    """
+    Class for testing CLIENT TRACKING with a server in the same reactor
+    """
+    def setUp(self) -> None:
+        self.factory = ServerProtocolFactory()
+        self.port = reactor.listenTCP(0, self.factory, interface='127.0.0.1')
+
+    def tearDown(self):
+        return self.port.stopListening()
+
+    def test_client_command(self):
+        proto = self.factory.buildProtocol(('127.0.0.1', 0))
+        tr = StringTransport()
+        proto.makeConnection(tr)
+        proto.dataReceived(RedisEncoder.encodeArray(['client', 'id']) +
+                           RedisEncoder.encodeArray(['client', 'tracking', 'on']) +
+                           RedisEncoder.encodeArray(['client', 'tracking', 'on', 'redirect', '99']) +
+                           RedisEncoder.encodeArray(['client', 'tracking', 'on', 'redirect', '1', 'prefix', 'a']) +
+                           RedisEncoder.encodeArray(['client', 'tracking', 'on', 'redirect', '1']) +
+                           RedisEncoder.encodeArray(['get', 'a']) +
+                           RedisEncoder.encodeArray(['client', 'nope']))
+        replies = tr.value().split(b'\r\n')
+        self.assertEqual(b':1', replies[0])
+        self.assertEqual([b'-', b'-', b'-'], [reply[:1] for reply in replies[1:4]])
+        self.assertEqual([b'+OK', b'$-1'], replies[4:6])
+        self.assertEqual(b'-', replies[6][:1])
+        self.factory.parser.parse(['set', 'a', '1'])
+        self.assertEqual(invalidation(['a']), tr.value()[-len(invalidation(['a'])):])
+        proto.connectionLost(None)
+        self.assertEqual({}, self.factory.tracking.clients)
+        self.assertEqual({}, self.factory.clients)
+
+    async def test_client_cache(self):
+        """
+        Cached values are dropped when another connection changes them
+        :return:
+        """
+        port = self.port.getHost().port
+        connection = await connect('127.0.0.1', port)
+        invalidations = await connect('127.0.0.1', port)
+        writer = await connect('127.0.0.1', port)
+        cache = RedisClientCache(connection, invalidations)
+        self.assertEqual('OK', await cache.start())
+        await writer.execute('set', 'a', '1')
+        self.assertEqual('1', await cache.get('a'))
+        self.assertEqual('1', await cache.get('a'))
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+        await writer.execute('rpush', 'l', 'x')
+        await writer.execute('set', 'a', '2')
+        self.assertTrue(await wait_for(lambda: 'a' not in cache.cache))
+        self.assertEqual('2', await cache.get('a'))
+        self.assertEqual((1, 2), (cache.hits, cache.misses))
+        for client in (connection, invalidations, writer):
+            client.close()
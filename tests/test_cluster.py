@@ -0,0 +1,127 @@
+import unittest
+from src.cluster import *
+from src.redis_command_parser import RedisCommandParser, CommandParserSuccess
+from src.exceptions.redis_command_parser_exceptions import *
+from src.redis_encoder import RedisEncoder
+from src.server_protocol import ServerProtocolFactory
+from twisted.internet.testing import StringTransport
+
+
+class TestHashSlots(unittest.TestCase):
+    """
+    Class for testing key hash slots
+    """
+    def test_crc16(self):
+        """
+        Test vector from Redis cluster specification
+        :return:
+        """
+        self.assertEqual(0x31C3, crc16(b'123456789'))
+
+    def test_key_hash_slot(self):
+        """
+        Test slots of keys with and without hash tags
+        :return:
+        """
+        self.assertEqual(12182, key_hash_slot('foo'))
+        self.assertEqual(key_hash_slot('user1000'), key_hash_slot('{user1000}.following'))
+        self.assertEqual(key_hash_slot('user1000'), key_hash_slot('foo{user1000}{bar}'))
+        # empty tag, whole key is hashed
+        self.assertEqual(crc16(b'foo{}{bar}') % CLUSTER_SLOTS, key_hash_slot('foo{}{bar}'))
+
+
+class TestClusterLayout(unittest.TestCase):
+    """
+    Class for testing ClusterLayout
+    """
+    def test_ranges(self):
+        """
+        Slots are split between nodes without gaps
+        :return:
+        """
+        layout = ClusterLayout.local(3, 7000)
+        self.assertEqual([(0, 5460, 0), (5461, 10921, 1), (10922, 16383, 2)], layout.ranges)
+        self.assertEqual(0, layout.slot_node(0))
+        self.assertEqual(2, layout.slot_node(CLUSTER_SLOTS - 1))
+        self.assertEqual(2, layout.key_node('foo'))
+        reply = layout.slots_reply()
+        self.assertEqual([5461, 10921, ['127.0.0.1', 7001, layout.node_ids[1]]], reply[1])
+
+    def test_wrong_size(self):
+        self.assertRaises(ValueError, ClusterLayout, [])
+
+
+class TestClusterCommandParser(unittest.TestCase):
+    """
+    Class for testing ClusterCommandParser
+    """
+    def setUp(self) -> None:
+        self.layout = ClusterLayout.local(2, 7000)
+        self.parser = ClusterCommandParser(self.layout, 1)
+
+    def test_own_keys(self):
+        """
+        Keys of own slots are served
+        :return:
+        """
+        self.assertEqual(CommandParserSuccess, self.parser.parse(['set', 'foo', 'bar']))
+        self.assertEqual('bar', self.parser.parse(['get', 'foo']))
+        self.assertEqual(1, self.parser.parse(['del', '{foo}1', 'foo']))
+
+    def test_moved(self):
+        """
+        Keys of other nodes are redirected
+        :return:
+        """
+        slot = key_hash_slot('b')
+        self.assertEqual(0, self.layout.slot_node(slot))
+        with self.assertRaises(CommandMoved) as cm:
+            self.parser.parse(['set', 'b', '1'])
+        self.assertEqual(f'MOVED {slot} 127.0.0.1:7000', str(cm.exception))
+
+    def test_cross_slot(self):
+        self.assertRaises(CommandCrossSlot, self.parser.parse, ['del', 'foo', 'bar'])
+
+    def test_blocking_pops(self):
+        """
+        Blocking pops are checked before the connection blocks
+        :return:
+        """
+        factory = ServerProtocolFactory(parser=self.parser)
+        proto = factory.buildProtocol(('127.0.0.1', 0))
+        transport = StringTransport()
+        proto.makeConnection(transport)
+        for command in (['blpop', 'foo', 'bar', '0'], ['brpop', 'foo', 'b', '0'],
+                        ['blmove', 'foo', 'bar', 'left', 'right', '0']):
+            transport.clear()
+            proto.dataReceived(RedisEncoder.encodeArray(command))
+            self.assertEqual(RedisEncoder.encodeError(CommandCrossSlot()), transport.value())
+        transport.clear()
+        proto.dataReceived(RedisEncoder.encodeArray(['blpop', 'b', '0']))
+        self.assertTrue(transport.value().startswith(b'-MOVED'))
+        self.assertEqual(0, len(self.parser.list_waiters))
+        proto.dataReceived(RedisEncoder.encodeArray(['rpush', 'foo', '1']) +
+                           RedisEncoder.encodeArray(['blpop', '{foo}1', 'foo', '0']))
+        self.assertTrue(transport.value().endswith(RedisEncoder.encodeArray(['foo', '1'])))
+
+    def test_cluster_command(self):
+        """
+        Test CLUSTER subcommands
+        :return:
+        """
+        self.assertEqual(self.layout.slots_reply(), self.parser.parse(['cluster', 'slots']))
+        self.assertEqual(12182, self.parser.parse(['CLUSTER', 'KEYSLOT', 'foo']))
+        self.assertEqual(self.layout.node_ids[1], self.parser.parse(['cluster', 'myid']))
+        self.assertRaises(CommandSyntaxError, self.parser.parse, ['cluster', 'meet'])
+        self.assertRaises(CommandWrongArgumentNumber, self.parser.parse, ['cluster'])
+
+
+class TestCommandKeys(unittest.TestCase):
+    def test_command_keys(self):
+        self.assertEqual(['k'], RedisCommandParser.command_keys(['SET', 'k', 'v', 'EX', '5']))
+        self.assertEqual(['a', 'b'], RedisCommandParser.command_keys(['del', 'a', 'b']))
+        self.assertEqual([], RedisCommandParser.command_keys(['keys', '*']))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
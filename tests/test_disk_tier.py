@@ -0,0 +1,153 @@
+import unittest
+import os
+import tempfile
+import time
+from unittest.mock import patch
+from src.disk_tier import DiskTier, Spilled
+from src.storage import Storage
+from src.redis_command_parser import RedisCommandParser
+from src.exceptions.redis_command_parser_exceptions import CommandStorageError
+from src.exceptions.storage_exceptions import *
+
+
+class TestDiskTier(unittest.TestCase):
+    """
+    Class for testing DiskTier
+    """
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'tier.log')
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_put_get(self):
+        """
+        Test putting, reading and removing values
+        :return:
+        """
+        tier = DiskTier(self.path)
+        tier.put('1', 'one')
+        tier.put('2', ['a', 'b'])
+        self.assertEqual(2, len(tier))
+        self.assertEqual('one', tier.get('1'))
+        self.assertEqual(['a', 'b'], tier.pop('2'))
+        self.assertEqual(False, '2' in tier)
+        self.assertRaises(KeyError, tier.get, '2')
+        tier.put('1', 'uno')
+        self.assertEqual('uno', tier.get('1'))
+        tier.close()
+        self.assertEqual(False, os.path.exists(self.path))
+
+    def test_compact(self):
+        """
+        Log is rewritten when most of it is dead
+        :return:
+        """
+        tier = DiskTier(self.path, compact_ratio=0.5, compact_min_bytes=0)
+        for i in range(10):
+            tier.put(i, str(i) * 100)
+        size = tier.size
+        for i in range(5):
+            tier.discard(i)
+        self.assertLess(tier.size, size)
+        self.assertEqual(0, tier.dead_bytes)
+        self.assertEqual(tier.size, os.path.getsize(self.path))
+        self.assertEqual([str(i) * 100 for i in range(5, 10)], [tier.get(i) for i in range(5, 10)])
+        tier.close()
+
+
+class TestStorageDiskTier(unittest.TestCase):
+    """
+    Class for testing Storage with disk tier
+    """
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.tier = DiskTier(os.path.join(self.tmp_dir.name, 'tier.log'))
+        self.now = time.time()
+
+        def fake_time():
+            return self.now
+
+        self.fake_time = fake_time
+
+    def tearDown(self) -> None:
+        self.tier.close()
+        self.tmp_dir.cleanup()
+
+    def test_spill_and_page_in(self):
+        """
+        Idle values are moved to disk and read back on access
+        :return:
+        """
+        with patch('time.time', self.fake_time):
+            storage = Storage(disk_tier=self.tier, spill_after=10)
+            storage.set('1', 'one')
+            storage.set('2', ['two'])
+            self.now += 5
+            storage.set('3', 'three')
+            self.now += 6
+            self.assertEqual(2, storage.spill_idle())
+            self.assertIs(Spilled, storage._keys_dict['1'])
+            self.assertIs(Spilled, storage._keys_dict['2'])
+            self.assertEqual('three', storage._keys_dict['3'])
+            self.assertEqual(['two'], storage.get('2'))
+            self.assertEqual(['two'], storage._keys_dict['2'])
+            self.assertEqual(['1'], list(self.tier._index))
+            info = storage.tier_info()
+            self.assertEqual(1, info['disk_keys'])
+            self.assertEqual(1, info['disk_hits'])
+            self.assertEqual(0, info['memory_hits'])
+
+    def test_read_error(self):
+        """
+        Unreadable disk tier log gives command errors
+        :return:
+        """
+        with patch('time.time', self.fake_time):
+            parser = RedisCommandParser(Storage(disk_tier=self.tier, spill_after=1))
+            parser.parse(['set', '1', 'one'])
+            parser.parse(['rpush', '2', 'a', 'b'])
+            self.now += 2
+            self.assertEqual(2, parser.storage.spill_idle())
+            os.truncate(self.tier.path, 0)
+            self.assertRaises(CommandStorageError, parser.parse, ['get', '1'])
+            self.assertRaises(CommandStorageError, parser.parse, ['set', '1', 'uno', 'get'])
+            self.assertRaises(CommandStorageError, parser.parse_slow, ['lrange', '2', '0', '-1'])
+
+    def test_spilled_keys_removed(self):
+        """
+        Deleted, rewritten and expired keys are removed from disk
+        :return:
+        """
+        with patch('time.time', self.fake_time):
+            storage = Storage(disk_tier=self.tier, spill_after=1)
+            storage.set('1', 'one')
+            storage.set('2', 'two')
+            storage.set('3', 'three', moe=self.now + 5)
+            self.now += 2
+            storage.spill_idle()
+            self.assertEqual(1, storage.delete(['1']))
+            self.assertEqual('two', storage.set('2', 'dos', get=True))
+            self.now += 5
+            self.assertRaises(StorageKeyError, storage.get, '3')
+            self.assertEqual(0, len(self.tier))
+            self.assertEqual({'2': 'dos'}, storage._keys_dict)
+
+    def test_save(self):
+        """
+        Spilled values are written to snapshot
+        :return:
+        """
+        with patch('time.time', self.fake_time):
+            prefix = os.path.join(self.tmp_dir.name, 'storage')
+            storage = Storage(file_prefix=prefix, disk_tier=self.tier, spill_after=1)
+            storage.set('1', 'one')
+            self.now += 2
+            storage.spill_idle()
+            storage.save()
+            self.assertEqual({'1': 'one'}, Storage(file_prefix=prefix)._keys_dict)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,100 @@
+from twisted.trial import unittest
+from twisted.internet import task
+from twisted.internet.testing import StringTransport
+from src.fair_scheduler import FairScheduler
+from src.server_protocol import ServerProtocolFactory
+from src.redis_encoder import RedisEncoder
+
+
+class TestFairScheduler(unittest.TestCase):
+    """
+    Class for testing turns of connections
+    """
+    def setUp(self) -> None:
+        self.clock = task.Clock()
+        self.factory = ServerProtocolFactory()
+        self.factory.scheduler = FairScheduler(max_commands=3, clock=self.clock)
+
+    def connection(self):
+        proto = self.factory.buildProtocol(('127.0.0.1', 6379))
+        tr = StringTransport()
+        proto.makeConnection(tr)
+        return proto, tr
+
+    def turn(self):
+        """
+        Run one turn of the scheduler, Clock.advance would run
+        the turns scheduled during it as well
+        """
+        self.clock.getDelayedCalls()[0].cancel()
+        self.factory.scheduler._run()
+
+    def test_round_robin(self):
+        """
+        Pipelines are parsed by turns, a single command is parsed at once
+        :return:
+        """
+        bulk, bulk_tr = self.connection()
+        other, other_tr = self.connection()
+        small, small_tr = self.connection()
+        bulk.dataReceived(RedisEncoder.encodeArray(['rpush', 'l', 'x']) * 8)
+        other.dataReceived(RedisEncoder.encodeArray(['rpush', 'm', 'x']) * 4)
+        self.assertEqual(3, bulk_tr.value().count(b':'))
+        self.assertEqual(3, other_tr.value().count(b':'))
+        small.dataReceived(RedisEncoder.encodeArray(['get', 'a']))
+        self.assertEqual(b'$-1\r\n', small_tr.value())
+        # data coming while waiting for a turn doesn't give an extra turn
+        bulk.dataReceived(RedisEncoder.encodeArray(['rpush', 'l', 'x']))
+        self.assertEqual(3, bulk_tr.value().count(b':'))
+        self.assertEqual(2, len(self.factory.scheduler))
+        self.turn()
+        self.assertEqual(6, bulk_tr.value().count(b':'))
+        self.assertEqual(4, other_tr.value().count(b':'))
+        self.turn()
+        self.assertEqual(9, bulk_tr.value().count(b':'))
+        self.assertEqual([], self.clock.getDelayedCalls())
+        self.assertEqual(9, len(self.factory.parser.storage.get('l')))
+        stats = self.factory.scheduler.stats()
+        self.assertEqual((3, 2, 0, 2), (stats['deferrals'], stats['turns'], stats['waiting'], stats['max_queue']))
+        self.assertEqual(2, bulk.deferrals)
+
+    def test_deferred_reading(self):
+        """
+        Reading from the socket is paused while the connection waits
+        for its turn, the buffer is not copied on every turn
+        :return:
+        """
+        proto, tr = self.connection()
+        data = RedisEncoder.encodeArray(['rpush', 'l', 'x']) * 8
+        proto.dataReceived(data)
+        self.assertEqual('paused', tr.producerState)
+        self.assertIs(data, proto._data_buffer)
+        self.assertEqual(len(data) // 8 * 5, proto.bufferedBytes())
+        self.turn()
+        self.assertEqual('paused', tr.producerState)
+        self.assertIs(data, proto._data_buffer)
+        self.turn()
+        self.assertEqual('producing', tr.producerState)
+        self.assertEqual(0, proto.bufferedBytes())
+        self.assertEqual(8, tr.value().count(b':'))
+
+    def test_max_time(self):
+        """
+        At least one command is parsed per turn
+        :return:
+        """
+        self.factory.scheduler = FairScheduler(max_commands=0, max_time=1e-12, clock=self.clock)
+        proto, tr = self.connection()
+        proto.dataReceived(RedisEncoder.encodeArray(['get', 'a']) * 3)
+        self.assertEqual(b'$-1\r\n', tr.value())
+        self.turn()
+        self.assertEqual(b'$-1\r\n' * 2, tr.value())
+        self.turn()
+        self.assertEqual(b'$-1\r\n' * 3, tr.value())
+
+    def test_connection_lost(self):
+        proto, tr = self.connection()
+        proto.dataReceived(RedisEncoder.encodeArray(['set', 'a', '1']) * 5)
+        proto.connectionLost(None)
+        self.clock.advance(0)
+        self.assertEqual(b'+OK\r\n' * 3, tr.value())
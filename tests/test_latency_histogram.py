@@ -0,0 +1,86 @@
+import unittest
+from twisted.internet.testing import StringTransport
+from src.latency_histogram import LatencyHistogram, bucket_index, bucket_bounds, BUCKETS, MAX_VALUE
+from src.metrics_http import render_metrics
+from src.redis_encoder import RedisEncoder
+from src.server_protocol import ServerProtocolFactory
+
+
+class TestLatencyHistogram(unittest.TestCase):
+    """
+    Class for testing LatencyHistogram
+    """
+    def test_buckets(self):
+        """
+        Buckets cover all values without gaps, relative width is at most 1/16
+        :return:
+        """
+        low = 0
+        for index in range(BUCKETS):
+            bounds = bucket_bounds(index)
+            self.assertEqual(low, bounds[0])
+            self.assertEqual((index, index), (bucket_index(bounds[0]), bucket_index(bounds[1])))
+            self.assertLessEqual(bounds[1] - bounds[0], bounds[0] / 16)
+            low = bounds[1] + 1
+        self.assertEqual(MAX_VALUE + 1, low)
+
+    def test_percentile(self):
+        histogram = LatencyHistogram()
+        self.assertEqual(0, histogram.percentile(50))
+        for value in range(1, 1001):
+            histogram.record(value)
+        histogram.record(MAX_VALUE * 2)
+        self.assertEqual(1001, histogram.count)
+        self.assertAlmostEqual(500, histogram.percentile(50), delta=500 / 16)
+        self.assertAlmostEqual(990, histogram.percentile(99), delta=990 / 16)
+        self.assertEqual(MAX_VALUE, histogram.percentile(100))
+        self.assertEqual((1, 1), histogram.cumulative()[0])
+        self.assertEqual(1001, histogram.cumulative()[-1][1])
+
+
+class TestLatencyCommand(unittest.TestCase):
+    """
+    Class for testing LATENCY HISTOGRAM and metrics of a connection
+    """
+    def setUp(self) -> None:
+        self.factory = ServerProtocolFactory()
+        self.proto = self.factory.buildProtocol(('127.0.0.1', 0))
+        self.proto.makeConnection(StringTransport())
+        self.proto.dataReceived(RedisEncoder.encodeArray(['set', 'a', '1']) * 3 +
+                                RedisEncoder.encodeArray(['get', 'a']) +
+                                RedisEncoder.encodeArray(['nope']))
+        self.proto.transport.clear()
+
+    def test_histogram(self):
+        self.assertEqual(['get', 'set'], sorted(self.factory.latency.commands))
+        self.assertEqual(3, self.factory.latency.commands['set'].count)
+        self.proto.dataReceived(RedisEncoder.encodeArray(['latency', 'histogram', 'SET', 'del']))
+        reply = self.proto.transport.value()
+        self.assertTrue(reply.startswith(b'*2\r\n$3\r\nset\r\n*10\r\n$5\r\ncalls\r\n:3\r\n'))
+        self.assertIn(b'histogram_usec', reply)
+        self.proto.transport.clear()
+        self.proto.dataReceived(RedisEncoder.encodeArray(['latency', 'histogram']) +
+                                RedisEncoder.encodeArray(['latency', 'nope']))
+        self.assertTrue(self.proto.transport.value().startswith(b'*6\r\n$3\r\nget\r\n'))
+        self.assertIn(b'\r\n-', self.proto.transport.value())
+
+    def test_metrics(self):
+        lines = render_metrics(self.factory).splitlines()
+        self.assertIn('redis_command_latency_seconds_bucket{command="set",le="+Inf"} 3', lines)
+        self.assertIn('redis_command_latency_seconds_count{command="get"} 1', lines)
+        self.assertIn('# TYPE redis_total_commands_processed counter', lines)
+        self.assertIn('redis_total_commands_processed 5', lines)
+        self.assertIn('# TYPE redis_keyspace_hits counter', lines)
+        self.assertIn('# TYPE redis_used_cpu_user counter', lines)
+        self.assertIn('# TYPE redis_connected_clients gauge', lines)
+        self.assertIn('# TYPE redis_command_latency_quantile_seconds summary', lines)
+        self.assertTrue(any(line.startswith('redis_command_latency_quantile_seconds{command="set",quantile="0.99"}')
+                            for line in lines))
+        self.assertIn('redis_command_latency_quantile_seconds_count{command="set"} 3', lines)
+        buckets = [int(line.split()[-1]) for line in lines
+                   if line.startswith('redis_command_latency_seconds_bucket{command="set"')]
+        self.assertEqual(sorted(buckets), buckets)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,83 @@
+import unittest
+from twisted.internet import task
+from src.lazy_free import LazyFreer, is_big
+
+
+class TestLazyFreer(unittest.TestCase):
+    """
+    Class for testing LazyFreer with a fake clock
+    """
+    def setUp(self) -> None:
+        self.clock = task.Clock()
+        self.freer = LazyFreer(self.clock, slice_size=100)
+
+    def turn(self):
+        """
+        Free one slice, Clock.advance would run
+        the slices scheduled during it as well
+        """
+        self.clock.getDelayedCalls()[0].cancel()
+        self.freer._run()
+
+    def test_small_values(self):
+        """
+        Small values are dropped at once, nothing is scheduled
+        :return:
+        """
+        self.freer.free('value')
+        self.freer.free(list(range(10)))
+        self.assertEqual(2, self.freer.freed_values)
+        self.assertEqual(0, len(self.freer))
+        self.assertEqual([], self.clock.getDelayedCalls())
+
+    def test_slices(self):
+        """
+        Big values lose at most slice_size elements per turn
+        :return:
+        """
+        self.freer.free(list(range(250)))
+        self.freer.free({i: str(i) for i in range(100)})
+        self.assertEqual(350, self.freer.pending_elements)
+        self.turn()
+        self.assertEqual(250, self.freer.pending_elements)
+        self.turn()
+        self.turn()
+        self.assertEqual(50, self.freer.pending_elements)
+        self.assertEqual(1, len(self.freer))
+        self.turn()
+        self.assertEqual(0, self.freer.pending_elements)
+        self.assertEqual(0, len(self.freer))
+        self.assertEqual(4, self.freer.slices)
+        self.assertEqual([], self.clock.getDelayedCalls())
+
+    def test_free_all(self):
+        """
+        Big values of a freed dict are queued instead of being freed inline
+        :return:
+        """
+        self.freer.freeAll({'a': 'x', 'b': list(range(150)), 'c': {}})
+        while self.clock.getDelayedCalls():
+            self.turn()
+        self.assertEqual(0, self.freer.pending_elements)
+        self.assertEqual(2, self.freer.slices)
+
+    def test_shared_value(self):
+        """
+        Value referenced elsewhere, e.g. by a snapshot, is left intact
+        :return:
+        """
+        value = list(range(250))
+        snapshot = {'l': value}
+        self.freer.free(value)
+        self.clock.advance(0)
+        self.assertEqual(250, len(snapshot['l']))
+        self.assertEqual(0, len(self.freer))
+
+    def test_is_big(self):
+        self.assertTrue(is_big(list(range(65))))
+        self.assertFalse(is_big(list(range(64))))
+        self.assertFalse(is_big('x' * 1000))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,81 @@
+from twisted.trial import unittest
+from twisted.internet import reactor
+from src.load_generator import LoadFactory, Workload, parse_mix, format_report
+from src.server_protocol import ServerProtocolFactory
+
+
+class TestWorkload(unittest.TestCase):
+    """
+    Class for testing Workload
+    """
+    def test_parse_mix(self):
+        self.assertEqual([('set', 3), ('get', 1)], parse_mix('SET:3, get'))
+        self.assertRaises(ValueError, parse_mix, 'set,del')
+        self.assertRaises(ValueError, parse_mix, 'set:0')
+        self.assertRaises(ValueError, parse_mix, 'set:x')
+
+    def test_commands(self):
+        mix = parse_mix('set,get,lpush,lrange,hset,keys')
+        workload = Workload(mix, keyspace=10, value_size=5, ttl_ratio=0.5, ttl=30, lrange_count=20, seed=1)
+        commands = [workload.next() for _ in range(600)]
+        # the same seed gives the same commands
+        same = Workload(mix, keyspace=10, value_size=5, ttl_ratio=0.5, ttl=30, lrange_count=20, seed=1)
+        self.assertEqual(commands, [same.next() for _ in range(600)])
+        names = {command[0] for command in commands}
+        self.assertEqual(set(name for name, _ in mix), names)
+        sets = [command for command in commands if command[0] == 'set']
+        with_ttl = [command for command in sets if len(command) == 5]
+        self.assertTrue(0 < len(with_ttl) < len(sets))
+        self.assertEqual(['ex', '30'], with_ttl[0][3:])
+        self.assertTrue(all(len(command[2]) == 5 for command in sets))
+        keys = {command[1] for command in commands if command[0] in ('set', 'get')}
+        self.assertTrue(keys <= {f'bench:key:{i}' for i in range(10)})
+        lrange = next(command for command in commands if command[0] == 'lrange')
+        self.assertEqual(['0', '19'], lrange[2:])
+        self.assertIn(['keys', 'bench:key:1*'], commands)
+
+
+class TestLoadFactory(unittest.TestCase):
+    """
+    Class for testing a run of the benchmark against a server in the same reactor
+    """
+    def setUp(self) -> None:
+        self.server = ServerProtocolFactory()
+        self.port = reactor.listenTCP(0, self.server, interface='127.0.0.1')
+
+    def tearDown(self):
+        return self.port.stopListening()
+
+    def run_benchmark(self, factory):
+        for _ in range(factory.clients):
+            reactor.connectTCP('127.0.0.1', self.port.getHost().port, factory)
+        return factory.finished
+
+    async def test_requests(self):
+        workload = Workload(parse_mix('set:2,get,lpush,lrange,hset,keys'), keyspace=50, seed=2)
+        factory = await self.run_benchmark(LoadFactory(workload, clients=4, requests=203, pipeline=5))
+        report = factory.report()
+        self.assertEqual((203, 203, 0), (factory.sent, report['requests'], report['errors']))
+        self.assertEqual(report['requests'], sum(stats['requests'] for stats in report['commands'].values()))
+        self.assertEqual(['get', 'hset', 'keys', 'lpush', 'lrange', 'set'], list(report['commands']))
+        stats = report['commands']['set']
+        self.assertTrue(0 < stats['p50_ms'] <= stats['p99_ms'] <= stats['max_ms'])
+        self.assertGreater(report['requests_per_sec'], 0)
+        self.assertEqual(7, len(format_report(report).splitlines()))
+        self.assertEqual(203, self.server.stats.commands)
+
+    async def test_errors(self):
+        self.server.parser.storage.set('bench:list:0', 'string')
+        workload = Workload(parse_mix('lpush'), keyspace=1)
+        factory = await self.run_benchmark(LoadFactory(workload, clients=2, requests=10))
+        report = factory.report()
+        self.assertEqual(10, report['errors'])
+        self.assertTrue(report['first_error'].startswith('Wrong type'))
+        self.assertIn('first error', format_report(report))
+
+    async def test_duration(self):
+        workload = Workload(parse_mix('get'))
+        factory = await self.run_benchmark(LoadFactory(workload, clients=2, pipeline=3, duration=0.2))
+        self.assertGreater(factory.replies, 0)
+        self.assertEqual(factory.sent, factory.replies)
+        self.assertGreaterEqual(factory.elapsed, 0.2)
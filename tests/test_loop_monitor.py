@@ -0,0 +1,115 @@
+import os
+import sys
+import time
+from twisted.trial import unittest
+from twisted.internet import defer, reactor, task
+from twisted.internet.testing import StringTransport
+from src.loop_monitor import LoopMonitor, describe_stack
+from src.redis_encoder import RedisEncoder
+from src.server_protocol import ServerProtocolFactory
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__)) + os.sep
+
+
+class Connection:
+    """
+    Connection executing a command for some time
+    """
+    def __init__(self, command, seconds=0):
+        self.last_command = command
+        self.seconds = seconds
+
+    def _valueParsed(self, value):
+        time.sleep(self.seconds)
+        return sys._getframe()
+
+
+def blocking_timer():
+    return inner_function()
+
+
+def inner_function():
+    return sys._getframe()
+
+
+class TestLoopMonitor(unittest.TestCase):
+    """
+    Class for testing LoopMonitor
+    """
+    def test_lag(self):
+        """
+        Late timer calls are lags, lags over the threshold are events
+        :return:
+        """
+        clock = task.Clock()
+        monitor = LoopMonitor(threshold=0.05, interval=0.1, clock=clock)
+        monitor.start(watchdog=False)
+        clock.advance(0.1)
+        clock.advance(0.2)
+        self.assertEqual(2, monitor.histogram.count)
+        self.assertEqual((100000, 1), (monitor.max_lag, monitor.stalls))
+        self.assertEqual([['unknown', monitor.history['unknown'][0][0], 100, 100]], monitor.latest())
+        self.assertEqual(1, monitor.reset(['unknown', 'other']))
+        self.assertEqual([], monitor.latest())
+        monitor.stop()
+        self.assertEqual([], clock.getDelayedCalls())
+
+    def test_describe_stack(self):
+        self.assertEqual('command:get', describe_stack(Connection('get')._valueParsed(None), TESTS_DIR))
+        self.assertEqual('TestLoopMonitor.test_describe_stack', describe_stack(blocking_timer(), TESTS_DIR))
+        self.assertEqual('unknown', describe_stack(blocking_timer()))
+
+    def test_watchdog(self):
+        """
+        Stall is named after the command blocking the reactor
+        :return:
+        """
+        monitor = LoopMonitor(threshold=0.05, interval=0.02)
+        monitor.start()
+        d = defer.Deferred()
+        factory = ServerProtocolFactory()
+        factory.loop_monitor = monitor
+        proto = factory.buildProtocol(('127.0.0.1', 0))
+        proto.makeConnection(StringTransport())
+        factory.parser.parse_slow = lambda value: time.sleep(0.3)
+        reactor.callLater(0.03, proto.dataReceived, RedisEncoder.encodeArray(['lrange', 'l', '0', '-1']))
+        reactor.callLater(0.5, d.callback, None)
+
+        def check(_):
+            monitor.stop()
+            self.assertIn('command:lrange', monitor.history)
+            self.assertGreaterEqual(monitor.max_latency['command:lrange'], 200)
+        return d.addCallback(check)
+
+    def test_blame(self):
+        """
+        Command longer than the threshold names the stall
+        :return:
+        """
+        clock = task.Clock()
+        factory = ServerProtocolFactory()
+        factory.loop_monitor = LoopMonitor(threshold=0, clock=clock)
+        factory.loop_monitor.start(watchdog=False)
+        proto = factory.buildProtocol(('127.0.0.1', 0))
+        proto.makeConnection(StringTransport())
+        proto.dataReceived(RedisEncoder.encodeArray(['set', 'a', '1']))
+        clock.advance(0.1)
+        self.assertEqual(['command:set'], list(factory.loop_monitor.history))
+        factory.loop_monitor.stop()
+
+    def test_commands(self):
+        factory = ServerProtocolFactory()
+        proto = factory.buildProtocol(('127.0.0.1', 0))
+        proto.makeConnection(StringTransport())
+        proto.dataReceived(RedisEncoder.encodeArray(['latency', 'latest']))
+        self.assertEqual(b'*0\r\n', proto.transport.value())
+        factory.loop_monitor = LoopMonitor()
+        factory.loop_monitor.addEvent('command:keys', 150)
+        factory.loop_monitor.addEvent('command:keys', 120)
+        proto.transport.clear()
+        proto.dataReceived(RedisEncoder.encodeArray(['latency', 'history', 'command:keys']) +
+                           RedisEncoder.encodeArray(['latency', 'reset']) +
+                           RedisEncoder.encodeArray(['latency', 'history', 'command:keys']))
+        replies = proto.transport.value()
+        self.assertTrue(replies.startswith(b'*2\r\n*2\r\n:'))
+        self.assertTrue(replies.endswith(b':120\r\n:1\r\n*0\r\n'))
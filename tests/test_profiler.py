@@ -0,0 +1,117 @@
+import os
+import pstats
+import shutil
+import tempfile
+import time
+import unittest
+from twisted.internet import task
+from twisted.internet.testing import StringTransport
+from src.profiler import Profiler, collapse
+from src.redis_encoder import RedisEncoder
+from src.server_protocol import ServerProtocolFactory
+from src.exceptions.profiler_exceptions import ProfilerStateError
+
+
+def busy_function(seconds):
+    """
+    Burn CPU time for the sampling profiler
+    """
+    deadline = time.process_time() + seconds
+    total = 0
+    while time.process_time() < deadline:
+        total += sum(range(100))
+    return total
+
+
+class TestProfiler(unittest.TestCase):
+    """
+    Class for testing Profiler
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.clock = task.Clock()
+        self.profiler = Profiler(self.directory, self.clock)
+
+    def tearDown(self):
+        if self.profiler.running:
+            self.profiler.stop()
+        shutil.rmtree(self.directory)
+
+    def test_cprofile(self):
+        path = self.profiler.start()
+        self.assertTrue(self.profiler.running)
+        busy_function(0.01)
+        self.assertEqual(path, self.profiler.stop())
+        self.assertFalse(self.profiler.running)
+        self.assertTrue(path.endswith('.pstats'))
+        functions = [function[2] for function in pstats.Stats(path).stats]
+        self.assertIn('busy_function', functions)
+
+    def test_sampling(self):
+        path = self.profiler.start(mode='sampling')
+        busy_function(0.2)
+        self.profiler.stop()
+        self.assertTrue(path.endswith('.collapsed'))
+        with open(path) as f:
+            lines = f.read().splitlines()
+        stack, count = lines[0].rsplit(' ', 1)
+        self.assertGreater(int(count), 0)
+        self.assertTrue(any('test_profiler.py:busy_function' in line for line in lines))
+
+    def test_timed(self):
+        path = self.profiler.start(seconds=5)
+        self.clock.advance(5)
+        self.assertFalse(self.profiler.running)
+        self.assertTrue(os.path.exists(path))
+        # another profile gets another file
+        self.assertNotEqual(path, self.profiler.start())
+        self.profiler.stop()
+        self.assertEqual([], self.clock.getDelayedCalls())
+
+    def test_state(self):
+        self.assertRaises(ProfilerStateError, self.profiler.stop)
+        self.profiler.start()
+        self.assertRaises(ProfilerStateError, self.profiler.start)
+
+    def test_collapse(self):
+        def inner():
+            import sys
+            return collapse(sys._getframe())
+        stack = inner().split(';')
+        self.assertEqual('test_profiler.py:TestProfiler.test_collapse.<locals>.inner', stack[-1])
+        self.assertEqual('test_profiler.py:TestProfiler.test_collapse', stack[-2])
+
+    def test_command(self):
+        factory = ServerProtocolFactory()
+        factory.profiler = self.profiler
+        proto = factory.buildProtocol(('127.0.0.1', 0))
+        transport = StringTransport()
+        proto.makeConnection(transport)
+        proto.dataReceived(RedisEncoder.encodeArray(['debug', 'profile', 'start', '10', 'sampling']))
+        self.assertTrue(self.profiler.running)
+        path = self.profiler.path
+        self.assertEqual(RedisEncoder.encodeBulkString(path), transport.value())
+        transport.clear()
+        proto.dataReceived(RedisEncoder.encodeArray(['debug', 'profile', 'start']))
+        self.assertEqual(b'-Syntax error: Wrong profiler state: profiler is running already\r\n', transport.value())
+        transport.clear()
+        proto.dataReceived(RedisEncoder.encodeArray(['debug', 'profile', 'stop']))
+        self.assertEqual(RedisEncoder.encodeBulkString(path), transport.value())
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual([], self.clock.getDelayedCalls())
+        for command in (['debug'], ['debug', 'profile'], ['debug', 'profile', 'stop', 'now'],
+                        ['debug', 'profile', 'start', '1', 'sampling', 'x']):
+            transport.clear()
+            proto.dataReceived(RedisEncoder.encodeArray(command))
+            self.assertTrue(transport.value().startswith(b'-Wrong arguments'), command)
+        for command in (['debug', 'sleep'], ['debug', 'profile', 'pause'], ['debug', 'profile', 'start', '-1'],
+                        ['debug', 'profile', 'start', 'nan'], ['debug', 'profile', 'start', 'inf'],
+                        ['debug', 'profile', 'start', 'perf'], ['debug', 'profile', 'stop']):
+            transport.clear()
+            proto.dataReceived(RedisEncoder.encodeArray(command))
+            self.assertTrue(transport.value().startswith(b'-Syntax error'), command)
+        self.assertFalse(self.profiler.running)
+
+
+if __name__ == '__main__':
+    unittest.main()
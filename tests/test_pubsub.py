@@ -0,0 +1,91 @@
+import unittest
+from twisted.internet.testing import StringTransport
+from src.pubsub import PatternIndex, PubSub
+from src.redis_pattern_matching import compile_pattern, pattern_prefix
+from src.redis_encoder import RedisEncoder
+from src.exceptions.storage_exceptions import *
+
+
+class Subscriber:
+    def __init__(self):
+        self.transport = StringTransport()
+
+    def sendData(self, data):
+        self.transport.write(data)
+
+
+class TestPatternIndex(unittest.TestCase):
+    """
+    Class for testing compiled patterns and their index
+    """
+    def test_compile_pattern(self):
+        cases = [('h?llo', 'hallo', True), ('h?llo', 'hllo', False), ('h*llo', 'heeeello', True),
+                 ('h[ae]llo', 'hello', True), ('h[ae]llo', 'hillo', False), ('h[^e]llo', 'hallo', True),
+                 ('h[^e]llo', 'hello', False), ('h[a-b]llo', 'hbllo', True), ('h[b-a]llo', 'hallo', True),
+                 ('h\\*llo', 'h*llo', True), ('h\\*llo', 'hallo', False), ('a.b', 'axb', False),
+                 ('*', '', True), ('news.*', 'news.sport', True), ('news.*', 'weather', False)]
+        for pattern, s, expected in cases:
+            self.assertEqual(expected, compile_pattern(pattern).fullmatch(s) is not None, (pattern, s))
+        self.assertRaises(StoragePatternError, compile_pattern, 'h[ello')
+
+    def test_pattern_prefix(self):
+        self.assertEqual('news.', pattern_prefix('news.*'))
+        self.assertEqual('h', pattern_prefix('h[ae]llo'))
+        self.assertEqual('', pattern_prefix('*'))
+        self.assertEqual('plain', pattern_prefix('plain'))
+
+    def test_match(self):
+        index = PatternIndex()
+        for pattern in ('*', 'news.*', 'news.sport.*', 'weather.?', 'plain'):
+            index.add(pattern)
+        self.assertEqual(5, len(index))
+        self.assertEqual({'*', 'news.*', 'news.sport.*'}, set(index.match('news.sport.football')))
+        self.assertEqual({'*', 'weather.?'}, set(index.match('weather.1')))
+        self.assertEqual({'*', 'plain'}, set(index.match('plain')))
+        index.discard('*')
+        index.discard('missing')
+        self.assertEqual([], index.match('other'))
+        self.assertFalse('*' in index)
+        self.assertTrue('plain' in index)
+
+
+class TestPubSub(unittest.TestCase):
+    """
+    Class for testing PubSub
+    """
+    def test_publish(self):
+        """
+        Subscribers of the channel and of matching patterns get the message
+        :return:
+        """
+        pubsub = PubSub()
+        first, second, third = Subscriber(), Subscriber(), Subscriber()
+        self.assertEqual(1, pubsub.subscribe(first, 'news'))
+        self.assertEqual(2, pubsub.psubscribe(first, 'n*'))
+        self.assertEqual(1, pubsub.subscribe(second, 'news'))
+        self.assertEqual(1, pubsub.psubscribe(third, 'weather'))
+        self.assertEqual(3, pubsub.publish('news', 'hi'))
+        message = RedisEncoder.encodeArray(['message', 'news', 'hi'])
+        self.assertEqual(message + RedisEncoder.encodeArray(['pmessage', 'n*', 'news', 'hi']),
+                         first.transport.value())
+        self.assertEqual(message, second.transport.value())
+        self.assertEqual(b'', third.transport.value())
+        self.assertEqual(0, pubsub.publish('other', 'hi'))
+
+    def test_unsubscribe(self):
+        pubsub = PubSub()
+        subscriber = Subscriber()
+        pubsub.subscribe(subscriber, 'a')
+        pubsub.subscribe(subscriber, 'b')
+        pubsub.psubscribe(subscriber, 'c*')
+        self.assertEqual(2, pubsub.unsubscribe(subscriber, 'a'))
+        self.assertEqual(2, pubsub.unsubscribe(subscriber, 'a'))
+        pubsub.remove(subscriber)
+        self.assertEqual(0, pubsub.subscription_count(subscriber))
+        self.assertEqual({}, pubsub.channels)
+        self.assertEqual({}, pubsub.patterns)
+        self.assertEqual(0, pubsub.publish('c1', 'hi'))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
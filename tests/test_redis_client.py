@@ -0,0 +1,110 @@
+from twisted.trial import unittest
+from twisted.internet import reactor, defer
+from twisted.internet.testing import StringTransport
+from twisted.python.failure import Failure
+from twisted.internet.error import ConnectionDone
+import os
+import stat
+import tempfile
+from src.redis_client import RedisClientProtocol, RedisClientPool, connect
+from src.redis_encoder import RedisEncoder
+from src.server_protocol import ServerProtocolFactory
+from src.exceptions.redis_client_exceptions import *
+
+
+class TestRedisClientProtocol(unittest.TestCase):
+    """
+    Class for testing RedisClientProtocol with fake transport
+    """
+    def setUp(self) -> None:
+        self.proto = RedisClientProtocol()
+        self.tr = StringTransport()
+        self.proto.makeConnection(self.tr)
+
+    def test_pipelining(self):
+        """
+        Commands are sent without waiting for replies,
+        replies are matched in order
+        :return:
+        """
+        results = []
+        self.proto.execute('set', 'a', 1).addCallback(results.append)
+        self.proto.execute('get', 'a').addCallback(results.append)
+        self.assertEqual(RedisEncoder.encodeArray(['set', 'a', '1']) + RedisEncoder.encodeArray(['get', 'a']),
+                         self.tr.value())
+        self.assertEqual(2, self.proto.pending)
+        self.proto.dataReceived(b'+OK\r\n$1\r')
+        self.assertEqual(['OK'], results)
+        self.proto.dataReceived(b'\n1\r\n')
+        self.assertEqual(['OK', '1'], results)
+        self.assertEqual(0, self.proto.pending)
+
+    def test_error_reply(self):
+        d = self.proto.execute('nope')
+        self.proto.dataReceived(b'-Wrong command\r\n')
+        return self.assertFailure(d, RedisReplyError)
+
+    def test_pipeline(self):
+        d = self.proto.pipeline([['set', 'a', '1'], ['nope'], ['get', 'a']])
+        self.proto.dataReceived(b'+OK\r\n-Wrong command\r\n$1\r\n1\r\n')
+        result = self.successResultOf(d)
+        self.assertEqual('OK', result[0])
+        self.assertIsInstance(result[1], RedisReplyError)
+        self.assertEqual('1', result[2])
+
+    def test_connection_lost(self):
+        d = self.proto.execute('get', 'a')
+        self.proto.connectionLost(Failure(ConnectionDone()))
+        self.failureResultOf(d, RedisConnectionLost)
+        self.failureResultOf(self.proto.execute('get', 'a'), RedisConnectionLost)
+
+
+class TestRedisClientPool(unittest.TestCase):
+    """
+    Class for testing client with a server in the same reactor
+    """
+    def setUp(self) -> None:
+        self.factory = ServerProtocolFactory()
+        self.port = reactor.listenTCP(0, self.factory, interface='127.0.0.1')
+        self.pool = RedisClientPool('127.0.0.1', self.port.getHost().port, size=2)
+
+    def tearDown(self):
+        self.pool.close()
+        return self.port.stopListening()
+
+    async def test_connect(self):
+        client = await connect('127.0.0.1', self.port.getHost().port)
+        self.assertEqual('OK', await client.execute('set', 'a', 'b'))
+        self.assertEqual('b', await client.execute('get', 'a'))
+        client.close()
+
+    async def test_unix_socket(self):
+        tmp_dir = tempfile.mkdtemp()
+        path = os.path.join(tmp_dir, 'server.sock')
+        port = reactor.listenUNIX(path, self.factory, mode=0o600)
+        self.assertEqual(0o600, stat.S_IMODE(os.stat(path).st_mode))
+        client = await connect(unix_socket=path)
+        self.assertEqual('OK', await client.execute('set', 'a', 'b'))
+        info = await client.execute('client', 'list')
+        self.assertIn(f'addr={path}:0', info)
+        client.close()
+        await port.stopListening()
+        self.assertFalse(os.path.exists(path))
+        os.rmdir(tmp_dir)
+
+    async def test_pool(self):
+        """
+        Concurrent commands share a bounded number of connections
+        :return:
+        """
+        results = await defer.gatherResults([self.pool.execute('rpush', 'l', i) for i in range(20)])
+        self.assertEqual(list(range(1, 21)), sorted(results))
+        self.assertLessEqual(len(self.pool.connections), 2)
+        self.assertEqual(20, len(await self.pool.execute('lrange', 'l', 0, -1)))
+        self.pool.close()
+        self.failureResultOf(self.pool.execute('get', 'a'), RedisPoolClosed)
+
+    async def test_connect_failed(self):
+        self.pool.port = 1
+        with self.assertRaises(Exception):
+            await self.pool.execute('get', 'a')
@@ -3,6 +3,8 @@ from unittest.mock import patch
 import time
 from src.exceptions.redis_command_parser_exceptions import *
 from src.redis_command_parser import RedisCommandParser, CommandParserSuccess, ArrayNone, BulkStringNone
+from src.storage import Storage
+from twisted.internet import task
 
 
 class TestCommandParser(unittest.TestCase):
@@ -412,6 +414,69 @@ class TestCommandParser(unittest.TestCase):
         self.assertRaises(CommandWrongArgumentNumber, parser.parse, ['persist'])
         self.assertRaises(CommandWrongArgumentNumber, parser.parse, ['persist', '1', '2'])
 
+    def test_lpop_rpop(self):
+        """
+        Test 'lpop' and 'rpop', the key is deleted with the last element
+        :return:
+        """
+        parser = RedisCommandParser()
+        parser.parse(['rpush', 'l', 'a', 'b', 'c'])
+        self.assertEqual('a', parser.parse(['lpop', 'l']))
+        self.assertEqual('c', parser.parse(['rpop', 'l']))
+        self.assertEqual('b', parser.parse(['lpop', 'l']))
+        self.assertEqual(BulkStringNone, parser.parse(['lpop', 'l']))
+        self.assertEqual(0, parser.parse(['del', 'l']))
+        parser.parse(['set', 's', 'v'])
+        self.assertRaises(CommandWrongType, parser.parse, ['rpop', 's'])
+        self.assertRaises(CommandWrongArgumentNumber, parser.parse, ['lpop'])
+
+    def test_lmove(self):
+        """
+        Test 'lmove' between lists and rotation of one list
+        :return:
+        """
+        parser = RedisCommandParser()
+        parser.parse(['rpush', 'a', '1', '2', '3'])
+        self.assertEqual('3', parser.parse(['lmove', 'a', 'b', 'right', 'left']))
+        self.assertEqual('1', parser.parse(['lmove', 'a', 'b', 'LEFT', 'RIGHT']))
+        self.assertEqual(['3', '1'], parser.parse(['lrange', 'b', '0', '-1']))
+        self.assertEqual('3', parser.parse(['lmove', 'b', 'b', 'left', 'right']))
+        self.assertEqual(['1', '3'], parser.parse(['lrange', 'b', '0', '-1']))
+        self.assertEqual('2', parser.parse(['lmove', 'a', 'a', 'left', 'left']))
+        self.assertEqual(['2'], parser.parse(['lrange', 'a', '0', '-1']))
+        self.assertEqual(BulkStringNone, parser.parse(['lmove', 'c', 'b', 'left', 'left']))
+        parser.parse(['set', 's', 'v'])
+        self.assertRaises(CommandWrongType, parser.parse, ['lmove', 'a', 's', 'left', 'left'])
+        self.assertEqual(['2'], parser.parse(['lrange', 'a', '0', '-1']))
+        self.assertRaises(CommandSyntaxError, parser.parse, ['lmove', 'a', 'b', 'up', 'left'])
+        self.assertRaises(CommandWrongArgumentNumber, parser.parse, ['lmove', 'a', 'b', 'left'])
+
+    def test_unlink(self):
+        """
+        Test 'unlink' deletes keys like 'del'
+        :return:
+        """
+        parser = RedisCommandParser(Storage(clock=task.Clock()))
+        parser.parse(['rpush', 'l'] + [str(i) for i in range(100)])
+        parser.parse(['set', 's', 'v'])
+        self.assertEqual(2, parser.parse(['unlink', 's', 'l', 'x']))
+        self.assertEqual(BulkStringNone, parser.parse(['get', 's']))
+        self.assertEqual(1, len(parser.storage.lazy_freer))
+        self.assertRaises(CommandWrongArgumentNumber, parser.parse, ['unlink'])
+
+    def test_flushall(self):
+        """
+        Test 'flushall' with and without ASYNC option
+        :return:
+        """
+        parser = RedisCommandParser(Storage(clock=task.Clock()))
+        for mode in ([], ['async'], ['SYNC']):
+            parser.parse(['set', 's', 'v'])
+            self.assertEqual(CommandParserSuccess, parser.parse(['flushall'] + mode))
+            self.assertEqual(BulkStringNone, parser.parse(['get', 's']))
+        self.assertRaises(CommandSyntaxError, parser.parse, ['flushall', 'now'])
+        self.assertRaises(CommandWrongArgumentNumber, parser.parse, ['flushall', 'async', 'sync'])
+
 
 if __name__ == '__main__':
     unittest.main(verbosity=2)
@@ -198,6 +198,21 @@ class TestRedisDataParser(unittest.TestCase):
         return d
 
 
+    def test_array_split(self):
+        """
+        Test parsing of an array split in two parts at every position,
+        the line separator may be split too
+        :return:
+        """
+        data = b'*3\r\n$3\r\nset\r\n$4\r\npxat\r\n:42\r\n'
+        for pos in range(1, len(data)):
+            values = []
+            parser = RedisDataParser()
+            parser.getDeferred().addCallback(values.append)
+            remaining = parser.parse(data[:pos])
+            parser.parse(remaining + data[pos:])
+            self.assertEqual([['set', 'pxat', 42]], values)
+
 if __name__ == '__main__':
     import unittest as unit
     unit.main(verbosity=2)
@@ -0,0 +1,238 @@
+from twisted.trial import unittest
+from twisted.internet import reactor, task
+from twisted.internet.testing import StringTransport
+from unittest.mock import patch
+from src.list_waiters import ListWaiter
+from src.replication import ReplicationBacklog, Replication, MasterLinkFactory, snapshot_commands
+from src.redis_command_parser import RedisCommandParser, CommandParserSuccess, BulkStringNone
+from src.server_protocol import ServerProtocolFactory
+from src.redis_encoder import RedisEncoder
+from src.value_compression import ValueCompressor
+from src.storage import Storage
+from src.exceptions.redis_command_parser_exceptions import *
+
+
+def wait_for(condition, timeout=5):
+    """
+    Wait until condition() is true
+    :return: deferred firing with the last value of condition()
+    """
+    deadline = reactor.seconds() + timeout
+
+    def check(_=None):
+        if condition() or reactor.seconds() > deadline:
+            return condition()
+        return task.deferLater(reactor, 0.01, check)
+    return check()
+
+
+class TestReplicationBacklog(unittest.TestCase):
+    """
+    Class for testing ReplicationBacklog
+    """
+    def test_since(self):
+        backlog = ReplicationBacklog(size=100)
+        backlog.append(b'abc')
+        backlog.append(b'defg')
+        self.assertEqual(7, backlog.offset)
+        self.assertEqual(b'abcdefg', backlog.since(0))
+        self.assertEqual(b'cdefg', backlog.since(2))
+        self.assertEqual(b'g', backlog.since(6))
+        self.assertEqual(b'', backlog.since(7))
+        self.assertIsNone(backlog.since(8))
+
+    def test_bounded(self):
+        """
+        Old data is dropped when backlog is full
+        :return:
+        """
+        backlog = ReplicationBacklog(size=10)
+        for i in range(10):
+            backlog.append(b'12345')
+        self.assertEqual(50, backlog.offset)
+        self.assertEqual(10, len(backlog))
+        self.assertEqual(40, backlog.start)
+        self.assertIsNone(backlog.since(39))
+        self.assertEqual(b'2345', backlog.since(46))
+        backlog.reset(100)
+        self.assertEqual(b'', backlog.since(100))
+        self.assertIsNone(backlog.since(50))
+
+
+class TestReplicationCommands(unittest.TestCase):
+    """
+    Class for testing write commands propagation
+    """
+    def test_propagated(self):
+        with patch('time.time', lambda: 1000):
+            self.assertEqual(['set', 'a', '1', 'pxat', '1010000', 'nx'],
+                             RedisCommandParser.propagated(['set', 'a', '1', 'EX', '10', 'nx']))
+            self.assertEqual(['set', 'a', '1', 'pxat', '1000500'],
+                             RedisCommandParser.propagated(['set', 'a', '1', 'px', '500']))
+            self.assertEqual(['pexpireat', 'a', '1005000'], RedisCommandParser.propagated(['expire', 'a', '5']))
+            self.assertEqual(['rpush', 'l', 'ex', '1'], RedisCommandParser.propagated(['rpush', 'l', 'ex', '1']))
+
+    def test_feed(self):
+        """
+        Successful writes are added to the stream, reads and errors are not
+        :return:
+        """
+        parser = RedisCommandParser()
+        parser.replication = Replication(parser)
+        parser.parse(['set', 'a', '1'])
+        # no backlog and no encoding until a replica connects
+        self.assertIsNone(parser.replication.backlog)
+        self.assertEqual(0, parser.replication.offset)
+        parser.replication.addReplica(StringTransport(), '?', 0)
+        parser.parse(['set', 'a', '1'])
+        parser.parse(['get', 'a'])
+        self.assertRaises(CommandWrongType, parser.parse, ['rpush', 'a', '2'])
+        data = RedisEncoder.encodeArray(['set', 'a', '1'])
+        self.assertEqual(data, parser.replication.backlog.since(0))
+
+    def test_served_pop(self):
+        """
+        Pop serving a blocked connection goes after the push
+        :return:
+        """
+        parser = RedisCommandParser()
+        parser.replication = Replication(parser)
+        parser.replication.addReplica(StringTransport(), '?', 0)
+        served = []
+        parser.list_waiters.block(ListWaiter(['l'], lambda key: ['lpop', key], lambda *args: served.append(args)))
+        parser.parse(['rpush', 'l', 'a', 'b'])
+        self.assertEqual([('l', 'a')], served)
+        data = RedisEncoder.encodeArray(['rpush', 'l', 'a', 'b']) + RedisEncoder.encodeArray(['lpop', 'l'])
+        self.assertEqual(data, parser.replication.backlog.since(0))
+
+    def test_readonly(self):
+        parser = RedisCommandParser()
+        parser.replication = Replication(parser)
+        parser.replication.master = ('127.0.0.1', 6379)
+        parser.replication.fullSyncStarted('id', 0)
+        parser.replication.fullSyncFinished()
+        self.assertRaises(CommandReadOnly, parser.parse, ['set', 'a', '1'])
+        self.assertEqual(BulkStringNone, parser.parse(['get', 'a']))
+        parser.replication.apply(['set', 'a', '1'])
+        self.assertEqual('1', parser.parse(['get', 'a']))
+        self.assertEqual(len(RedisEncoder.encodeArray(['set', 'a', '1'])), parser.replication.offset)
+
+    def test_empty_status(self):
+        """
+        Empty simple string from the primary is ignored
+        :return:
+        """
+        parser = RedisCommandParser()
+        parser.replication = Replication(parser)
+        proto = MasterLinkFactory(parser.replication).buildProtocol(('127.0.0.1', 6379))
+        proto.makeConnection(StringTransport())
+        proto.dataReceived(b'+\r\n+FULLRESYNC id 5\r\n')
+        self.assertEqual(('id', 5), (parser.replication.replid, parser.replication.offset))
+
+    def test_snapshot_commands(self):
+        storage = Storage(compressor=ValueCompressor(threshold=10))
+        storage.set('s', 'x' * 20, moe=2000.5)
+        storage.set('l', ['a', 'b'])
+        storage.set('h', {'f': 'v'}, moe=3000)
+        with patch('time.time', lambda: 1000):
+            commands = list(snapshot_commands(storage.items_view()))
+        self.assertEqual([['set', 's', 'x' * 20, 'pxat', '2000500'],
+                          ['rpush', 'l', 'a', 'b'],
+                          ['hset', 'h', 'f', 'v'], ['pexpireat', 'h', '3000000']], commands)
+
+
+class TestReplication(unittest.TestCase):
+    """
+    Class for testing replication between two servers in one reactor
+    """
+    def setUp(self) -> None:
+        self.master = ServerProtocolFactory()
+        self.master.parser.replication = Replication(self.master.parser, sync_batch=2)
+        self.port = reactor.listenTCP(0, self.master, interface='127.0.0.1')
+        self.replica = ServerProtocolFactory()
+        self.replica.parser.replication = Replication(self.replica.parser)
+
+    def tearDown(self):
+        self.replica.parser.replication.replicaOf(None)
+        return self.port.stopListening()
+
+    def master_write(self, *args):
+        return self.master.parser.parse(list(args))
+
+    def synced(self):
+        return self.master.parser.storage._keys_dict == self.replica.parser.storage._keys_dict and \
+            self.master.parser.replication.offset == self.replica.parser.replication.offset
+
+    def replicaof(self):
+        proto = self.replica.buildProtocol(('127.0.0.1', 0))
+        tr = StringTransport()
+        proto.makeConnection(tr)
+        proto.dataReceived(RedisEncoder.encodeArray(['replicaof', '127.0.0.1', str(self.port.getHost().port)]))
+        self.assertEqual(b'+OK\r\n', tr.value())
+
+    async def test_full_and_partial_sync(self):
+        """
+        Replica loads keys, follows writes, resumes after disconnect
+        :return:
+        """
+        for i in range(5):
+            self.master_write('set', str(i), 'v', 'ex', '100')
+        self.master_write('rpush', 'l', 'a', 'b')
+        self.master_write('hset', 'h', 'f', 'v')
+        self.replicaof()
+        self.assertTrue(await wait_for(self.synced))
+        self.assertEqual(1, self.master.parser.replication.full_syncs)
+        # expiration times are sent in milliseconds
+        master_moes = self.master.parser.storage._moe_dict
+        replica_moes = self.replica.parser.storage._moe_dict
+        self.assertEqual(set(master_moes), set(replica_moes))
+        for key in master_moes:
+            self.assertLess(abs(master_moes[key] - replica_moes[key]), 0.001)
+
+        self.master_write('rpush', 'l', 'c')
+        self.master_write('del', '0')
+        self.assertTrue(await wait_for(self.synced))
+        self.assertEqual(['a', 'b', 'c'], self.replica.parser.storage.get('l'))
+        self.assertRaises(CommandReadOnly, self.replica.parser.parse, ['set', 'a', '1'])
+        role = self.replica.parser.parse(['role'])
+        self.assertEqual(['slave', '127.0.0.1', self.port.getHost().port, 'connected'], role[:4])
+
+        # writes made while the replica is away come from the backlog
+        replication = self.master.parser.replication
+        replication.replicas[0].transport.loseConnection()
+        self.assertTrue(await wait_for(lambda: not replication.replicas))
+        self.master_write('set', 'new', 'value')
+        self.assertTrue(await wait_for(lambda: replication.partial_syncs and self.synced()))
+        self.assertEqual(1, self.master.parser.replication.full_syncs)
+
+    async def test_writes_during_sync(self):
+        """
+        Writes made while snapshot is sent go after it
+        :return:
+        """
+        for i in range(10):
+            self.master_write('set', str(i), str(i))
+        tr = StringTransport()
+        replication = self.master.parser.replication
+        offset = replication.offset
+        link = replication.addReplica(tr, '?', 0)
+        self.master_write('set', '0', 'changed')
+        self.assertTrue(await wait_for(lambda: b'+SYNCED' in tr.value()))
+        data = tr.value()
+        self.assertTrue(data.startswith(f'+FULLRESYNC {replication.replid} {offset}\r\n'.encode('utf-8')))
+        self.assertTrue(data.endswith(b'+SYNCED\r\n' + RedisEncoder.encodeArray(['set', '0', 'changed'])))
+        link.stop()
+        self.assertEqual([], replication.replicas)
+
+    def test_replicaof_no_one(self):
+        replication = self.replica.parser.replication
+        replication.master = ('127.0.0.1', 1)
+        replid = replication.replid
+        proto = self.replica.buildProtocol(('127.0.0.1', 0))
+        tr = StringTransport()
+        proto.makeConnection(tr)
+        proto.dataReceived(RedisEncoder.encodeArray(['replicaof', 'no', 'one']))
+        self.assertEqual(b'+OK\r\n', tr.value())
+        self.assertFalse(replication.readonly)
+        self.assertNotEqual(replid, replication.replid)
+        self.assertEqual(CommandParserSuccess, self.replica.parser.parse(['set', 'a', '1']))
@@ -1,8 +1,19 @@
-from src.server_protocol import ServerProtocolFactory
+from src.server_protocol import ServerProtocolFactory, parse_output_buffer_limit, parse_memory, set_keepalive
 from twisted.trial import unittest
+from twisted.internet import reactor, task
 from twisted.internet.testing import StringTransport, StringTransportWithDisconnection
 from src.redis_encoder import RedisEncoder
+from src.redis_command_parser import RedisCommandParser
+from src.storage import Storage
+from src.snapshot import read_manifest, load_snapshot, SnapshotWriter
+from twisted.internet.address import IPv4Address
+from twisted.internet.interfaces import IPushProducer
 from unittest.mock import patch
+import os
+import socket
+import tempfile
+import threading
+import time
 
 
 class TestServerProtocol(unittest.TestCase):
@@ -21,7 +32,7 @@ class TestServerProtocol(unittest.TestCase):
         proto = factory.buildProtocol(('127.0.0.1', 6379))
         tr = StringTransportWithDisconnection()
         tr.protocol = proto
-        proto.makeConnection(self.tr)
+        proto.makeConnection(tr)
         tr.loseConnection()
         self.assertEqual(0,factory.proto_count)
 
@@ -75,6 +86,410 @@ class TestServerProtocol(unittest.TestCase):
             self.assertEqual(b'+OK\r\n', self.tr.value())
             self.tr.clear()
 
+    def test_pipeline(self):
+        """
+        Several commands received at once
+        :return:
+        """
+        data = RedisEncoder.encodeArray(['set', '1', 'one']) + RedisEncoder.encodeArray(['get', '1'])
+        self.proto.dataReceived(data[:5])
+        self.proto.dataReceived(data[5:])
+        self.assertEqual(b'+OK\r\n$3\r\none\r\n', self.tr.value())
+
+    def waitForReply(self, expected, timeout=5):
+        """
+        Wait until the transport gets expected data
+        :return: deferred
+        """
+        deadline = reactor.seconds() + timeout
+
+        def check(_=None):
+            if self.tr.value() == expected or reactor.seconds() > deadline:
+                self.assertEqual(expected, self.tr.value())
+                return
+            return task.deferLater(reactor, 0.01, check)
+        return check()
+
+    def test_slow_command_order(self):
+        """
+        Slow command runs in a thread, replies are sent
+        in the order of commands
+        :return:
+        """
+        self.factory.parser.slow_lrange_threshold = 3
+        self.proto.dataReceived(RedisEncoder.encodeArray(['rpush', 'l', 'a', 'b', 'c']))
+        self.tr.clear()
+        data = RedisEncoder.encodeArray(['lrange', 'l', '0', '-1']) + \
+            RedisEncoder.encodeArray(['keys', '[']) + \
+            RedisEncoder.encodeArray(['rpush', 'l', 'd'])
+        self.proto.dataReceived(data)
+        self.assertEqual(b'', self.tr.value())
+        self.assertEqual(['a', 'b', 'c', 'd'], self.factory.parser.storage.get('l'))
+        expected = RedisEncoder.encodeArray(['a', 'b', 'c']) + \
+            b'-Syntax error: error in pattern\r\n' + \
+            RedisEncoder.encodeInt(4)
+        return self.waitForReply(expected)
+
+    def test_small_lrange_inline(self):
+        """
+        Small LRANGE is not sent to a thread
+        :return:
+        """
+        self.factory.parser.slow_lrange_threshold = 3
+        self.proto.dataReceived(RedisEncoder.encodeArray(['rpush', 'l', 'a', 'b', 'c']))
+        self.tr.clear()
+        self.proto.dataReceived(RedisEncoder.encodeArray(['lrange', 'l', '1', '-1']))
+        self.assertEqual(RedisEncoder.encodeArray(['b', 'c']), self.tr.value())
+
+    def test_bgsave(self):
+        """
+        BGSAVE replies at once and saves in a thread
+        :return:
+        """
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        prefix = os.path.join(tmp_dir.name, 'storage')
+        parser = RedisCommandParser(Storage(file_prefix=prefix))
+        factory = ServerProtocolFactory(parser)
+        proto = factory.buildProtocol(('127.0.0.1', 6379))
+        tr = StringTransport()
+        proto.makeConnection(tr)
+        proto.dataReceived(RedisEncoder.encodeArray(['set', '1', 'one']))
+        # the first save waits for the lock, so the second one finds it running
+        with parser.storage._save_lock:
+            proto.dataReceived(RedisEncoder.encodeArray(['bgsave']))
+            proto.dataReceived(RedisEncoder.encodeArray(['bgsave']))
+        self.assertEqual(b'+OK\r\n' + RedisEncoder.encodeBulkString('Background saving started') +
+                         b'-Syntax error: background save already in progress\r\n', tr.value())
+
+        def check(_=None):
+            if parser.bgsave_in_progress:
+                return task.deferLater(reactor, 0.01, check)
+            self.assertEqual(1, read_manifest(prefix)['records'])
+        return check()
+
+    def test_bgsave_consistent_view(self):
+        """
+        Lists and hashes changed in place during BGSAVE are saved
+        as they were when BGSAVE was called
+        :return:
+        """
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        prefix = os.path.join(tmp_dir.name, 'storage')
+        parser = RedisCommandParser(Storage(file_prefix=prefix))
+        proto = ServerProtocolFactory(parser).buildProtocol(('127.0.0.1', 6379))
+        proto.makeConnection(StringTransport())
+        proto.dataReceived(RedisEncoder.encodeArray(['rpush', 'l', *map(str, range(1000))]) +
+                           RedisEncoder.encodeArray(['hset', 'h', 'a', '1']))
+        started = threading.Event()
+        proceed = threading.Event()
+        add = SnapshotWriter.add
+
+        def blocked_add(writer, key, value, moe=None):
+            started.set()
+            proceed.wait(5)
+            return add(writer, key, value, moe)
+
+        with patch.object(SnapshotWriter, 'add', blocked_add):
+            proto.dataReceived(RedisEncoder.encodeArray(['bgsave']))
+            self.assertTrue(started.wait(5))
+            proto.dataReceived(RedisEncoder.encodeArray(['rpush', 'l', 'x']) +
+                               RedisEncoder.encodeArray(['lset', 'l', '0', 'y']) +
+                               RedisEncoder.encodeArray(['lpop', 'l']) +
+                               RedisEncoder.encodeArray(['hset', 'h', 'b', '2']))
+            proceed.set()
+            while parser.bgsave_in_progress:
+                time.sleep(0.01)
+        keys, _ = load_snapshot(prefix)
+        self.assertEqual(list(map(str, range(1000))), keys['l'])
+        self.assertEqual({'a': '1'}, keys['h'])
+
+
+    def test_pubsub(self):
+        """
+        Subscribe on one connection, publish on another
+        :return:
+        """
+        subscriber = self.factory.buildProtocol(('127.0.0.1', 6379))
+        tr = StringTransport()
+        subscriber.makeConnection(tr)
+        subscriber.dataReceived(RedisEncoder.encodeArray(['subscribe', 'a', 'b']) +
+                                RedisEncoder.encodeArray(['psubscribe', 'a*']))
+        self.assertEqual(RedisEncoder.encodeArray(['subscribe', 'a', 1]) +
+                         RedisEncoder.encodeArray(['subscribe', 'b', 2]) +
+                         RedisEncoder.encodeArray(['psubscribe', 'a*', 3]), tr.value())
+        tr.clear()
+        self.proto.dataReceived(RedisEncoder.encodeArray(['publish', 'a', 'hi']))
+        self.assertEqual(b':2\r\n', self.tr.value())
+        self.assertEqual(RedisEncoder.encodeArray(['message', 'a', 'hi']) +
+                         RedisEncoder.encodeArray(['pmessage', 'a*', 'a', 'hi']), tr.value())
+        tr.clear()
+        subscriber.dataReceived(RedisEncoder.encodeArray(['punsubscribe']))
+        self.assertEqual(RedisEncoder.encodeArray(['punsubscribe', 'a*', 2]), tr.value())
+        tr.clear()
+        subscriber.dataReceived(RedisEncoder.encodeArray(['punsubscribe']))
+        self.assertEqual(RedisEncoder.encodeArray(['punsubscribe', None, 2]), tr.value())
+        subscriber.connectionLost(None)
+        self.assertEqual({}, self.factory.pubsub.channels)
+
+    def worker(self, *commands):
+        proto = self.factory.buildProtocol(('127.0.0.1', 6379))
+        tr = StringTransport()
+        proto.makeConnection(tr)
+        for command in commands:
+            proto.dataReceived(RedisEncoder.encodeArray(command))
+        return proto, tr
+
+    def test_blocking_pop(self):
+        """
+        Blocked connections are served in FIFO order by the push
+        that gives them elements, replies after a blocked one wait for it
+        :return:
+        """
+        first, tr1 = self.worker(['blpop', 'a', 'b', '0'], ['get', 'x'])
+        second, tr2 = self.worker(['brpop', 'b', '0'])
+        third, tr3 = self.worker(['blmove', 'b', 'done', 'left', 'right', '0'])
+        self.assertEqual(b'', tr1.value() + tr2.value() + tr3.value())
+        self.assertEqual(3, len(self.factory.parser.list_waiters))
+        self.proto.dataReceived(RedisEncoder.encodeArray(['rpush', 'b', '1', '2']))
+        self.assertEqual(b':2\r\n', self.tr.value())
+        self.assertEqual(RedisEncoder.encodeArray(['b', '1']) + b'$-1\r\n', tr1.value())
+        self.assertEqual(RedisEncoder.encodeArray(['b', '2']), tr2.value())
+        self.assertEqual(b'', tr3.value())
+        self.proto.dataReceived(RedisEncoder.encodeArray(['lpush', 'b', '3']))
+        self.assertEqual(b'$1\r\n3\r\n', tr3.value())
+        self.assertEqual(['3'], self.factory.parser.parse(['lrange', 'done', '0', '-1']))
+        self.assertEqual(0, len(self.factory.parser.list_waiters))
+        self.assertEqual(0, self.factory.parser.parse(['del', 'b']))
+        # element is there already
+        _, tr = self.worker(['rpush', 'c', '1'], ['blpop', 'c', '0'])
+        self.assertEqual(b':1\r\n' + RedisEncoder.encodeArray(['c', '1']), tr.value())
+
+    def test_blocked_pipeline(self):
+        """
+        Commands after a blocked pop are executed after it's served
+        :return:
+        """
+        proto, tr = self.worker()
+        proto.dataReceived(RedisEncoder.encodeArray(['blpop', 'q', '0']) +
+                           RedisEncoder.encodeArray(['rpush', 'q', 'x']) +
+                           RedisEncoder.encodeArray(['get', 'k']))
+        self.assertEqual('paused', tr.producerState)
+        self.assertEqual(None, self.factory.parser.storage._keys_dict.get('q'))
+        self.proto.dataReceived(RedisEncoder.encodeArray(['rpush', 'q', 'y']))
+        self.assertEqual(RedisEncoder.encodeArray(['q', 'y']) + b':1\r\n$-1\r\n', tr.value())
+        self.assertEqual('producing', tr.producerState)
+        self.assertEqual(['x'], self.factory.parser.parse(['lrange', 'q', '0', '-1']))
+
+    def test_blocking_pop_timeout(self):
+        clock = task.Clock()
+        self.factory.parser.list_waiters.clock = clock
+        _, tr1 = self.worker(['blpop', 'a', '1.5'])
+        _, tr2 = self.worker(['blmove', 'a', 'b', 'left', 'left', '1'])
+        clock.advance(1)
+        self.assertEqual(b'', tr1.value())
+        self.assertEqual(b'$-1\r\n', tr2.value())
+        clock.advance(1)
+        self.assertEqual(b'*-1\r\n', tr1.value())
+        self.assertEqual({}, self.factory.parser.list_waiters.waiters)
+        self.assertEqual([], clock.getDelayedCalls())
+        _, tr = self.worker(['blpop', 'a', '-1'], ['blpop', 'a'], ['blpop', 'a', 'x'])
+        self.assertEqual(3, tr.value().count(b'-'))
+
+    def test_blocking_pop_connection_lost(self):
+        clock = task.Clock()
+        self.factory.parser.list_waiters.clock = clock
+        proto, tr = self.worker(['blpop', 'a', '10'])
+        proto.connectionLost(None)
+        self.assertEqual({}, self.factory.parser.list_waiters.waiters)
+        self.assertEqual([], clock.getDelayedCalls())
+        self.factory.parser.parse(['rpush', 'a', '1'])
+        self.assertEqual(['1'], self.factory.parser.parse(['lrange', 'a', '0', '-1']))
+
+
+class BufferingTransport(StringTransport):
+    """
+    Transport that never sends written data, like TCP one with a slow peer
+    """
+    offset = 0
+    _tempDataLen = 0
+
+    @property
+    def dataBuffer(self):
+        return self.value()
+
+
+class TestOutputBuffer(unittest.TestCase):
+    """
+    Class for testing output buffer limits and backpressure
+    """
+    def setUp(self) -> None:
+        self.factory = ServerProtocolFactory()
+        self.factory.parser.parse(['set', 'big', 'x' * 1000])
+        self.proto = self.factory.buildProtocol(('127.0.0.1', 6379))
+        self.tr = BufferingTransport()
+        self.proto.makeConnection(self.tr)
+
+    def test_parse_limit(self):
+        self.assertEqual(('pubsub', (32 << 20, 8 << 10, 60)), parse_output_buffer_limit('pubsub 32mb 8kb 60'))
+        self.assertEqual(100, parse_memory('100'))
+        self.assertRaises(ValueError, parse_output_buffer_limit, 'slow 1 2 3')
+        self.assertRaises(ValueError, parse_output_buffer_limit, 'normal 1mb 2')
+
+    def test_hard_limit(self):
+        self.factory.output_limits['normal'] = (2000, 0, 0)
+        self.proto.dataReceived(RedisEncoder.encodeArray(['get', 'big']) * 5)
+        self.assertTrue(self.proto.closing)
+        self.assertTrue(self.tr.disconnecting)
+        self.assertEqual(1, self.factory.clients_closed_over_limit)
+        # commands after the limit are not executed
+        self.assertLess(len(self.tr.value()), 3000)
+
+    def test_soft_limit(self):
+        self.factory.output_limits['normal'] = (0, 1000, 10)
+        now = [1000]
+        with patch('time.time', lambda: now[0]):
+            self.proto.dataReceived(RedisEncoder.encodeArray(['get', 'big']) * 2)
+            self.assertFalse(self.proto.closing)
+            now[0] += 11
+            self.proto.dataReceived(RedisEncoder.encodeArray(['get', 'big']))
+        self.assertTrue(self.proto.closing)
+
+    def test_pause_reading(self):
+        """
+        Commands are not parsed while the transport has paused the connection
+        :return:
+        """
+        self.assertTrue(IPushProducer.providedBy(self.proto))
+        self.assertIs(self.proto, self.tr.producer)
+        self.proto.pauseProducing()
+        self.assertEqual('paused', self.tr.producerState)
+        self.proto.dataReceived(RedisEncoder.encodeArray(['set', 'a', '1']) + RedisEncoder.encodeArray(['get', 'a']))
+        self.assertEqual(b'', self.tr.value())
+        self.proto.resumeProducing()
+        self.assertEqual('producing', self.tr.producerState)
+        self.assertEqual(b'+OK\r\n$1\r\n1\r\n', self.tr.value())
+
+    def test_client_list(self):
+        self.proto.dataReceived(RedisEncoder.encodeArray(['get', 'big']))
+        other = self.factory.buildProtocol(('127.0.0.1', 6379))
+        other.makeConnection(StringTransport())
+        other.dataReceived(RedisEncoder.encodeArray(['subscribe', 'a']) + RedisEncoder.encodeArray(['client', 'list']))
+        lines = other.transport.value().split(b'\r\n')[-2].decode().splitlines()
+        self.assertEqual(2, len(lines))
+        first = dict(field.split('=', 1) for field in lines[0].split())
+        second = dict(field.split('=', 1) for field in lines[1].split())
+        self.assertEqual(('1', 'N', 'get'), (first['id'], first['flags'], first['cmd']))
+        self.assertEqual(len(self.tr.value()), int(first['omem']))
+        self.assertEqual(('2', 'P', '1', 'client'), (second['id'], second['flags'], second['sub'], second['cmd']))
+
+
+class KeepAliveTransport(StringTransport):
+    """
+    Transport recording keepalive options
+    """
+    def __init__(self):
+        super().__init__()
+        self.keepalive = 0
+        self.options = {}
+
+    def setTcpKeepAlive(self, enabled):
+        self.keepalive = enabled
+
+    def getHandle(self):
+        return self
+
+    def setsockopt(self, level, option, value):
+        self.options[option] = value
+
+
+class TestConnectionLimits(unittest.TestCase):
+    """
+    Class for testing maxclients, idle timeout, keepalive and CLIENT KILL
+    """
+    def setUp(self) -> None:
+        self.factory = ServerProtocolFactory()
+        self.clock = task.Clock()
+
+    def connect(self, transport=None):
+        proto = self.factory.buildProtocol(('127.0.0.1', 6379))
+        proto.makeConnection(transport or StringTransport(peerAddress=None))
+        return proto
+
+    def test_max_clients(self):
+        self.factory.max_clients = 2
+        self.connect()
+        second = self.connect()
+        third = self.connect()
+        self.assertEqual(b'-ERR max number of clients reached\r\n', third.transport.value())
+        self.assertTrue(third.transport.disconnecting)
+        self.assertEqual((2, 1), (len(self.factory.clients), self.factory.rejected_connections))
+        third.connectionLost(None)
+        second.connectionLost(None)
+        self.assertIsNot(self.connect().transport.disconnecting, True)
+
+    def test_client_kill(self):
+        first = self.connect()
+        second = self.connect(StringTransport(peerAddress=IPv4Address('TCP', '10.0.0.2', 5000)))
+        third = self.connect()
+        third.dataReceived(RedisEncoder.encodeArray(['subscribe', 'a']))
+        first.dataReceived(RedisEncoder.encodeArray(['client', 'kill', '10.0.0.2:5000']) +
+                           RedisEncoder.encodeArray(['client', 'kill', '10.0.0.2:5000']) +
+                           RedisEncoder.encodeArray(['client', 'kill', 'type', 'pubsub', 'skipme', 'no']) +
+                           RedisEncoder.encodeArray(['client', 'kill', 'id', '1']) +
+                           RedisEncoder.encodeArray(['client', 'kill', 'id', 'x']) +
+                           RedisEncoder.encodeArray(['client', 'kill', 'id', '1', 'skipme', 'no']))
+        replies = first.transport.value().split(b'\r\n')
+        self.assertEqual([b'+OK', b'-'], [replies[0], replies[1][:1]])
+        self.assertEqual([b':1', b':0', b'-', b':1'], [replies[2], replies[3], replies[4][:1], replies[5]])
+        self.assertTrue(all(proto.transport.disconnecting for proto in (first, second, third)))
+
+    def test_client_list_filters(self):
+        first = self.connect()
+        self.connect().dataReceived(RedisEncoder.encodeArray(['subscribe', 'a']))
+        first.dataReceived(RedisEncoder.encodeArray(['client', 'list', 'type', 'pubsub']) +
+                           RedisEncoder.encodeArray(['client', 'list', 'id', '1', '5']) +
+                           RedisEncoder.encodeArray(['client', 'list', 'type', 'other']))
+        replies = first.transport.value().split(b'\r\n')
+        self.assertTrue(replies[1].startswith(b'id=2 '))
+        self.assertTrue(replies[3].startswith(b'id=1 '))
+        self.assertEqual(b'-', replies[4][:1])
+
+    def test_idle_timeout(self):
+        """
+        Idle normal connections are closed, subscribers are kept
+        :return:
+        """
+        self.clock.advance(1000)
+        idle = self.connect()
+        active = self.connect()
+        subscriber = self.connect()
+        subscriber.dataReceived(RedisEncoder.encodeArray(['subscribe', 'a']))
+        for proto in (idle, active, subscriber):
+            proto.last_interaction = self.clock.seconds()
+        self.factory.setIdleTimeout(10, self.clock)
+        self.clock.pump([1] * 6)
+        active.last_interaction = self.clock.seconds()
+        self.clock.pump([1] * 6)
+        self.assertEqual([True, False, False],
+                         [proto.transport.disconnecting for proto in (idle, active, subscriber)])
+        self.clock.pump([1] * 6)
+        self.assertTrue(active.transport.disconnecting)
+        self.assertFalse(subscriber.transport.disconnecting)
+        self.factory.setIdleTimeout(0)
+        self.assertEqual([], self.clock.getDelayedCalls())
+
+    def test_keepalive(self):
+        tr = KeepAliveTransport()
+        set_keepalive(tr, 0)
+        self.assertEqual(0, tr.keepalive)
+        self.connect(tr)
+        self.assertEqual(1, tr.keepalive)
+        if hasattr(socket, 'TCP_KEEPIDLE'):
+            self.assertEqual({socket.TCP_KEEPIDLE: 300, socket.TCP_KEEPINTVL: 100, socket.TCP_KEEPCNT: 3},
+                             tr.options)
+
 
 if __name__ == '__main__':
     import unittest as unit
@@ -0,0 +1,124 @@
+import os
+import tempfile
+from twisted.trial import unittest
+from twisted.internet import task
+from twisted.internet.testing import StringTransport
+from src.redis_encoder import RedisEncoder
+from src.server_protocol import ServerProtocolFactory
+from src.server_stats import ServerStats, SAMPLES
+from src.value_compression import ValueCompressor
+from src.disk_tier import DiskTier
+
+
+def parse_info(text: str) -> dict:
+    """
+    :return: {section: {field: value}}
+    """
+    sections = {}
+    for line in text.split('\r\n'):
+        if line.startswith('# '):
+            section = sections.setdefault(line[2:].lower(), {})
+        elif line:
+            name, value = line.split(':', 1)
+            section[name] = value
+    return sections
+
+
+class TestServerStats(unittest.TestCase):
+    """
+    Class for testing counters and INFO command
+    """
+    def setUp(self) -> None:
+        self.factory = ServerProtocolFactory()
+        self.proto = self.factory.buildProtocol(('127.0.0.1', 0))
+        self.proto.makeConnection(StringTransport())
+
+    def info(self, *sections) -> dict:
+        self.proto.transport.clear()
+        self.proto.dataReceived(RedisEncoder.encodeArray(['info', *sections]))
+        reply = self.proto.transport.value().decode()
+        return parse_info(reply[reply.index('\r\n') + 2:-2])
+
+    def test_sampling(self):
+        clock = task.Clock()
+        stats = ServerStats()
+        stats.startSampling(clock)
+        stats.commands += 100
+        stats.net_output_bytes += 1000
+        clock.advance(0.1)
+        self.assertEqual(1000 / SAMPLES, stats.instantaneous('ops'))
+        self.assertEqual(10000 / SAMPLES, stats.instantaneous('output'))
+        for _ in range(SAMPLES):
+            stats.commands += 100
+            clock.advance(0.1)
+        self.assertAlmostEqual(1000, stats.instantaneous('ops'))
+        stats.stopSampling()
+        self.assertEqual([], clock.getDelayedCalls())
+
+    def test_info(self):
+        """
+        Counters of commands, bytes and keyspace lookups are shown in sections
+        :return:
+        """
+        commands = RedisEncoder.encodeArray(['set', 'a', '1']) + RedisEncoder.encodeArray(['get', 'a']) + \
+            RedisEncoder.encodeArray(['get', 'b']) + RedisEncoder.encodeArray(['set', 'c', '1', 'px', '100000'])
+        self.proto.dataReceived(commands)
+        sent = len(self.proto.transport.value())
+        info = self.info()
+        self.assertEqual(['server', 'clients', 'persistence', 'stats', 'replication', 'cpu', 'compression', 'tiering',
+                          'keyspace'], list(info))
+        stats = info['stats']
+        self.assertEqual('5', stats['total_commands_processed'])
+        self.assertEqual(str(len(commands) + len(RedisEncoder.encodeArray(['info']))), stats['total_net_input_bytes'])
+        self.assertEqual(str(sent), stats['total_net_output_bytes'])
+        self.assertEqual(('1', '1'), (stats['keyspace_hits'], stats['keyspace_misses']))
+        self.assertEqual('1', info['clients']['connected_clients'])
+        self.assertEqual('keys=2,expires=1', info['keyspace']['db0'])
+        self.assertEqual('master', info['replication']['role'])
+        self.assertIn('used_cpu_user', info['cpu'])
+
+    def test_sections(self):
+        self.assertEqual(['clients', 'cpu'], list(self.info('CLIENTS', 'cpu', 'nope')))
+        self.assertEqual(9, len(self.info('all')))
+        self.assertEqual({'keyspace': {}}, self.info('keyspace'))
+
+    def test_lrange_hits(self):
+        """
+        LRANGE counts one keyspace lookup
+        :return:
+        """
+        self.factory.parser.storage.set('l', ['a', 'b'])
+        self.proto.dataReceived(RedisEncoder.encodeArray(['lrange', 'l', '0', '-1']) +
+                                RedisEncoder.encodeArray(['lrange', 'm', '0', '-1']))
+        stats = self.info('stats')['stats']
+        self.assertEqual(('1', '1'), (stats['keyspace_hits'], stats['keyspace_misses']))
+
+    def test_tiering(self):
+        self.assertEqual({'tiering': {'disk_tier_enabled': '0'}}, self.info('tiering'))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            storage = self.factory.parser.storage
+            storage.disk_tier = DiskTier(os.path.join(tmp_dir, 'tier.log'))
+            storage.spill_after = 0
+            self.proto.dataReceived(RedisEncoder.encodeArray(['set', 'a', '1']) +
+                                    RedisEncoder.encodeArray(['set', 'b', '1']) +
+                                    RedisEncoder.encodeArray(['rpush', 'l', 'a']))
+            storage.spill_idle()
+            self.proto.dataReceived(RedisEncoder.encodeArray(['get', 'a']) * 3 +
+                                    RedisEncoder.encodeArray(['lrange', 'l', '0', '-1']))
+            tiering = self.info('tiering')['tiering']
+            storage.disk_tier.close()
+        self.assertEqual(('1', '2', '1'), (tiering['disk_tier_enabled'], tiering['memory_keys'], tiering['disk_keys']))
+        self.assertEqual(('2', '2'), (tiering['memory_hits'], tiering['disk_hits']))
+        self.assertEqual(('0.5', '0.5'), (tiering['memory_hit_rate'], tiering['disk_hit_rate']))
+
+    def test_compression(self):
+        self.assertEqual({'compression': {'compression_enabled': '0'}}, self.info('compression'))
+        self.factory.parser.storage.compressor = ValueCompressor('zlib', threshold=100)
+        self.proto.dataReceived(RedisEncoder.encodeArray(['set', 'a', 'x' * 1000]) +
+                                RedisEncoder.encodeArray(['get', 'a']))
+        compression = self.info('compression')['compression']
+        self.assertEqual(('1', 'zlib', '100'), (compression['compression_enabled'], compression['compression_codec'],
+                                                compression['compression_threshold']))
+        self.assertEqual(('1', '1'), (compression['compressed_values'], compression['decompressed_values']))
+        self.assertGreater(float(compression['compression_ratio']), 10)
+        self.assertIn('compress_cpu_ms', compression)
@@ -0,0 +1,69 @@
+import unittest
+from twisted.internet.testing import StringTransport
+from src.redis_encoder import RedisEncoder
+from src.server_protocol import ServerProtocolFactory
+from src.slowlog import SlowLog
+
+
+def address():
+    return '127.0.0.1:5000'
+
+
+class TestSlowLog(unittest.TestCase):
+    """
+    Class for testing SlowLog
+    """
+    def test_threshold(self):
+        slowlog = SlowLog(threshold_us=100, max_len=2)
+        slowlog.record(99, ['get', 'a'], address)
+        slowlog.record(100, ['get', 'b'], address)
+        slowlog.record(200, ['get', 'c'], address)
+        slowlog.record(300, ['get', 'd'], address)
+        self.assertEqual(2, len(slowlog))
+        self.assertEqual([[2, ['get', 'd']], [1, ['get', 'c']]],
+                         [[entry[0], entry[3]] for entry in slowlog.get()])
+        self.assertEqual(1, len(slowlog.get(1)))
+        self.assertEqual(2, len(slowlog.get(-1)))
+        slowlog.reset()
+        self.assertEqual([], slowlog.get())
+        slowlog.threshold_us = -1
+        slowlog.record(10 ** 9, ['get', 'e'], address)
+        self.assertEqual(0, len(slowlog))
+
+    def test_truncation(self):
+        slowlog = SlowLog(threshold_us=0)
+        slowlog.record(1, ['rpush', 'l'] + ['x' * 200] * 40, address)
+        args = slowlog.get()[0][3]
+        self.assertEqual(32, len(args))
+        self.assertEqual('x' * 128 + '... (72 more bytes)', args[2])
+        self.assertEqual('... (11 more arguments)', args[-1])
+
+    def test_command(self):
+        """
+        SLOWLOG GET, LEN and RESET through a connection
+        :return:
+        """
+        factory = ServerProtocolFactory()
+        factory.slowlog.threshold_us = 0
+        proto = factory.buildProtocol(('127.0.0.1', 0))
+        proto.makeConnection(StringTransport())
+        proto.dataReceived(RedisEncoder.encodeArray(['set', 'a', '1']) +
+                           RedisEncoder.encodeArray(['slowlog', 'len']))
+        self.assertEqual(b'+OK\r\n:1\r\n', proto.transport.value())
+        proto.transport.clear()
+        proto.dataReceived(RedisEncoder.encodeArray(['slowlog', 'get', '1']))
+        reply = proto.transport.value()
+        self.assertTrue(reply.startswith(b'*1\r\n*6\r\n:1\r\n'))
+        self.assertIn(RedisEncoder.encodeArray(['slowlog', 'len']) + RedisEncoder.encodeBulkString('192.168.1.1:54321'),
+                      reply)
+        proto.transport.clear()
+        proto.dataReceived(RedisEncoder.encodeArray(['slowlog', 'reset']) +
+                           RedisEncoder.encodeArray(['slowlog', 'get', 'x']) +
+                           RedisEncoder.encodeArray(['slowlog', 'nope']) +
+                           RedisEncoder.encodeArray(['slowlog', 'len', '1']))
+        replies = proto.transport.value().split(b'\r\n')
+        self.assertEqual([b'+OK', b'-', b'-', b'-'], [replies[0]] + [reply[:1] for reply in replies[1:4]])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,149 @@
+import unittest
+import os
+import pickle
+import tempfile
+import time
+from unittest.mock import patch
+from src.snapshot import *
+from src.storage import Storage
+from src.exceptions.storage_exceptions import *
+
+
+class TestSnapshot(unittest.TestCase):
+    """
+    Class for testing sharded snapshot reading and writing
+    """
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.prefix = os.path.join(self.tmp_dir.name, 'storage')
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_write_load(self):
+        """
+        Write records to several shards and load them back
+        :return:
+        """
+        with SnapshotWriter(self.prefix, shards=3, batch_size=2) as writer:
+            for i in range(10):
+                writer.add(str(i), f'value {i}', i + 100 if i % 2 else None)
+        keys_dict, moe_dict = load_snapshot(self.prefix)
+        self.assertEqual(dict((str(i), f'value {i}') for i in range(10)), keys_dict)
+        self.assertEqual(dict((str(i), i + 100) for i in range(1, 10, 2)), moe_dict)
+        self.assertEqual({'version': SNAPSHOT_VERSION, 'shards': 3, 'records': 10},
+                         read_manifest(self.prefix))
+
+    def test_load_parallel(self):
+        """
+        Load shards with a pool of worker processes
+        :return:
+        """
+        with SnapshotWriter(self.prefix, shards=4) as writer:
+            for i in range(100):
+                writer.add(i, [str(i)] * 3)
+        keys_dict, moe_dict = load_snapshot(self.prefix, workers=4)
+        self.assertEqual(dict((i, [str(i)] * 3) for i in range(100)), keys_dict)
+        self.assertEqual({}, moe_dict)
+
+    def test_no_snapshot(self):
+        """
+        Load when there is no snapshot
+        :return:
+        """
+        self.assertEqual(None, load_snapshot(self.prefix))
+        self.assertRaises(StorageFileError, list, iter_snapshot_batches(self.prefix))
+
+    def test_iter_batches(self):
+        """
+        Batches have at most batch_size records
+        :return:
+        """
+        with SnapshotWriter(self.prefix, shards=1, batch_size=3) as writer:
+            for i in range(7):
+                writer.add(i, i)
+        sizes = [len(keys) for keys, values, moes in iter_snapshot_batches(self.prefix)]
+        self.assertEqual([3, 3, 1], sizes)
+
+    def test_incomplete_snapshot(self):
+        """
+        Snapshot with missing records is not loaded
+        :return:
+        """
+        with SnapshotWriter(self.prefix, shards=2) as writer:
+            for i in range(10):
+                writer.add(i, i)
+        with open(shard_path(self.prefix, 0), 'wb'):
+            pass
+        self.assertRaises(StorageFileError, load_snapshot, self.prefix)
+
+    def test_fewer_shards(self):
+        """
+        Shards of a previous snapshot are removed
+        :return:
+        """
+        with SnapshotWriter(self.prefix, shards=4) as writer:
+            writer.add('1', 'one')
+        with SnapshotWriter(self.prefix, shards=2) as writer:
+            writer.add('1', 'one')
+        self.assertEqual(False, os.path.exists(shard_path(self.prefix, 2)))
+        self.assertEqual(False, os.path.exists(shard_path(self.prefix, 3)))
+        self.assertEqual(({'1': 'one'}, {}), load_snapshot(self.prefix))
+
+
+class TestStorageSnapshot(unittest.TestCase):
+    """
+    Class for testing Storage saving and loading
+    """
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.prefix = os.path.join(self.tmp_dir.name, 'storage')
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_close_error(self):
+        """
+        Temporary files are removed when a batch can't be written on close
+        :return:
+        """
+        writer = SnapshotWriter(self.prefix, shards=2)
+        writer.add('a', '1')
+        with patch('pickle.dump', side_effect=pickle.PicklingError):
+            self.assertRaises(StorageFileError, writer.close)
+        self.assertTrue(all(f.closed for f in writer._files))
+        self.assertEqual([], os.listdir(self.tmp_dir.name))
+
+    def test_save_load(self):
+        """
+        Save storage and load it with several workers,
+        expired keys are not saved
+        :return:
+        """
+        storage = Storage(file_prefix=self.prefix, shards=3)
+        moe = time.time() + 100
+        storage.set('s', 'string')
+        storage.set('l', ['a', 'b'], moe)
+        storage.set('h', {'f': 'v'})
+        storage.set('expired', 'value', time.time() - 1)
+        storage.save()
+        loaded = Storage(file_prefix=self.prefix, load_workers=3)
+        self.assertEqual({'s': 'string', 'l': ['a', 'b'], 'h': {'f': 'v'}}, loaded._keys_dict)
+        self.assertEqual({'l': moe}, loaded._moe_dict)
+
+    def test_load_dicts(self):
+        """
+        Load pickled dicts when there is no snapshot
+        :return:
+        """
+        with open(self.prefix + '_keys.pkl', 'wb') as f:
+            pickle.dump({'1': 'one', '2': 'two'}, f)
+        with open(self.prefix + '_moes.pkl', 'wb') as f:
+            pickle.dump({'2': 5}, f)
+        storage = Storage(file_prefix=self.prefix)
+        self.assertEqual({'1': 'one', '2': 'two'}, storage._keys_dict)
+        self.assertEqual({'2': 5}, storage._moe_dict)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
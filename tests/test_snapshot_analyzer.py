@@ -0,0 +1,94 @@
+import unittest
+import os
+import tempfile
+from src.snapshot import SnapshotWriter
+from src.snapshot_analyzer import *
+from src.exceptions.storage_exceptions import StorageFileError
+
+
+class TestSnapshotAnalyzer(unittest.TestCase):
+    """
+    Class for testing SnapshotAnalyzer
+    """
+    def test_types_and_prefixes(self):
+        """
+        Test type and prefix breakdown
+        :return:
+        """
+        analyzer = SnapshotAnalyzer()
+        analyzer.add('user:1', 'name')
+        analyzer.add('user:2', ['a', 'b'])
+        analyzer.add('session:1', {'f': 'v'})
+        analyzer.add('plain', 'value')
+        report = analyzer.report()
+        self.assertEqual(4, report['keys'])
+        self.assertEqual({'string': 2, 'list': 1, 'hash': 1},
+                         dict((name, stats['keys']) for name, stats in report['types'].items()))
+        self.assertEqual({'user': 2, 'session': 1, NO_PREFIX: 1},
+                         dict((name, stats['keys']) for name, stats in report['prefixes'].items()))
+        self.assertEqual(report['bytes'], sum(stats['bytes'] for stats in report['types'].values()))
+
+    def test_max_prefixes(self):
+        """
+        Prefixes over the limit are counted together
+        :return:
+        """
+        analyzer = SnapshotAnalyzer(max_prefixes=2)
+        for prefix in 'abcd':
+            analyzer.add(f'{prefix}:1', '1')
+        analyzer.add('a:2', '1')
+        self.assertEqual({'a': 2, 'b': 1, OTHER_PREFIXES: 2},
+                         dict((name, stats['keys']) for name, stats in analyzer.prefixes.items()))
+
+    def test_biggest_keys(self):
+        """
+        Only top keys are kept, sorted by size
+        :return:
+        """
+        analyzer = SnapshotAnalyzer(top=2)
+        for i in range(10):
+            analyzer.add(str(i), 'x' * i * 10)
+        self.assertEqual(['9', '8'], [key for key, _, _ in analyzer.biggest_keys()])
+        self.assertEqual(2, len(analyzer._biggest))
+
+    def test_repeated_key(self):
+        """
+        Records of a repeated key are counted separately,
+        the analyzer doesn't keep every key
+        :return:
+        """
+        analyzer = SnapshotAnalyzer(top=2)
+        analyzer.add('a', 'x' * 100)
+        analyzer.add('a', 'y' * 100)
+        self.assertEqual(2, analyzer.report()['keys'])
+        self.assertEqual(['a', 'a'], [key for key, _, _ in analyzer.biggest_keys()])
+
+    def test_ttl_histogram(self):
+        """
+        Test ttl buckets
+        :return:
+        """
+        analyzer = SnapshotAnalyzer(now=1000)
+        for moe in (None, 900, 1010, 2000, 50000, 100000, 10 ** 7):
+            analyzer.add('k', 'v', moe)
+        self.assertEqual({'no ttl': 1, 'expired': 1, '<1m': 1, '<1h': 1,
+                          '<1d': 1, '<1w': 1, '>=1w': 1}, analyzer.ttl_histogram)
+
+    def test_analyze_snapshot(self):
+        """
+        Analyze snapshot written to disk
+        :return:
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            prefix = os.path.join(tmp_dir, 'storage')
+            self.assertRaises(StorageFileError, analyze_snapshot, prefix)
+            with SnapshotWriter(prefix, shards=2, batch_size=3) as writer:
+                for i in range(20):
+                    writer.add(f'k:{i}', str(i))
+            analyzer = analyze_snapshot(prefix, top=3)
+            self.assertEqual(20, analyzer.keys)
+            self.assertEqual(3, len(analyzer.biggest_keys()))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
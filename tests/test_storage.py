@@ -1,8 +1,13 @@
 import unittest
+import os
+import tempfile
+import threading
 import time
+from twisted.internet import task
 from src.storage import Storage, StorageGarbageCollector
 from unittest.mock import patch
 from src.exceptions.storage_exceptions import *
+from src.snapshot import load_snapshot
 
 
 class TestStorage(unittest.TestCase):
@@ -201,6 +206,124 @@ class TestStorage(unittest.TestCase):
             self.assertRaises(StorageKeyError, storage.get, 1)
             self.assertEqual('two', storage.get(2))
 
+    def test_keyspace_counters(self):
+        """
+        Test lookup and expiration counters
+        :return:
+        """
+        with patch('time.time', self.fake_time):
+            storage = Storage()
+            storage.set('a', '1')
+            storage.set('b', '2', self.now + 1)
+            storage.get('a')
+            self.assertRaises(StorageKeyError, storage.get, 'c')
+            self.assertEqual((2, 1), storage.keyspace())
+            self.now += 2
+            self.assertRaises(StorageKeyError, storage.get, 'b')
+        self.assertEqual((1, 2, 1), (storage.keyspace_hits, storage.keyspace_misses, storage.expired_keys))
+        self.assertEqual((1, 0), storage.keyspace())
+
+    def test_unlink(self):
+        """
+        Test Storage.unlink, big values are freed by the lazy freer
+        :return:
+        """
+        clock = task.Clock()
+        storage = Storage(clock=clock)
+        storage.set('s', 'value')
+        storage.set('l', list(range(1000)))
+        self.assertEqual(2, storage.unlink(['s', 'l', 'x']))
+        self.assertEqual({}, storage._keys_dict)
+        self.assertEqual(1, len(storage.lazy_freer))
+        clock.advance(0)
+        self.assertEqual(0, len(storage.lazy_freer))
+
+    def test_lazy_expire(self):
+        """
+        Test big values of expired keys are freed lazily
+        :return:
+        """
+        clock = task.Clock()
+        with patch('time.time', self.fake_time):
+            storage = Storage(clock=clock)
+            storage.set('l', list(range(1000)), self.now + 1)
+            storage.set('h', {i: i for i in range(1000)}, self.now + 1)
+            self.now += 2
+            self.assertRaises(StorageKeyError, storage.get, 'l')
+            self.assertEqual([], storage.keys('*'))
+        self.assertEqual(2, len(storage.lazy_freer))
+        storage = Storage(clock=clock, lazy_expire=False)
+        with patch('time.time', self.fake_time):
+            storage.set('l', list(range(1000)), self.now - 1)
+            self.assertRaises(StorageKeyError, storage.get, 'l')
+        self.assertEqual(0, len(storage.lazy_freer))
+
+    def test_flush(self):
+        """
+        Test Storage.flush, the listener is called once with None
+        :return:
+        """
+        clock = task.Clock()
+        storage = Storage(clock=clock)
+        changed = []
+        storage.set('a', '1', time.time() + 10)
+        storage.set('l', list(range(1000)))
+        storage.change_listener = changed.append
+        storage.flush(lazy=True)
+        self.assertEqual(({}, {}), (storage._keys_dict, storage._moe_dict))
+        self.assertEqual([None], changed)
+        self.assertEqual(1, len(storage.lazy_freer))
+        clock.advance(0)
+        self.assertEqual(0, storage.lazy_freer.pending_elements)
+        storage.set('a', '1')
+        storage.flush()
+        self.assertEqual({}, storage._keys_dict)
+        self.assertEqual(0, len(storage.lazy_freer))
+
+    def test_set_moe_listener(self):
+        """
+        Setting or removing moe notifies the listener,
+        removing a missing moe doesn't
+        :return:
+        """
+        storage = Storage()
+        storage.set('a', '1')
+        changed = []
+        storage.change_listener = changed.append
+        storage.set_moe('a')
+        storage.set_moe('a', time.time() + 10)
+        storage.set_moe('a')
+        self.assertEqual(['a', 'a'], changed)
+
+    def test_save_view(self):
+        """
+        Values changed after the view is taken are saved as they were,
+        saving waits for a running save of another view
+        :return:
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            prefix = os.path.join(tmp_dir, 'storage')
+            storage = Storage(file_prefix=prefix)
+            storage.set('l', ['a', 'b'])
+            storage.set('h', {'f': 'v'})
+            write = storage.save_view()
+            self.assertTrue(storage.saving)
+            storage.before_write(['l', 'h'])
+            storage.get('l').append('c')
+            storage.get('h')['g'] = 'w'
+            storage._save_lock.acquire()
+            saving = threading.Thread(target=storage.save)
+            saving.start()
+            saving.join(0.1)
+            self.assertTrue(saving.is_alive())
+            storage._save_lock.release()
+            saving.join()
+            self.assertEqual(['a', 'b', 'c'], load_snapshot(prefix)[0]['l'])
+            write()
+            self.assertFalse(storage.saving)
+            keys, _ = load_snapshot(prefix)
+            self.assertEqual((['a', 'b'], {'f': 'v'}), (keys['l'], keys['h']))
+
 
 class TestGarbageCollector(unittest.TestCase):
     def setUp(self) -> None:
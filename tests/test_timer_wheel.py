@@ -0,0 +1,82 @@
+import unittest
+from twisted.internet import task
+from src.timer_wheel import TimerWheel
+
+
+class Connection:
+    def __init__(self, last_interaction):
+        self.last_interaction = last_interaction
+
+
+class TestTimerWheel(unittest.TestCase):
+    """
+    Class for testing TimerWheel with a fake clock
+    """
+    def setUp(self) -> None:
+        self.clock = task.Clock()
+        self.clock.advance(100)
+        self.idle = []
+        self.keep = set()
+        self.wheel = TimerWheel(10, self.on_idle, clock=self.clock)
+
+    def on_idle(self, connection):
+        self.idle.append(connection)
+        return connection not in self.keep
+
+    def test_idle(self):
+        """
+        Connections are reported after timeout seconds without commands
+        :return:
+        """
+        first = Connection(100)
+        second = Connection(100)
+        self.wheel.add(first)
+        self.wheel.add(second)
+        self.clock.advance(5)
+        second.last_interaction = 105
+        self.clock.pump([1] * 5)
+        self.assertEqual([first], self.idle)
+        self.assertEqual(1, len(self.wheel))
+        self.clock.pump([1] * 5)
+        self.assertEqual([first, second], self.idle)
+        self.assertEqual(0, len(self.wheel))
+        self.assertEqual(2, self.wheel.expired)
+        self.assertEqual([], self.clock.getDelayedCalls())
+
+    def test_kept(self):
+        """
+        Connection not closed by on_idle is checked again after timeout
+        :return:
+        """
+        connection = Connection(100)
+        self.keep.add(connection)
+        self.wheel.add(connection)
+        self.clock.pump([1] * 10)
+        self.assertEqual(1, len(self.idle))
+        self.clock.pump([1] * 9)
+        self.assertEqual(1, len(self.idle))
+        self.clock.advance(1)
+        self.assertEqual(2, len(self.idle))
+        self.assertEqual(0, self.wheel.expired)
+
+    def test_remove(self):
+        connection = Connection(100)
+        self.wheel.add(connection)
+        self.wheel.remove(connection)
+        self.clock.pump([1] * 20)
+        self.assertEqual([], self.idle)
+
+    def test_late_tick(self):
+        """
+        Deadlines of ticks passed while the reactor was busy are not missed
+        :return:
+        """
+        connection = Connection(100)
+        self.wheel.add(connection)
+        self.clock.advance(1)
+        self.clock.advance(30)
+        self.assertEqual([connection], self.idle)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
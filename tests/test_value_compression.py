@@ -0,0 +1,102 @@
+import unittest
+import json
+import os
+import tempfile
+from src.value_compression import *
+from src.storage import Storage
+from src.snapshot import load_snapshot
+
+
+class TestValueCompressor(unittest.TestCase):
+    """
+    Class for testing ValueCompressor
+    """
+    def setUp(self) -> None:
+        self.value = json.dumps([{'id': i, 'name': 'item', 'tags': ['a', 'b']} for i in range(200)])
+
+    def test_compress(self):
+        """
+        Values over threshold are compressed and decompressed back
+        :return:
+        """
+        for codec in CODECS:
+            compressor = ValueCompressor(codec, threshold=100)
+            compressed = compressor.compress(self.value)
+            self.assertEqual(CompressedValue, type(compressed))
+            self.assertEqual(codec, compressed.codec)
+            self.assertLess(len(compressed.data), len(self.value))
+            self.assertEqual(self.value, compressor.decompress(compressed))
+            stats = compressor.stats()
+            self.assertEqual(1, stats['compressed_values'])
+            self.assertEqual(1, stats['decompressed_values'])
+            self.assertGreater(stats['compression_ratio'], 1)
+
+    def test_not_compressed(self):
+        """
+        Small and incompressible values are kept as is
+        :return:
+        """
+        compressor = ValueCompressor(threshold=10)
+        self.assertEqual('short', compressor.compress('short'))
+        self.assertEqual('abcdefghijkl', compressor.compress('abcdefghijkl'))
+        self.assertEqual(0, compressor.stats()['compressed_values'])
+        self.assertEqual(1, compressor.stats()['not_compressible_values'])
+
+    def test_multibyte(self):
+        """
+        Threshold is compared with the size of UTF-8 data,
+        not with the number of characters
+        :return:
+        """
+        compressor = ValueCompressor(threshold=100)
+        value = 'я' * 60
+        compressed = compressor.compress(value)
+        self.assertIsInstance(compressed, CompressedValue)
+        self.assertEqual(value, compressor.decompress(compressed))
+        self.assertEqual('я' * 24, compressor.compress('я' * 24))
+
+    def test_unknown_codec(self):
+        self.assertRaises(ValueError, ValueCompressor, 'gzip')
+
+
+class TestStorageCompression(unittest.TestCase):
+    """
+    Class for testing Storage with compression
+    """
+    def setUp(self) -> None:
+        self.value = 'x' * 1000
+
+    def test_set_get(self):
+        """
+        Values are kept compressed and returned decompressed
+        :return:
+        """
+        storage = Storage(compressor=ValueCompressor(threshold=100))
+        storage.set('1', self.value)
+        storage.set('2', 'small')
+        storage.set('3', ['x' * 1000])
+        self.assertEqual(CompressedValue, type(storage._keys_dict['1']))
+        self.assertEqual(str, type(storage._keys_dict['2']))
+        self.assertEqual(list, type(storage._keys_dict['3']))
+        self.assertEqual(self.value, storage.get('1'))
+        self.assertEqual(self.value, storage.set('1', 'new', get=True))
+        self.assertEqual('new', storage.get('1'))
+
+    def test_snapshot(self):
+        """
+        Compressed values are saved as is and can be read
+        by storage without compressor
+        :return:
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            prefix = os.path.join(tmp_dir, 'storage')
+            storage = Storage(file_prefix=prefix, compressor=ValueCompressor(threshold=100))
+            storage.set('1', self.value)
+            storage.save()
+            keys_dict, _ = load_snapshot(prefix)
+            self.assertEqual(storage._keys_dict['1'], keys_dict['1'])
+            self.assertEqual(self.value, Storage(file_prefix=prefix).get('1'))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,77 @@
+"""
+Offline snapshot analyzer. Reports the biggest keys, type, encoding
+and prefix breakdown and ttl histogram of a snapshot written by the server.
+
+Run from the repository root:
+    python -m tools.analyze_snapshot --save /data
+"""
+import sys, getopt
+import json
+
+from src.snapshot_analyzer import analyze_snapshot
+from src.exceptions.storage_exceptions import StorageFileError
+
+
+help_msg =\
+    '''
+    Usage: analyze_snapshot [-h] [--save dest] [--top n] [--separator s] [--json]
+        -h, --help      see this message
+        --save dest     destination the server saves snapshot to (default is ./)
+        --top n         number of biggest keys to report (default is 10)
+        --separator s   separator of key prefix (default is :)
+        --json          print report as JSON
+    '''
+
+
+def print_table(title, rows, total):
+    print(title)
+    for name, stats in rows.items():
+        share = stats['bytes'] / total * 100 if total else 0
+        print(f'    {name:<30} {stats["keys"]:>12} keys {stats["bytes"]:>16} bytes {share:>6.1f}%')
+
+
+if __name__ == '__main__':
+    save_dest = './'
+    top = 10
+    separator = ':'
+    as_json = False
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'h', ['save=', 'top=', 'separator=', 'json', 'help'])
+    except getopt.GetoptError as err:
+        print('Usage: analyze_snapshot [-h] [--save dest] [--top n] [--separator s] [--json]')
+        sys.exit(err.msg)
+
+    for opt, arg in opts:
+        if opt in ('-h', '--help'):
+            print(help_msg)
+            sys.exit()
+        if opt == '--save':
+            save_dest = arg + '/'
+        if opt == '--top':
+            top = int(arg)
+        if opt == '--separator':
+            separator = arg
+        if opt == '--json':
+            as_json = True
+
+    try:
+        analyzer = analyze_snapshot(save_dest + 'storage', top=top, separator=separator)
+    except StorageFileError as err:
+        sys.exit(str(err))
+    report = analyzer.report()
+
+    if as_json:
+        print(json.dumps(report, indent=2, default=str))
+        sys.exit()
+
+    print(f'Keys: {report["keys"]}, estimated size: {report["bytes"]} bytes')
+    print_table('Types:', report['types'], report['bytes'])
+    print_table('Encodings:', report['encodings'], report['bytes'])
+    print_table('Prefixes:', report['prefixes'], report['bytes'])
+    print('TTL:')
+    for bucket, count in report['ttl'].items():
+        print(f'    {bucket:<10} {count:>12}')
+    print(f'Top {top} biggest keys:')
+    for item in report['biggest_keys']:
+        print(f'    {item["bytes"]:>16} {item["type"]:<8} {item["key"]}')
@@ -0,0 +1,75 @@
+"""
+Offline bulk loader. Builds a storage snapshot from CSV or
+JSON lines input, the server loads it on start with the same --save.
+
+Run from the repository root:
+    python -m tools.bulk_load --save /data < keys.csv
+"""
+import sys, getopt
+import time
+
+from src.bulk_loader import iter_csv_records, iter_jsonl_records, build_snapshot
+from src.exceptions.bulk_loader_exceptions import BulkLoaderException
+from src.exceptions.storage_exceptions import StorageFileError
+
+
+help_msg =\
+    '''
+    Usage: bulk_load [-h] [--format csv|jsonl] [--save dest] [--shards n] [file]
+        -h, --help      see this message
+        --format f      input format, csv or jsonl (default is csv)
+        --save dest     destination of the snapshot, the same as
+                        server --save (default is ./)
+        --shards n      number of snapshot shards (default is 1)
+        file            input file, stdin if not specified
+
+    CSV columns are key, type, value and optional ttl in seconds.
+    Types are string, list and hash, list and hash values are JSON.
+    JSON lines are objects with the same fields.
+    '''
+
+
+if __name__ == '__main__':
+    input_format = 'csv'
+    save_dest = './'
+    shards = 1
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'h', ['format=', 'save=', 'shards=', 'help'])
+    except getopt.GetoptError as err:
+        print('Usage: bulk_load [-h] [--format csv|jsonl] [--save dest] [--shards n] [file]')
+        sys.exit(err.msg)
+
+    for opt, arg in opts:
+        if opt in ('-h', '--help'):
+            print(help_msg)
+            sys.exit()
+        if opt == '--format':
+            if arg not in ('csv', 'jsonl'):
+                sys.exit(f'Unknown format {arg}')
+            input_format = arg
+        if opt == '--save':
+            save_dest = arg + '/'
+        if opt == '--shards':
+            shards = int(arg)
+
+    if args:
+        input_file = open(args[0], newline='', encoding='utf-8')
+    else:
+        input_file = sys.stdin
+
+    if input_format == 'csv':
+        records = iter_csv_records(input_file)
+    else:
+        records = iter_jsonl_records(input_file)
+
+    start = time.perf_counter()
+    try:
+        count = build_snapshot(records, save_dest + 'storage', shards=shards)
+    except (BulkLoaderException, StorageFileError) as err:
+        sys.exit(str(err))
+    finally:
+        input_file.close()
+    elapsed = time.perf_counter() - start
+    print(f'Written {count} records to {save_dest}storage in {elapsed:.2f}s '
+          f'({count / max(elapsed, 1e-9):.0f} records/s)')